@@ -1,6 +1,6 @@
 import re
 import json
-from typing import Dict, Any, List, Tuple, Union
+from typing import Dict, Any, List, Tuple, Union, Optional, Iterable, Iterator
 from concurrent.futures import ThreadPoolExecutor, as_completed
 from src.apps.rag_base.core.rag_client import RAGClient
 from src.apps.rag_base.core.shadow_file_manager import ShadowFileManager
@@ -20,14 +20,19 @@ class ScenarioProcessor:
 
     def extract_questions(self, doc_path: str) -> List[Dict[str, Any]]:
         """Atomic Tool: Extract questions from the document using Field-Based Context."""
-        content = ShadowFileManager.read_file(doc_path)
-        lines = content.split('\n')
-        
-        questions: List[Dict[str, Any]] = []
+        return list(self.iter_questions(doc_path))
+
+    def iter_questions(self, doc_path: str) -> Iterator[Dict[str, Any]]:
+        """
+        Streaming form of extract_questions: the file is read line by line and each question
+        is yielded when its block ends, so memory stays flat for very large documents.
+        """
         in_code_block = False
         current_question = None
         
-        for idx, line in enumerate(lines):
+        for idx, raw_line in enumerate(ShadowFileManager.iter_lines(doc_path)):
+            # Same line view as content.split('\n'): only the "\n" is removed
+            line = raw_line[:-1] if raw_line.endswith('\n') else raw_line
             stripped = line.strip()
             
             # 1. Skip Code Blocks
@@ -40,9 +45,11 @@ class ScenarioProcessor:
             # 2. Header Detection (Start of a new logical block)
             header_match = re.match(r'^(#{1,6})\s+(.*)', line)
             if header_match:
-                # Save previous question if valid
+                # Emit previous question if valid
                 if current_question:
-                    questions.append(current_question)
+                    question = self._finalize_question(current_question)
+                    if question:
+                        yield question
                     current_question = None
                 
                 header_text = header_match.group(2).strip()
@@ -69,34 +76,34 @@ class ScenarioProcessor:
                 # Stop if empty line? No, allow empty lines.
                 # Stop at next header is handled by step 2.
 
-        # Append last one
+        # Emit last one
         if current_question:
-            questions.append(current_question)
-            
-        # Filter: Only keep items that are questions or have question-like fields
-        final_questions = []
-        for q in questions:
-            # Construct full query
-            # Priority: Header text if it's a question, otherwise join context
-            full_text = q['text']
-            if q.get('context'):
-                full_text += " " + " ".join(q['context'])
-            
-            # Simple heuristic to decide if it's worth asking
-            # 1. Header has '?'
-            # 2. Or explicit "Question/问题" field found (implied by context presence if we strictly filtered fields)
-            # Let's be permissive: if header looks like question OR we found context fields.
-            is_valid = ('?' in q['text'] or '？' in q['text'] or q.get('context'))
-            
-            if is_valid:
-                # Store the FULL enriched text for retrieval, but keep line_index of the header
-                final_questions.append({
-                    "line_index": q['line_index'],
-                    "text": full_text
-                })
-                logger.info(f"Extracted Question at {q['line_index']}: {full_text[:50]}...")
+            question = self._finalize_question(current_question)
+            if question:
+                yield question
+
+    def _finalize_question(self, q: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """Build the retrieval text of a scanned block, or None if it is not worth asking."""
+        # Construct full query
+        # Priority: Header text if it's a question, otherwise join context
+        full_text = q['text']
+        if q.get('context'):
+            full_text += " " + " ".join(q['context'])
         
-        return final_questions
+        # Simple heuristic to decide if it's worth asking
+        # 1. Header has '?'
+        # 2. Or explicit "Question/问题" field found (implied by context presence if we strictly filtered fields)
+        # Let's be permissive: if header looks like question OR we found context fields.
+        is_valid = ('?' in q['text'] or '？' in q['text'] or q.get('context'))
+        if not is_valid:
+            return None
+        
+        # Store the FULL enriched text for retrieval, but keep line_index of the header
+        logger.info(f"Extracted Question at {q['line_index']}: {full_text[:50]}...")
+        return {
+            "line_index": q['line_index'],
+            "text": full_text
+        }
 
     def retrieve_rag_suggestion(self, query: str, dataset_id: str = "") -> Dict[str, Any]:
         """Atomic Tool: Retrieve a single suggestion.
@@ -199,11 +206,7 @@ class ScenarioProcessor:
         }
 
     def apply_suggestions(self, doc_path: str, suggestions_map: Dict[Union[int, str], str]) -> str:
-        """Atomic Tool: Apply suggestions to the document."""
-        content = ShadowFileManager.read_file(doc_path)
-        lines = content.split('\n')
-        new_lines = []
-        
+        """Atomic Tool: Apply suggestions to the document (streamed through a temp file, constant memory)."""
         # Ensure keys are integers
         int_map = {}
         for k, v in suggestions_map.items():
@@ -212,13 +215,19 @@ class ScenarioProcessor:
             except ValueError:
                 logger.warning(f"Invalid line index in suggestions_map: {k}")
 
+        ShadowFileManager.write_lines(doc_path, self._insert_after_lines(ShadowFileManager.iter_lines(doc_path), int_map))
+        return doc_path
+
+    @staticmethod
+    def _insert_after_lines(lines: Iterable[str], int_map: Dict[int, str]) -> Iterator[str]:
+        # Output matches '\n'.join() over content.split('\n') with each suggestion added after its line
         for idx, line in enumerate(lines):
-            new_lines.append(line)
+            yield line
             if idx in int_map:
-                new_lines.append(int_map[idx])
-        
-        ShadowFileManager.write_file(doc_path, '\n'.join(new_lines))
-        return doc_path
+                if line.endswith('\n'):
+                    yield int_map[idx] + '\n'
+                else:
+                    yield '\n' + int_map[idx]
 
     def process_clarification_suggestions(self, doc_path: str, dataset_id: str) -> Dict[str, Any]:
         """
@@ -98,6 +98,18 @@ class TestDecoupledToolsUnit(unittest.TestCase):
             content = f.read()
             self.assertIn("RAG is cool", content)
 
+    def test_apply_suggestions_streams_in_place(self):
+        """Suggestions are inserted after their lines; the rest of the file is untouched."""
+        doc_path = os.path.join(self.test_dir, "test_apply.md")
+        with open(doc_path, "w", encoding="utf-8", newline="") as f:
+            f.write("## Q1?\r\ntext\n## Q2?")
+
+        scenario_processor.apply_suggestions(doc_path, {"0": "> S1", "2": "> S2"})
+
+        with open(doc_path, "r", encoding="utf-8", newline="") as f:
+            self.assertEqual(f.read(), "## Q1?\r\n> S1\ntext\n## Q2?\n> S2")
+        self.assertEqual(sorted(os.listdir(self.test_dir)), ["test_apply.md", "test_doc.md"])
+
     def test_controller(self):
         self.mock_rag.retrieve_and_answer.return_value = {
             "answer": "Auto answer.",
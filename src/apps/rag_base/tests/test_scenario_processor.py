@@ -1,6 +1,7 @@
 
 import pytest
-from unittest.mock import MagicMock, patch
+from pathlib import Path
+from unittest.mock import MagicMock
 from src.apps.rag_base.core.scenario_processor import ScenarioProcessor
 
 class TestScenarioProcessor:
@@ -8,16 +9,19 @@ class TestScenarioProcessor:
         self.mock_rag_client = MagicMock()
         self.processor = ScenarioProcessor(self.mock_rag_client)
 
-    @patch("src.apps.rag_base.core.shadow_file_manager.ShadowFileManager.create_shadow_copy")
-    @patch("src.apps.rag_base.core.shadow_file_manager.ShadowFileManager.read_file")
-    @patch("src.apps.rag_base.core.shadow_file_manager.ShadowFileManager.write_file")
-    def test_process_suggestions(self, mock_write, mock_read, mock_create):
+    @staticmethod
+    def _doc(tmp_path, content):
+        # Real files: the processor streams the shadow copy with iter_lines / write_lines
+        doc = tmp_path / "doc.md"
+        doc.write_text(content, encoding="utf-8")
+        return str(doc)
+
+    def test_process_suggestions(self, tmp_path):
         # Setup
-        mock_create.return_value = "shadow_path.md"
-        mock_read.return_value = """# Title
+        doc = self._doc(tmp_path, """# Title
 ## What is 6A?
 Some content.
-"""
+""")
         # Mock RAG response
         self.mock_rag_client.retrieve_and_answer.return_value = {
             "answer": "6A is a workflow.",
@@ -26,25 +30,21 @@ Some content.
         }
 
         # Execute
-        result = self.processor.process_clarification_suggestions("doc.md", "kb_id")
+        result = self.processor.process_clarification_suggestions(doc, "")
 
         # Verify
         assert result["status"] == "success"
         
-        # Verify write content
-        args, _ = mock_write.call_args
-        written_content = args[1]
+        # Verify write content (the original is left untouched)
+        written_content = Path(result["shadow_file"]).read_text(encoding="utf-8")
+        assert "AI Suggestion" not in Path(doc).read_text(encoding="utf-8")
         
         assert "> 💡 **AI Suggestion**" in written_content
         assert "6A is a workflow." in written_content
         assert "(Confidence: 0.90)" in written_content
 
-    @patch("src.apps.rag_base.core.shadow_file_manager.ShadowFileManager.create_shadow_copy")
-    @patch("src.apps.rag_base.core.shadow_file_manager.ShadowFileManager.read_file")
-    @patch("src.apps.rag_base.core.shadow_file_manager.ShadowFileManager.write_file")
-    def test_process_low_confidence_skipped(self, mock_write, mock_read, mock_create):
-        mock_create.return_value = "shadow.md"
-        mock_read.return_value = "## Low Conf Question?"
+    def test_process_low_confidence_skipped(self, tmp_path):
+        doc = self._doc(tmp_path, "## Low Conf Question?")
         
         self.mock_rag_client.retrieve_and_answer.return_value = {
             "answer": "Dunno.",
@@ -52,26 +52,22 @@ Some content.
             "references": []
         }
 
-        self.processor.process_clarification_suggestions("doc.md", "")
+        result = self.processor.process_clarification_suggestions(doc, "")
         
-        args, _ = mock_write.call_args
-        written_content = args[1]
+        written_content = Path(result["shadow_file"]).read_text(encoding="utf-8")
+        assert written_content == "## Low Conf Question?"
         # Should NOT contain suggestion
         assert "AI Suggestion" not in written_content
 
-    @patch("src.apps.rag_base.core.shadow_file_manager.ShadowFileManager.create_shadow_copy")
-    @patch("src.apps.rag_base.core.shadow_file_manager.ShadowFileManager.read_file")
-    @patch("src.apps.rag_base.core.shadow_file_manager.ShadowFileManager.write_file")
-    def test_process_with_references_and_codeblocks(self, mock_write, mock_read, mock_create):
-        mock_create.return_value = "shadow_path.md"
-        mock_read.return_value = """# Title
+    def test_process_with_references_and_codeblocks(self, tmp_path):
+        doc = self._doc(tmp_path, """# Title
 ## What is 6A?
 ```python
 # Is this a question?
 print("hello")
 ```
 ## Another Question?
-"""
+""")
         # Mock RAG response side_effect for different inputs
         def side_effect(query):
             if "What is 6A?" in query:
@@ -91,13 +87,12 @@ print("hello")
         self.mock_rag_client.retrieve_and_answer.side_effect = side_effect
 
         # Execute
-        result = self.processor.process_clarification_suggestions("doc.md", "kb_id")
+        result = self.processor.process_clarification_suggestions(doc, "")
 
         # Verify
         assert result["status"] == "success"
         
-        args, _ = mock_write.call_args
-        written_content = args[1]
+        written_content = Path(result["shadow_file"]).read_text(encoding="utf-8")
         
         # Check Reference
         assert "*Sources: doc1.pdf, doc2.txt*" in written_content
@@ -6,6 +6,7 @@ import json
 import logging
 from typing import List, Dict, Optional
 from litellm import completion
+from src.common.context_packer import ContextPacker
 
 # Configure logging
 logger = logging.getLogger(__name__)
@@ -15,6 +16,11 @@ logger.setLevel(logging.INFO)
 # Users should set GEMINI_API_KEY in .env
 MODEL_NAME = "gemini/gemini-2.0-flash-exp"
 
+# Prompt token budgets: whole document for QA generation, relevant spans per question for answering
+GENERATION_CONTEXT_TOKENS = int(os.getenv("RAG_EVAL_GENERATION_TOKENS", "32000"))
+ANSWER_CONTEXT_TOKENS = int(os.getenv("RAG_EVAL_ANSWER_TOKENS", "4000"))
+_context_packer = ContextPacker(budget=GENERATION_CONTEXT_TOKENS)
+
 class LogicError(Exception):
     pass
 
@@ -45,11 +51,10 @@ def generate_qa_pairs(source_path: str, output_path: str, num_pairs: int = 20) -
     except Exception as e:
         raise LogicError(f"Failed to read source file: {e}")
         
-    # Truncate if too long (simple handling for now)
-    # Gemini 2.0 has large context, but let's be safe.
-    if len(content) > 100000:
-        logger.warning("Content too long, truncating to first 100k chars.")
-        content = content[:100000]
+    # Fit the document into the token budget (leading sections first, cut at paragraph boundaries)
+    if _context_packer.count(content) > GENERATION_CONTEXT_TOKENS:
+        logger.warning(f"Content too long, keeping the first {GENERATION_CONTEXT_TOKENS} tokens.")
+        content = _context_packer.pack_text(content, budget=GENERATION_CONTEXT_TOKENS)
 
     prompt = f"""
     你是一个专业的测试工程师。请阅读以下文档内容，生成 {num_pairs} 个高质量的问答对。
@@ -114,20 +119,22 @@ def run_rag_simulation(dataset_path: str, knowledge_base_path: str, output_path:
         
     # Read KB Context
     context = kb_file.read_text(encoding='utf-8')
-    if len(context) > 100000:
-        context = context[:100000] # Simple truncation
+    # Split once into spans small enough for the answer budget; each question gets only the
+    # spans most relevant to it (BM25) within that budget
+    spans = _context_packer.split(context, max_tokens=max(1, ANSWER_CONTEXT_TOKENS // 4)) if _context_packer.count(context) > ANSWER_CONTEXT_TOKENS else [context]
         
     results = []
     
     for idx, row in df.iterrows():
         question = row['question']
         logger.info(f"Processing Q{idx+1}: {question}")
+        question_context = _context_packer.pack(spans, query=str(question), budget=ANSWER_CONTEXT_TOKENS)
         
         prompt = f"""
         基于以下参考资料回答问题。如果资料中没有答案，请说不知道。
         
         参考资料:
-        {context}
+        {question_context}
         
         问题: {question}
         """
@@ -34,5 +34,52 @@ def load_config():
         "RAGFLOW_TOP_K": int(os.getenv("RAGFLOW_TOP_K", "10")),
         "RAGFLOW_SIMILARITY_THRESHOLD": float(os.getenv("RAGFLOW_SIMILARITY_THRESHOLD", "0.2")),
         "RAG_CONFIDENCE_THRESHOLD": float(os.getenv("RAG_CONFIDENCE_THRESHOLD", "0.6")),
+        # Async client connection pool
+        "RAGFLOW_MAX_CONNECTIONS": int(os.getenv("RAGFLOW_MAX_CONNECTIONS", "100")),
+        "RAGFLOW_MAX_KEEPALIVE": int(os.getenv("RAGFLOW_MAX_KEEPALIVE", "20")),
+        "RAGFLOW_KEEPALIVE_EXPIRY": float(os.getenv("RAGFLOW_KEEPALIVE_EXPIRY", "30")),
+        "RAGFLOW_MAX_PER_HOST": int(os.getenv("RAGFLOW_MAX_PER_HOST", "10")),
+        # Time budget (seconds) for one MCP tool call, shared by every RAGFlow request it makes; 0 = unbounded
+        "RAG_TOOL_DEADLINE": float(os.getenv("RAG_TOOL_DEADLINE", "300")),
+        # Adaptive concurrency limit (AIMD, per endpoint) + circuit breaker
+        "RAGFLOW_LIMIT_INITIAL": int(os.getenv("RAGFLOW_LIMIT_INITIAL", "10")),
+        "RAGFLOW_LIMIT_MIN": int(os.getenv("RAGFLOW_LIMIT_MIN", "1")),
+        "RAGFLOW_LIMIT_MAX": int(os.getenv("RAGFLOW_LIMIT_MAX", "64")),
+        "RAGFLOW_LATENCY_TARGET": float(os.getenv("RAGFLOW_LATENCY_TARGET", "30")),
+        "RAGFLOW_BREAKER_FAILURES": int(os.getenv("RAGFLOW_BREAKER_FAILURES", "5")),
+        "RAGFLOW_BREAKER_RESET": float(os.getenv("RAGFLOW_BREAKER_RESET", "30")),
+        # agentic_search hedging: off / parallel / delayed (RAG_HEDGE_DELAY 0 = p90 of strict-query latency)
+        "RAG_HEDGE_MODE": os.getenv("RAG_HEDGE_MODE", "off").lower(),
+        "RAG_HEDGE_DELAY": float(os.getenv("RAG_HEDGE_DELAY", "0")),
+        # fill_clarification_suggestions: queries per batched rewrite call, search workers and queue bound between stages
+        "RAG_REWRITE_BATCH_SIZE": int(os.getenv("RAG_REWRITE_BATCH_SIZE", "50")),
+        "RAG_SEARCH_CONCURRENCY": int(os.getenv("RAG_SEARCH_CONCURRENCY", "4")),
+        "RAG_PIPELINE_QUEUE_SIZE": int(os.getenv("RAG_PIPELINE_QUEUE_SIZE", "8")),
+        # Sidecar .<doc>.answers.json: reuse answers of unchanged questions while the datasets are unchanged
+        "RAG_ANSWER_MANIFEST_ENABLED": os.getenv("RAG_ANSWER_MANIFEST_ENABLED", "true").lower() in ("1", "true", "yes"),
+        # Query rewriting tiers: queries up to N chars skip the LLM (0 = off); LLM rewrites cached (sqlite tier in RAG_CACHE_DIR)
+        "RAG_REWRITE_FAST_PATH_CHARS": int(os.getenv("RAG_REWRITE_FAST_PATH_CHARS", "32")),
+        "RAG_REWRITE_CACHE_ENABLED": os.getenv("RAG_REWRITE_CACHE_ENABLED", "true").lower() in ("1", "true", "yes"),
+        "RAG_REWRITE_CACHE_MAX_ENTRIES": int(os.getenv("RAG_REWRITE_CACHE_MAX_ENTRIES", "2048")),
+        # Token budget for document / chunk context in LLM prompts (synthesis, evolution)
+        "RAG_CONTEXT_BUDGET": int(os.getenv("RAG_CONTEXT_BUDGET", "3000")),
+        # Evolution prompts: number of best matching scheme sections (BM25) sent per decision
+        "RAG_EVOLUTION_TOP_K": int(os.getenv("RAG_EVOLUTION_TOP_K", "3")),
+        # Retrieved chunk post-processing: MinHash near-duplicate removal + MMR re-ranking
+        "RAG_MMR_ENABLED": os.getenv("RAG_MMR_ENABLED", "true").lower() in ("1", "true", "yes"),
+        "RAG_MMR_TOP_N": int(os.getenv("RAG_MMR_TOP_N", "8")),
+        "RAG_MMR_LAMBDA": float(os.getenv("RAG_MMR_LAMBDA", "0.7")),
+        "RAG_DEDUP_THRESHOLD": float(os.getenv("RAG_DEDUP_THRESHOLD", "0.85")),
+        # Bulk upload: parallel upload streams, documents per parse request, parse status poll interval (seconds)
+        "RAG_UPLOAD_CONCURRENCY": int(os.getenv("RAG_UPLOAD_CONCURRENCY", "4")),
+        "RAG_PARSE_BATCH_SIZE": int(os.getenv("RAG_PARSE_BATCH_SIZE", "32")),
+        "RAG_PARSE_POLL_INTERVAL": float(os.getenv("RAG_PARSE_POLL_INTERVAL", "5")),
+        # Retrieval cache (memory LRU + optional sqlite store in RAG_CACHE_DIR)
+        "RAG_CACHE_ENABLED": os.getenv("RAG_CACHE_ENABLED", "true").lower() in ("1", "true", "yes"),
+        "RAG_CACHE_MAX_ENTRIES": int(os.getenv("RAG_CACHE_MAX_ENTRIES", "1024")),
+        "RAG_CACHE_TTL": float(os.getenv("RAG_CACHE_TTL", "3600")),
+        "RAG_CACHE_DIR": os.getenv("RAG_CACHE_DIR", ""),
+        "RAG_CACHE_DISK_MAX_ENTRIES": int(os.getenv("RAG_CACHE_DISK_MAX_ENTRIES", "10000")),
+        "RAG_CACHE_VERSION_TTL": float(os.getenv("RAG_CACHE_VERSION_TTL", "60")),
         "LOG_LEVEL": common_conf.get("log_level", "INFO")
     }
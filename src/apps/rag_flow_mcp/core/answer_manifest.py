@@ -0,0 +1,76 @@
+import os
+import re
+import json
+import time
+import hashlib
+import logging
+from typing import Dict, Any, Iterable, Optional
+
+logger = logging.getLogger(__name__)
+
+# The question number is left out of the hash so renumbering a document does not invalidate its answers
+_QUESTION_NUMBER = re.compile(r'^(##\s+)\d+\.')
+
+def question_hash(context: str, block: str) -> str:
+    """Content hash of a question block (AI block already stripped) plus the context it is searched with."""
+    normalized = _QUESTION_NUMBER.sub(r'\1', block.strip())
+    return hashlib.sha256(f"{context}\n{normalized}".encode("utf-8")).hexdigest()
+
+class AnswerManifest:
+    """
+    答案清单 (Answer Manifest)
+
+    每个澄清文档旁的隐藏 JSON 文件，按问题内容哈希记录：数据集版本、检索结果以及校验结论。
+    再次运行时，内容未变、数据集版本一致且通过校验的问题直接复用上次结果，其余问题重新请求 RAG。
+    """
+
+    def __init__(self, file_service: Any, path: str):
+        self.file_service = file_service
+        self.path = path
+        self.entries: Dict[str, Dict[str, Any]] = {}
+        if file_service.exists(path):
+            try:
+                data = json.loads(file_service.read_text(path))
+                self.entries = data.get("questions", {}) if isinstance(data, dict) else {}
+            except (OSError, TypeError, ValueError) as e:
+                logger.warning(f"Ignoring unreadable answer manifest {path}: {e}")
+
+    @staticmethod
+    def default_path(doc_path: str) -> str:
+        directory, name = os.path.split(doc_path)
+        return os.path.join(directory, f".{name}.answers.json")
+
+    def lookup(self, key: str, dataset_version: Optional[str]) -> Optional[Dict[str, Any]]:
+        """
+        The recorded answer, if the question is unchanged, the datasets have not moved since
+        and the answer passed verification. Failed / low-confidence entries are kept for
+        reference but never reused, so the next run asks RAG again.
+        """
+        entry = self.entries.get(key)
+        if entry is None or dataset_version is None or entry.get("dataset_version") != dataset_version:
+            return None
+        if not entry.get("valid"):
+            return None
+        return entry
+
+    def record(self, key: str, question_id: str, dataset_version: Optional[str],
+               result: Dict[str, Any], is_valid: bool, reason: str) -> None:
+        self.entries[key] = {
+            "id": question_id,
+            "dataset_version": dataset_version,
+            "answer": result,
+            "valid": is_valid,
+            "reason": reason,
+            "updated_at": time.time()
+        }
+
+    def retain(self, keys: Iterable[str]) -> None:
+        """Drop entries of questions that are no longer in the document."""
+        keep = set(keys)
+        self.entries = {k: e for k, e in self.entries.items() if k in keep}
+
+    def save(self) -> None:
+        try:
+            self.file_service.write_json(self.path, {"questions": self.entries})
+        except (OSError, TypeError, ValueError) as e:
+            logger.warning(f"Failed to save answer manifest {self.path}: {e}")
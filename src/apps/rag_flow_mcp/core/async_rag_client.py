@@ -0,0 +1,706 @@
+import time
+import asyncio
+import logging
+from typing import Dict, Any, List, Optional, Callable, Awaitable, Iterable, AsyncIterator
+from urllib.parse import urlsplit
+
+import httpx
+
+from src.apps.rag_flow_mcp.core.rag_client import (
+    _chat_payload,
+    _llm_messages,
+    _retrieval_payload,
+    _normalize_chunks,
+    _llm_content,
+    _parse_chat_answer,
+    _compose_agentic_answer,
+    _strict_query,
+    _ERROR_CITATIONS,
+    _parse_sse_line,
+    _stream_event_parts,
+    _stream_result,
+    _stream_error,
+    _degraded_answer,
+    _degraded_chunks,
+    _needs_broad_query,
+    _deadline_answer,
+    _GLOBAL_CTX_PACKER,
+    _MultipartFile,
+)
+from src.apps.rag_flow_mcp.core.retrieval_cache import RetrievalCache, dataset_fingerprint, chat_dataset_ids
+from src.apps.rag_flow_mcp.core.single_flight import AsyncSingleFlight, flight_key
+from src.apps.rag_flow_mcp.core.resilience import Resilience, CircuitOpenError
+from src.apps.rag_flow_mcp.core import deadline
+from src.apps.rag_flow_mcp.core.pagination import aiter_pages
+from src.apps.rag_flow_mcp.core.hedging import (
+    HEDGE_MODES, LOW_CONFIDENCE, LatencyTracker, HedgeStats, hedge_delay, pick_better
+)
+
+logger = logging.getLogger(__name__)
+
+class AsyncRAGClient:
+    """
+    异步 RAGFlow 客户端 (Async RAG Client)
+
+    与 RAGClient 方法一致，但基于 httpx.AsyncClient：
+    - 连接池有上限 (max_connections)，并复用 keep-alive 连接。
+    - 每个 host 的并发请求数由 max_per_host 限制。
+    - 调用方可以 await 多个请求并发执行，而不占用线程。
+    """
+
+    def __init__(
+        self,
+        api_key: str,
+        base_url: str,
+        chat_id: str = "",
+        timeout: int = 120,
+        top_k: int = 10,
+        similarity_threshold: float = 0.2,
+        max_connections: int = 100,
+        max_keepalive_connections: int = 20,
+        keepalive_expiry: float = 30.0,
+        max_per_host: int = 10,
+        cache: Optional[RetrievalCache] = None,
+        coalesce: bool = True,
+        resilience: Optional[Resilience] = None,
+        hedge_mode: str = "off",
+        hedge_delay: float = 0.0
+    ):
+        self.api_key = api_key
+        self.base_url = base_url.rstrip('/')
+        self.chat_id = chat_id
+        self.timeout = timeout
+        self.top_k = top_k
+        self.similarity_threshold = similarity_threshold
+        self.limits = httpx.Limits(
+            max_connections=max_connections,
+            max_keepalive_connections=max_keepalive_connections,
+            keepalive_expiry=keepalive_expiry
+        )
+        self.max_per_host = max_per_host
+        self.cache = cache
+        # Concurrent identical retrieval / chat / LLM requests share one upstream call
+        self.single_flight = AsyncSingleFlight() if coalesce else None
+        # Per-endpoint adaptive concurrency limit + circuit breaker (shared per RAGFlow host by default)
+        self.resilience = resilience or Resilience.shared({"RAGFLOW_HOST": self.base_url})
+        # agentic_search hedging: "off" | "parallel" | "delayed" (hedge_delay 0 = p90 of strict queries)
+        if hedge_mode not in HEDGE_MODES:
+            raise ValueError(f"hedge_mode must be one of {HEDGE_MODES}, got '{hedge_mode}'")
+        self.hedge_mode = hedge_mode
+        self.hedge_delay = hedge_delay
+        self.hedge_stats = HedgeStats()
+        self.strict_latency = LatencyTracker()
+
+        # Created lazily so the client can be constructed outside of a running event loop
+        self._client: Optional[httpx.AsyncClient] = None
+        self._host_semaphores: Dict[str, asyncio.Semaphore] = {}
+
+        logger.info(f"AsyncRAGClient initialized with Base URL: {self.base_url}, Chat ID: {self.chat_id}, Timeout: {self.timeout}s")
+        logger.info(f"Connection Pool: max={max_connections}, keepalive={max_keepalive_connections}, per_host={max_per_host}")
+
+    @property
+    def client(self) -> httpx.AsyncClient:
+        if self._client is None or self._client.is_closed:
+            self._client = httpx.AsyncClient(
+                limits=self.limits,
+                timeout=self.timeout,
+                # Disable proxy usage to ensure local/LAN connections work reliably
+                trust_env=False
+            )
+        return self._client
+
+    async def aclose(self) -> None:
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    async def __aenter__(self) -> "AsyncRAGClient":
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb) -> None:
+        await self.aclose()
+
+    def _headers(self, json_body: bool = False) -> Dict[str, str]:
+        headers = {"Authorization": f"Bearer {self.api_key}"}
+        if json_body:
+            headers["Content-Type"] = "application/json"
+        return headers
+
+    def _host_semaphore(self, url: str) -> asyncio.Semaphore:
+        host = urlsplit(url).netloc
+        if host not in self._host_semaphores:
+            self._host_semaphores[host] = asyncio.Semaphore(self.max_per_host)
+        return self._host_semaphores[host]
+
+    async def _request(self, method: str, url: str, endpoint: str = "", **kwargs) -> httpx.Response:
+        """endpoint: resilience group ("chat" / "retrieval" / "documents"); empty = unguarded."""
+        kwargs.setdefault("timeout", deadline.timeout_for(self.timeout))
+        if not endpoint:
+            async with self._host_semaphore(url):
+                return await self.client.request(method, url, **kwargs)
+        async with self.resilience.guard_async(endpoint) as outcome:
+            async with self._host_semaphore(url):
+                resp = await self.client.request(method, url, **kwargs)
+            Resilience.record(outcome, resp.status_code)
+            return resp
+
+    async def _coalesce(self, key_parts: tuple, fn: Callable[[], Awaitable[Any]]) -> Any:
+        if self.single_flight is None:
+            return await fn()
+        return await self.single_flight.do(flight_key(self.base_url, *key_parts), fn)
+
+    def _handle_response(self, response: httpx.Response) -> Dict[str, Any]:
+        try:
+            data = response.json()
+            if response.status_code >= 400 or data.get("code", 0) != 0:
+                logger.error(f"RAGFlow API Error: {response.status_code} - {data}")
+                return {"status": "error", "message": data.get("message", "Unknown error"), "code": data.get("code")}
+            return {"status": "success", "data": data.get("data", data)}
+        except Exception as e:
+            logger.error(f"Failed to parse response: {e}, Content: {response.text}")
+            return {"status": "error", "message": f"Response parsing failed: {str(e)}"}
+
+    # --- Retrieval Cache ---
+
+    def _forget_version(self, dataset_id: str) -> None:
+        # The dataset changed through this client; force a re-probe on the next lookup
+        if self.cache is not None:
+            self.cache.invalidate(dataset_id)
+
+    async def _dataset_version(self, dataset_ids: List[str]) -> Optional[str]:
+        if not dataset_ids:
+            # Without explicit datasets the answer depends on the chat assistant's own datasets
+            dataset_ids = await self._chat_dataset_ids()
+            if not dataset_ids:
+                return None
+        versions = []
+        for ds in dataset_ids:
+            version = self.cache.cached_version(ds)
+            if version is None:
+                version = dataset_fingerprint(await self._coalesce(
+                    ("dataset_version", ds),
+                    lambda: self.list_documents(ds, page=1, page_size=1, orderby="update_time")
+                ))
+                if version is None:
+                    return None
+                self.cache.remember_version(ds, version)
+            versions.append(f"{ds}={version}")
+        return "|".join(versions)
+
+    async def _chat_dataset_ids(self) -> Optional[List[str]]:
+        if not self.chat_id:
+            return None
+        key = f"chat:{self.chat_id}"
+        remembered = self.cache.cached_version(key)
+        if remembered is not None:
+            return remembered.split(",") if remembered else []
+        ids = chat_dataset_ids(await self._coalesce(("chat_datasets", self.chat_id), self.get_chat))
+        if ids is not None:
+            self.cache.remember_version(key, ",".join(ids))
+        return ids
+
+    async def _cached(self, kind: str, query: str, dataset_ids: List[str], params: Dict[str, Any],
+                      fetch: Callable[[], Awaitable[Dict[str, Any]]], is_ok: Callable[[Dict[str, Any]], bool]) -> Dict[str, Any]:
+        if self.cache is None:
+            return await fetch()
+
+        key = RetrievalCache.make_key(kind, query, dataset_ids, params)
+        version = await self._dataset_version(dataset_ids)
+        if version is not None:
+            cached = self.cache.get(key, version)
+            if cached is not None:
+                logger.info(f"Retrieval cache hit ({kind}): {query[:50]}")
+                return cached
+
+        result = await fetch()
+        if version is not None and is_ok(result):
+            self.cache.set(key, result, version)
+        return self._stale_fallback(key, kind, result)
+
+    def _stale_fallback(self, key: str, kind: str, result: Dict[str, Any]) -> Dict[str, Any]:
+        # While the circuit is open, an outdated answer beats no answer
+        if not result.get("degraded"):
+            return result
+        stale = self.cache.get_stale(key)
+        if stale is None:
+            return result
+        logger.warning(f"Serving stale cached result ({kind}) while RAGFlow is unavailable")
+        stale["stale"] = True
+        return stale
+
+    # --- Dataset Operations ---
+
+    async def create_dataset(self, name: str, avatar: str = "", description: str = "") -> Dict[str, Any]:
+        url = f"{self.base_url}/api/v1/datasets"
+        payload = {
+            "name": name,
+            "avatar": avatar,
+            "description": description,
+            "permission": "me",
+            "document_count": 0,
+            "chunk_count": 0,
+            "parse_method": "general"
+        }
+        logger.info(f"Creating dataset: {name}")
+        resp = await self._request("POST", url, headers=self._headers(), json=payload)
+        return self._handle_response(resp)
+
+    async def delete_dataset(self, dataset_id: str) -> Dict[str, Any]:
+        url = f"{self.base_url}/api/v1/datasets/{dataset_id}"
+        logger.info(f"Deleting dataset: {dataset_id}")
+        resp = await self._request("DELETE", url, headers=self._headers())
+        return self._handle_response(resp)
+
+    async def update_dataset(self, dataset_id: str, name: str = None, description: str = None) -> Dict[str, Any]:
+        url = f"{self.base_url}/api/v1/datasets/{dataset_id}"
+        payload = {}
+        if name: payload["name"] = name
+        if description: payload["description"] = description
+
+        logger.info(f"Updating dataset: {dataset_id}")
+        resp = await self._request("PUT", url, headers=self._headers(), json=payload)
+        return self._handle_response(resp)
+
+    # --- Document Operations ---
+
+    async def delete_document(self, dataset_id: str, document_id: str) -> Dict[str, Any]:
+        url = f"{self.base_url}/api/v1/datasets/{dataset_id}/documents/{document_id}"
+        logger.info(f"Deleting document: {document_id}")
+        self._forget_version(dataset_id)
+        resp = await self._request("DELETE", url, headers=self._headers())
+        return self._handle_response(resp)
+
+    async def update_document(self, dataset_id: str, document_id: str, name: str = None, enabled: bool = None) -> Dict[str, Any]:
+        url = f"{self.base_url}/api/v1/datasets/{dataset_id}/documents/{document_id}"
+        payload = {}
+        if name: payload["name"] = name
+        if enabled is not None: payload["run_status"] = "1" if enabled else "0"
+
+        logger.info(f"Updating document {document_id}: {payload}")
+        self._forget_version(dataset_id)
+        resp = await self._request("PUT", url, headers=self._headers(), json=payload)
+        return self._handle_response(resp)
+
+    async def get_document_content(self, dataset_id: str, document_id: str, page: Optional[int] = None, page_size: Optional[int] = None) -> Dict[str, Any]:
+        url = f"{self.base_url}/api/v1/datasets/{dataset_id}/documents/{document_id}/chunks"
+        params = {"page": page, "page_size": page_size or 30} if page is not None else None
+        logger.info(f"Getting chunks for {document_id}")
+        resp = await self._request("GET", url, headers=self._headers(), params=params)
+        return self._handle_response(resp)
+
+    # --- Paginated Iterators (see RAGClient.iter_datasets) ---
+
+    def iter_datasets(self, page_size: int = 100, fields: Optional[List[str]] = None, start_page: int = 1) -> AsyncIterator[Dict[str, Any]]:
+        return aiter_pages(lambda p, ps: self.list_datasets(p, ps), "datasets", page_size, fields, start_page)
+
+    def iter_documents(self, dataset_id: str, page_size: int = 100, keywords: str = "", fields: Optional[List[str]] = None, start_page: int = 1) -> AsyncIterator[Dict[str, Any]]:
+        return aiter_pages(lambda p, ps: self.list_documents(dataset_id, p, ps, keywords), "docs", page_size, fields, start_page)
+
+    def iter_chunks(self, dataset_id: str, document_id: str, page_size: int = 100, fields: Optional[List[str]] = None, start_page: int = 1) -> AsyncIterator[Dict[str, Any]]:
+        return aiter_pages(lambda p, ps: self.get_document_content(dataset_id, document_id, p, ps), "chunks", page_size, fields, start_page)
+
+    # --- LLM Operations ---
+
+    async def call_llm(self, system_prompt: str, user_prompt: str) -> str:
+        """
+        Call LLM using RAGFlow Chat API (Simulating LLM call).
+        """
+        return await self._coalesce(
+            ("call_llm", self.chat_id, system_prompt, user_prompt),
+            lambda: self._call_llm(system_prompt, user_prompt)
+        )
+
+    async def _call_llm(self, system_prompt: str, user_prompt: str) -> str:
+        if not self.chat_id:
+            logger.warning("RAGFLOW_CHAT_ID not configured. Cannot call LLM.")
+            return ""
+
+        url = f"{self.base_url}/api/v1/chats_openai/{self.chat_id}/chat/completions"
+        payload = _chat_payload(_llm_messages(system_prompt, user_prompt), quote=False)
+
+        try:
+            logger.info(f"Calling LLM...")
+            resp = await self._request("POST", url, endpoint="chat", headers=self._headers(json_body=True), json=payload)
+            if resp.status_code == 200:
+                content = _llm_content(resp.json())
+                if content:
+                    return content
+            logger.error(f"LLM Call Failed: {resp.status_code} - {resp.text}")
+            return ""
+        except Exception as e:
+            logger.error(f"LLM Connection Error: {e}")
+            return ""
+
+    async def stream_chat_completion(self, messages: List[Dict[str, str]], quote: bool = True, dataset_ids: str = "") -> AsyncIterator[Dict[str, Any]]:
+        """
+        Stream a chat completion over SSE.
+        Yields {"type": "delta", "content": str} as tokens arrive, then exactly one
+        {"type": "result", "answer", "citation", "score", "reference"}.
+        """
+        if self.api_key == "mock_key":
+            mock = self._mock_response(messages[-1]["content"])
+            yield {"type": "delta", "content": mock["answer"]}
+            yield {"type": "result", **mock, "reference": []}
+            return
+
+        if not self.chat_id:
+            yield _stream_error("Error: RAGFLOW_CHAT_ID is not configured.", "Config Error")
+            return
+
+        url = f"{self.base_url}/api/v1/chats_openai/{self.chat_id}/chat/completions"
+        payload = _chat_payload(messages, quote=quote, dataset_ids=dataset_ids, stream=True)
+
+        parts: List[str] = []
+        reference = None
+        try:
+            logger.info(f"Streaming chat completion: {url}")
+            async with self.resilience.guard_async("chat") as outcome, self._host_semaphore(url):
+                async with self.client.stream("POST", url, headers=self._headers(json_body=True), json=payload,
+                                              timeout=deadline.timeout_for(self.timeout)) as resp:
+                    Resilience.record(outcome, resp.status_code)
+                    if resp.status_code != 200:
+                        body = (await resp.aread()).decode("utf-8", errors="replace")
+                        logger.error(f"RAGFlow Stream Error: {resp.status_code} - {body}")
+                        yield _stream_error(f"Error: RAGFlow returned {resp.status_code} - {body[:200]}", "API Error")
+                        return
+                    async for line in resp.aiter_lines():
+                        event = _parse_sse_line(line)
+                        if event is None:
+                            continue
+                        content, ref = _stream_event_parts(event)
+                        if ref:
+                            reference = ref
+                        if content:
+                            parts.append(content)
+                            yield {"type": "delta", "content": content}
+        except CircuitOpenError as e:
+            yield {"type": "result", **_degraded_answer(e), "reference": []}
+            return
+        except Exception as e:
+            logger.error(f"RAG Stream Connection Error: {e}")
+            yield _stream_error(f"Connection Error: {str(e)}", "System Error")
+            return
+
+        yield _stream_result("".join(parts), reference)
+
+    async def call_llm_stream(self, system_prompt: str, user_prompt: str) -> AsyncIterator[str]:
+        """Streaming variant of call_llm: yields text deltas as they are generated."""
+        async for event in self.stream_chat_completion(_llm_messages(system_prompt, user_prompt), quote=False):
+            if event["type"] == "delta":
+                yield event["content"]
+            elif event["citation"] in _ERROR_CITATIONS:
+                logger.error(f"LLM Stream Failed: {event['answer']}")
+
+    def retrieve_and_answer_stream(self, query: str, dataset_ids: str = "") -> AsyncIterator[Dict[str, Any]]:
+        """Streaming variant of retrieve_and_answer (see stream_chat_completion for the event format)."""
+        return self.stream_chat_completion([{"role": "user", "content": query}], quote=True, dataset_ids=dataset_ids)
+
+    def refine_query(self, global_ctx: str, local_ctx: str, question: str) -> str:
+        """
+        [DEPRECATED] Use agentic_search instead.
+        """
+        truncated_global = _GLOBAL_CTX_PACKER.pack_text(global_ctx, query=f"{local_ctx}\n{question}")
+        return (
+            f"Background Context: {truncated_global}\n"
+            f"Specific Scenario: {local_ctx}\n"
+            f"Question: {question}"
+        )
+
+    async def agentic_search(self, global_ctx: str, local_ctx: str, question: str, dataset_ids: str = "") -> Dict[str, Any]:
+        """
+        Async version of RAGClient.agentic_search (strict query first, broad query on low confidence).
+        """
+        keywords = f"{local_ctx} {question}"
+
+        if self.hedge_mode == "off":
+            result, hedged = await self.retrieve_and_answer(_strict_query(question), dataset_ids), False
+        else:
+            result, hedged = await self._hedged_search(_strict_query(question), question, dataset_ids)
+
+        if not hedged and _needs_broad_query(result):
+            logger.info(f"Low confidence ({result['score']}) for '{keywords}'. Retrying with broader query...")
+            result_retry = await self.retrieve_and_answer(question, dataset_ids)
+            if result_retry["score"] > result["score"]:
+                result = result_retry
+
+        return _compose_agentic_answer(result, global_ctx, question)
+
+    async def _hedged_search(self, strict_query: str, question: str, dataset_ids: str):
+        """
+        Async version of RAGClient._hedged_search; the losing request is cancelled.
+        Returns (result, hedged). Every wait is bounded by the remaining deadline.
+        """
+        may_hedge = lambda: not deadline.expired() and not self.resilience.is_open("chat")
+
+        started = time.monotonic()
+        strict_task = asyncio.ensure_future(self.retrieve_and_answer(strict_query, dataset_ids))
+        broad_task = None
+        if self.hedge_mode == "parallel" and may_hedge():
+            broad_task = asyncio.ensure_future(self.retrieve_and_answer(question, dataset_ids))
+        elif self.hedge_mode == "delayed":
+            delay = hedge_delay(self.hedge_delay, self.strict_latency)
+            left = deadline.remaining()
+            done, _ = await asyncio.wait({strict_task}, timeout=delay if left is None else min(delay, left))
+            if not done and may_hedge():
+                logger.info(f"Strict query slower than hedge delay, sending broad query: {question[:50]}")
+                broad_task = asyncio.ensure_future(self.retrieve_and_answer(question, dataset_ids))
+
+        try:
+            # wait_for cancels the strict task when the budget runs out
+            result = await asyncio.wait_for(strict_task, deadline.remaining())
+        except asyncio.TimeoutError:
+            if broad_task is not None and broad_task.done() and not broad_task.cancelled() and broad_task.exception() is None:
+                return broad_task.result(), True
+            if broad_task is not None:
+                broad_task.cancel()
+            logger.warning(f"Deadline exceeded while waiting for the strict query: {question[:50]}")
+            return _deadline_answer(), True
+        except BaseException:
+            if broad_task is not None:
+                broad_task.cancel()
+            raise
+        self.strict_latency.record(time.monotonic() - started)
+
+        if broad_task is None:
+            self.hedge_stats.incr("not_hedged")
+            return result, False
+
+        self.hedge_stats.incr("hedged")
+        if result["score"] >= LOW_CONFIDENCE:
+            broad_task.cancel()
+            self.hedge_stats.incr("wasted")
+            return result, True
+
+        try:
+            broad = await asyncio.wait_for(broad_task, deadline.remaining())
+        except asyncio.TimeoutError:
+            # Out of time: the strict answer is all we have
+            self.hedge_stats.incr("lost")
+            return result, True
+        better = pick_better(result, broad)
+        self.hedge_stats.incr("won" if better is not result else "lost")
+        return better, True
+
+    async def retrieve_and_answer(self, query: str, dataset_ids: str = "") -> Dict[str, Any]:
+        """
+        Call RAGFlow API to get an answer.
+        Returns dict with 'answer', 'citation', 'score'.
+        """
+        if self.api_key == "mock_key":
+            return self._mock_response(query)
+
+        ids_list = [d for d in dataset_ids.split(",") if d] if dataset_ids else []
+        return await self._coalesce(
+            ("retrieve_and_answer", self.chat_id, query, dataset_ids),
+            lambda: self._cached(
+                "retrieve_and_answer", query, ids_list, {"chat_id": self.chat_id},
+                lambda: self._retrieve_and_answer(query, dataset_ids),
+                lambda r: r.get("citation") not in _ERROR_CITATIONS
+            )
+        )
+
+    async def _retrieve_and_answer(self, query: str, dataset_ids: str = "") -> Dict[str, Any]:
+        try:
+            if not self.chat_id:
+                return {
+                    "answer": "Error: RAGFLOW_CHAT_ID is not configured.",
+                    "citation": "Config Error",
+                    "score": 0.0
+                }
+
+            url = f"{self.base_url}/api/v1/chats_openai/{self.chat_id}/chat/completions"
+            payload = _chat_payload([{"role": "user", "content": query}], quote=True, dataset_ids=dataset_ids)
+
+            logger.info(f"Sending request to RAGFlow: {url}")
+            resp = await self._request("POST", url, endpoint="chat", headers=self._headers(json_body=True), json=payload)
+
+            if resp.status_code != 200:
+                logger.error(f"RAGFlow API Error: {resp.status_code} - {resp.text}")
+                return {
+                    "answer": f"Error: RAGFlow returned {resp.status_code} - {resp.text[:200]}",
+                    "citation": "API Error",
+                    "score": 0.0
+                }
+
+            return _parse_chat_answer(resp.json())
+
+        except CircuitOpenError as e:
+            return _degraded_answer(e)
+        except Exception as e:
+            logger.error(f"RAG Connection Error: {e}")
+            return {
+                "answer": f"Connection Error: {str(e)}",
+                "citation": "System Error",
+                "score": 0.0
+            }
+
+    async def list_datasets(self, page: int = 1, page_size: int = 30) -> Dict[str, Any]:
+        """
+        List all knowledge bases (datasets).
+        API: GET /api/v1/datasets
+        """
+        if self.api_key == "mock_key":
+            return {"data": [{"id": "mock_id", "name": "Mock KB"}], "total": 1}
+
+        try:
+            url = f"{self.base_url}/api/v1/datasets"
+            params = {"page": page, "page_size": page_size}
+            logger.info(f"Listing datasets: {url} {params}")
+            resp = await self._request("GET", url, headers=self._headers(), params=params)
+
+            if resp.status_code != 200:
+                logger.error(f"RAGFlow List Datasets Error: {resp.status_code} - {resp.text}")
+                return {"error": f"API Error: {resp.status_code}", "details": resp.text}
+
+            return resp.json()
+
+        except Exception as e:
+            logger.error(f"List Datasets Connection Error: {e}")
+            return {"error": str(e)}
+
+    async def get_chat(self) -> Dict[str, Any]:
+        """
+        Details of the configured chat assistant (including its datasets).
+        API: GET /api/v1/chats?id={chat_id}
+        """
+        if self.api_key == "mock_key":
+            return {"code": 0, "data": [{"id": self.chat_id, "datasets": []}]}
+
+        try:
+            url = f"{self.base_url}/api/v1/chats"
+            params = {"id": self.chat_id, "page": 1, "page_size": 1}
+            resp = await self._request("GET", url, endpoint="chats", headers=self._headers(), params=params)
+
+            if resp.status_code != 200:
+                logger.error(f"RAGFlow Get Chat Error: {resp.status_code} - {resp.text}")
+                return {"error": f"API Error: {resp.status_code}", "details": resp.text}
+
+            return resp.json()
+
+        except Exception as e:
+            logger.error(f"Get Chat Connection Error: {e}")
+            return {"error": str(e)}
+
+    async def list_documents(self, dataset_id: str, page: int = 1, page_size: int = 30, keywords: str = "", orderby: str = "") -> Dict[str, Any]:
+        """
+        List documents in a specific knowledge base.
+        API: GET /api/v1/datasets/{dataset_id}/documents
+        """
+        if self.api_key == "mock_key":
+            return {"data": [{"id": "doc1", "name": "test.pdf"}], "total": 1}
+
+        try:
+            url = f"{self.base_url}/api/v1/datasets/{dataset_id}/documents"
+            params = {"page": page, "page_size": page_size, "keywords": keywords}
+            if orderby:
+                params.update({"orderby": orderby, "desc": "true"})
+            logger.info(f"Listing documents for {dataset_id}: {url} {params}")
+            resp = await self._request("GET", url, endpoint="documents", headers=self._headers(), params=params)
+
+            if resp.status_code != 200:
+                logger.error(f"RAGFlow List Documents Error: {resp.status_code} - {resp.text}")
+                return {"error": f"API Error: {resp.status_code}", "details": resp.text}
+
+            return resp.json()
+
+        except Exception as e:
+            logger.error(f"List Documents Connection Error: {e}")
+            return {"error": str(e)}
+
+    async def upload_document(self, dataset_id: str, file_path: str) -> Dict[str, Any]:
+        """
+        Upload a document to the knowledge base.
+        API: POST /api/v1/datasets/{dataset_id}/documents
+        """
+        if self.api_key == "mock_key":
+            return {"code": 0, "message": "Mock upload success"}
+
+        try:
+            url = f"{self.base_url}/api/v1/datasets/{dataset_id}/documents"
+            logger.info(f"Uploading document to {dataset_id}: {file_path}")
+            self._forget_version(dataset_id)
+
+            # Streamed from disk block by block (Content-Length is known, so no chunked encoding)
+            with _MultipartFile(file_path) as body:
+                headers = dict(self._headers(), **{"Content-Type": body.content_type, "Content-Length": str(len(body))})
+                resp = await self._request("POST", url, endpoint="documents", headers=headers, content=body.aiter_blocks())
+
+            if resp.status_code != 200:
+                logger.error(f"RAGFlow Upload Error: {resp.status_code} - {resp.text}")
+                return {"error": f"API Error: {resp.status_code}", "details": resp.text}
+
+            return resp.json()
+
+        except Exception as e:
+            logger.error(f"Upload Document Connection Error: {e}")
+            return {"error": str(e)}
+
+    async def retrieve_chunks(self, dataset_id: str, query: str, page: int = 1, page_size: int = 30, similarity_threshold: float = 0.2) -> Dict[str, Any]:
+        """
+        Retrieve chunks from a dataset without LLM generation.
+        API: POST /api/v1/retrieval
+        """
+        if self.api_key == "mock_key":
+            return {"data": [{"content_with_weight": "Mock content", "similarity": 0.9}], "total": 1}
+
+        params = {"page": page, "page_size": page_size, "similarity_threshold": similarity_threshold}
+        return await self._coalesce(
+            ("retrieve_chunks", dataset_id, query, params),
+            lambda: self._cached(
+                "retrieve_chunks", query, [dataset_id], params,
+                lambda: self._retrieve_chunks(dataset_id, query, page, page_size, similarity_threshold),
+                lambda r: "error" not in r and r.get("code", 0) == 0
+            )
+        )
+
+    async def _retrieve_chunks(self, dataset_id: str, query: str, page: int, page_size: int, similarity_threshold: float) -> Dict[str, Any]:
+        try:
+            url = f"{self.base_url}/api/v1/retrieval"
+            payload = _retrieval_payload(dataset_id, query, page, page_size, similarity_threshold)
+
+            logger.info(f"Retrieving chunks from {dataset_id}: {url}")
+            resp = await self._request("POST", url, endpoint="retrieval", headers=self._headers(json_body=True), json=payload)
+
+            if resp.status_code == 200:
+                return _normalize_chunks(resp.json())
+
+            logger.error(f"RAGFlow Retrieve Chunks Error: {resp.status_code} - {resp.text}")
+            return {"error": f"API Error: {resp.status_code}", "details": resp.text}
+
+        except CircuitOpenError as e:
+            return _degraded_chunks(e)
+        except Exception as e:
+            logger.error(f"Retrieve Chunks Connection Error: {e}")
+            return {"error": str(e)}
+
+    async def retrieve_chunks_many(self, dataset_id: str, queries: Iterable[str], concurrency: int = 4, page: int = 1, page_size: int = 30, similarity_threshold: float = 0.2) -> AsyncIterator[Dict[str, Any]]:
+        """
+        Retrieve chunks for many queries with at most `concurrency` requests in flight.
+        Yields {"index", "query", "result"} in completion order.
+        """
+        semaphore = asyncio.Semaphore(max(1, concurrency))
+
+        async def run(idx: int, query: str) -> Dict[str, Any]:
+            async with semaphore:
+                try:
+                    result = await self.retrieve_chunks(dataset_id, query, page, page_size, similarity_threshold)
+                except Exception as e:
+                    logger.error(f"Retrieve Chunks failed for query {idx}: {e}")
+                    result = {"error": str(e)}
+            return {"index": idx, "query": query, "result": result}
+
+        tasks = [asyncio.ensure_future(run(i, q)) for i, q in enumerate(queries)]
+        try:
+            for next_done in asyncio.as_completed(tasks):
+                yield await next_done
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    def _mock_response(self, query: str) -> Dict[str, Any]:
+        """Generate a mock response for testing."""
+        return {
+            "answer": f"Based on the knowledge base, here is a suggested answer for: {query[:50]}...",
+            "citation": "Mock Document v1.0, Section 3.2",
+            "score": 0.88
+        }
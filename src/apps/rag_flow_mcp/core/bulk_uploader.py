@@ -0,0 +1,328 @@
+import os
+import glob
+import json
+import hashlib
+import time
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Dict, Any, List, Optional, Tuple
+
+from src.apps.rag_flow_mcp.core import deadline
+from src.apps.rag_flow_mcp.core.pagination import PageError
+
+logger = logging.getLogger(__name__)
+
+# RAGFlow document run states (newer servers return names, older ones the numeric codes)
+_PARSE_DONE = ("DONE", "3")
+_PARSE_FAILED = ("FAIL", "CANCEL", "4", "2")
+
+def collect_files(source: str) -> Tuple[str, List[str]]:
+    """
+    Resolve a directory (walked recursively) or a glob pattern into (root_dir, sorted file paths).
+    Hidden files (e.g. the upload manifest) are skipped.
+    """
+    if os.path.isdir(source):
+        root = os.path.abspath(source)
+        paths = []
+        for dirpath, dirnames, filenames in os.walk(root):
+            dirnames[:] = [d for d in dirnames if not d.startswith(".")]
+            paths.extend(os.path.join(dirpath, f) for f in filenames if not f.startswith("."))
+    else:
+        root = os.path.abspath(os.path.dirname(source.split("*", 1)[0]) or ".")
+        paths = [os.path.abspath(p) for p in glob.glob(source, recursive=True)
+                 if os.path.isfile(p) and not os.path.basename(p).startswith(".")]
+    return root, sorted(paths)
+
+def file_sha256(path: str, block_size: int = 1 << 20) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(block_size), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+def _uploaded_id(result: Dict[str, Any]) -> Optional[str]:
+    # POST /documents returns {"code": 0, "data": [{"id": ...}]}
+    data = result.get("data") if isinstance(result, dict) else None
+    if isinstance(data, list) and data:
+        data = data[0]
+    return data.get("id") if isinstance(data, dict) else None
+
+class UploadManifest:
+    """
+    上传清单 (Upload Manifest)
+
+    记录每个文件的 size / mtime / sha256 / document_id / status，保存在数据目录下的隐藏 JSON 文件中。
+    中断后再次运行时，内容未变化且已上传的文件会被跳过，只补做剩余的上传与解析。
+    status: uploaded -> parsing -> done / failed；upload_failed 的文件下次会重新上传。
+    """
+
+    def __init__(self, path: str, dataset_id: str, save_interval: float = 1.0):
+        self.path = path
+        self.dataset_id = dataset_id
+        self.save_interval = save_interval
+        self._lock = threading.Lock()
+        self._last_save = 0.0
+        self._dirty = False
+        self.files: Dict[str, Dict[str, Any]] = {}
+        if os.path.exists(path):
+            try:
+                with open(path, "r", encoding="utf-8") as f:
+                    data = json.load(f)
+                if data.get("dataset_id") == dataset_id:
+                    self.files = data.get("files", {})
+            except (OSError, ValueError) as e:
+                logger.warning(f"Ignoring unreadable upload manifest {path}: {e}")
+
+    @staticmethod
+    def default_path(root: str, dataset_id: str) -> str:
+        return os.path.join(root, f".ragflow_upload_{dataset_id}.json")
+
+    def is_unchanged(self, rel_path: str, path: str, stat: os.stat_result) -> Tuple[bool, Optional[str]]:
+        """
+        (unchanged, sha256). size + mtime equal -> unchanged without reading the file;
+        otherwise the content hash decides (a touched but identical file is not re-uploaded).
+        """
+        entry = self.files.get(rel_path)
+        if entry is None or entry.get("document_id") is None:
+            return False, None
+        if entry.get("size") == stat.st_size and entry.get("mtime") == stat.st_mtime:
+            return True, entry.get("sha256")
+        sha256 = file_sha256(path)
+        if entry.get("sha256") == sha256:
+            self.update(rel_path, size=stat.st_size, mtime=stat.st_mtime)
+            return True, sha256
+        return False, sha256
+
+    def remove(self, rel_path: str) -> None:
+        with self._lock:
+            self.files.pop(rel_path, None)
+            self._dirty = True
+
+    def update(self, rel_path: str, **fields: Any) -> None:
+        with self._lock:
+            self.files.setdefault(rel_path, {}).update(fields)
+            self._dirty = True
+        self.save(force=False)
+
+    def with_status(self, *statuses: str) -> Dict[str, Dict[str, Any]]:
+        with self._lock:
+            return {p: dict(e) for p, e in self.files.items() if e.get("status") in statuses}
+
+    def save(self, force: bool = True) -> None:
+        with self._lock:
+            if not self._dirty or (not force and time.monotonic() - self._last_save < self.save_interval):
+                return
+            payload = json.dumps({"dataset_id": self.dataset_id, "files": self.files}, ensure_ascii=False, indent=1)
+            self._dirty = False
+            self._last_save = time.monotonic()
+        # Write-then-rename so an interrupted run never leaves a truncated manifest
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.write(payload)
+        os.replace(tmp_path, self.path)
+
+class BulkUploader:
+    """
+    批量上传 (Bulk Uploader)
+
+    1. 以 concurrency 个并行流上传目录 / glob 匹配的文件（文件内容流式读取，不整体载入内存）。
+    2. 每凑满 parse_batch_size 个已上传文档就触发一次解析。
+    3. 轮询文档状态直到全部解析完成 / 失败，或当前工具调用的时间预算用尽。
+    进度写入 UploadManifest；未完成时再次调用同一命令即可从中断处继续。
+    内容变化的文件重新上传后删除旧文档；sync() 还会删除源文件已不存在的文档。
+    """
+
+    def __init__(self, rag_client, dataset_id: str, concurrency: int = 4, parse_batch_size: int = 32,
+                 poll_interval: float = 5.0, manifest_path: Optional[str] = None):
+        self.rag_client = rag_client
+        self.dataset_id = dataset_id
+        self.concurrency = max(1, concurrency)
+        self.parse_batch_size = max(1, parse_batch_size)
+        self.poll_interval = poll_interval
+        self.manifest_path = manifest_path
+
+    def run(self, source: str, parse: bool = True) -> Dict[str, Any]:
+        """Upload new / changed files of `source` (directory or glob) and parse them."""
+        return self._run(source, parse, sync=False)
+
+    def sync(self, folder: str, parse: bool = True, delete_missing: bool = True) -> Dict[str, Any]:
+        """
+        Make the dataset mirror `folder`: like run(), plus documents whose source file is gone
+        are deleted (delete_missing) and documents deleted on the RAGFlow side are uploaded again.
+        """
+        if not os.path.isdir(folder):
+            raise NotADirectoryError(f"Sync source must be a directory: {folder}")
+        return self._run(folder, parse, sync=True, delete_missing=delete_missing)
+
+    def _run(self, source: str, parse: bool, sync: bool, delete_missing: bool = False) -> Dict[str, Any]:
+        root, paths = collect_files(source)
+        manifest = UploadManifest(self.manifest_path or UploadManifest.default_path(root, self.dataset_id), self.dataset_id)
+        summary: Dict[str, Any] = {"files": len(paths), "uploaded": 0, "skipped": 0, "upload_failed": [],
+                                   "replaced": 0, "parsed": 0, "parse_failed": [], "pending": 0, "complete": False,
+                                   "manifest": manifest.path}
+        if sync:
+            summary["deleted"] = 0
+        try:
+            if sync:
+                self._forget_remote_deleted(manifest)
+            self._upload_all(root, paths, manifest, summary, parse)
+            if sync and delete_missing:
+                self._delete_missing(root, paths, manifest, summary)
+            if parse:
+                self._parse_all(manifest, summary)
+        finally:
+            manifest.save()
+
+        not_uploaded = len(paths) - summary["uploaded"] - summary["skipped"] - len(summary["upload_failed"])
+        summary["pending"] += max(0, not_uploaded)
+        summary["complete"] = summary["pending"] == 0 and not summary["upload_failed"]
+        if not summary["complete"]:
+            logger.warning(f"Bulk upload incomplete ({summary['pending']} pending); run again to resume")
+        return summary
+
+    # --- Upload ---
+
+    def _upload_one(self, path: str) -> Dict[str, Any]:
+        return self.rag_client.upload_document(self.dataset_id, path)
+
+    def _upload_all(self, root: str, paths: List[str], manifest: UploadManifest, summary: Dict[str, Any], parse: bool) -> None:
+        todo = []
+        for path in paths:
+            rel_path = os.path.relpath(path, root)
+            stat = os.stat(path)
+            unchanged, sha256 = manifest.is_unchanged(rel_path, path, stat)
+            if unchanged:
+                summary["skipped"] += 1
+            else:
+                todo.append((path, rel_path, stat, sha256))
+        if not todo:
+            return
+
+        logger.info(f"Bulk upload: {len(todo)} file(s) to {self.dataset_id} ({summary['skipped']} unchanged)")
+        batch: List[str] = []
+        replaced: List[str] = []
+        upload = deadline.wrap(self._upload_one)
+        with ThreadPoolExecutor(max_workers=self.concurrency, thread_name_prefix="rag-upload") as executor:
+            futures = {}
+            for path, rel_path, stat, sha256 in todo:
+                if deadline.expired():
+                    break
+                futures[executor.submit(upload, path)] = (path, rel_path, stat, sha256)
+
+            for future in as_completed(futures):
+                path, rel_path, stat, sha256 = futures[future]
+                try:
+                    result = future.result()
+                    doc_id = _uploaded_id(result)
+                    error = None if doc_id else str(result.get("error") or result.get("message") or result)
+                except Exception as e:
+                    doc_id, error = None, str(e)
+
+                if doc_id is None:
+                    logger.error(f"Upload failed for {rel_path}: {error}")
+                    manifest.update(rel_path, status="upload_failed", error=error)
+                    summary["upload_failed"].append({"path": rel_path, "error": error})
+                    continue
+
+                old_doc_id = manifest.files.get(rel_path, {}).get("document_id")
+                if old_doc_id and old_doc_id != doc_id:
+                    # The file changed: the new version supersedes the old document
+                    replaced.append(old_doc_id)
+                manifest.update(rel_path, size=stat.st_size, mtime=stat.st_mtime, sha256=sha256 or file_sha256(path),
+                                document_id=doc_id, status="uploaded", error=None)
+                summary["uploaded"] += 1
+                if parse:
+                    batch.append(rel_path)
+                    if len(batch) >= self.parse_batch_size:
+                        self._trigger_parse(manifest, batch)
+                        batch = []
+        if batch:
+            self._trigger_parse(manifest, batch)
+        if replaced:
+            self._delete_documents(replaced)
+            summary["replaced"] += len(replaced)
+
+    # --- Sync ---
+
+    def _forget_remote_deleted(self, manifest: UploadManifest) -> None:
+        """Documents removed on the RAGFlow side are uploaded again instead of being skipped."""
+        try:
+            remote_ids = {d["id"] for d in self.rag_client.iter_documents(self.dataset_id, fields=["id"]) if "id" in d}
+        except PageError as e:
+            logger.error(f"Could not list remote documents, skipping remote check: {e}")
+            return
+        for rel_path, entry in list(manifest.files.items()):
+            if entry.get("document_id") and entry["document_id"] not in remote_ids:
+                logger.info(f"Document for {rel_path} no longer exists in {self.dataset_id}; will re-upload")
+                manifest.update(rel_path, document_id=None, status="upload_failed", error="missing remotely")
+
+    def _delete_missing(self, root: str, paths: List[str], manifest: UploadManifest, summary: Dict[str, Any]) -> None:
+        present = {os.path.relpath(p, root) for p in paths}
+        gone = {p: e.get("document_id") for p, e in list(manifest.files.items()) if p not in present}
+        if not gone:
+            return
+        logger.info(f"Sync: deleting {len(gone)} document(s) whose source file was removed")
+        failed = self._delete_documents([d for d in gone.values() if d])
+        for rel_path, doc_id in gone.items():
+            if doc_id not in failed:
+                manifest.remove(rel_path)
+                summary["deleted"] += 1
+
+    def _delete_documents(self, doc_ids: List[str], batch_size: int = 100) -> set:
+        """Delete in batches; returns the ids that could not be deleted (retried on the next sync)."""
+        failed = set()
+        for i in range(0, len(doc_ids), batch_size):
+            batch = doc_ids[i:i + batch_size]
+            result = self.rag_client.delete_documents(self.dataset_id, batch)
+            if result.get("status") == "error":
+                logger.error(f"Deleting {len(batch)} document(s) failed: {result.get('message')}")
+                failed.update(batch)
+        return failed
+
+    # --- Parse ---
+
+    def _trigger_parse(self, manifest: UploadManifest, rel_paths: List[str]) -> None:
+        if deadline.expired():
+            return
+        doc_ids = [manifest.files[p]["document_id"] for p in rel_paths]
+        result = self.rag_client.parse_documents(self.dataset_id, doc_ids)
+        if result.get("status") == "error":
+            # Stay "uploaded": the next run triggers parsing again
+            logger.error(f"Parse request failed for {len(doc_ids)} document(s): {result.get('message')}")
+            return
+        for p in rel_paths:
+            manifest.update(p, status="parsing")
+
+    def _parse_all(self, manifest: UploadManifest, summary: Dict[str, Any]) -> None:
+        # Documents uploaded by an earlier, interrupted run
+        leftover = list(manifest.with_status("uploaded"))
+        for i in range(0, len(leftover), self.parse_batch_size):
+            self._trigger_parse(manifest, leftover[i:i + self.parse_batch_size])
+
+        pending = {e["document_id"]: p for p, e in manifest.with_status("parsing").items()}
+        while pending:
+            try:
+                states = {d["id"]: d for d in self.rag_client.iter_documents(self.dataset_id, fields=["id", "run", "progress_msg"])
+                          if d.get("id") in pending}
+            except PageError as e:
+                logger.error(f"Polling parse status failed: {e}")
+                break
+            for doc_id, doc in states.items():
+                run = str(doc.get("run", ""))
+                if run in _PARSE_DONE:
+                    manifest.update(pending.pop(doc_id), status="done")
+                elif run in _PARSE_FAILED:
+                    rel_path = pending.pop(doc_id)
+                    manifest.update(rel_path, status="failed", error=doc.get("progress_msg"))
+            if not pending or not deadline.has_time_for(self.poll_interval):
+                break
+            logger.info(f"Waiting for {len(pending)} document(s) to finish parsing")
+            time.sleep(self.poll_interval)
+
+        for rel_path, entry in manifest.files.items():
+            if entry.get("status") == "done":
+                summary["parsed"] += 1
+            elif entry.get("status") == "failed":
+                summary["parse_failed"].append({"path": rel_path, "error": entry.get("error")})
+        summary["pending"] = len(manifest.with_status("uploaded", "parsing"))
@@ -0,0 +1,135 @@
+import re
+import zlib
+import logging
+from typing import Dict, Any, List, Optional
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# Mersenne prime for the MinHash permutations; a * h stays below 2**63 for 32-bit shingle hashes
+_MINHASH_PRIME = (1 << 31) - 1
+_WHITESPACE = re.compile(r"\s+")
+
+def chunk_text(chunk: Dict[str, Any]) -> str:
+    """Text of a RAGFlow retrieval chunk (content_with_weight on older servers, content on newer ones)."""
+    return chunk.get("content_with_weight") or chunk.get("content") or ""
+
+def _normalize(text: str) -> str:
+    return _WHITESPACE.sub(" ", text).strip().lower()
+
+def shingle_hashes(text: str, k: int = 3) -> np.ndarray:
+    """32-bit hashes of the distinct character k-grams of `text` (works for CJK and latin text alike)."""
+    text = _normalize(text)
+    if len(text) <= k:
+        grams = {text} if text else set()
+    else:
+        grams = {text[i:i + k] for i in range(len(text) - k + 1)}
+    return np.fromiter((zlib.crc32(g.encode("utf-8")) for g in grams), dtype=np.uint64, count=len(grams))
+
+class ChunkRanker:
+    """
+    检索切片后处理 (Chunk Ranker)
+
+    1. 去重：字符 shingle + MinHash 估计 Jaccard 相似度，近似重复的切片只保留相关度最高的一条。
+    2. 重排：MMR (Maximal Marginal Relevance)，相关度取 RAGFlow 返回的 similarity，
+       切片间冗余度取字符 bigram 词频向量的余弦相似度，在覆盖面与相关度之间取平衡。
+    全部计算使用 NumPy 向量化完成，30 条切片耗时在毫秒级。
+    """
+
+    def __init__(self, top_n: int = 8, mmr_lambda: float = 0.7, dedup_threshold: float = 0.85,
+                 num_perm: int = 64, shingle_size: int = 3, lexical_dim: int = 4096, seed: int = 1):
+        self.top_n = top_n
+        self.mmr_lambda = mmr_lambda
+        self.dedup_threshold = dedup_threshold
+        self.shingle_size = shingle_size
+        self.lexical_dim = lexical_dim
+        rng = np.random.default_rng(seed)
+        self._perm_a = rng.integers(1, _MINHASH_PRIME, size=num_perm, dtype=np.uint64)
+        self._perm_b = rng.integers(0, _MINHASH_PRIME, size=num_perm, dtype=np.uint64)
+
+    @classmethod
+    def from_config(cls, config: Dict[str, Any]) -> Optional["ChunkRanker"]:
+        if not config.get("RAG_MMR_ENABLED", True):
+            return None
+        return cls(
+            top_n=config.get("RAG_MMR_TOP_N", 8),
+            mmr_lambda=config.get("RAG_MMR_LAMBDA", 0.7),
+            dedup_threshold=config.get("RAG_DEDUP_THRESHOLD", 0.85)
+        )
+
+    # --- MinHash dedup ---
+
+    def signatures(self, texts: List[str]) -> np.ndarray:
+        """(len(texts), num_perm) MinHash signatures."""
+        sigs = np.full((len(texts), len(self._perm_a)), _MINHASH_PRIME, dtype=np.uint64)
+        for i, text in enumerate(texts):
+            hashes = shingle_hashes(text, self.shingle_size)
+            if hashes.size:
+                # (num_perm, n_shingles) permuted hashes, min over shingles
+                permuted = (np.outer(self._perm_a, hashes) + self._perm_b[:, None]) % _MINHASH_PRIME
+                sigs[i] = permuted.min(axis=1)
+        return sigs
+
+    def near_duplicates(self, texts: List[str]) -> np.ndarray:
+        """Boolean (n, n) matrix: estimated Jaccard similarity >= dedup_threshold."""
+        sigs = self.signatures(texts)
+        jaccard = (sigs[:, None, :] == sigs[None, :, :]).mean(axis=2)
+        return jaccard >= self.dedup_threshold
+
+    # --- MMR ---
+
+    def lexical_vectors(self, texts: List[str]) -> np.ndarray:
+        """L2-normalised hashed character-bigram term-frequency vectors."""
+        vectors = np.zeros((len(texts), self.lexical_dim), dtype=np.float32)
+        for i, text in enumerate(texts):
+            hashes = shingle_hashes(text, 2)
+            if hashes.size:
+                np.add.at(vectors[i], (hashes % self.lexical_dim).astype(np.int64), 1.0)
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        return vectors / np.where(norms == 0, 1.0, norms)
+
+    def mmr(self, relevance: np.ndarray, vectors: np.ndarray, k: int) -> List[int]:
+        """Greedy MMR selection; returns indices in selection order."""
+        n = len(relevance)
+        k = min(k, n)
+        if k <= 0:
+            return []
+        pairwise = vectors @ vectors.T
+        selected = [int(np.argmax(relevance))]
+        # Highest similarity of each candidate to anything already selected
+        redundancy = pairwise[selected[0]].copy()
+        available = np.ones(n, dtype=bool)
+        available[selected[0]] = False
+        while len(selected) < k:
+            scores = self.mmr_lambda * relevance - (1 - self.mmr_lambda) * redundancy
+            scores[~available] = -np.inf
+            best = int(np.argmax(scores))
+            selected.append(best)
+            available[best] = False
+            redundancy = np.maximum(redundancy, pairwise[best])
+        return selected
+
+    def rank(self, chunks: List[Dict[str, Any]], top_n: Optional[int] = None) -> List[Dict[str, Any]]:
+        """Drop near-duplicate chunks, then return up to top_n chunks in MMR order."""
+        if not chunks:
+            return []
+        top_n = self.top_n if top_n is None else top_n
+        texts = [chunk_text(c) for c in chunks]
+        relevance = np.array([float(c.get("similarity", 0) or 0) for c in chunks], dtype=np.float32)
+
+        # Visit in relevance order so the best copy of each duplicate group survives
+        order = np.argsort(-relevance, kind="stable")
+        dup = self.near_duplicates(texts)
+        keep: List[int] = []
+        for i in order:
+            if not any(dup[i, j] for j in keep):
+                keep.append(int(i))
+
+        kept_rel = relevance[keep]
+        if kept_rel.max() > 0:
+            kept_rel = kept_rel / kept_rel.max()
+        picked = self.mmr(kept_rel, self.lexical_vectors([texts[i] for i in keep]), top_n)
+        result = [chunks[keep[i]] for i in picked]
+        logger.info(f"Chunk ranking: {len(chunks)} -> {len(keep)} after dedup -> {len(result)} after MMR")
+        return result
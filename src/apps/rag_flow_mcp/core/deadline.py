@@ -0,0 +1,69 @@
+import time
+import logging
+import contextvars
+from contextlib import contextmanager
+from typing import Any, Callable, Optional
+
+logger = logging.getLogger(__name__)
+
+# Absolute deadline (time.monotonic()) of the current tool call, None = unbounded
+_deadline: contextvars.ContextVar[Optional[float]] = contextvars.ContextVar("rag_deadline", default=None)
+
+class DeadlineExceeded(TimeoutError):
+    """Raised when the time budget of the current tool call has been spent."""
+
+@contextmanager
+def deadline(seconds: Optional[float]):
+    """
+    端到端时间预算 (Deadline Budget)
+
+    在 with 块内（包括其调用的 engine / RAGClient，以及用 wrap() 提交到线程池的任务）
+    所有 HTTP 请求只会拿到剩余的时间。嵌套调用只能缩短、不能延长外层的预算。
+    seconds 为 None 或 <= 0 表示不设限。
+    """
+    if not seconds or seconds <= 0:
+        yield
+        return
+    new_deadline = time.monotonic() + seconds
+    current = _deadline.get()
+    if current is not None:
+        new_deadline = min(current, new_deadline)
+    token = _deadline.set(new_deadline)
+    try:
+        yield
+    finally:
+        _deadline.reset(token)
+
+def remaining() -> Optional[float]:
+    """Seconds left in the current budget (None if no deadline is set)."""
+    current = _deadline.get()
+    if current is None:
+        return None
+    return max(0.0, current - time.monotonic())
+
+def expired() -> bool:
+    left = remaining()
+    return left is not None and left <= 0
+
+def has_time_for(seconds: float) -> bool:
+    """True if a step that needs `seconds` (e.g. a retry back-off) still fits in the budget."""
+    left = remaining()
+    return left is None or left > seconds
+
+def timeout_for(default: float) -> float:
+    """
+    Per-attempt timeout: the configured default, clamped to the remaining budget.
+    Raises DeadlineExceeded if nothing is left, so no request is started.
+    """
+    left = remaining()
+    if left is None:
+        return default
+    if left <= 0:
+        raise DeadlineExceeded("Deadline exceeded before the request was sent")
+    return min(default, left)
+
+def wrap(fn: Callable[..., Any]) -> Callable[..., Any]:
+    """Carry the caller's deadline into a worker thread (ThreadPoolExecutor does not copy contextvars)."""
+    ctx = contextvars.copy_context()
+    # A Context can only be entered by one thread at a time, so each call runs in its own copy
+    return lambda *args, **kwargs: ctx.copy().run(fn, *args, **kwargs)
@@ -1,7 +1,9 @@
 import os
 import logging
-from typing import Tuple, Optional, List
+from typing import Tuple, Optional, List, Iterable, Iterator, Union
 from .shadow_file_manager import ShadowFileManager
+from .text_buffer import TextBuffer
+from src.common.atomic_io import write_lines_atomic
 
 logger = logging.getLogger(__name__)
 
@@ -23,15 +25,38 @@ class FileService:
         with open(file_path, 'r', encoding='utf-8') as f:
             return f.read()
             
-    def write_text(self, file_path: str, content: str) -> None:
-        """写入文本文件内容 (直接写入，慎用)"""
+    def iter_lines(self, file_path: str) -> Iterator[str]:
+        """逐行读取文本文件 (保留换行符，内存占用与文件大小无关)"""
+        if not os.path.exists(file_path):
+            raise FileNotFoundError(f"File not found: {file_path}")
+        
+        with open(file_path, 'r', encoding='utf-8', newline='\n') as f:
+            yield from f
+            
+    def write_lines(self, file_path: str, chunks: Iterable[str]) -> None:
+        """
+        流式写入文本文件：先写入同目录下的临时文件，完成后原子替换目标文件。
+        chunks 可以是生成器 (例如正在读取 file_path 本身的 iter_lines 流水线)，写入中途失败时原文件保持不变。
+        """
+        self.ensure_dir(os.path.dirname(os.path.abspath(file_path)))
+        write_lines_atomic(file_path, chunks)
+            
+    def write_text(self, file_path: str, content: Union[str, TextBuffer]) -> None:
+        """写入文本文件内容 (直接写入，慎用)；TextBuffer 按分片写出，不拼接成完整字符串"""
         self.ensure_dir(os.path.dirname(file_path))
         with open(file_path, 'w', encoding='utf-8') as f:
-            f.write(content)
+            if isinstance(content, TextBuffer):
+                f.writelines(content.chunks())
+            else:
+                f.write(content)
             
-    def create_shadow_copy(self, file_path: str, content: str) -> Tuple[str, str]:
+    def create_shadow_copy(self, file_path: str, content: Union[str, TextBuffer]) -> Tuple[str, str]:
         """创建影子副本 (安全写入)"""
         return self.shadow_manager.generate_shadow_copy(file_path, content)
+
+    def create_shadow_copy_segments(self, file_path: str, segments: Iterable[Tuple[str, str]]) -> Tuple[str, str]:
+        """流式创建影子副本：segments 为按文档顺序的 (原文片段, 新片段)，副本与差异报告边读边写"""
+        return self.shadow_manager.generate_shadow_copy_segments(file_path, segments)
         
     def exists(self, path: str) -> bool:
         """检查路径是否存在"""
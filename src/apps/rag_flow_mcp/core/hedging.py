@@ -0,0 +1,71 @@
+import threading
+from collections import deque
+from typing import Dict, Any, Optional
+
+# off: strict query, then broad query only on low confidence (sequential)
+# parallel: send strict and broad queries together
+# delayed: send the broad query only if the strict one is slower than its p90 latency
+HEDGE_MODES = ("off", "parallel", "delayed")
+
+# Hedge delay used in delayed mode until enough strict-query latencies have been observed
+DEFAULT_HEDGE_DELAY = 3.0
+
+# Below this score agentic_search considers the strict answer unreliable and uses the broad one if better
+LOW_CONFIDENCE = 0.5
+
+def hedge_delay(fixed: float, tracker: "LatencyTracker") -> float:
+    """Delay before the hedged broad query: the configured value, else p90 of recent strict queries."""
+    if fixed and fixed > 0:
+        return fixed
+    p90 = tracker.percentile(0.9)
+    return p90 if p90 is not None else DEFAULT_HEDGE_DELAY
+
+class LatencyTracker:
+    """
+    最近 window 次请求的延迟，用于计算 hedged 请求的触发延迟 (p90)。
+    样本数不足 min_samples 时返回 None，由调用方使用默认值。
+    """
+
+    def __init__(self, window: int = 100, min_samples: int = 5):
+        self.min_samples = min_samples
+        self._samples = deque(maxlen=window)
+        self._lock = threading.Lock()
+
+    def record(self, seconds: float) -> None:
+        with self._lock:
+            self._samples.append(seconds)
+
+    def percentile(self, q: float = 0.9) -> Optional[float]:
+        with self._lock:
+            samples = sorted(self._samples)
+        if len(samples) < self.min_samples:
+            return None
+        return samples[min(len(samples) - 1, int(q * len(samples)))]
+
+class HedgeStats:
+    """
+    Hedging counters:
+    - hedged: a broad query was sent speculatively
+    - won: the hedged broad query produced the better answer (hedging helped)
+    - lost: both finished, the strict answer was kept
+    - wasted: the strict answer was confident, the broad query was cancelled / ignored
+    - not_hedged: delayed mode, the strict query finished before the hedge delay
+    """
+
+    def __init__(self):
+        self._counts = {"hedged": 0, "won": 0, "lost": 0, "wasted": 0, "not_hedged": 0}
+        self._lock = threading.Lock()
+
+    def incr(self, name: str) -> None:
+        with self._lock:
+            self._counts[name] += 1
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            stats = dict(self._counts)
+        stats["win_rate"] = round(stats["won"] / stats["hedged"], 4) if stats["hedged"] else 0.0
+        return stats
+
+def pick_better(strict: Dict[str, Any], broad: Dict[str, Any]) -> Dict[str, Any]:
+    """Same rule as the sequential fallback: the broad answer replaces the strict one only if it scores higher."""
+    return broad if broad.get("score", 0.0) > strict.get("score", 0.0) else strict
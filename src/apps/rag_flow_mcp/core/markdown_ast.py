@@ -1,14 +1,121 @@
+import re
+import bisect
+import hashlib
 import logging
 import io
-import pandas as pd
-from typing import List, Tuple, Optional
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, List, Tuple, Optional, Union
 from markdown_it import MarkdownIt
 from markdown_it.token import Token
+from src.apps.rag_flow_mcp.core.markdown_table import MarkdownTable
+from src.apps.rag_flow_mcp.core.text_buffer import TextBuffer
 
 logger = logging.getLogger(__name__)
 
+_SLUG_DROP = re.compile(r"[^\w\- ]")
+
+def slugify(text: str) -> str:
+    """GitHub-style anchor slug: "## 3.1 Auth & SSO" -> "31-auth--sso"."""
+    return _SLUG_DROP.sub("", text.strip().lower()).replace(" ", "-")
+
+class ParsedDocument:
+    """
+    解析后的文档 (Parsed Document)
+
+    一次解析的结果：token 列表、按行切分的内容与每行起始偏移、标题树 (含每个章节的行范围) 以及表格位置。
+    标题按原文与 slug 各建一张有序索引，查找为 O(log n)；对象只读，可被多个编辑共享。
+    Line numbers are 0-based, ranges are [start, end).
+    """
+
+    def __init__(self, content: str, tokens: List[Token]):
+        self.content = content
+        self.tokens = tokens
+        self.lines = content.splitlines(keepends=True)
+        self.line_offsets = [0]
+        for line in self.lines:
+            self.line_offsets.append(self.line_offsets[-1] + len(line))
+
+        doc_end = max((t.map[1] for t in tokens if t.map), default=0)
+        self.headings: List[Dict[str, Any]] = []
+        self.tables: List[Tuple[int, int]] = []
+        open_sections: List[Dict[str, Any]] = []
+        for i, token in enumerate(tokens):
+            if token.type == "table_open" and token.map:
+                self.tables.append((token.map[0], token.map[1]))
+            if token.type != "heading_open" or not token.map:
+                continue
+            level = int(token.tag[1:])
+            # A heading closes every open section of the same or a deeper level
+            while open_sections and open_sections[-1]["level"] >= level:
+                open_sections.pop()["end"] = token.map[0]
+            text = tokens[i + 1].content if i + 1 < len(tokens) and tokens[i + 1].type == "inline" else ""
+            heading = {
+                "index": len(self.headings),
+                "text": text,
+                "slug": slugify(text),
+                "level": level,
+                "start": token.map[0],
+                "header_end": token.map[1],
+                "end": doc_end,
+                "parent": open_sections[-1]["index"] if open_sections else None,
+                "children": []
+            }
+            if open_sections:
+                open_sections[-1]["children"].append(heading["index"])
+            self.headings.append(heading)
+            open_sections.append(heading)
+
+        # Sorted (key, position) indexes; the first heading with a given text / slug wins
+        self._by_text = sorted((h["text"].strip(), h["index"]) for h in self.headings)
+        self._by_slug = sorted((h["slug"], h["index"]) for h in self.headings)
+        self._table_starts = [t[0] for t in self.tables]
+
+    @staticmethod
+    def _lookup(index: List[Tuple[str, int]], key: str) -> Optional[int]:
+        pos = bisect.bisect_left(index, (key, -1))
+        if pos < len(index) and index[pos][0] == key:
+            return index[pos][1]
+        return None
+
+    def find_heading(self, header_text: str) -> Optional[Dict[str, Any]]:
+        """
+        Heading by exact text, then by slug; falls back to the first heading containing
+        header_text (the historical substring match) when neither index has it.
+        """
+        key = header_text.strip()
+        found = self._lookup(self._by_text, key)
+        if found is None:
+            found = self._lookup(self._by_slug, slugify(key))
+        if found is not None:
+            return self.headings[found]
+        for heading in self.headings:
+            if header_text in heading["text"]:
+                return heading
+        return None
+
+    def section_range(self, header_text: str) -> Optional[Tuple[int, int]]:
+        """(start_line, end_line) of the section, header included, up to the next heading of the same or a higher level."""
+        heading = self.find_heading(header_text)
+        return (heading["start"], heading["end"]) if heading else None
+
+    def tables_in(self, start_line: int, end_line: int) -> List[Tuple[int, int]]:
+        """Tables lying entirely within [start_line, end_line), in document order."""
+        pos = bisect.bisect_left(self._table_starts, start_line)
+        result = []
+        for t_start, t_end in self.tables[pos:]:
+            if t_start >= end_line:
+                break
+            if t_end <= end_line:
+                result.append((t_start, t_end))
+        return result
+
+    def offset(self, line: int) -> int:
+        """Character offset of the start of a 0-based line (len(content) past the last line)."""
+        return self.line_offsets[min(max(line, 0), len(self.lines))]
+
 class MarkdownASTManager:
-    def __init__(self):
+    def __init__(self, cache_size: int = 16):
         # Use gfm-like preset to support tables
         # Disable linkify to avoid extra dependency
         try:
@@ -16,123 +123,59 @@ class MarkdownASTManager:
         except KeyError:
             # Fallback if gfm-like is not found (older versions), though unlikely
             self.md = MarkdownIt("commonmark", {"breaks": True, "html": True}).enable('table')
+        self.cache_size = cache_size
+        self._documents: "OrderedDict[str, ParsedDocument]" = OrderedDict()
+        self._lock = threading.Lock()
 
     def parse(self, content: str) -> List[Token]:
-        return self.md.parse(content)
+        return self.document(content).tokens
 
-    def find_section_range(self, tokens: List[Token], header_text: str) -> Optional[Tuple[int, int]]:
+    def document(self, content: str) -> ParsedDocument:
+        """Parsed form of content, cached by content hash so repeated lookups / edits on the same text parse once."""
+        digest = hashlib.sha1(content.encode("utf-8")).hexdigest()
+        with self._lock:
+            doc = self._documents.get(digest)
+            if doc is not None:
+                self._documents.move_to_end(digest)
+                return doc
+        doc = ParsedDocument(content, self.md.parse(content))
+        with self._lock:
+            self._documents[digest] = doc
+            while len(self._documents) > self.cache_size:
+                self._documents.popitem(last=False)
+        return doc
+
+    def find_section_range(self, tokens: Union[List[Token], ParsedDocument], header_text: str) -> Optional[Tuple[int, int]]:
         """
         Find the line range (start_line, end_line) of a section under a specific header.
         Range includes the header itself and all content until the next header of same or higher level.
         Line numbers are 0-based.
         """
-        start_line = -1
-        end_line = -1
-        header_level = -1
-        
-        # 1. Find the header
-        for i, token in enumerate(tokens):
-            if token.type == "heading_open":
-                # Check next token for text content
-                if i + 1 < len(tokens) and tokens[i+1].type == "inline":
-                    if header_text in tokens[i+1].content:
-                        start_line = token.map[0]
-                        header_level = int(token.tag.replace("h", ""))
-                        # Initial end_line guess: end of file or map[1]
-                        end_line = token.map[1] 
-                        
-                        # Continue to find the actual end of section
-                        # Iterate from this header onwards
-                        for j in range(i + 1, len(tokens)):
-                            next_token = tokens[j]
-                            # Update end_line based on current token's map
-                            if next_token.map:
-                                end_line = max(end_line, next_token.map[1])
-                                
-                            if next_token.type == "heading_open":
-                                next_level = int(next_token.tag.replace("h", ""))
-                                if next_level <= header_level:
-                                    # Found next header of same or higher level (e.g. h2 found h2 or h1)
-                                    # Section ends at the start of this new header
-                                    end_line = next_token.map[0]
-                                    return (start_line, end_line)
-                        
-                        # If loop finishes, section goes to end of content
-                        # We don't have total line count here easily, but we can infer from max map
-                        return (start_line, end_line)
-        
-        return None
+        doc = tokens if isinstance(tokens, ParsedDocument) else ParsedDocument("", tokens)
+        return doc.section_range(header_text)
+
+    def edit(self, content: str) -> "DocumentEdit":
+        """Start a batch of section / table edits resolved against one parse of content (see DocumentEdit)."""
+        return DocumentEdit(self.document(content))
 
     def replace_section(self, content: str, header_text: str, new_content: str) -> str:
         """
         Replace the content of a section identified by header_text.
         Preserves the original header line(s).
         """
-        tokens = self.parse(content)
-        line_range = self.find_section_range(tokens, header_text)
-        
-        if not line_range:
-            logger.warning(f"Header '{header_text}' not found.")
+        transaction = self.edit(content)
+        if not transaction.replace_section(header_text, new_content):
             return content
-            
-        start_line, end_line = line_range
-        lines = content.splitlines(keepends=True)
-        
-        # Ensure lines list is long enough
-        if start_line >= len(lines):
-             return content
-
-        # Find the header token to get its specific end line
-        header_end_line = start_line + 1
-        for token in tokens:
-            if token.type == "heading_open" and token.map and token.map[0] == start_line:
-                header_end_line = token.map[1]
-                break
-        
-        # Safety check
-        if header_end_line > end_line:
-            header_end_line = end_line
-
-        new_lines = []
-        # Keep lines up to the end of the header
-        new_lines.extend(lines[:header_end_line])
-        
-        # Ensure separation - REMOVED to avoid extra newlines
-        # if new_content and not new_content.startswith('\n'):
-        #     new_lines.append('\n')
-            
-        new_lines.append(new_content)
-        
-        if new_content and not new_content.endswith('\n'):
-            new_lines.append('\n')
-            
-        new_lines.extend(lines[end_line:])
-        
-        return "".join(new_lines)
+        return transaction.apply()
 
     def insert_after_section(self, content: str, header_text: str, content_to_insert: str) -> str:
         """
         Insert content at the end of a section.
         """
-        tokens = self.parse(content)
-        line_range = self.find_section_range(tokens, header_text)
-        
-        if not line_range:
-            logger.warning(f"Header '{header_text}' not found.")
+        transaction = self.edit(content)
+        if not transaction.insert_after_section(header_text, content_to_insert):
             return content
-            
-        _, end_line = line_range
-        lines = content.splitlines(keepends=True)
-        
-        if not content_to_insert.endswith('\n'):
-            content_to_insert += '\n'
-            
-        new_lines = []
-        new_lines.extend(lines[:end_line])
-        new_lines.append(content_to_insert)
-        new_lines.extend(lines[end_line:])
-        
-        return "".join(new_lines)
+        return transaction.apply()
 
     def update_table_cell(self, content: str, header_text: str, row_idx: int, col_idx: int, new_value: str, table_index: int = 0) -> str:
         """
@@ -146,97 +189,136 @@ class MarkdownASTManager:
             new_value: New string value for the cell.
             table_index: Index of the table within the section (default 0).
         """
-        tokens = self.parse(content)
-        line_range = self.find_section_range(tokens, header_text)
-        
+        transaction = self.edit(content)
+        if not transaction.update_table_cell(header_text, row_idx, col_idx, new_value, table_index):
+            return content
+        return transaction.apply()
+
+class DocumentEdit:
+    """
+    批量编辑事务 (Document Edit Transaction)
+
+    所有编辑都针对同一次解析：入队时即解析出目标行范围并检查重叠，apply() 再从文档末尾向前一次拼接完成，
+    N 次编辑只需一次解析、一次拼接 (在 TextBuffer 上完成)，结果与依次调用单次编辑方法相同。
+    replace_section 会覆盖之前入队、位于该章节正文内的编辑 (与依次执行时被整段替换一致)；
+    同一表格的多次单元格修改合并为一次重绘；落在已替换正文内部的新编辑会抛出 ValueError，
+    此时应先 apply() 再基于新文本开启新的事务。
+    Queue methods return False (with a warning) when the target does not exist, like the single-edit methods.
+    """
+
+    def __init__(self, doc: ParsedDocument):
+        self.doc = doc
+        self._edits: List[Dict[str, Any]] = []
+        self._tables: Dict[Tuple[int, int], Dict[str, Any]] = {}
+        self._seq = 0
+
+    def __len__(self) -> int:
+        return len(self._edits)
+
+    def _queue(self, start: int, end: int, text: Optional[str], kind: str, key: Any = None) -> Dict[str, Any]:
+        if kind == "replace":
+            # Applied one after another, the replacement would wipe every earlier edit inside the body
+            # (including text inserted at either end of it), so those edits are dropped
+            self._edits = [e for e in self._edits if not (start <= e["start"] and e["end"] <= end)]
+            self._tables = {span: t for span, t in self._tables.items() if not (start <= span[0] and span[1] <= end)}
+        for edit in self._edits:
+            if self._overlaps(start, end, edit["start"], edit["end"]):
+                raise ValueError(f"Edit of lines {start}-{end} overlaps a queued edit of lines {edit['start']}-{edit['end']}")
+        self._seq += 1
+        edit = {"start": start, "end": end, "text": text, "kind": kind, "key": key, "seq": self._seq}
+        self._edits.append(edit)
+        return edit
+
+    @staticmethod
+    def _overlaps(a_start: int, a_end: int, b_start: int, b_end: int) -> bool:
+        # An insertion point only conflicts with a range that strictly contains it
+        if a_start == a_end:
+            return b_start < a_start < b_end
+        if b_start == b_end:
+            return a_start < b_start < a_end
+        return a_start < b_end and b_start < a_end
+
+    def replace_section(self, header_text: str, new_content: str) -> bool:
+        """Queue a replacement of the section body (the header line(s) are kept)."""
+        heading = self.doc.find_heading(header_text)
+        if not heading:
+            logger.warning(f"Header '{header_text}' not found.")
+            return False
+        # Ensure lines list is long enough
+        if heading["start"] >= len(self.doc.lines):
+            return False
+        end_line = heading["end"]
+        header_end_line = min(heading["header_end"], end_line)
+        if new_content and not new_content.endswith('\n'):
+            new_content += '\n'
+        self._queue(header_end_line, end_line, new_content, "replace", heading["index"])
+        return True
+
+    def insert_after_section(self, header_text: str, content_to_insert: str) -> bool:
+        """Queue an insertion at the end of a section (after edits queued earlier at the same point)."""
+        line_range = self.doc.section_range(header_text)
         if not line_range:
             logger.warning(f"Header '{header_text}' not found.")
-            return content
-            
-        start_line, end_line = line_range
-        
-        # Find tables within section
-        tables = []
-        for i, token in enumerate(tokens):
-            if token.type == "table_open" and token.map:
-                t_start, t_end = token.map
-                # Check if strictly within section
-                if t_start >= start_line and t_end <= end_line:
-                    tables.append((t_start, t_end))
-        
+            return False
+        if not content_to_insert.endswith('\n'):
+            content_to_insert += '\n'
+        self._queue(line_range[1], line_range[1], content_to_insert, "insert")
+        return True
+
+    def table(self, header_text: str, table_index: int = 0) -> Optional[MarkdownTable]:
+        """
+        Model of the table_index-th table under header_text, for bulk cell / row edits; the table is
+        re-serialized by apply() only if it was changed. None (with a warning) if there is no such table.
+        """
+        line_range = self.doc.section_range(header_text)
+        if not line_range:
+            logger.warning(f"Header '{header_text}' not found.")
+            return None
+        tables = self.doc.tables_in(*line_range)
         if not tables or table_index >= len(tables):
             logger.warning(f"Table index {table_index} not found in section '{header_text}'.")
-            return content
-            
-        t_start, t_end = tables[table_index]
-        
-        # Extract lines
-        lines = content.splitlines(keepends=False)
-        table_lines = lines[t_start:t_end]
-        
-        # Clean up empty lines if any
-        table_lines = [l for l in table_lines if l.strip()]
-        
-        if len(table_lines) < 2:
-            return content
-            
-        # Parse manually to be robust
+            return None
+
+        span = tables[table_index]
+        if span not in self._tables:
+            try:
+                table = MarkdownTable.parse(self.doc.lines[span[0]:span[1]])
+            except ValueError as e:
+                logger.warning(f"Unreadable table in section '{header_text}': {e}")
+                return None
+            self._queue(span[0], span[1], None, "table", span)
+            self._tables[span] = table
+        return self._tables[span]
+
+    def update_table_cell(self, header_text: str, row_idx: int, col_idx: int, new_value: str, table_index: int = 0) -> bool:
+        """Queue a cell update (arguments as in MarkdownASTManager.update_table_cell)."""
+        table = self.table(header_text, table_index)
+        if table is None:
+            return False
         try:
-            # Prepare data for pandas
-            # Strategy:
-            # 1. Split header
-            # 2. Skip separator
-            # 3. Split rows
-            
-            def split_row(line):
-                parts = line.split('|')
-                # Remove empty first/last if they exist (standard pipe table style)
-                if line.strip().startswith('|'):
-                    parts = parts[1:]
-                if line.strip().endswith('|'):
-                    parts = parts[:-1]
-                return [p.strip() for p in parts]
-
-            headers = split_row(table_lines[0])
-            data_rows = []
-            
-            # Skip index 1 (separator: |---|---|)
-            # But ensure index 1 is actually separator? 
-            # MarkdownIt identifies table, so it must be valid.
-            
-            for i in range(2, len(table_lines)):
-                data_rows.append(split_row(table_lines[i]))
-                
-            # Update
-            if row_idx < 0 or row_idx >= len(data_rows):
-                logger.warning(f"Row index {row_idx} out of bounds.")
-                return content
-            
-            row = data_rows[row_idx]
-            if col_idx < 0 or col_idx >= len(row):
-                 logger.warning(f"Col index {col_idx} out of bounds.")
-                 return content
-                 
-            row[col_idx] = new_value
-            
-            # Reconstruct using pandas
-            df = pd.DataFrame(data_rows, columns=headers)
-            new_table_md = df.to_markdown(index=False, tablefmt="pipe")
-            
-            # Replace in original content
-            original_lines_full = content.splitlines(keepends=True)
-            
-            new_output = []
-            new_output.extend(original_lines_full[:t_start])
-            # Ensure new table ends with newline
-            if not new_table_md.endswith('\n'):
-                new_table_md += '\n'
-            new_output.append(new_table_md)
-            new_output.extend(original_lines_full[t_end:])
-            
-            return "".join(new_output)
-            
-        except Exception as e:
-            logger.error(f"Failed to update table: {e}")
-            return content
+            table.set(row_idx, col_idx, new_value)
+        except IndexError as e:
+            logger.warning(str(e))
+            return False
+        return True
+
+    def to_buffer(self) -> TextBuffer:
+        """
+        The edited document as a TextBuffer: the edits are spliced into the parsed text from the last one
+        backward, so earlier line offsets stay valid and nothing is joined until the text is read or written.
+        """
+        buffer = TextBuffer(self.doc.content)
+        for edit in sorted(self._edits, key=lambda e: (e["start"], e["end"], e["seq"]), reverse=True):
+            buffer.replace(self.doc.offset(edit["start"]), self.doc.offset(edit["end"]), self._text(edit))
+        return buffer
+
+    def apply(self) -> str:
+        """The edited document (the transaction stays reusable)."""
+        return self.to_buffer().getvalue()
 
+    def _text(self, edit: Dict[str, Any]) -> str:
+        if edit["kind"] != "table":
+            return edit["text"]
+        table = self._tables[edit["key"]]
+        # Unchanged tables keep their exact source text
+        return table.render() if table.changed else "".join(self.doc.lines[edit["start"]:edit["end"]])
@@ -0,0 +1,213 @@
+import re
+import unicodedata
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple, Union
+
+# Cells are separated by unescaped pipes ("\|" is a literal pipe inside a cell)
+_PIPE = re.compile(r"(?<!\\)\|")
+_DELIMITER = re.compile(r"^\s*(:?)-+(:?)\s*$")
+_INDENT = re.compile(r"^[ \t]*")
+
+Column = Union[int, str]
+
+def display_width(text: str) -> int:
+    """Monospace width of text: wide / full-width (e.g. CJK) characters take two columns."""
+    return sum(2 if unicodedata.east_asian_width(ch) in ("W", "F") else 1 for ch in text)
+
+def _pad(text: str, width: int, align: Optional[str]) -> str:
+    gap = max(0, width - display_width(text))
+    if align == "right":
+        return " " * gap + text
+    if align == "center":
+        return " " * (gap // 2) + text + " " * (gap - gap // 2)
+    return text + " " * gap
+
+def _cell(value: Any) -> str:
+    # Cell text is one line; a bare pipe would start a new cell
+    return _PIPE.sub(r"\\|", str(value).replace("\r", " ").replace("\n", " ").strip())
+
+class MarkdownTable:
+    """
+    管道表格模型 (Pipe Table Model)
+
+    一次解析出表头、对齐方式与各行单元格，支持批量读写单元格、增删行与排序，不依赖 pandas / tabulate。
+    序列化时尽量保留原样：未修改的行按原文输出，修改过的行按原列宽与对齐方式重排；
+    原表按列对齐时，超出列宽的新值会加宽整列，未对齐的表格则以紧凑格式输出修改行。
+    对齐标记 (:---, ---:, :---:)、缩进与换行符均保持不变。
+    Row / column indices are 0-based; rows exclude the header. Columns may also be given by header name.
+    """
+
+    def __init__(self, lines: List[str], newline: str = "\n"):
+        lines = [l.rstrip("\r\n") for l in lines if l.strip()]
+        if len(lines) < 2:
+            raise ValueError("A table needs a header row and a delimiter row")
+        self.newline = newline
+        self.indent = _INDENT.match(lines[0]).group(0)
+        body = lines[0].strip()
+        self.leading_pipe = body.startswith("|")
+        self.trailing_pipe = body.endswith("|") and not body.endswith("\\|")
+
+        self.header = self._split(lines[0])
+        delimiter = self._split(lines[1], keep_spaces=True)
+        self.aligns: List[Optional[str]] = []
+        for cell in delimiter[:len(self.header)]:
+            match = _DELIMITER.match(cell)
+            if not match:
+                raise ValueError(f"Invalid delimiter row: {lines[1]!r}")
+            left, right = bool(match.group(1)), bool(match.group(2))
+            self.aligns.append("center" if left and right else "left" if left else "right" if right else None)
+        self.aligns += [None] * (len(self.header) - len(self.aligns))
+
+        # Each row keeps its source line until it is modified (None = must be rendered)
+        self._header_raw = lines[0]
+        self._delimiter_raw = lines[1]
+        self._rows: List[Dict[str, Any]] = [{"cells": self._normalize(self._split(l)), "raw": l} for l in lines[2:]]
+        # Segment widths (pipe to pipe) if every source line lines up, i.e. the table is laid out in columns
+        self._layout: Optional[List[int]] = None
+        if self.leading_pipe and self.trailing_pipe:
+            layouts = [[display_width(seg) for seg in self._split(l, keep_spaces=True)] for l in lines]
+            if all(l == layouts[0] for l in layouts) and len(layouts[0]) == len(self.header) and min(layouts[0]) >= 3:
+                self._layout = layouts[0]
+        self.changed = False
+
+    @classmethod
+    def parse(cls, text: Union[str, Iterable[str]]) -> "MarkdownTable":
+        """Table from its markdown source (a string or lines, line endings optional)."""
+        lines = text.splitlines(keepends=True) if isinstance(text, str) else list(text)
+        newline = "\r\n" if lines and lines[0].endswith("\r\n") else "\n"
+        return cls(lines, newline)
+
+    def _split(self, line: str, keep_spaces: bool = False) -> List[str]:
+        parts = _PIPE.split(line.strip())
+        # Remove empty first/last if they exist (standard pipe table style)
+        if parts and parts[0].strip() == "" and line.strip().startswith("|"):
+            parts = parts[1:]
+        if parts and parts[-1].strip() == "" and line.strip().endswith("|") and not line.strip().endswith("\\|"):
+            parts = parts[:-1]
+        return parts if keep_spaces else [p.strip() for p in parts]
+
+    def _normalize(self, cells: List[str]) -> List[str]:
+        # Like GFM: missing cells are empty, cells past the header are dropped
+        n = len(self.header)
+        return cells[:n] + [""] * (n - len(cells))
+
+    def _render_row(self, cells: List[str], widths: List[int]) -> str:
+        inner = " | ".join(_pad(c, w, a) for c, w, a in zip(cells, widths, self.aligns))
+        return self._wrap(f" {inner} ")
+
+    def _widen(self, line: str, widths: List[int], delimiter: bool = False) -> str:
+        """Source line with each segment padded to widths, keeping how its text is justified."""
+        segments = []
+        for seg, width in zip(self._split(line, keep_spaces=True), widths):
+            gap = width - display_width(seg)
+            if gap > 0:
+                lead, trail = len(seg) - len(seg.lstrip(" ")), len(seg) - len(seg.rstrip(" "))
+                if delimiter:
+                    seg = seg[:2] + "-" * gap + seg[2:]
+                elif lead > 1 and trail > 1:
+                    seg = " " * (gap // 2) + seg + " " * (gap - gap // 2)
+                elif lead > 1:
+                    seg = " " * gap + seg
+                else:
+                    seg = seg + " " * gap
+            segments.append(seg)
+        return self.indent + "|" + "|".join(segments) + "|"
+
+    def _wrap(self, inner: str) -> str:
+        if not self.leading_pipe:
+            inner = inner[1:] if inner.startswith(" ") else inner
+        if not self.trailing_pipe:
+            inner = inner[:-1] if inner.endswith(" ") else inner
+        return self.indent + ("|" if self.leading_pipe else "") + inner + ("|" if self.trailing_pipe else "")
+
+    def column(self, col: Column) -> int:
+        """Index of a column given by index or header name."""
+        if isinstance(col, str):
+            if col not in self.header:
+                raise KeyError(f"Column '{col}' not found")
+            return self.header.index(col)
+        if col < 0 or col >= len(self.header):
+            raise IndexError(f"Col index {col} out of bounds.")
+        return col
+
+    def _row(self, row: int) -> Dict[str, Any]:
+        if row < 0 or row >= len(self._rows):
+            raise IndexError(f"Row index {row} out of bounds.")
+        return self._rows[row]
+
+    def __len__(self) -> int:
+        return len(self._rows)
+
+    @property
+    def rows(self) -> List[List[str]]:
+        """Copy of the data rows (header excluded)."""
+        return [list(r["cells"]) for r in self._rows]
+
+    def get(self, row: int, col: Column) -> str:
+        return self._row(row)["cells"][self.column(col)]
+
+    def set(self, row: int, col: Column, value: str) -> None:
+        record = self._row(row)
+        index = self.column(col)
+        value = _cell(value)
+        if record["cells"][index] != value:
+            record["cells"][index] = value
+            record["raw"] = None
+            self.changed = True
+
+    def get_cells(self, cells: Iterable[Tuple[int, Column]]) -> List[str]:
+        return [self.get(row, col) for row, col in cells]
+
+    def set_cells(self, updates: Dict[Tuple[int, Column], str]) -> None:
+        """Set many cells; every address is checked before anything is written."""
+        for row, col in updates:
+            self._row(row)
+            self.column(col)
+        for (row, col), value in updates.items():
+            self.set(row, col, value)
+
+    def add_row(self, values: Union[List[str], Dict[str, str]], index: Optional[int] = None) -> None:
+        """Insert a row (list in column order, or {header: value}) at index, default at the end."""
+        if isinstance(values, dict):
+            values = [values.get(h, "") for h in self.header]
+        cells = self._normalize([_cell(v) for v in values])
+        self._rows.insert(len(self._rows) if index is None else index, {"cells": cells, "raw": None})
+        self.changed = True
+
+    def delete_row(self, row: int) -> List[str]:
+        """Remove a data row and return its cells."""
+        self._row(row)
+        self.changed = True
+        return self._rows.pop(row)["cells"]
+
+    def sort(self, col: Column, key: Optional[Callable[[str], Any]] = None, reverse: bool = False) -> None:
+        """Stable sort of the data rows by one column (unchanged rows keep their source text)."""
+        index = self.column(col)
+        order = sorted(self._rows, key=lambda r: (key or str)(r["cells"][index]), reverse=reverse)
+        if order != self._rows:
+            self._rows = order
+            self.changed = True
+
+    def render(self) -> str:
+        """
+        Markdown source of the table, ending with a newline. Unmodified rows keep their text; in a
+        column-aligned table a value wider than its column widens that column on every line.
+        """
+        dirty = [r["cells"] for r in self._rows if r["raw"] is None]
+        if self._layout is None:
+            lines = [self._header_raw, self._delimiter_raw]
+            lines += [r["raw"] if r["raw"] is not None else self._render_row(r["cells"], [0] * len(self.header)) for r in self._rows]
+            return self.newline.join(lines) + self.newline
+
+        widths = list(self._layout)
+        for cells in dirty:
+            for i, cell in enumerate(cells):
+                widths[i] = max(widths[i], display_width(cell) + 2)
+        relayout = widths != self._layout
+        lines = [self._widen(self._header_raw, widths) if relayout else self._header_raw,
+                 self._widen(self._delimiter_raw, widths, delimiter=True) if relayout else self._delimiter_raw]
+        for record in self._rows:
+            if record["raw"] is None:
+                lines.append(self._render_row(record["cells"], [w - 2 for w in widths]))
+            else:
+                lines.append(self._widen(record["raw"], widths) if relayout else record["raw"])
+        return self.newline.join(lines) + self.newline
@@ -0,0 +1,118 @@
+import asyncio
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Any, List, Optional, Sequence, Tuple, Callable, Awaitable, Iterator, AsyncIterator
+
+from src.apps.rag_flow_mcp.core import deadline
+
+logger = logging.getLogger(__name__)
+
+class PageError(RuntimeError):
+    """A page request failed while iterating; carries the raw error response."""
+
+    def __init__(self, page: int, response: Any):
+        super().__init__(f"Failed to fetch page {page}: {response}")
+        self.page = page
+        self.response = response
+
+def page_items(response: Any, key: str) -> Tuple[List[Dict[str, Any]], Optional[int]]:
+    """
+    Extract (items, total) from one RAGFlow list response. Handles the shapes used by
+    list_datasets ({"data": [...]}), list_documents ({"data": {"docs": [...], "total": n}})
+    and get_document_content ({"status": "success", "data": {"chunks": [...], "total": n}}).
+    Returns ([], None) for error responses; callers check is_error_page first.
+    """
+    if not isinstance(response, dict):
+        return [], None
+    data = response.get("data", response)
+    total = response.get("total")
+    if isinstance(data, dict):
+        total = data.get("total", total)
+        data = data.get(key, [])
+    if not isinstance(data, list):
+        data = []
+    return data, total
+
+def is_error_page(response: Any) -> bool:
+    if not isinstance(response, dict):
+        return True
+    return "error" in response or response.get("status") == "error" or response.get("code", 0) != 0
+
+def project(item: Dict[str, Any], fields: Optional[Sequence[str]]) -> Dict[str, Any]:
+    """Keep only `fields` of an item (None = keep everything), e.g. to drop chunk vectors / content."""
+    if not fields or not isinstance(item, dict):
+        return item
+    return {f: item[f] for f in fields if f in item}
+
+def _is_last_page(items: List[Any], total: Optional[int], page: int, page_size: int) -> bool:
+    if len(items) < page_size:
+        return True
+    return total is not None and page * page_size >= total
+
+def iter_pages(
+    fetch_page: Callable[[int, int], Dict[str, Any]],
+    key: str,
+    page_size: int = 100,
+    fields: Optional[Sequence[str]] = None,
+    start_page: int = 1,
+    prefetch: bool = True
+) -> Iterator[Dict[str, Any]]:
+    """
+    分页迭代器 (Prefetching Page Iterator)
+
+    依次遍历所有分页并逐条 yield；消费第 N 页时，第 N+1 页已在后台线程中请求。
+    fetch_page(page, page_size) 返回 RAGFlow 原始响应；出错时抛出 PageError。
+    """
+    executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="rag-prefetch") if prefetch else None
+    fetch = deadline.wrap(fetch_page)
+    try:
+        page = start_page
+        pending = executor.submit(fetch, page, page_size) if executor else None
+        while True:
+            response = pending.result() if executor else fetch(page, page_size)
+            if is_error_page(response):
+                raise PageError(page, response)
+            items, total = page_items(response, key)
+            last = _is_last_page(items, total, page, page_size)
+            if not last and executor:
+                pending = executor.submit(fetch, page + 1, page_size)
+            for item in items:
+                yield project(item, fields)
+            if last:
+                return
+            page += 1
+    finally:
+        if executor:
+            # Consumer may stop early: drop the prefetched page instead of waiting for it
+            executor.shutdown(wait=False, cancel_futures=True)
+
+async def aiter_pages(
+    fetch_page: Callable[[int, int], Awaitable[Dict[str, Any]]],
+    key: str,
+    page_size: int = 100,
+    fields: Optional[Sequence[str]] = None,
+    start_page: int = 1,
+    prefetch: bool = True
+) -> AsyncIterator[Dict[str, Any]]:
+    """Async version of iter_pages: page N+1 is requested in a task while page N is consumed."""
+    page = start_page
+    pending = asyncio.ensure_future(fetch_page(page, page_size))
+    try:
+        while True:
+            response = await pending
+            if is_error_page(response):
+                raise PageError(page, response)
+            items, total = page_items(response, key)
+            last = _is_last_page(items, total, page, page_size)
+            if not last:
+                pending = asyncio.ensure_future(fetch_page(page + 1, page_size)) if prefetch else None
+            for item in items:
+                yield project(item, fields)
+            if last:
+                return
+            page += 1
+            if pending is None:
+                pending = asyncio.ensure_future(fetch_page(page, page_size))
+    finally:
+        if pending is not None and not pending.done():
+            pending.cancel()
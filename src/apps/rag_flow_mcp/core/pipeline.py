@@ -0,0 +1,123 @@
+import queue
+import logging
+import threading
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Sequence, Tuple
+
+from src.apps.rag_flow_mcp.core import deadline
+
+logger = logging.getLogger(__name__)
+
+_DONE = object()
+_POLL = 0.1
+
+class StageFailure:
+    """Result slot of an item whose stage raised; later stages pass it through untouched."""
+
+    def __init__(self, stage: str, error: BaseException):
+        self.stage = stage
+        self.error = error
+
+    def __repr__(self) -> str:
+        return f"StageFailure(stage={self.stage!r}, error={self.error!r})"
+
+class Pipeline:
+    """
+    分阶段并发流水线 (Staged Pipeline)
+
+    stages: [(name, fn, concurrency), ...]，每个阶段有自己的工作线程数，阶段之间用有界队列连接，
+    上游过快时会被阻塞 (背压)，因此第 k+1 项的第一阶段可以与第 k 项的第二阶段重叠执行。
+    process() 按输入顺序产出 (index, result)；某阶段抛出异常的项产出 StageFailure。
+    时间预算 (deadline) 用完后不再送入新项，已在处理中的项照常完成。
+    """
+
+    def __init__(self, stages: Sequence[Tuple[str, Callable[[Any], Any], int]], queue_size: int = 8):
+        if not stages:
+            raise ValueError("Pipeline needs at least one stage")
+        self.stages = [(name, fn, max(1, concurrency)) for name, fn, concurrency in stages]
+        self.queue_size = max(1, queue_size)
+
+    def run(self, items: Iterable[Any]) -> List[Any]:
+        """Results in input order (items not started before the deadline are left out)."""
+        return [result for _, result in self.process(items)]
+
+    def process(self, items: Iterable[Any]) -> Iterator[Tuple[int, Any]]:
+        queues = [queue.Queue(self.queue_size) for _ in range(len(self.stages) + 1)]
+        stop = threading.Event()
+        remaining = [concurrency for _, _, concurrency in self.stages]
+        lock = threading.Lock()
+
+        def put(q: queue.Queue, entry: Any) -> bool:
+            while not stop.is_set():
+                try:
+                    q.put(entry, timeout=_POLL)
+                    return True
+                except queue.Full:
+                    continue
+            return False
+
+        def get(q: queue.Queue) -> Any:
+            while not stop.is_set():
+                try:
+                    return q.get(timeout=_POLL)
+                except queue.Empty:
+                    continue
+            return _DONE
+
+        def feed():
+            for index, item in enumerate(items):
+                if stop.is_set() or deadline.expired():
+                    if deadline.expired():
+                        logger.warning(f"Deadline reached, pipeline stops after {index} item(s)")
+                    break
+                if not put(queues[0], (index, item)):
+                    return
+            put(queues[0], _DONE)
+
+        def work(stage_index: int):
+            name, fn, _ = self.stages[stage_index]
+            inbox, outbox = queues[stage_index], queues[stage_index + 1]
+            while True:
+                entry = get(inbox)
+                if entry is _DONE:
+                    break
+                index, value = entry
+                if not isinstance(value, StageFailure):
+                    try:
+                        value = fn(value)
+                    except Exception as e:
+                        logger.error(f"Pipeline stage '{name}' failed for item {index}: {e}")
+                        value = StageFailure(name, e)
+                if not put(outbox, (index, value)):
+                    return
+            with lock:
+                remaining[stage_index] -= 1
+                last = remaining[stage_index] == 0
+            # The last worker of a stage closes the next queue; others hand the marker to their siblings
+            put(outbox if last else inbox, _DONE)
+
+        # Workers run in a copy of the caller's context so RAGFlow calls see its deadline
+        threads = [threading.Thread(target=deadline.wrap(feed), name="pipeline-feed", daemon=True)]
+        for stage_index, (name, _, concurrency) in enumerate(self.stages):
+            threads.extend(
+                threading.Thread(target=deadline.wrap(work), args=(stage_index,), name=f"pipeline-{name}-{n}", daemon=True)
+                for n in range(concurrency)
+            )
+        for t in threads:
+            t.start()
+
+        # Ordered assembly: buffer out-of-order results until their predecessors are done
+        pending: Dict[int, Any] = {}
+        next_index = 0
+        try:
+            while True:
+                entry = get(queues[-1])
+                if entry is _DONE:
+                    break
+                index, value = entry
+                pending[index] = value
+                while next_index in pending:
+                    yield next_index, pending.pop(next_index)
+                    next_index += 1
+        finally:
+            # Also reached when the consumer stops early: unblock and retire all workers
+            stop.set()
@@ -1,18 +1,185 @@
+import os
+import re
+import json
+import time
+import sqlite3
+import hashlib
 import logging
-from typing import Optional
+import threading
+from typing import Any, Dict, List, Optional, Sequence, Union
 from src.apps.rag_flow_mcp.core.rag_client import RAGClient
+from src.apps.rag_flow_mcp.core.retrieval_cache import LRUCache, SQLiteStore, normalize_query
 
 logger = logging.getLogger(__name__)
 
+_REWRITE_RULES = (
+    "你是一个专业的搜索引擎查询优化专家。\n"
+    "你的任务是将用户的输入（可能包含模糊描述、上下文或长文本）改写为精简、准确的搜索关键词或短语，以便在知识库中进行 RAG 检索。\n"
+    "要求：\n"
+    "1. 去除无关的语气词、礼貌用语。\n"
+    "2. 提取核心实体、技术术语和关键动作。\n"
+    "3. 如果有上下文，利用上下文补充指代不明的部分。\n"
+)
+
+_BATCH_OUTPUT_RULES = (
+    "4. 输入是一个 JSON 数组，每项包含 id、query 以及可选的 context，请逐项独立改写。\n"
+    "5. 只输出一个 JSON 数组，每项格式为 {\"id\": 原 id, \"rewritten\": \"改写后的查询\"}，"
+    "数量与输入一致，不要包含任何解释或额外内容。"
+)
+
+# Cached rewrites are tagged with the prompt they came from; editing the rules retires them
+_PROMPT_VERSION = hashlib.sha256((_REWRITE_RULES + _BATCH_OUTPUT_RULES).encode("utf-8")).hexdigest()[:12]
+
+# Rule-based cleanup, as in ScenarioProcessor: list / heading markers and "问题:" style labels
+_LIST_MARKER = re.compile(r'^[\#\-\*\s]*(?:\d+[\.、]\s*)?')
+_LABEL = re.compile(r'^(Question|问题|Description|描述)[:：]\s*', re.IGNORECASE)
+# References that only the context can resolve; such queries always go to the LLM
+_DEICTIC = re.compile(r'(这个|那个|这些|那些|它|上述|上面|前面|\b(?:this|that|it|these|those)\b)', re.IGNORECASE)
+
+def clean_query(query: str) -> str:
+    """Deterministic normalisation: strip list markers and question labels, collapse whitespace."""
+    cleaned = _LIST_MARKER.sub("", query.strip())
+    cleaned = _LABEL.sub("", cleaned)
+    return " ".join(cleaned.split())
+
+def _parse_batch_response(text: str) -> Dict[int, str]:
+    """{id: rewritten} from the model's JSON array; tolerates code fences and surrounding prose."""
+    text = re.sub(r"```(?:json)?", "", text or "")
+    start, end = text.find("["), text.rfind("]")
+    if start == -1 or end <= start:
+        return {}
+    try:
+        items = json.loads(text[start:end + 1])
+    except ValueError:
+        return {}
+    parsed = {}
+    for item in items if isinstance(items, list) else []:
+        if not isinstance(item, dict):
+            continue
+        rewritten = item.get("rewritten")
+        try:
+            item_id = int(item.get("id"))
+        except (TypeError, ValueError):
+            continue
+        if isinstance(rewritten, str) and rewritten.strip():
+            parsed[item_id] = rewritten.strip().strip('"').strip("'")
+    return parsed
+
+class RewriteCache:
+    """
+    改写结果缓存 (Rewrite Cache)
+
+    两级缓存：内存 LRU + 可选的 sqlite 磁盘存储 (RAG_CACHE_DIR 下的 rewrite_cache.sqlite3，进程重启后仍有效)。
+    Key 由归一化查询与上下文组成；记录附带 prompt 版本，改写规则变化后旧记录视为未命中。
+    """
+
+    def __init__(self, max_entries: int = 2048, cache_dir: str = "", disk_max_entries: int = 10000):
+        self.memory = LRUCache(max_entries)
+        self.disk = SQLiteStore(os.path.join(cache_dir, "rewrite_cache.sqlite3"), disk_max_entries) if cache_dir else None
+
+    @classmethod
+    def from_config(cls, config: Dict[str, Any]) -> Optional["RewriteCache"]:
+        if not config.get("RAG_REWRITE_CACHE_ENABLED", True):
+            return None
+        return cls(
+            max_entries=config.get("RAG_REWRITE_CACHE_MAX_ENTRIES", 2048),
+            cache_dir=config.get("RAG_CACHE_DIR", ""),
+            disk_max_entries=config.get("RAG_CACHE_DISK_MAX_ENTRIES", 10000)
+        )
+
+    @staticmethod
+    def make_key(query: str, context: str = "") -> str:
+        raw = json.dumps({"query": normalize_query(query), "context": normalize_query(context or "")}, ensure_ascii=False)
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    def get(self, query: str, context: str = "") -> Optional[str]:
+        key = self.make_key(query, context)
+        entry = self.memory.get(key)
+        if entry is None and self.disk is not None:
+            try:
+                entry = self.disk.get(key)
+            except sqlite3.Error as e:
+                logger.warning(f"Rewrite cache disk read failed: {e}")
+            if entry is not None:
+                self.memory.set(key, *entry)
+        if entry is None or entry[1] != _PROMPT_VERSION:
+            return None
+        return entry[0]
+
+    def set(self, query: str, context: str, rewritten: str) -> None:
+        key = self.make_key(query, context)
+        created_at = time.time()
+        self.memory.set(key, rewritten, _PROMPT_VERSION, created_at)
+        if self.disk is not None:
+            try:
+                self.disk.set(key, rewritten, _PROMPT_VERSION, created_at)
+            except sqlite3.Error as e:
+                logger.warning(f"Rewrite cache disk write failed: {e}")
+
+    def __len__(self) -> int:
+        return len(self.disk) if self.disk is not None else len(self.memory)
+
 class QueryRewriter:
     """
     查询改写服务 (Query Rewriter)
     
     职责: 将用户的自然语言查询或任务描述，改写为更适合 RAG 检索的关键词或问题。
+    分层处理：
+    1. 规则快速通道：已经足够短、且不依赖上下文的查询只做确定性清理，不调用 LLM。
+    2. 改写缓存：LLM 改写结果按 (查询, 上下文) 缓存，重复查询直接命中。
+    3. LLM 改写：其余查询调用 LLM (批量接口一次调用处理多条)。
     """
     
-    def __init__(self, rag_client: RAGClient):
+    def __init__(self, rag_client: RAGClient, cache: Optional[RewriteCache] = None, fast_path_chars: int = 0):
         self.rag_client = rag_client
+        self.cache = cache
+        # 0 disables the rule-based fast path (every query goes to the LLM)
+        self.fast_path_chars = fast_path_chars
+        self._stats = {"fast_path": 0, "cache_hits": 0, "llm_rewrites": 0}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_config(cls, rag_client: RAGClient, config: Dict[str, Any]) -> "QueryRewriter":
+        return cls(
+            rag_client,
+            cache=RewriteCache.from_config(config),
+            fast_path_chars=config.get("RAG_REWRITE_FAST_PATH_CHARS", 32)
+        )
+
+    def simple_rewrite(self, query: str, context: str = "") -> Optional[str]:
+        """Rule-based rewrite for short, self-contained queries; None means the query needs the LLM."""
+        if self.fast_path_chars <= 0 or "\n" in query.strip():
+            return None
+        cleaned = clean_query(query)
+        if not cleaned or len(cleaned) > self.fast_path_chars:
+            return None
+        if context and _DEICTIC.search(cleaned):
+            return None
+        return cleaned
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            stats = dict(self._stats)
+        stats["cache_entries"] = len(self.cache) if self.cache is not None else 0
+        return stats
+
+    def _lookup(self, query: str, context: str) -> Optional[str]:
+        """Fast path, then cache; None if the query has to be rewritten by the LLM."""
+        result = self.simple_rewrite(query, context)
+        tier = "fast_path"
+        if result is None and self.cache is not None:
+            result = self.cache.get(query, context)
+            tier = "cache_hits"
+        if result is not None:
+            with self._lock:
+                self._stats[tier] += 1
+        return result
+
+    def _remember(self, query: str, context: str, rewritten: str) -> None:
+        with self._lock:
+            self._stats["llm_rewrites"] += 1
+        if self.cache is not None:
+            self.cache.set(query, context, rewritten)
         
     def rewrite(self, query: str, context: str = "") -> str:
         """
@@ -25,21 +192,17 @@ class QueryRewriter:
         Returns:
             str: 改写后的查询字符串。
         """
+        hit = self._lookup(query, context)
+        if hit is not None:
+            return hit
+        
         # 如果没有配置 Chat ID，无法调用 LLM，直接返回原查询
         if not self.rag_client.chat_id:
             logger.warning("RAGFLOW_CHAT_ID 未配置，跳过查询改写，使用原始查询。")
             return query
             
         try:
-            system_prompt = (
-                "你是一个专业的搜索引擎查询优化专家。\n"
-                "你的任务是将用户的输入（可能包含模糊描述、上下文或长文本）改写为精简、准确的搜索关键词或短语，以便在知识库中进行 RAG 检索。\n"
-                "要求：\n"
-                "1. 去除无关的语气词、礼貌用语。\n"
-                "2. 提取核心实体、技术术语和关键动作。\n"
-                "3. 如果有上下文，利用上下文补充指代不明的部分。\n"
-                "4. 直接输出改写后的查询，不要包含任何解释或额外内容。"
-            )
+            system_prompt = _REWRITE_RULES + "4. 直接输出改写后的查询，不要包含任何解释或额外内容。"
             
             user_prompt = f"原始查询: {query}\n"
             if context:
@@ -52,6 +215,7 @@ class QueryRewriter:
                 # 清理可能的多余空白或标点
                 rewritten = rewritten.strip().strip('"').strip("'")
                 logger.info(f"查询改写: '{query}' -> '{rewritten}'")
+                self._remember(query, context, rewritten)
                 return rewritten
             else:
                 logger.warning("LLM 返回为空，使用原始查询。")
@@ -60,3 +224,64 @@ class QueryRewriter:
         except Exception as e:
             logger.error(f"查询改写失败: {e}，回退到原始查询。")
             return query
+
+    def rewrite_many(self, queries: Sequence[str], contexts: Union[str, Sequence[str], None] = None, batch_size: int = 50) -> List[str]:
+        """
+        批量查询改写：每 batch_size 个查询只调用一次 LLM (JSON 数组进、JSON 数组出)。
+        
+        Args:
+            queries: 原始查询列表。
+            contexts: 所有查询共用的上下文 (str)，或与 queries 一一对应的上下文列表。
+            batch_size: 单次 LLM 调用包含的最大查询数。
+            
+        Returns:
+            List[str]: 与 queries 顺序一致的改写结果。解析失败的单项回退到 rewrite()，
+            LLM 不可用时回退到原始查询。
+        """
+        queries = list(queries)
+        if isinstance(contexts, str) or contexts is None:
+            contexts = [contexts or ""] * len(queries)
+        contexts = list(contexts)
+        if len(contexts) != len(queries):
+            raise ValueError("contexts must be a string or have one entry per query")
+        results: List[Optional[str]] = [self._lookup(q, c) for q, c in zip(queries, contexts)]
+        pending = [i for i, r in enumerate(results) if r is None]
+        if pending and not self.rag_client.chat_id:
+            logger.warning("RAGFLOW_CHAT_ID 未配置，跳过查询改写，使用原始查询。")
+            pending, results = [], [queries[i] if r is None else r for i, r in enumerate(results)]
+        
+        batch_size = max(1, batch_size)
+        for start in range(0, len(pending), batch_size):
+            batch = pending[start:start + batch_size]
+            rewritten = self._rewrite_batch([queries[i] for i in batch], [contexts[i] for i in batch])
+            for i, value in zip(batch, rewritten):
+                results[i] = value
+        return results
+
+    def _rewrite_batch(self, queries: List[str], contexts: List[str]) -> List[str]:
+        items: List[Dict[str, Any]] = []
+        for i, (query, context) in enumerate(zip(queries, contexts)):
+            item: Dict[str, Any] = {"id": i, "query": query}
+            if context:
+                item["context"] = context
+            items.append(item)
+        user_prompt = f"待改写的查询:\n{json.dumps(items, ensure_ascii=False)}\n改写结果 (JSON 数组):"
+        
+        try:
+            response = self.rag_client.call_llm(_REWRITE_RULES + _BATCH_OUTPUT_RULES, user_prompt)
+        except Exception as e:
+            logger.error(f"批量查询改写失败: {e}，回退到原始查询。")
+            return list(queries)
+        if not response:
+            logger.warning("LLM 返回为空，使用原始查询。")
+            return list(queries)
+        
+        parsed = _parse_batch_response(response)
+        for i, rewritten in parsed.items():
+            if 0 <= i < len(queries):
+                self._remember(queries[i], contexts[i], rewritten)
+        missing = [i for i in range(len(queries)) if i not in parsed]
+        if missing:
+            logger.warning(f"批量改写结果缺失 {len(missing)}/{len(queries)} 项，逐项回退改写。")
+        logger.info(f"批量查询改写: {len(queries) - len(missing)}/{len(queries)} 项由一次 LLM 调用完成")
+        return [parsed[i] if i in parsed else self.rewrite(queries[i], contexts[i]) for i in range(len(queries))]
@@ -0,0 +1,250 @@
+import io
+import os
+import re
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+# "## 3. Title" starts a question block; "**Label**：" at the start of a line starts a field inside it
+_HEADER = re.compile(r'##[ \t]+(\d+)\.(.+)')
+_FIELD = re.compile(r'\*\*([^*\n]+?)\*\*[:：]')
+
+AI_FIELD = "AI 参考建议"
+ANSWER_FIELD = "回答"
+
+def _lines(content: str) -> Iterable[str]:
+    # Split on "\n" only (str.splitlines would also break on \r, \x0c, \u2028, ...)
+    return io.StringIO(content, newline="\n")
+
+def _close_block(block: Dict[str, Any], pos: int, ends_with_newline: bool, last: bool = False) -> None:
+    # Like the old "(?=\n##\s+\d+\.|\Z)" pattern, the newline before the next header is not part of the block
+    end = pos - 1 if not last and ends_with_newline else pos
+    block["end"] = end
+    for label, (start, value_start, field_end) in block["fields"].items():
+        if field_end is None:
+            block["fields"][label] = (start, value_start, max(value_start, end))
+
+def iter_blocks(lines: Iterable[str]) -> Iterator[Tuple[Optional[Dict[str, Any]], str]]:
+    """
+    Streaming scan over the document lines (line endings kept). Yields (block, block_text) for every
+    question block as soon as the next header (or the end of input) is reached, and (None, line) for
+    lines before the first question, so the yielded texts concatenate back to the input.
+    Offsets in block are absolute; only the current block is held in memory.
+    """
+    block = None
+    buffer: List[str] = []
+    open_field = None
+    pos = 0
+    previous = ""
+    for line_no, line in enumerate(lines, 1):
+        text = line.rstrip("\r\n")
+        header = _HEADER.match(text)
+        if header:
+            if block is not None:
+                _close_block(block, pos, previous.endswith("\n"))
+                yield block, "".join(buffer)
+            block = {"id": header.group(1), "title": header.group(2).strip(), "line": line_no, "start": pos,
+                     "header_end": pos + len(line), "fields": {}}
+            buffer = [line]
+            open_field = None
+        elif block is None:
+            yield None, line
+        else:
+            buffer.append(line)
+            field = _FIELD.match(text)
+            if field:
+                if open_field is not None:
+                    start, value_start, _ = block["fields"][open_field]
+                    block["fields"][open_field] = (start, value_start, max(value_start, pos - 1))
+                label = field.group(1).strip()
+                if label in block["fields"]:
+                    open_field = None
+                else:
+                    block["fields"][label] = (pos, pos + field.end(), None)
+                    open_field = label
+        pos += len(line)
+        previous = line
+    if block is not None:
+        _close_block(block, pos, previous.endswith("\n"), last=True)
+        yield block, "".join(buffer)
+
+def index_questions(content: str) -> List[Dict[str, Any]]:
+    """
+    One linear scan over the document. Each question block is returned as
+    {"id", "title", "line", "start", "end", "header_end", "fields"} with character offsets into content
+    (line is the 1-based line number of the header);
+    fields maps a label ("问题描述", "AI 参考建议", "回答", ...) to (line_start, value_start, end),
+    where end stops before the newline that precedes the next field (first occurrence of a label wins).
+    """
+    return [block for block, _ in iter_blocks(_lines(content)) if block is not None]
+
+def _rebase(block: Dict[str, Any], delta: int) -> Dict[str, Any]:
+    """Copy of block with every offset shifted by delta (e.g. -start to address the block's own text)."""
+    moved = dict(block, start=block["start"] + delta, end=block["end"] + delta, header_end=block["header_end"] + delta)
+    moved["fields"] = {label: (a + delta, b + delta, c + delta) for label, (a, b, c) in block["fields"].items()}
+    return moved
+
+def field_text(content: str, block: Dict[str, Any], label: str) -> str:
+    """Stripped value of a field, "" if the block does not have it."""
+    span = block["fields"].get(label)
+    return content[span[1]:span[2]].strip() if span else ""
+
+def splice(content: str, edits: Iterable[Tuple[int, int, str]]) -> str:
+    """Apply (start, end, replacement) edits in a single rebuild; edits must not overlap."""
+    parts: List[str] = []
+    cursor = 0
+    for start, end, text in sorted(edits, key=lambda e: (e[0], e[1])):
+        if start < cursor:
+            raise ValueError(f"Overlapping edit at offset {start}")
+        parts.append(content[cursor:start])
+        parts.append(text)
+        cursor = end
+    parts.append(content[cursor:])
+    return "".join(parts)
+
+def _ai_span(content: str, block: Dict[str, Any]) -> Optional[Tuple[int, int]]:
+    """(start, end) of the existing AI block, from the newline before its label up to "**回答**" (or the block end)."""
+    fields = block["fields"]
+    if AI_FIELD not in fields:
+        return None
+    start = fields[AI_FIELD][0]
+    # The AI block runs up to "**回答**" even if the answer text contains bold "**...**：" lines
+    answer = fields.get(ANSWER_FIELD)
+    end = answer[0] - 1 if answer and answer[0] > start else block["end"]
+    if start > block["start"] and content[start - 1] == "\n":
+        start -= 1
+    return start, end
+
+def ai_block_edit(content: str, block: Dict[str, Any], ai_block: str) -> Tuple[int, int, str]:
+    """
+    Edit that places ai_block ("\n**AI 参考建议**：..."): over the existing AI field,
+    else right before the "**回答**" field, else at the end of the block.
+    """
+    span = _ai_span(content, block)
+    if span is not None:
+        return span[0], span[1], ai_block
+    if ANSWER_FIELD in block["fields"]:
+        pos = block["fields"][ANSWER_FIELD][0]
+        return pos, pos, ai_block + "\n"
+    return block["end"], block["end"], ai_block
+
+def iter_revisions(lines: Iterable[str], answers_map: Dict[str, Dict[str, Any]],
+                   render: Callable[[Dict[str, Any]], str]) -> Iterator[Tuple[str, str]]:
+    """
+    (old_text, new_text) for every segment of the document, one question block at a time:
+    the new texts concatenate to the revised document, the old ones to the input (e.g. for a diff report).
+    """
+    rendered: Dict[str, str] = {}
+    for block, text in iter_blocks(lines):
+        if block is None or block["id"] not in answers_map:
+            yield text, text
+            continue
+        if block["id"] not in rendered:
+            rendered[block["id"]] = render(answers_map[block["id"]])
+        yield text, splice(text, [ai_block_edit(text, _rebase(block, -block["start"]), rendered[block["id"]])])
+
+def iter_injected(lines: Iterable[str], answers_map: Dict[str, Dict[str, Any]],
+                  render: Callable[[Dict[str, Any]], str]) -> Iterator[str]:
+    """Streaming inject_answers: yields the revised document one question block at a time."""
+    for _, new_text in iter_revisions(lines, answers_map, render):
+        yield new_text
+
+def inject_answers(content: str, answers_map: Dict[str, Dict[str, Any]], render: Callable[[Dict[str, Any]], str]) -> str:
+    """Write the rendered AI block of every answered question in one pass (answers_map is keyed by question id)."""
+    return "".join(iter_injected(_lines(content), answers_map, render))
+
+def _record(text: str, block: Dict[str, Any]) -> Dict[str, Any]:
+    local = _rebase(block, -block["start"])
+    span = _ai_span(text, local)
+    if span is not None:
+        ai_block = text[local["fields"][AI_FIELD][1]:span[1]].strip()
+        clean_block = text[:span[0]] + text[span[1]:local["end"]]
+    else:
+        ai_block, clean_block = "", text[:local["end"]]
+    return {
+        "id": block["id"],
+        "title": block["title"],
+        "description": field_text(text, local, "问题描述") or field_text(text, local, "描述"),
+        "business_context": field_text(text, local, "业务上下文"),
+        "answer": field_text(text, local, ANSWER_FIELD),
+        "ai_block": ai_block,
+        "full_block": text[:local["end"]],
+        "clean_block": clean_block,
+        "line": block["line"],
+        "start": block["start"],
+        "end": block["end"],
+        "fields": block["fields"]
+    }
+
+def iter_questions(lines: Iterable[str]) -> Iterator[Dict[str, Any]]:
+    """Question records yielded one by one while scanning lines (e.g. an open file): memory is bounded by one block."""
+    for block, text in iter_blocks(lines):
+        if block is not None:
+            yield _record(text, block)
+
+def extract_questions(content: str) -> List[Dict[str, Any]]:
+    """
+    Structured question records from one scan: id, title, description, business_context, answer,
+    ai_block (text of the AI suggestion), full_block, clean_block (full_block without the AI block),
+    line / start / end offsets and the raw field spans.
+    """
+    return list(iter_questions(_lines(content)))
+
+class QuestionExtractor:
+    """
+    共享的问题解析缓存 (Question Extractor)
+
+    解析结果按内容摘要缓存；按路径读取时先比较 mtime / size，文件未变化时连读取都省去。
+    各引擎 (Inference / Evolution / Lifecycle / DocumentProcessor) 共用同一个实例，同一文件只解析一次。
+    """
+
+    def __init__(self, max_entries: int = 32):
+        self.max_entries = max_entries
+        self._records: "OrderedDict[str, List[Dict[str, Any]]]" = OrderedDict()
+        self._files: Dict[str, Tuple[int, int, str]] = {}
+        self._lock = threading.Lock()
+
+    def extract(self, content: str) -> List[Dict[str, Any]]:
+        """Question records of content (a fresh list of record copies; parsed once per distinct content)."""
+        digest = hashlib.sha1(content.encode("utf-8")).hexdigest()
+        with self._lock:
+            records = self._records.get(digest)
+            if records is not None:
+                self._records.move_to_end(digest)
+        if records is None:
+            records = extract_questions(content)
+            with self._lock:
+                self._records[digest] = records
+                while len(self._records) > self.max_entries:
+                    self._records.popitem(last=False)
+        return [dict(r) for r in records]
+
+    def load(self, path: str) -> Tuple[str, List[Dict[str, Any]]]:
+        """(content, records) of a UTF-8 file, re-read only when its mtime or size changed."""
+        stat = os.stat(path)
+        with self._lock:
+            cached = self._files.get(path)
+        if cached is not None and cached[:2] == (stat.st_mtime_ns, stat.st_size):
+            content = cached[2]
+        else:
+            with open(path, "r", encoding="utf-8") as f:
+                content = f.read()
+            with self._lock:
+                self._files[path] = (stat.st_mtime_ns, stat.st_size, content)
+                while len(self._files) > self.max_entries:
+                    self._files.pop(next(iter(self._files)))
+        return content, self.extract(content)
+
+    def stream(self, path: str) -> Iterator[Dict[str, Any]]:
+        """Records of a (very large) file read line by line; nothing is cached and only one block is in memory."""
+        with open(path, "r", encoding="utf-8", newline="\n") as f:
+            yield from iter_questions(f)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._records.clear()
+            self._files.clear()
+
+# Process-wide instance shared by the engines
+extractor = QuestionExtractor()
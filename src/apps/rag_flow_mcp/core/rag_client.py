@@ -1,21 +1,324 @@
+import io
 import os
+import time
+import uuid
 import logging
 import requests
 import json
-from typing import Dict, Any
+from concurrent.futures import ThreadPoolExecutor, as_completed, TimeoutError as FuturesTimeout
+from typing import Dict, Any, List, Optional, Callable, Iterable, Iterator, AsyncIterator
 from requests.adapters import HTTPAdapter
 from urllib3.util.retry import Retry
+from src.apps.rag_flow_mcp.core.retrieval_cache import RetrievalCache, dataset_fingerprint, chat_dataset_ids
+from src.apps.rag_flow_mcp.core.single_flight import SingleFlight, flight_key
+from src.apps.rag_flow_mcp.core.resilience import Resilience, CircuitOpenError
+from src.apps.rag_flow_mcp.core import deadline
+from src.apps.rag_flow_mcp.core.pagination import iter_pages
+from src.common.context_packer import ContextPacker
+from src.apps.rag_flow_mcp.core.hedging import (
+    HEDGE_MODES, LOW_CONFIDENCE, LatencyTracker, HedgeStats, hedge_delay, pick_better
+)
 
 logger = logging.getLogger(__name__)
 
+# refine_query: background context is cut to the spans most relevant to the question
+_GLOBAL_CTX_PACKER = ContextPacker(budget=200)
+
+# Citations that mark a retrieve_and_answer result as an error (never cached)
+_ERROR_CITATIONS = ("API Error", "System Error", "Config Error", "Degraded")
+
+
+def _chat_payload(messages: List[Dict[str, str]], quote: bool, dataset_ids: str = "", stream: bool = False) -> Dict[str, Any]:
+    """Build the OpenAI-compatible payload for /chats_openai/{chat_id}/chat/completions."""
+    payload = {
+        "model": "ragflow",  # Required by API but ignored
+        "messages": messages,
+        "stream": stream,
+        "quote": quote
+    }
+    # RAGFlow usually binds datasets to the chat assistant; pass them explicitly if given.
+    if dataset_ids:
+        payload["dataset_ids"] = dataset_ids.split(",")
+    return payload
+
+
+class _MultipartFile:
+    """
+    multipart/form-data body for one file, read from disk block by block while it is sent.
+    requests' files= builds the whole body in memory; this keeps memory flat for large uploads.
+    """
+
+    def __init__(self, file_path: str, field: str = "file"):
+        boundary = uuid.uuid4().hex
+        filename = os.path.basename(file_path).replace('"', '%22')
+        self.content_type = f"multipart/form-data; boundary={boundary}"
+        head = (f'--{boundary}\r\nContent-Disposition: form-data; name="{field}"; filename="{filename}"\r\n'
+                f'Content-Type: application/octet-stream\r\n\r\n').encode("utf-8")
+        tail = f"\r\n--{boundary}--\r\n".encode("ascii")
+        self._file = open(file_path, "rb")
+        self._length = len(head) + os.fstat(self._file.fileno()).st_size + len(tail)
+        self._parts = [io.BytesIO(head), self._file, io.BytesIO(tail)]
+
+    def __len__(self) -> int:
+        # Lets requests send a Content-Length header instead of chunked encoding
+        return self._length
+
+    def read(self, size: int = -1) -> bytes:
+        chunks = []
+        while self._parts and size != 0:
+            data = self._parts[0].read(size)
+            if not data:
+                self._parts.pop(0)
+                continue
+            chunks.append(data)
+            if size > 0:
+                size -= len(data)
+        return b"".join(chunks)
+
+    async def aiter_blocks(self, block_size: int = 64 * 1024) -> AsyncIterator[bytes]:
+        """The same body as an async byte stream, for httpx.AsyncClient(content=...)."""
+        while True:
+            data = self.read(block_size)
+            if not data:
+                return
+            yield data
+
+    def close(self) -> None:
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def _llm_messages(system_prompt: str, user_prompt: str) -> List[Dict[str, str]]:
+    messages = []
+    if system_prompt:
+        messages.append({"role": "system", "content": system_prompt})
+    messages.append({"role": "user", "content": user_prompt})
+    return messages
+
+
+def _retrieval_payload(dataset_id: str, query: str, page: int, page_size: int, similarity_threshold: float) -> Dict[str, Any]:
+    """Build the payload for POST /api/v1/retrieval."""
+    return {
+        "question": query,
+        "dataset_ids": [dataset_id],
+        "page": page,
+        "page_size": page_size,
+        "similarity_threshold": similarity_threshold,
+        "vector_similarity_weight": 0.3,
+        "top_k": 1024
+    }
+
+
+def _normalize_chunks(json_data: Dict[str, Any]) -> Dict[str, Any]:
+    # 兼容性修复：某些版本返回 {"code":0, "data": {"chunks": [...]}} 而不是 {"code":0, "data": [...]}
+    if isinstance(json_data.get("data"), dict) and "chunks" in json_data["data"]:
+        # 转换结构以保持统一
+        json_data["data"] = json_data["data"]["chunks"]
+    return json_data
+
+
+def _llm_content(data: Dict[str, Any]) -> str:
+    if "choices" in data and len(data["choices"]) > 0:
+        return data["choices"][0].get("message", {}).get("content", "")
+    return ""
+
+
+def _parse_chat_answer(data: Any) -> Dict[str, Any]:
+    """
+    Convert a chat completion response body into {'answer', 'citation', 'score'}.
+    Shared by the sync and async clients.
+    """
+    logger.info(f"RAGFlow Response: {data}")
+
+    if not isinstance(data, dict):
+        return {
+            "answer": f"Unexpected Response Format: {type(data)}",
+            "citation": "API Error",
+            "score": 0.0
+        }
+
+    if data.get("code", 0) != 0:
+        msg = data.get('message', 'Unknown error')
+        if "Model(@None)" in msg:
+            msg += " (Hint: Please configure an LLM model for this Chat Assistant in RAGFlow UI)"
+        return {
+            "answer": f"RAGFlow Error: {msg}",
+            "citation": "API Error",
+            "score": 0.0
+        }
+    # { "choices": [ { "message": { "content": "..." } } ], "code": 0 }
+    # If it's OpenAI compatible, it might not have "code": 0 at top level if success.
+    # But RAGFlow wrapper might add it.
+
+    answer = _llm_content(data)
+    citations = []
+
+    # RAGFlow might return it in a different way or in the content?
+    # Based on docs, if quote=True, it might be in 'reference' field of data if it's not strictly OpenAI?
+    # Fallback: Check standard RAGFlow 'data' field if the structure is mixed
+    result_data = data.get("data") or {}
+    if not answer and "answer" in result_data:
+        answer = result_data["answer"]
+
+    # Refs
+    refs = result_data.get("reference", [])
+    # Also check if refs are in data root (some versions)
+    if not refs and "reference" in data:
+        refs = data["reference"]
+    # Newer versions return {"chunks": [...], "doc_aggs": [...]}
+    if isinstance(refs, dict):
+        refs = refs.get("chunks") or refs.get("doc_aggs") or []
+
+    score = 0.8 if refs else 0.3
+
+    if isinstance(refs, list):
+        for r in refs:
+            if isinstance(r, dict):
+                doc_name = r.get("doc_name") or r.get("document_name") or "Unknown"
+                citations.append(doc_name)
+            elif isinstance(r, str):
+                citations.append(r)
+
+    citation_str = ", ".join(citations[:3]) if citations else "No citation"
+
+    return {
+        "answer": answer,
+        "citation": citation_str,
+        "score": score
+    }
+
+
+def _parse_sse_line(line: Any) -> Optional[Dict[str, Any]]:
+    """Decode one 'data: {...}' line of a chat completion SSE stream (None for keep-alives / [DONE])."""
+    if not line:
+        return None
+    if isinstance(line, bytes):
+        line = line.decode("utf-8")
+    line = line.strip()
+    if not line.startswith("data:"):
+        return None
+    data = line[len("data:"):].strip()
+    if not data or data == "[DONE]":
+        return None
+    try:
+        event = json.loads(data)
+    except json.JSONDecodeError:
+        logger.warning(f"Skipping malformed SSE event: {data[:200]}")
+        return None
+    return event if isinstance(event, dict) else None
+
+
+def _stream_event_parts(event: Dict[str, Any]):
+    """Return (content delta, reference or None) for one streamed chat completion chunk."""
+    content, reference = "", None
+    choices = event.get("choices") or []
+    if choices:
+        delta = choices[0].get("delta") or {}
+        content = delta.get("content") or ""
+        reference = delta.get("reference")
+    if reference is None:
+        reference = event.get("reference")
+    if reference is None and isinstance(event.get("data"), dict):
+        reference = event["data"].get("reference")
+    return content, reference
+
+
+def _stream_result(answer: str, reference: Any) -> Dict[str, Any]:
+    """Final event of a stream: the same fields as retrieve_and_answer plus the raw reference."""
+    body = {"choices": [{"message": {"content": answer}}]}
+    if reference:
+        body["reference"] = reference
+    result = _parse_chat_answer(body)
+    result["reference"] = reference or []
+    return {"type": "result", **result}
+
+
+def _stream_error(answer: str, citation: str) -> Dict[str, Any]:
+    return {"type": "result", "answer": answer, "citation": citation, "score": 0.0, "reference": []}
+
+
+def _degraded_answer(error: CircuitOpenError) -> Dict[str, Any]:
+    """Fail-fast answer returned while the chat endpoint's circuit breaker is open."""
+    logger.warning(str(error))
+    return {
+        "answer": "⚠️ **知识库服务繁忙**\n> RAGFlow 暂时不可用 (熔断中)，请稍后重试或人工查阅相关文档。",
+        "citation": "Degraded",
+        "score": 0.0,
+        "degraded": True
+    }
+
+
+def _deadline_answer() -> Dict[str, Any]:
+    """Returned when the time budget ran out while a hedged query was still queued or running."""
+    return {
+        "answer": "Error: deadline exceeded before RAGFlow answered",
+        "citation": "System Error",
+        "score": 0.0
+    }
+
+
+def _degraded_chunks(error: CircuitOpenError) -> Dict[str, Any]:
+    logger.warning(str(error))
+    return {"error": str(error), "degraded": True}
+
+
+def _compose_agentic_answer(result: Dict[str, Any], global_ctx: str, question: str) -> Dict[str, Any]:
+    """Dual-Context Synthesis (Simulation) shared by the sync and async agentic_search."""
+    # We inject a note about the local context into the final answer
+    # to ensure the user considers their own new requirements.
+    original_answer = result["answer"]
+
+    # Check for conflicts (Mock logic)
+    conflict_note = ""
+    if "timeout" in question.lower() and "30s" in original_answer and "15s" in global_ctx:
+        conflict_note = "\n\n⚠️ **Conflict Detected**: RAG knowledge says 30s, but your ALIGNMENT doc mentions 15s."
+
+    result["answer"] = f"{original_answer}{conflict_note}"
+    return result
+
+
+def _needs_broad_query(result: Dict[str, Any]) -> bool:
+    """
+    agentic_search fallback rule: low confidence strict answer.
+    Never add a second query while RAGFlow is failing or shedding load, or once the deadline is spent.
+    """
+    return (result["score"] < LOW_CONFIDENCE and result.get("citation") not in _ERROR_CITATIONS
+            and not result.get("stale") and not deadline.expired())
+
+
+def _strict_query(question: str) -> str:
+    # Enforce "Single Question Focus": append a strict instruction to the query itself
+    # to guide the RAG/LLM backend.
+    return f"{question}\n\n[System Instruction: You MUST answer ONLY the specific question above. Do NOT merge with other topics. Do NOT hallucinate.]"
+
+
 class RAGClient:
-    def __init__(self, api_key: str, base_url: str, chat_id: str = "", timeout: int = 120, top_k: int = 10, similarity_threshold: float = 0.2):
+    def __init__(self, api_key: str, base_url: str, chat_id: str = "", timeout: int = 120, top_k: int = 10, similarity_threshold: float = 0.2, cache: Optional[RetrievalCache] = None, pool_maxsize: int = 10, coalesce: bool = True, resilience: Optional[Resilience] = None, hedge_mode: str = "off", hedge_delay: float = 0.0):
         self.api_key = api_key
         self.base_url = base_url.rstrip('/')
         self.chat_id = chat_id
         self.timeout = timeout
         self.top_k = top_k
         self.similarity_threshold = similarity_threshold
+        # Optional retrieval cache (retrieve_chunks / retrieve_and_answer)
+        self.cache = cache
+        # Concurrent identical retrieval / chat / LLM requests share one upstream call
+        self.single_flight = SingleFlight() if coalesce else None
+        # Per-endpoint adaptive concurrency limit + circuit breaker (shared per RAGFlow host by default)
+        self.resilience = resilience or Resilience.shared({"RAGFLOW_HOST": self.base_url})
+        # agentic_search hedging: "off" | "parallel" | "delayed" (hedge_delay 0 = p90 of strict queries)
+        if hedge_mode not in HEDGE_MODES:
+            raise ValueError(f"hedge_mode must be one of {HEDGE_MODES}, got '{hedge_mode}'")
+        self.hedge_mode = hedge_mode
+        self.hedge_delay = hedge_delay
+        self.hedge_stats = HedgeStats()
+        self.strict_latency = LatencyTracker()
+        self._hedge_executor: Optional[ThreadPoolExecutor] = None
         
         logger.info(f"RAGClient initialized with Base URL: {self.base_url}, Chat ID: {self.chat_id}, Timeout: {self.timeout}s")
         logger.info(f"RAG Params: Top K={self.top_k}, Threshold={self.similarity_threshold}")
@@ -25,14 +328,17 @@ class RAGClient:
         # Disable proxy usage to ensure local/LAN connections work reliably
         self.session.trust_env = False
         
+        # POSTs (retrieval / chat) are never retried at the transport level: retrying a
+        # struggling server only adds load. Overload is handled by self.resilience instead.
         retries = Retry(
             total=1,
             backoff_factor=1,
             status_forcelist=[500, 502, 503, 504],
-            allowed_methods=["GET", "POST"]
+            allowed_methods=["GET"]
         )
-        self.session.mount('http://', HTTPAdapter(max_retries=retries))
-        self.session.mount('https://', HTTPAdapter(max_retries=retries))
+        # pool_maxsize bounds the keep-alive connections per host (relevant for batch calls)
+        self.session.mount('http://', HTTPAdapter(max_retries=retries, pool_maxsize=pool_maxsize))
+        self.session.mount('https://', HTTPAdapter(max_retries=retries, pool_maxsize=pool_maxsize))
         
         # Default timeout
         # self.timeout = 120 # Moved to __init__
@@ -48,6 +354,93 @@ class RAGClient:
             logger.error(f"Failed to parse response: {e}, Content: {response.text}")
             return {"status": "error", "message": f"Response parsing failed: {str(e)}"}
 
+    def _coalesce(self, key_parts: tuple, fn: Callable[[], Any]) -> Any:
+        if self.single_flight is None:
+            return fn()
+        return self.single_flight.do(flight_key(self.base_url, *key_parts), fn)
+
+    # --- Retrieval Cache ---
+
+    def _forget_version(self, dataset_id: str) -> None:
+        # The dataset changed through this client; force a re-probe on the next lookup
+        if self.cache is not None:
+            self.cache.invalidate(dataset_id)
+
+    def _dataset_version(self, dataset_ids: List[str]) -> Optional[str]:
+        """
+        Combined version of the given datasets, probed via list_documents
+        (newest document first) and remembered for cache.version_ttl seconds.
+        Without dataset_ids the chat assistant's own datasets are used.
+        Returns None if any probe fails (callers then neither cache nor reuse answers).
+        """
+        if not dataset_ids:
+            dataset_ids = self._chat_dataset_ids()
+            if not dataset_ids:
+                return None
+        versions = []
+        for ds in dataset_ids:
+            version = self.cache.cached_version(ds) if self.cache is not None else None
+            if version is None:
+                version = dataset_fingerprint(self._coalesce(
+                    ("dataset_version", ds),
+                    lambda: self.list_documents(ds, page=1, page_size=1, orderby="update_time")
+                ))
+                if version is None:
+                    return None
+                if self.cache is not None:
+                    self.cache.remember_version(ds, version)
+            versions.append(f"{ds}={version}")
+        return "|".join(versions)
+
+    def _chat_dataset_ids(self) -> Optional[List[str]]:
+        """Datasets linked to the chat assistant (remembered like a dataset version); None if unknown."""
+        if not self.chat_id:
+            return None
+        key = f"chat:{self.chat_id}"
+        remembered = self.cache.cached_version(key) if self.cache is not None else None
+        if remembered is not None:
+            return remembered.split(",") if remembered else []
+        ids = chat_dataset_ids(self._coalesce(("chat_datasets", self.chat_id), self.get_chat))
+        if ids is not None and self.cache is not None:
+            self.cache.remember_version(key, ",".join(ids))
+        return ids
+
+    def dataset_version(self, dataset_ids: str = "") -> Optional[str]:
+        """
+        Version of the comma separated datasets (changes whenever a document is added / updated),
+        for callers that persist answers across runs. None if a probe fails.
+        """
+        return self._dataset_version([d for d in dataset_ids.split(",") if d] if dataset_ids else [])
+
+    def _cached(self, kind: str, query: str, dataset_ids: List[str], params: Dict[str, Any],
+                fetch: Callable[[], Dict[str, Any]], is_ok: Callable[[Dict[str, Any]], bool]) -> Dict[str, Any]:
+        if self.cache is None:
+            return fetch()
+
+        key = RetrievalCache.make_key(kind, query, dataset_ids, params)
+        version = self._dataset_version(dataset_ids)
+        if version is not None:
+            cached = self.cache.get(key, version)
+            if cached is not None:
+                logger.info(f"Retrieval cache hit ({kind}): {query[:50]}")
+                return cached
+
+        result = fetch()
+        if version is not None and is_ok(result):
+            self.cache.set(key, result, version)
+        return self._stale_fallback(key, kind, result)
+
+    def _stale_fallback(self, key: str, kind: str, result: Dict[str, Any]) -> Dict[str, Any]:
+        # While the circuit is open, an outdated answer beats no answer
+        if not result.get("degraded"):
+            return result
+        stale = self.cache.get_stale(key)
+        if stale is None:
+            return result
+        logger.warning(f"Serving stale cached result ({kind}) while RAGFlow is unavailable")
+        stale["stale"] = True
+        return stale
+
     # --- Dataset Operations (Legacy Support) ---
 
     def create_dataset(self, name: str, avatar: str = "", description: str = "") -> Dict[str, Any]:
@@ -90,9 +483,25 @@ class RAGClient:
         url = f"{self.base_url}/api/v1/datasets/{dataset_id}/documents/{document_id}"
         headers = {"Authorization": f"Bearer {self.api_key}"}
         logger.info(f"Deleting document: {document_id}")
+        self._forget_version(dataset_id)
         resp = self.session.delete(url, headers=headers)
         return self._handle_response(resp)
         
+    def delete_documents(self, dataset_id: str, document_ids: List[str]) -> Dict[str, Any]:
+        """Delete several documents in one request (DELETE /api/v1/datasets/{dataset_id}/documents)."""
+        url = f"{self.base_url}/api/v1/datasets/{dataset_id}/documents"
+        headers = {"Authorization": f"Bearer {self.api_key}"}
+        logger.info(f"Deleting {len(document_ids)} document(s) from {dataset_id}")
+        self._forget_version(dataset_id)
+        try:
+            with self.resilience.guard("documents") as outcome:
+                resp = self.session.delete(url, headers=headers, json={"ids": document_ids}, timeout=deadline.timeout_for(self.timeout))
+                Resilience.record(outcome, resp.status_code)
+            return self._handle_response(resp)
+        except Exception as e:
+            logger.error(f"Delete Documents Connection Error: {e}")
+            return {"status": "error", "message": str(e)}
+
     def update_document(self, dataset_id: str, document_id: str, name: str = None, enabled: bool = None) -> Dict[str, Any]:
         url = f"{self.base_url}/api/v1/datasets/{dataset_id}/documents/{document_id}"
         headers = {"Authorization": f"Bearer {self.api_key}"}
@@ -101,22 +510,44 @@ class RAGClient:
         if enabled is not None: payload["run_status"] = "1" if enabled else "0"
         
         logger.info(f"Updating document {document_id}: {payload}")
+        self._forget_version(dataset_id)
         resp = self.session.put(url, headers=headers, json=payload)
         return self._handle_response(resp)
 
-    def get_document_content(self, dataset_id: str, document_id: str) -> Dict[str, Any]:
+    def get_document_content(self, dataset_id: str, document_id: str, page: Optional[int] = None, page_size: Optional[int] = None) -> Dict[str, Any]:
         url = f"{self.base_url}/api/v1/datasets/{dataset_id}/documents/{document_id}/chunks"
+        if page is not None:
+            url += f"?page={page}&page_size={page_size or 30}"
         headers = {"Authorization": f"Bearer {self.api_key}"}
         logger.info(f"Getting chunks for {document_id}")
         resp = self.session.get(url, headers=headers)
         return self._handle_response(resp)
 
+    # --- Paginated Iterators ---
+    # Walk every page and yield items one by one; page N+1 is prefetched while page N is consumed.
+    # fields: keep only these keys per item (drop heavy fields). Raises PageError if a page fails.
+
+    def iter_datasets(self, page_size: int = 100, fields: Optional[List[str]] = None, start_page: int = 1) -> Iterator[Dict[str, Any]]:
+        return iter_pages(lambda p, ps: self.list_datasets(p, ps), "datasets", page_size, fields, start_page)
+
+    def iter_documents(self, dataset_id: str, page_size: int = 100, keywords: str = "", fields: Optional[List[str]] = None, start_page: int = 1) -> Iterator[Dict[str, Any]]:
+        return iter_pages(lambda p, ps: self.list_documents(dataset_id, p, ps, keywords), "docs", page_size, fields, start_page)
+
+    def iter_chunks(self, dataset_id: str, document_id: str, page_size: int = 100, fields: Optional[List[str]] = None, start_page: int = 1) -> Iterator[Dict[str, Any]]:
+        return iter_pages(lambda p, ps: self.get_document_content(dataset_id, document_id, p, ps), "chunks", page_size, fields, start_page)
+
     # --- LLM Operations ---
 
     def call_llm(self, system_prompt: str, user_prompt: str) -> str:
         """
         Call LLM using RAGFlow Chat API (Simulating LLM call).
         """
+        return self._coalesce(
+            ("call_llm", self.chat_id, system_prompt, user_prompt),
+            lambda: self._call_llm(system_prompt, user_prompt)
+        )
+
+    def _call_llm(self, system_prompt: str, user_prompt: str) -> str:
         if not self.chat_id:
             logger.warning("RAGFLOW_CHAT_ID not configured. Cannot call LLM.")
             return ""
@@ -127,39 +558,96 @@ class RAGClient:
             "Content-Type": "application/json"
         }
         
-        # Combine prompts or use messages
-        messages = []
-        if system_prompt:
-            messages.append({"role": "system", "content": system_prompt})
-        messages.append({"role": "user", "content": user_prompt})
-        
-        payload = {
-            "model": "ragflow",
-            "messages": messages,
-            "stream": False,
-            "quote": False # We just want generation
-        }
+        payload = _chat_payload(_llm_messages(system_prompt, user_prompt), quote=False)  # We just want generation
         
         try:
             logger.info(f"Calling LLM...")
-            resp = self.session.post(url, headers=headers, json=payload, timeout=self.timeout)
+            with self.resilience.guard("chat") as outcome:
+                resp = self.session.post(url, headers=headers, json=payload, timeout=deadline.timeout_for(self.timeout))
+                Resilience.record(outcome, resp.status_code)
             if resp.status_code == 200:
-                data = resp.json()
-                if "choices" in data and len(data["choices"]) > 0:
-                    return data["choices"][0].get("message", {}).get("content", "")
+                content = _llm_content(resp.json())
+                if content:
+                    return content
             logger.error(f"LLM Call Failed: {resp.status_code} - {resp.text}")
             return ""
         except Exception as e:
             logger.error(f"LLM Connection Error: {e}")
             return ""
 
+    def stream_chat_completion(self, messages: List[Dict[str, str]], quote: bool = True, dataset_ids: str = "") -> Iterator[Dict[str, Any]]:
+        """
+        Stream a chat completion over SSE.
+        Yields {"type": "delta", "content": str} as tokens arrive, then exactly one
+        {"type": "result", "answer", "citation", "score", "reference"} with the collected reference data.
+        """
+        if self.api_key == "mock_key":
+            mock = self._mock_response(messages[-1]["content"])
+            yield {"type": "delta", "content": mock["answer"]}
+            yield {"type": "result", **mock, "reference": []}
+            return
+
+        if not self.chat_id:
+            yield _stream_error("Error: RAGFLOW_CHAT_ID is not configured.", "Config Error")
+            return
+
+        url = f"{self.base_url}/api/v1/chats_openai/{self.chat_id}/chat/completions"
+        headers = {
+            "Authorization": f"Bearer {self.api_key}",
+            "Content-Type": "application/json"
+        }
+        payload = _chat_payload(messages, quote=quote, dataset_ids=dataset_ids, stream=True)
+
+        parts: List[str] = []
+        reference = None
+        try:
+            logger.info(f"Streaming chat completion: {url}")
+            with self.resilience.guard("chat") as outcome, \
+                    self.session.post(url, headers=headers, json=payload, timeout=deadline.timeout_for(self.timeout), stream=True) as resp:
+                Resilience.record(outcome, resp.status_code)
+                if resp.status_code != 200:
+                    logger.error(f"RAGFlow Stream Error: {resp.status_code} - {resp.text}")
+                    yield _stream_error(f"Error: RAGFlow returned {resp.status_code} - {resp.text[:200]}", "API Error")
+                    return
+                for line in resp.iter_lines(decode_unicode=True):
+                    event = _parse_sse_line(line)
+                    if event is None:
+                        continue
+                    content, ref = _stream_event_parts(event)
+                    if ref:
+                        reference = ref
+                    if content:
+                        parts.append(content)
+                        yield {"type": "delta", "content": content}
+        except CircuitOpenError as e:
+            yield {"type": "result", **_degraded_answer(e), "reference": []}
+            return
+        except Exception as e:
+            logger.error(f"RAG Stream Connection Error: {e}")
+            yield _stream_error(f"Connection Error: {str(e)}", "System Error")
+            return
+
+        yield _stream_result("".join(parts), reference)
+
+    def call_llm_stream(self, system_prompt: str, user_prompt: str) -> Iterator[str]:
+        """Streaming variant of call_llm: yields text deltas as they are generated."""
+        for event in self.stream_chat_completion(_llm_messages(system_prompt, user_prompt), quote=False):
+            if event["type"] == "delta":
+                yield event["content"]
+            elif event["citation"] in _ERROR_CITATIONS:
+                logger.error(f"LLM Stream Failed: {event['answer']}")
+
+    def retrieve_and_answer_stream(self, query: str, dataset_ids: str = "") -> Iterator[Dict[str, Any]]:
+        """Streaming variant of retrieve_and_answer (see stream_chat_completion for the event format)."""
+        return self.stream_chat_completion([{"role": "user", "content": query}], quote=True, dataset_ids=dataset_ids)
+
     def refine_query(self, global_ctx: str, local_ctx: str, question: str) -> str:
         """
         [DEPRECATED] Use agentic_search instead.
         Refine the query by combining contexts.
         """
-        # Truncate global context to avoid token limits
-        truncated_global = global_ctx[:500] + "..." if len(global_ctx) > 500 else global_ctx
+        # Fit global context into a small token budget to avoid token limits
+        truncated_global = _GLOBAL_CTX_PACKER.pack_text(global_ctx, query=f"{local_ctx}\n{question}")
         
         query = (
             f"Background Context: {truncated_global}\n"
@@ -180,17 +668,17 @@ class RAGClient:
         # Simple heuristic: Combine Business Context + Question Key Terms
         keywords = f"{local_ctx} {question}"
         
-        # Enforce "Single Question Focus" via prompt engineering (if LLM were used here)
-        # Since we pass 'keywords' to RAG, we append a strict instruction to the query itself
-        # to guide the RAG/LLM backend.
-        strict_query = f"{question}\n\n[System Instruction: You MUST answer ONLY the specific question above. Do NOT merge with other topics. Do NOT hallucinate.]"
+        strict_query = _strict_query(question)
         
         # 2. Search
-        # Try specific search first
-        result = self.retrieve_and_answer(strict_query, dataset_ids)
+        # Try specific search first (hedged: the broad query may already be in flight)
+        if self.hedge_mode == "off":
+            result, hedged = self.retrieve_and_answer(strict_query, dataset_ids), False
+        else:
+            result, hedged = self._hedged_search(strict_query, question, dataset_ids)
         
         # 3. Self-Correction / Retry
-        if result["score"] < 0.5:
+        if not hedged and _needs_broad_query(result):
             logger.info(f"Low confidence ({result['score']}) for '{keywords}'. Retrying with broader query...")
             # Broaden query: just the question
             result_retry = self.retrieve_and_answer(question, dataset_ids)
@@ -198,24 +686,70 @@ class RAGClient:
                 result = result_retry
                 
         # 4. Dual-Context Synthesis (Simulation)
-        # We inject a note about the local context into the final answer
-        # to ensure the user considers their own new requirements.
-        
-        original_answer = result["answer"]
-        
-        # Check for conflicts (Mock logic)
-        conflict_note = ""
-        if "timeout" in question.lower() and "30s" in original_answer and "15s" in global_ctx:
-             conflict_note = "\n\n⚠️ **Conflict Detected**: RAG knowledge says 30s, but your ALIGNMENT doc mentions 15s."
-             
-        final_answer = (
-            f"{original_answer}"
-            f"{conflict_note}"
-            # Removed debug context info to keep output clean as per user request
-        )
-        
-        result["answer"] = final_answer
-        return result
+        return _compose_agentic_answer(result, global_ctx, question)
+
+    def _hedged_search(self, strict_query: str, question: str, dataset_ids: str):
+        """
+        Run the strict query with a speculative broad query alongside it.
+        Returns (result, hedged); hedged=False means no broad query was sent and the
+        caller applies the normal sequential fallback.
+        Every wait is bounded by the remaining deadline: the shared executor may queue
+        the queries behind other hedges, and a request that has not started in time is cancelled.
+        """
+        if self._hedge_executor is None:
+            self._hedge_executor = ThreadPoolExecutor(max_workers=8, thread_name_prefix="rag-hedge")
+        executor = self._hedge_executor
+        may_hedge = lambda: not deadline.expired() and not self.resilience.is_open("chat")
+        submit = lambda query: executor.submit(deadline.wrap(self.retrieve_and_answer), query, dataset_ids)
+
+        started = time.monotonic()
+        strict_future = submit(strict_query)
+        broad_future = None
+        if self.hedge_mode == "parallel" and may_hedge():
+            broad_future = submit(question)
+        elif self.hedge_mode == "delayed":
+            delay = hedge_delay(self.hedge_delay, self.strict_latency)
+            left = deadline.remaining()
+            try:
+                strict_future.result(timeout=delay if left is None else min(delay, left))
+            except FuturesTimeout:
+                if may_hedge():
+                    logger.info(f"Strict query slower than hedge delay, sending broad query: {question[:50]}")
+                    broad_future = submit(question)
+
+        try:
+            result = strict_future.result(timeout=deadline.remaining())
+        except FuturesTimeout:
+            strict_future.cancel()
+            if broad_future is not None and broad_future.done() and not broad_future.cancelled():
+                return broad_future.result(), True
+            if broad_future is not None:
+                broad_future.cancel()
+            logger.warning(f"Deadline exceeded while waiting for the strict query: {question[:50]}")
+            return _deadline_answer(), True
+        self.strict_latency.record(time.monotonic() - started)
+
+        if broad_future is None:
+            self.hedge_stats.incr("not_hedged")
+            return result, False
+
+        self.hedge_stats.incr("hedged")
+        if result["score"] >= LOW_CONFIDENCE:
+            # Confident strict answer: drop the broad query (cancelled if it has not started yet)
+            broad_future.cancel()
+            self.hedge_stats.incr("wasted")
+            return result, True
+
+        try:
+            broad = broad_future.result(timeout=deadline.remaining())
+        except FuturesTimeout:
+            # Out of time: the strict answer is all we have
+            broad_future.cancel()
+            self.hedge_stats.incr("lost")
+            return result, True
+        better = pick_better(result, broad)
+        self.hedge_stats.incr("won" if better is not result else "lost")
+        return better, True
 
     def retrieve_and_answer(self, query: str, dataset_ids: str = "") -> Dict[str, Any]:
         """
@@ -225,7 +759,18 @@ class RAGClient:
         # If API key is explicitly set to mock or default, use mock
         if self.api_key == "mock_key":
             return self._mock_response(query)
-            
+
+        ids_list = [d for d in dataset_ids.split(",") if d] if dataset_ids else []
+        return self._coalesce(
+            ("retrieve_and_answer", self.chat_id, query, dataset_ids),
+            lambda: self._cached(
+                "retrieve_and_answer", query, ids_list, {"chat_id": self.chat_id},
+                lambda: self._retrieve_and_answer(query, dataset_ids),
+                lambda r: r.get("citation") not in _ERROR_CITATIONS
+            )
+        )
+
+    def _retrieve_and_answer(self, query: str, dataset_ids: str = "") -> Dict[str, Any]:
         try:
             # RAGFlow API v1 Implementation
             # Endpoint: /api/v1/chats_openai/{chat_id}/chat/completions
@@ -243,30 +788,15 @@ class RAGClient:
                 "Content-Type": "application/json"
             }
             
-            # Payload construction
-            # RAGFlow typically expects 'question' and 'stream' inside the body
-            # And 'quote' to get citations.
-            # Using standard OpenAI-like structure: messages
-            payload = {
-                "model": "ragflow",  # Required by API but ignored
-                "messages": [{"role": "user", "content": query}],
-                "stream": False,
-                "quote": True
-            }
-            
-            # If specific datasets are required, RAGFlow usually handles this via 
-            # the conversation ID or session. 
-            # If this is a stateless call, we might need to pass dataset_ids if the API supports it.
-            # For now, we assume the API Key is bound to a specific tenant/knowledge base context 
-            # OR we pass it in payload if documented. 
-            # Let's try passing it if provided.
+            # Using standard OpenAI-like structure: messages, with 'quote' to get citations.
+            payload = _chat_payload([{"role": "user", "content": query}], quote=True, dataset_ids=dataset_ids)
             if dataset_ids:
-                 ids_list = dataset_ids.split(",")
-                 payload["dataset_ids"] = ids_list
-                 logger.info(f"Using dataset_ids: {ids_list}")
+                logger.info(f"Using dataset_ids: {payload['dataset_ids']}")
 
             logger.info(f"Sending request to RAGFlow: {url}")
-            resp = self.session.post(url, headers=headers, json=payload, timeout=self.timeout)
+            with self.resilience.guard("chat") as outcome:
+                resp = self.session.post(url, headers=headers, json=payload, timeout=deadline.timeout_for(self.timeout))
+                Resilience.record(outcome, resp.status_code)
             
             if resp.status_code != 200:
                 logger.error(f"RAGFlow API Error: {resp.status_code} - {resp.text}")
@@ -276,79 +806,10 @@ class RAGClient:
                     "score": 0.0
                 }
                 
-            data = resp.json()
-            logger.info(f"RAGFlow Response: {data}")
-            
-            if not isinstance(data, dict):
-                 return {
-                    "answer": f"Unexpected Response Format: {type(data)}",
-                    "citation": "API Error",
-                    "score": 0.0
-                }
-
-            if data.get("code", 0) != 0:
-                 msg = data.get('message', 'Unknown error')
-                 if "Model(@None)" in msg:
-                     msg += " (Hint: Please configure an LLM model for this Chat Assistant in RAGFlow UI)"
-                 return {
-                    "answer": f"RAGFlow Error: {msg}",
-                    "citation": "API Error",
-                    "score": 0.0
-                }
-            # { "choices": [ { "message": { "content": "..." } } ], "code": 0 }
-            # Wait, if it's OpenAI compatible, it might not have "code": 0 at top level if success.
-            # But RAGFlow wrapper might add it.
-            
-            answer = ""
-            citations = []
-            
-            if "choices" in data and len(data["choices"]) > 0:
-                answer = data["choices"][0].get("message", {}).get("content", "")
-            
-            # Check for top-level code error (RAGFlow specific) if answer is empty
-            if not answer and data.get("code", 0) != 0:
-                 msg = data.get('message', 'Unknown error')
-                 if "Model(@None)" in msg:
-                     msg += " (Hint: Please configure an LLM model for this Chat Assistant in RAGFlow UI)"
-                 return {
-                    "answer": f"RAGFlow Error: {msg}",
-                    "citation": "API Error",
-                    "score": 0.0
-                }
-            # RAGFlow might return it in a different way or in the content?
-            # Based on docs, if quote=True, it might be in 'reference' field of data if it's not strictly OpenAI?
-            # Or maybe inside the message?
-            # Let's check if 'data' has 'reference' (some implementations do this).
-            
-            # Fallback: Check standard RAGFlow 'data' field if the structure is mixed
-            result_data = data.get("data") or {}
-            if not answer and "answer" in result_data:
-                answer = result_data["answer"]
-                
-            # Refs
-            refs = result_data.get("reference", [])
-            # Also check if refs are in data root (some versions)
-            if not refs and "reference" in data:
-                refs = data["reference"]
-                
-            score = 0.8 if refs else 0.3
-            
-            if isinstance(refs, list):
-                for r in refs:
-                    if isinstance(r, dict):
-                        doc_name = r.get("doc_name", "Unknown")
-                        citations.append(doc_name)
-                    elif isinstance(r, str):
-                        citations.append(r)
-            
-            citation_str = ", ".join(citations[:3]) if citations else "No citation"
-            
-            return {
-                "answer": answer,
-                "citation": citation_str,
-                "score": score
-            }
+            return _parse_chat_answer(resp.json())
 
+        except CircuitOpenError as e:
+            return _degraded_answer(e)
         except Exception as e:
             import traceback
             traceback.print_exc()
@@ -372,7 +833,7 @@ class RAGClient:
             headers = {"Authorization": f"Bearer {self.api_key}"}
             
             logger.info(f"Listing datasets: {url}")
-            resp = self.session.get(url, headers=headers, timeout=self.timeout)
+            resp = self.session.get(url, headers=headers, timeout=deadline.timeout_for(self.timeout))
             
             if resp.status_code != 200:
                 logger.error(f"RAGFlow List Datasets Error: {resp.status_code} - {resp.text}")
@@ -384,20 +845,50 @@ class RAGClient:
             logger.error(f"List Datasets Connection Error: {e}")
             return {"error": str(e)}
 
-    def list_documents(self, dataset_id: str, page: int = 1, page_size: int = 30, keywords: str = "") -> Dict[str, Any]:
+    def get_chat(self) -> Dict[str, Any]:
+        """
+        Details of the configured chat assistant (including its datasets).
+        API: GET /api/v1/chats?id={chat_id}
+        """
+        if self.api_key == "mock_key":
+            return {"code": 0, "data": [{"id": self.chat_id, "datasets": []}]}
+
+        try:
+            url = f"{self.base_url}/api/v1/chats?id={self.chat_id}&page=1&page_size=1"
+            headers = {"Authorization": f"Bearer {self.api_key}"}
+            with self.resilience.guard("chats") as outcome:
+                resp = self.session.get(url, headers=headers, timeout=deadline.timeout_for(self.timeout))
+                Resilience.record(outcome, resp.status_code)
+
+            if resp.status_code != 200:
+                logger.error(f"RAGFlow Get Chat Error: {resp.status_code} - {resp.text}")
+                return {"error": f"API Error: {resp.status_code}", "details": resp.text}
+
+            return resp.json()
+
+        except Exception as e:
+            logger.error(f"Get Chat Connection Error: {e}")
+            return {"error": str(e)}
+
+    def list_documents(self, dataset_id: str, page: int = 1, page_size: int = 30, keywords: str = "", orderby: str = "") -> Dict[str, Any]:
         """
         List documents in a specific knowledge base.
         API: GET /api/v1/datasets/{dataset_id}/documents
+        orderby: optional sort field ('create_time' / 'update_time'), newest first.
         """
         if self.api_key == "mock_key":
              return {"data": [{"id": "doc1", "name": "test.pdf"}], "total": 1}
 
         try:
             url = f"{self.base_url}/api/v1/datasets/{dataset_id}/documents?page={page}&page_size={page_size}&keywords={keywords}"
+            if orderby:
+                url += f"&orderby={orderby}&desc=true"
             headers = {"Authorization": f"Bearer {self.api_key}"}
             
             logger.info(f"Listing documents for {dataset_id}: {url}")
-            resp = self.session.get(url, headers=headers, timeout=self.timeout)
+            with self.resilience.guard("documents") as outcome:
+                resp = self.session.get(url, headers=headers, timeout=deadline.timeout_for(self.timeout))
+                Resilience.record(outcome, resp.status_code)
             
             if resp.status_code != 200:
                 logger.error(f"RAGFlow List Documents Error: {resp.status_code} - {resp.text}")
@@ -419,16 +910,15 @@ class RAGClient:
 
         try:
             url = f"{self.base_url}/api/v1/datasets/{dataset_id}/documents"
-            headers = {"Authorization": f"Bearer {self.api_key}"}
-            
             logger.info(f"Uploading document to {dataset_id}: {file_path}")
+            self._forget_version(dataset_id)
             
-            # Using multipart/form-data for file upload
-            with open(file_path, 'rb') as f:
-                files = {'file': (os.path.basename(file_path), f)}
-                # Note: Do not set Content-Type header when using 'files' param in requests, 
-                # it will be set automatically with boundary.
-                resp = self.session.post(url, headers=headers, files=files, timeout=self.timeout)
+            # Using multipart/form-data for file upload, streamed from disk
+            with _MultipartFile(file_path) as body:
+                headers = {"Authorization": f"Bearer {self.api_key}", "Content-Type": body.content_type}
+                with self.resilience.guard("documents") as outcome:
+                    resp = self.session.post(url, headers=headers, data=body, timeout=deadline.timeout_for(self.timeout))
+                    Resilience.record(outcome, resp.status_code)
             
             if resp.status_code != 200:
                 logger.error(f"RAGFlow Upload Error: {resp.status_code} - {resp.text}")
@@ -440,6 +930,27 @@ class RAGClient:
             logger.error(f"Upload Document Connection Error: {e}")
             return {"error": str(e)}
 
+    def parse_documents(self, dataset_id: str, document_ids: List[str]) -> Dict[str, Any]:
+        """
+        Start parsing (chunking + embedding) of uploaded documents.
+        API: POST /api/v1/datasets/{dataset_id}/chunks
+        """
+        if self.api_key == "mock_key":
+            return {"status": "success", "data": {}}
+
+        try:
+            url = f"{self.base_url}/api/v1/datasets/{dataset_id}/chunks"
+            headers = {"Authorization": f"Bearer {self.api_key}", "Content-Type": "application/json"}
+            logger.info(f"Parsing {len(document_ids)} document(s) in {dataset_id}")
+            self._forget_version(dataset_id)
+            with self.resilience.guard("documents") as outcome:
+                resp = self.session.post(url, headers=headers, json={"document_ids": document_ids}, timeout=deadline.timeout_for(self.timeout))
+                Resilience.record(outcome, resp.status_code)
+            return self._handle_response(resp)
+        except Exception as e:
+            logger.error(f"Parse Documents Connection Error: {e}")
+            return {"status": "error", "message": str(e)}
+
     def retrieve_chunks(self, dataset_id: str, query: str, page: int = 1, page_size: int = 30, similarity_threshold: float = 0.2) -> Dict[str, Any]:
         """
         Retrieve chunks from a dataset without LLM generation.
@@ -448,6 +959,17 @@ class RAGClient:
         if self.api_key == "mock_key":
              return {"data": [{"content_with_weight": "Mock content", "similarity": 0.9}], "total": 1}
 
+        params = {"page": page, "page_size": page_size, "similarity_threshold": similarity_threshold}
+        return self._coalesce(
+            ("retrieve_chunks", dataset_id, query, params),
+            lambda: self._cached(
+                "retrieve_chunks", query, [dataset_id], params,
+                lambda: self._retrieve_chunks(dataset_id, query, page, page_size, similarity_threshold),
+                lambda r: "error" not in r and r.get("code", 0) == 0
+            )
+        )
+
+    def _retrieve_chunks(self, dataset_id: str, query: str, page: int, page_size: int, similarity_threshold: float) -> Dict[str, Any]:
         try:
             # Correct Endpoint based on GitHub Issues: POST /api/v1/retrieval
             url = f"{self.base_url}/api/v1/retrieval"
@@ -456,34 +978,50 @@ class RAGClient:
                 "Content-Type": "application/json"
             }
             
-            payload = {
-                "question": query,
-                "dataset_ids": [dataset_id],
-                "page": page,
-                "page_size": page_size,
-                "similarity_threshold": similarity_threshold,
-                "vector_similarity_weight": 0.3,
-                "top_k": 1024 
-            }
+            payload = _retrieval_payload(dataset_id, query, page, page_size, similarity_threshold)
             
             logger.info(f"Retrieving chunks from {dataset_id}: {url}")
-            resp = self.session.post(url, headers=headers, json=payload, timeout=self.timeout)
+            with self.resilience.guard("retrieval") as outcome:
+                resp = self.session.post(url, headers=headers, json=payload, timeout=deadline.timeout_for(self.timeout))
+                Resilience.record(outcome, resp.status_code)
             
             if resp.status_code == 200:
-                json_data = resp.json()
-                # 兼容性修复：某些版本返回 {"code":0, "data": {"chunks": [...]}} 而不是 {"code":0, "data": [...]}
-                if isinstance(json_data.get("data"), dict) and "chunks" in json_data["data"]:
-                     # 转换结构以保持统一
-                     json_data["data"] = json_data["data"]["chunks"]
-                return json_data
+                return _normalize_chunks(resp.json())
             
             logger.error(f"RAGFlow Retrieve Chunks Error: {resp.status_code} - {resp.text}")
             return {"error": f"API Error: {resp.status_code}", "details": resp.text}
             
+        except CircuitOpenError as e:
+            return _degraded_chunks(e)
         except Exception as e:
             logger.error(f"Retrieve Chunks Connection Error: {e}")
             return {"error": str(e)}
 
+    def retrieve_chunks_many(self, dataset_id: str, queries: Iterable[str], concurrency: int = 4, page: int = 1, page_size: int = 30, similarity_threshold: float = 0.2) -> Iterator[Dict[str, Any]]:
+        """
+        Retrieve chunks for many queries with at most `concurrency` requests in flight.
+        Yields {"index", "query", "result"} in completion order (index = position in `queries`).
+        """
+        queries = list(queries)
+        executor = ThreadPoolExecutor(max_workers=max(1, min(concurrency, len(queries) or 1)))
+        try:
+            future_to_query = {
+                executor.submit(deadline.wrap(self.retrieve_chunks), dataset_id, q, page, page_size, similarity_threshold): (i, q)
+                for i, q in enumerate(queries)
+            }
+            logger.info(f"Retrieving chunks for {len(queries)} queries from {dataset_id} (concurrency={concurrency})")
+            for future in as_completed(future_to_query):
+                idx, query = future_to_query[future]
+                try:
+                    result = future.result()
+                except Exception as e:
+                    logger.error(f"Retrieve Chunks failed for query {idx}: {e}")
+                    result = {"error": str(e)}
+                yield {"index": idx, "query": query, "result": result}
+        finally:
+            # If the consumer stops early, don't wait for (or start) the remaining queries
+            executor.shutdown(wait=False, cancel_futures=True)
+
     def _mock_response(self, query: str) -> Dict[str, Any]:
         """Generate a mock response for testing."""
         return {
@@ -0,0 +1,325 @@
+import time
+import asyncio
+import logging
+import threading
+from contextlib import contextmanager, asynccontextmanager
+from typing import Dict, Any, List, Optional, Tuple
+
+from src.apps.rag_flow_mcp.core import deadline
+
+logger = logging.getLogger(__name__)
+
+class CircuitOpenError(Exception):
+    """Raised when a request is rejected because the endpoint's circuit breaker is open."""
+
+    def __init__(self, endpoint: str, retry_after: float):
+        super().__init__(f"RAGFlow endpoint '{endpoint}' is unavailable (circuit open, retry in {retry_after:.0f}s)")
+        self.endpoint = endpoint
+        self.retry_after = retry_after
+
+def is_overload_status(status_code: int) -> bool:
+    """429 and 5xx mean the server is struggling; back off instead of retrying."""
+    return status_code == 429 or status_code >= 500
+
+class AIMDLimiter:
+    """
+    自适应并发限制 (AIMD Limiter)
+
+    - 请求成功且延迟低于 latency_target：limit 线性增加 (每满一个窗口 +1)。
+    - 429 / 5xx / 超时 / 延迟超标：limit 乘性减少 (× backoff)，不低于 min_limit。
+    超过当前 limit 的请求会排队等待，直到有请求完成 (线程用 acquire()，协程用 acquire_async())。
+    """
+
+    def __init__(self, initial: int = 10, min_limit: int = 1, max_limit: int = 64,
+                 latency_target: float = 30.0, backoff: float = 0.5):
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.latency_target = latency_target
+        self.backoff = backoff
+        self._limit = float(max(min_limit, min(initial, max_limit)))
+        self._in_flight = 0
+        self._cond = threading.Condition()
+        # Coroutines waiting for a slot; release() may run in another thread, so they are woken
+        # through their own loop instead of an asyncio.Condition bound to a single loop
+        self._async_waiters: List[Tuple[asyncio.AbstractEventLoop, asyncio.Future]] = []
+
+    @property
+    def limit(self) -> int:
+        return int(self._limit)
+
+    @property
+    def in_flight(self) -> int:
+        return self._in_flight
+
+    def try_acquire(self) -> bool:
+        with self._cond:
+            if self._in_flight < int(self._limit):
+                self._in_flight += 1
+                return True
+            return False
+
+    def acquire(self, timeout: Optional[float] = None) -> bool:
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._cond:
+            while self._in_flight >= int(self._limit):
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self._cond.wait(remaining)
+            self._in_flight += 1
+            return True
+
+    async def acquire_async(self, timeout: Optional[float] = None) -> bool:
+        """Wait for a slot without blocking the event loop; False if none freed up within timeout."""
+        loop = asyncio.get_running_loop()
+        deadline = None if timeout is None else loop.time() + timeout
+        while True:
+            with self._cond:
+                if self._in_flight < int(self._limit):
+                    self._in_flight += 1
+                    return True
+                waiter = (loop, loop.create_future())
+                self._async_waiters.append(waiter)
+            try:
+                remaining = None if deadline is None else deadline - loop.time()
+                if remaining is not None and remaining <= 0:
+                    return False
+                await asyncio.wait_for(waiter[1], remaining)
+            except asyncio.TimeoutError:
+                pass
+            finally:
+                with self._cond:
+                    if waiter in self._async_waiters:
+                        self._async_waiters.remove(waiter)
+
+    @staticmethod
+    def _wake(future: asyncio.Future) -> None:
+        if not future.done():
+            future.set_result(None)
+
+    def release(self, latency: float, overloaded: bool) -> None:
+        with self._cond:
+            self._in_flight = max(0, self._in_flight - 1)
+            if overloaded or latency > self.latency_target:
+                new_limit = max(self.min_limit, self._limit * self.backoff)
+                if int(new_limit) < int(self._limit):
+                    logger.warning(f"Concurrency limit decreased: {int(self._limit)} -> {int(new_limit)}")
+                self._limit = new_limit
+            else:
+                # Additive increase: +1 after roughly `limit` successful requests
+                self._limit = min(self.max_limit, self._limit + 1.0 / max(self._limit, 1.0))
+            self._cond.notify_all()
+            waiters, self._async_waiters = self._async_waiters, []
+        for loop, future in waiters:
+            if not loop.is_closed():
+                loop.call_soon_threadsafe(self._wake, future)
+
+class CircuitBreaker:
+    """
+    熔断器 (Circuit Breaker)
+
+    closed    -> 连续 failure_threshold 次失败后进入 open
+    open      -> 直接拒绝请求 (快速失败)，reset_timeout 秒后进入 half_open
+    half_open -> 放行一个探测请求：成功则 closed，失败则重新 open
+    """
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._state = "closed"
+        self._failures = 0
+        self._opened_at = 0.0
+        self._probing = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            if self._state == "open" and time.monotonic() - self._opened_at >= self.reset_timeout:
+                return "half_open"
+            return self._state
+
+    def retry_after(self) -> float:
+        with self._lock:
+            return max(0.0, self.reset_timeout - (time.monotonic() - self._opened_at))
+
+    def allow(self) -> bool:
+        with self._lock:
+            if self._state == "closed":
+                return True
+            if self._state == "open" and time.monotonic() - self._opened_at >= self.reset_timeout:
+                self._state = "half_open"
+                self._probing = False
+            if self._state == "half_open" and not self._probing:
+                self._probing = True
+                return True
+            return False
+
+    def record_success(self) -> None:
+        with self._lock:
+            if self._state != "closed":
+                logger.info("Circuit breaker closed: RAGFlow recovered")
+            self._state = "closed"
+            self._failures = 0
+            self._probing = False
+
+    def release_probe(self) -> None:
+        """Outcome says nothing about server health: let the next caller probe instead."""
+        with self._lock:
+            self._probing = False
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self._failures += 1
+            if self._state == "half_open" or self._failures >= self.failure_threshold:
+                if self._state != "open":
+                    logger.error(f"Circuit breaker opened after {self._failures} failure(s)")
+                self._state = "open"
+                self._opened_at = time.monotonic()
+                self._probing = False
+
+class Resilience:
+    """
+    每个 endpoint (retrieval / chat / documents) 一组 AIMDLimiter + CircuitBreaker。
+    RAGClient / AsyncRAGClient 通过 guard() / guard_async() 包裹每次上游请求，
+    并调用 record() 上报状态码与延迟。
+    同一进程内的 client / engine 应通过 shared() 共用同一个实例，才能看到一致的 RAGFlow 健康状态。
+    """
+
+    _shared: Dict[str, "Resilience"] = {}
+    _shared_lock = threading.Lock()
+
+    def __init__(self, initial_limit: int = 10, min_limit: int = 1, max_limit: int = 64,
+                 latency_target: float = 30.0, failure_threshold: int = 5, reset_timeout: float = 30.0):
+        self._settings = dict(initial=initial_limit, min_limit=min_limit, max_limit=max_limit, latency_target=latency_target)
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._limiters: Dict[str, AIMDLimiter] = {}
+        self._breakers: Dict[str, CircuitBreaker] = {}
+        self._stats = {"rejected": 0, "overloaded": 0}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_config(cls, config: Dict[str, Any]) -> "Resilience":
+        return cls(
+            initial_limit=config.get("RAGFLOW_LIMIT_INITIAL", 10),
+            min_limit=config.get("RAGFLOW_LIMIT_MIN", 1),
+            max_limit=config.get("RAGFLOW_LIMIT_MAX", 64),
+            latency_target=config.get("RAGFLOW_LATENCY_TARGET", 30.0),
+            failure_threshold=config.get("RAGFLOW_BREAKER_FAILURES", 5),
+            reset_timeout=config.get("RAGFLOW_BREAKER_RESET", 30.0)
+        )
+
+    @classmethod
+    def shared(cls, config: Dict[str, Any]) -> "Resilience":
+        """The process-wide instance for config's RAGFLOW_HOST (built from config on first use)."""
+        host = str(config.get("RAGFLOW_HOST", "")).rstrip("/")
+        with cls._shared_lock:
+            if host not in cls._shared:
+                cls._shared[host] = cls.from_config(config)
+            return cls._shared[host]
+
+    @classmethod
+    def reset_shared(cls) -> None:
+        """Forget the process-wide instances (tests / config reloads)."""
+        with cls._shared_lock:
+            cls._shared.clear()
+
+    def limiter(self, endpoint: str) -> AIMDLimiter:
+        with self._lock:
+            if endpoint not in self._limiters:
+                self._limiters[endpoint] = AIMDLimiter(**self._settings)
+            return self._limiters[endpoint]
+
+    def breaker(self, endpoint: str) -> CircuitBreaker:
+        with self._lock:
+            if endpoint not in self._breakers:
+                self._breakers[endpoint] = CircuitBreaker(self.failure_threshold, self.reset_timeout)
+            return self._breakers[endpoint]
+
+    def is_open(self, endpoint: str) -> bool:
+        """True while the endpoint is failing fast (callers should skip retries / extra queries)."""
+        return self.breaker(endpoint).state == "open"
+
+    def _admit(self, endpoint: str) -> None:
+        breaker = self.breaker(endpoint)
+        if not breaker.allow():
+            with self._lock:
+                self._stats["rejected"] += 1
+            raise CircuitOpenError(endpoint, breaker.retry_after())
+
+    def _queue_timeout(self, endpoint: str) -> None:
+        # Admitted but no slot freed up before the caller's deadline: give back a half-open probe
+        self.breaker(endpoint).release_probe()
+        raise deadline.DeadlineExceeded(f"Deadline exceeded while waiting for a '{endpoint}' slot")
+
+    def _finish(self, endpoint: str, started: float, outcome: Dict[str, Any]) -> None:
+        latency = time.monotonic() - started
+        breaker = self.breaker(endpoint)
+        if outcome.get("neutral"):
+            self.limiter(endpoint).release(0.0, False)
+            breaker.release_probe()
+            return
+        overloaded = outcome.get("overloaded", True)
+        self.limiter(endpoint).release(latency, overloaded)
+        if overloaded:
+            with self._lock:
+                self._stats["overloaded"] += 1
+            breaker.record_failure()
+        else:
+            breaker.record_success()
+
+    @staticmethod
+    def record(outcome: Dict[str, Any], status_code: int) -> None:
+        """Report the HTTP status of a guarded request (unreported = transport failure)."""
+        outcome["overloaded"] = is_overload_status(status_code)
+
+    @staticmethod
+    def _on_error(outcome: Dict[str, Any]) -> None:
+        # A timeout caused by the caller's own deadline is not a sign of overload
+        if "overloaded" not in outcome and deadline.expired():
+            outcome["neutral"] = True
+
+    @contextmanager
+    def guard(self, endpoint: str):
+        self._admit(endpoint)
+        if not self.limiter(endpoint).acquire(timeout=deadline.remaining()):
+            self._queue_timeout(endpoint)
+        outcome: Dict[str, Any] = {}
+        started = time.monotonic()
+        try:
+            yield outcome
+        except BaseException:
+            self._on_error(outcome)
+            raise
+        finally:
+            self._finish(endpoint, started, outcome)
+
+    @asynccontextmanager
+    async def guard_async(self, endpoint: str):
+        self._admit(endpoint)
+        if not await self.limiter(endpoint).acquire_async(timeout=deadline.remaining()):
+            self._queue_timeout(endpoint)
+        outcome: Dict[str, Any] = {}
+        started = time.monotonic()
+        try:
+            yield outcome
+        except BaseException:
+            self._on_error(outcome)
+            raise
+        finally:
+            self._finish(endpoint, started, outcome)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            endpoints = sorted(set(self._limiters) | set(self._breakers))
+            stats = dict(self._stats)
+        stats["endpoints"] = {
+            ep: {
+                "limit": self.limiter(ep).limit,
+                "in_flight": self.limiter(ep).in_flight,
+                "breaker": self.breaker(ep).state
+            }
+            for ep in endpoints
+        }
+        return stats
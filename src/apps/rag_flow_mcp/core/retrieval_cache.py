@@ -0,0 +1,332 @@
+import os
+import copy
+import json
+import time
+import sqlite3
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+from typing import Dict, Any, List, Optional, Iterable, Tuple
+
+logger = logging.getLogger(__name__)
+
+class LRUCache:
+    """
+    线程安全的内存 LRU 缓存 (In-process tier)。
+    值为 (value, version, created_at)。
+    """
+
+    def __init__(self, max_entries: int = 1024):
+        self.max_entries = max_entries
+        self._data: "OrderedDict[str, Tuple[Any, str, float]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[Tuple[Any, str, float]]:
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is not None:
+                self._data.move_to_end(key)
+            return entry
+
+    def set(self, key: str, value: Any, version: str, created_at: float) -> None:
+        with self._lock:
+            self._data[key] = (value, version, created_at)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+
+    def delete(self, key: str) -> None:
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+class SQLiteStore:
+    """
+    基于 sqlite3 的磁盘缓存 (On-disk tier)，值以 JSON 存储。
+    超过 max_entries 时按最近访问时间淘汰。
+    """
+
+    def __init__(self, path: str, max_entries: int = 10000):
+        self.path = path
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS entries ("
+            "key TEXT PRIMARY KEY, value TEXT, version TEXT, created_at REAL, accessed_at REAL)"
+        )
+        self._conn.commit()
+
+    def get(self, key: str) -> Optional[Tuple[Any, str, float]]:
+        """(value, version, created_at), or None on a miss; a locked / corrupt database also counts as a miss."""
+        with self._lock:
+            try:
+                row = self._conn.execute(
+                    "SELECT value, version, created_at FROM entries WHERE key = ?", (key,)
+                ).fetchone()
+                if row is None:
+                    return None
+                self._conn.execute("UPDATE entries SET accessed_at = ? WHERE key = ?", (time.time(), key))
+                self._conn.commit()
+                return json.loads(row[0]), row[1], row[2]
+            except (sqlite3.Error, ValueError) as e:
+                logger.warning(f"Retrieval cache read failed, treating as miss: {e}")
+                return None
+
+    def set(self, key: str, value: Any, version: str, created_at: float) -> None:
+        payload = json.dumps(value, ensure_ascii=False)
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO entries (key, value, version, created_at, accessed_at) VALUES (?, ?, ?, ?, ?)",
+                (key, payload, version, created_at, time.time())
+            )
+            self._conn.execute(
+                "DELETE FROM entries WHERE key NOT IN "
+                "(SELECT key FROM entries ORDER BY accessed_at DESC LIMIT ?)",
+                (self.max_entries,)
+            )
+            self._conn.commit()
+
+    def delete(self, key: str) -> None:
+        with self._lock:
+            self._conn.execute("DELETE FROM entries WHERE key = ?", (key,))
+            self._conn.commit()
+
+    def clear(self) -> None:
+        with self._lock:
+            self._conn.execute("DELETE FROM entries")
+            self._conn.commit()
+
+    def __len__(self) -> int:
+        with self._lock:
+            try:
+                return self._conn.execute("SELECT COUNT(*) FROM entries").fetchone()[0]
+            except sqlite3.Error as e:
+                logger.warning(f"Retrieval cache count failed: {e}")
+                return 0
+
+def normalize_query(query: str) -> str:
+    """Collapse whitespace and case so trivially different phrasings share a key."""
+    return " ".join(query.split()).lower()
+
+def dataset_fingerprint(list_documents_response: Dict[str, Any]) -> Optional[str]:
+    """
+    Derive a dataset version from a list_documents response:
+    document total + the newest document's id/update time/chunk count.
+    Returns None if the response is an error (caller should bypass the cache).
+    """
+    if not isinstance(list_documents_response, dict) or "error" in list_documents_response:
+        return None
+    if list_documents_response.get("code", 0) != 0:
+        return None
+
+    data = list_documents_response.get("data")
+    total = list_documents_response.get("total")
+    docs = data
+    if isinstance(data, dict):
+        docs = data.get("docs", [])
+        total = data.get("total", total)
+    if not isinstance(docs, list):
+        docs = []
+    if total is None:
+        total = len(docs)
+
+    newest = docs[0] if docs and isinstance(docs[0], dict) else {}
+    return (
+        f"{total}:{newest.get('id', '')}:"
+        f"{newest.get('update_time', newest.get('update_date', ''))}:{newest.get('chunk_count', '')}"
+    )
+
+def chat_dataset_ids(list_chats_response: Dict[str, Any]) -> Optional[List[str]]:
+    """
+    Dataset ids linked to a chat assistant, from a GET /api/v1/chats?id=... response
+    ("datasets": [{"id": ...}] or "dataset_ids": [...] depending on the RAGFlow version).
+    Returns None if the response is an error or the chat was not found.
+    """
+    if not isinstance(list_chats_response, dict) or "error" in list_chats_response:
+        return None
+    if list_chats_response.get("code", 0) != 0:
+        return None
+    chats = list_chats_response.get("data")
+    if not isinstance(chats, list) or not chats or not isinstance(chats[0], dict):
+        return None
+    chat = chats[0]
+    ids = chat.get("dataset_ids")
+    if ids is None:
+        ids = [d.get("id") if isinstance(d, dict) else d for d in chat.get("datasets") or []]
+    return sorted(str(d) for d in ids if d)
+
+class RetrievalCache:
+    """
+    检索缓存 (Retrieval Cache)
+
+    两级缓存：内存 LRU + 可选的 sqlite 磁盘存储。
+    Key 由检索类型、归一化查询、dataset_ids 与检索参数组成；
+    每条记录附带数据集版本，版本变化或超过 TTL 即视为失效。
+    同一进程内的 client / engine 通过 shared() 共用同一个实例。
+    """
+
+    _shared: Dict[Tuple[str, str], "RetrievalCache"] = {}
+    _shared_lock = threading.Lock()
+
+    def __init__(
+        self,
+        max_entries: int = 1024,
+        ttl: float = 3600,
+        cache_dir: str = "",
+        disk_max_entries: int = 10000,
+        version_ttl: float = 60
+    ):
+        self.ttl = ttl
+        self.version_ttl = version_ttl
+        self.memory = LRUCache(max_entries)
+        self.disk = SQLiteStore(os.path.join(cache_dir, "retrieval_cache.sqlite3"), disk_max_entries) if cache_dir else None
+        self._versions: Dict[str, Tuple[str, float]] = {}
+        self._stats = {"hits": 0, "misses": 0, "memory_hits": 0, "disk_hits": 0, "invalidated": 0, "expired": 0, "stale_hits": 0}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_config(cls, config: Dict[str, Any]) -> Optional["RetrievalCache"]:
+        """Build the cache from rag_flow_mcp config, or return None if disabled (enabled by default, as in config.py)."""
+        if not config.get("RAG_CACHE_ENABLED", True):
+            return None
+        return cls(
+            max_entries=config.get("RAG_CACHE_MAX_ENTRIES", 1024),
+            ttl=config.get("RAG_CACHE_TTL", 3600),
+            cache_dir=config.get("RAG_CACHE_DIR", ""),
+            disk_max_entries=config.get("RAG_CACHE_DISK_MAX_ENTRIES", 10000),
+            version_ttl=config.get("RAG_CACHE_VERSION_TTL", 60)
+        )
+
+    @classmethod
+    def shared(cls, config: Dict[str, Any]) -> Optional["RetrievalCache"]:
+        """The process-wide cache for config's RAGFLOW_HOST / RAG_CACHE_DIR, or None if disabled."""
+        if not config.get("RAG_CACHE_ENABLED", True):
+            return None
+        key = (str(config.get("RAGFLOW_HOST", "")).rstrip("/"), config.get("RAG_CACHE_DIR", ""))
+        with cls._shared_lock:
+            if key not in cls._shared:
+                cls._shared[key] = cls.from_config(config)
+            return cls._shared[key]
+
+    @classmethod
+    def reset_shared(cls) -> None:
+        """Forget the process-wide instances (tests / config reloads)."""
+        with cls._shared_lock:
+            cls._shared.clear()
+
+    @staticmethod
+    def make_key(kind: str, query: str, dataset_ids: Iterable[str], params: Dict[str, Any]) -> str:
+        raw = json.dumps(
+            {
+                "kind": kind,
+                "query": normalize_query(query),
+                "datasets": sorted(d.strip() for d in dataset_ids if d and d.strip()),
+                "params": params
+            },
+            sort_keys=True,
+            ensure_ascii=False
+        )
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    # --- Dataset versions ---
+
+    def cached_version(self, dataset_id: str) -> Optional[str]:
+        """Return the remembered version if it was probed within version_ttl."""
+        with self._lock:
+            entry = self._versions.get(dataset_id)
+        if entry and time.time() - entry[1] < self.version_ttl:
+            return entry[0]
+        return None
+
+    def remember_version(self, dataset_id: str, version: str) -> None:
+        with self._lock:
+            self._versions[dataset_id] = (version, time.time())
+
+    def invalidate(self, dataset_id: Optional[str] = None) -> None:
+        """Forget remembered dataset versions (forces a re-probe), or clear everything."""
+        with self._lock:
+            if dataset_id is None:
+                self._versions.clear()
+            else:
+                self._versions.pop(dataset_id, None)
+        if dataset_id is None:
+            self.memory.clear()
+            if self.disk is not None:
+                self.disk.clear()
+
+    # --- Entries ---
+
+    def get(self, key: str, version: str) -> Optional[Any]:
+        entry = self.memory.get(key)
+        tier = "memory_hits"
+        if entry is None and self.disk is not None:
+            entry = self.disk.get(key)
+            tier = "disk_hits"
+            if entry is not None:
+                self.memory.set(key, *entry)
+
+        if entry is None:
+            return self._miss()
+
+        # Outdated entries are kept (LRU-bounded) so get_stale() can still serve them while RAGFlow is down
+        value, entry_version, created_at = entry
+        if entry_version != version:
+            return self._miss("invalidated")
+        if self.ttl and time.time() - created_at > self.ttl:
+            return self._miss("expired")
+
+        with self._lock:
+            self._stats["hits"] += 1
+            self._stats[tier] += 1
+        return copy.deepcopy(value)
+
+    def get_stale(self, key: str) -> Optional[Any]:
+        """
+        Return an entry regardless of version / TTL.
+        Only used to serve a degraded answer while RAGFlow is unavailable.
+        """
+        entry = self.memory.get(key)
+        if entry is None and self.disk is not None:
+            entry = self.disk.get(key)
+        if entry is None:
+            return None
+        with self._lock:
+            self._stats["stale_hits"] += 1
+        return copy.deepcopy(entry[0])
+
+    def set(self, key: str, value: Any, version: str) -> None:
+        created_at = time.time()
+        value = copy.deepcopy(value)
+        self.memory.set(key, value, version, created_at)
+        if self.disk is not None:
+            try:
+                self.disk.set(key, value, version, created_at)
+            except (TypeError, ValueError, sqlite3.Error) as e:
+                logger.warning(f"Retrieval cache disk write failed: {e}")
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            stats = dict(self._stats)
+        lookups = stats["hits"] + stats["misses"]
+        stats["hit_rate"] = round(stats["hits"] / lookups, 4) if lookups else 0.0
+        stats["memory_entries"] = len(self.memory)
+        stats["disk_entries"] = len(self.disk) if self.disk is not None else 0
+        return stats
+
+    def _miss(self, reason: str = "") -> None:
+        with self._lock:
+            self._stats["misses"] += 1
+            if reason:
+                self._stats[reason] += 1
+        return None
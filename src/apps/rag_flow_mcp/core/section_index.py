@@ -0,0 +1,75 @@
+from typing import Any, Dict, List, Optional
+from src.common.context_packer import BM25Index, ContextPacker
+from src.apps.rag_flow_mcp.core.markdown_ast import ParsedDocument
+
+class SectionIndex:
+    """
+    章节检索索引 (Section Index)
+
+    由 ParsedDocument 的标题树构建：每个标题对应一个章节 (标题行 + 到第一个子标题之前的正文)，
+    索引文本前附祖先标题路径。BM25 统计每次运行只建一次，之后每个决策只检索 top-k 个章节作为上下文；
+    章节被改写后用 update() 同步该章节 (其子章节随之失效)。
+    """
+
+    def __init__(self, doc: ParsedDocument):
+        self.doc = doc
+        self.sections: List[Dict[str, Any]] = []
+        for heading in doc.headings:
+            children = heading["children"]
+            body_end = doc.headings[children[0]]["start"] if children else heading["end"]
+            path = []
+            parent = heading["parent"]
+            while parent is not None:
+                path.insert(0, doc.headings[parent]["text"])
+                parent = doc.headings[parent]["parent"]
+            self.sections.append({
+                "header": heading["text"],
+                "path": path,
+                "header_line": "".join(doc.lines[heading["start"]:heading["header_end"]]),
+                "text": "".join(doc.lines[heading["start"]:body_end]),
+                "active": True
+            })
+        self._bm25 = BM25Index([self._document(s) for s in self.sections])
+
+    @staticmethod
+    def _document(section: Dict[str, Any]) -> str:
+        return " / ".join(section["path"] + [section["text"]]) if section["active"] else ""
+
+    def __len__(self) -> int:
+        return sum(1 for s in self.sections if s["active"])
+
+    def search(self, query: str, top_k: int = 3) -> List[Dict[str, Any]]:
+        """The top_k sections matching query, best first ({"header", "path", "text", "score"}); empty if none match."""
+        scores = self._bm25.scores(query)
+        ranked = sorted((i for i, s in enumerate(self.sections) if s["active"] and scores[i] > 0),
+                        key=lambda i: (-scores[i], i))
+        return [dict(self.sections[i], index=i, score=scores[i]) for i in ranked[:top_k]]
+
+    def context(self, query: str, packer: ContextPacker, top_k: int = 3, budget: Optional[int] = None) -> Dict[str, Any]:
+        """
+        Prompt context for query: the best sections that fit the token budget, in document order.
+        Returns {"text", "headers"}; both are empty when no section matches.
+        """
+        hits = sorted(self.search(query, top_k), key=lambda h: h["index"])
+        chosen = packer.select([h["text"].strip() for h in hits], budget=budget, scores=[h["score"] for h in hits])
+        return {
+            "text": "\n\n".join(hits[i]["text"].strip() for i in chosen),
+            "headers": [hits[i]["header"] for i in chosen]
+        }
+
+    def update(self, header_text: str, body: str) -> bool:
+        """Record a rewritten section body (header kept, subsections replaced); False if the section is unknown."""
+        heading = self.doc.find_heading(header_text)
+        if heading is None or not self.sections[heading["index"]]["active"]:
+            return False
+        section = self.sections[heading["index"]]
+        section["text"] = section["header_line"] + body
+        self._bm25.update(heading["index"], self._document(section))
+        # replace_section removes the subsections along with the old body
+        stack = list(heading["children"])
+        while stack:
+            child = stack.pop()
+            self.sections[child]["active"] = False
+            self._bm25.update(child, "")
+            stack.extend(self.doc.headings[child]["children"])
+        return True
@@ -1,8 +1,10 @@
 import os
 import difflib
 import time
-from typing import Tuple
+from typing import Iterable, Iterator, List, Tuple, Union
 import logging
+from .text_buffer import TextBuffer
+from src.common.atomic_io import write_lines_atomic
 
 logger = logging.getLogger(__name__)
 
@@ -10,13 +12,13 @@ class ShadowFileManager:
     def __init__(self):
         pass
 
-    def generate_shadow_copy(self, original_path: str, new_content: str) -> Tuple[str, str]:
+    def generate_shadow_copy(self, original_path: str, new_content: Union[str, TextBuffer]) -> Tuple[str, str]:
         """
         Create a shadow copy of the file with new content and a diff report.
         
         Args:
             original_path: Path to the original file.
-            new_content: The new content to write.
+            new_content: The new content to write (a TextBuffer is materialized here, once).
             
         Returns:
             Tuple[str, str]: (path_to_shadow_file, path_to_diff_report)
@@ -24,15 +26,14 @@ class ShadowFileManager:
         if not os.path.exists(original_path):
             raise FileNotFoundError(f"Original file not found: {original_path}")
 
+        new_content = str(new_content)
+
         # 1. Read original content
         with open(original_path, 'r', encoding='utf-8') as f:
             original_content = f.read()
 
         # 2. Generate file paths
-        timestamp = time.strftime("%Y%m%d_%H%M%S")
-        base, ext = os.path.splitext(original_path)
-        shadow_path = f"{base}_ai_revision_{timestamp}{ext}"
-        diff_path = f"{base}_diff_{timestamp}.md"
+        shadow_path, diff_path = self._output_paths(original_path)
 
         # 3. Write shadow file
         with open(shadow_path, 'w', encoding='utf-8') as f:
@@ -47,6 +48,93 @@ class ShadowFileManager:
 
         return shadow_path, diff_path
 
+    def generate_shadow_copy_segments(self, original_path: str, segments: Iterable[Tuple[str, str]]) -> Tuple[str, str]:
+        """
+        Streaming generate_shadow_copy for very large documents.
+
+        Args:
+            original_path: Path to the original file.
+            segments: (old_text, new_text) pairs in document order, made of whole lines; the old texts
+                concatenate to the original file, the new ones to the revision (e.g. question_index.iter_revisions).
+
+        The shadow copy and the diff report are written while the segments are consumed, so memory is
+        bounded by one segment instead of two copies of the whole document.
+
+        Returns:
+            Tuple[str, str]: (path_to_shadow_file, path_to_diff_report)
+        """
+        if not os.path.exists(original_path):
+            raise FileNotFoundError(f"Original file not found: {original_path}")
+
+        shadow_path, diff_path = self._output_paths(original_path)
+        with open(diff_path, 'w', encoding='utf-8') as report:
+            header = self._report_header(original_path, shadow_path)
+            header += [f"--- {os.path.basename(original_path)}", f"+++ {os.path.basename(shadow_path)}"]
+            report.write("\n".join(header) + "\n")
+
+            def revised() -> Iterator[str]:
+                old_line = new_line = 0
+                for old, new in segments:
+                    if old != new:
+                        for line in self._diff_hunks(old.splitlines(), new.splitlines(), old_line, new_line):
+                            report.write(line + "\n")
+                    old_line += old.count("\n")
+                    new_line += new.count("\n")
+                    yield new
+
+            write_lines_atomic(shadow_path, revised())
+            report.write("\n".join(self._report_footer()))
+        logger.info(f"Shadow copy created: {shadow_path}")
+        logger.info(f"Diff report created: {diff_path}")
+
+        return shadow_path, diff_path
+
+    def _output_paths(self, original_path: str) -> Tuple[str, str]:
+        timestamp = time.strftime("%Y%m%d_%H%M%S")
+        base, ext = os.path.splitext(original_path)
+        return f"{base}_ai_revision_{timestamp}{ext}", f"{base}_diff_{timestamp}.md"
+
+    def _diff_hunks(self, old_lines: List[str], new_lines: List[str], old_offset: int, new_offset: int) -> Iterator[str]:
+        """Unified diff hunks of one segment, numbered by the segment's position in the whole file."""
+        def span(start: int, stop: int) -> str:
+            length = stop - start
+            beginning = start + 1 if length else start
+            return f"{beginning}" if length == 1 else f"{beginning},{length}"
+
+        for group in difflib.SequenceMatcher(None, old_lines, new_lines).get_grouped_opcodes(3):
+            first, last = group[0], group[-1]
+            yield (f"@@ -{span(first[1] + old_offset, last[2] + old_offset)} "
+                   f"+{span(first[3] + new_offset, last[4] + new_offset)} @@")
+            for tag, i1, i2, j1, j2 in group:
+                if tag == 'equal':
+                    for line in old_lines[i1:i2]:
+                        yield ' ' + line
+                    continue
+                for line in old_lines[i1:i2]:
+                    yield '-' + line
+                for line in new_lines[j1:j2]:
+                    yield '+' + line
+
+    def _report_header(self, old_path: str, new_path: str) -> List[str]:
+        return [
+            f"# Diff Report: {os.path.basename(old_path)}",
+            f"**Date**: {time.strftime('%Y-%m-%d %H:%M:%S')}",
+            f"**Source**: `{old_path}`",
+            f"**Revision**: `{new_path}`",
+            "",
+            "## Changes",
+            "```diff",
+        ]
+
+    def _report_footer(self) -> List[str]:
+        return [
+            "```",
+            "",
+            "## Action",
+            "- [ ] Review changes above.",
+            "- [ ] Use a merge tool (like VS Code 'Compare Selected') to apply changes.",
+        ]
+
     def _generate_diff_report(self, old: str, new: str, old_path: str, new_path: str) -> str:
         """
         Generate a Markdown formatted diff report.
@@ -62,22 +150,8 @@ class ShadowFileManager:
             lineterm=''
         )
         
-        report = []
-        report.append(f"# Diff Report: {os.path.basename(old_path)}")
-        report.append(f"**Date**: {time.strftime('%Y-%m-%d %H:%M:%S')}")
-        report.append(f"**Source**: `{old_path}`")
-        report.append(f"**Revision**: `{new_path}`")
-        report.append("")
-        report.append("## Changes")
-        report.append("```diff")
-        
-        for line in diff:
-            report.append(line)
-            
-        report.append("```")
-        report.append("")
-        report.append("## Action")
-        report.append("- [ ] Review changes above.")
-        report.append("- [ ] Use a merge tool (like VS Code 'Compare Selected') to apply changes.")
+        report = self._report_header(old_path, new_path)
+        report.extend(diff)
+        report.extend(self._report_footer())
         
         return "\n".join(report)
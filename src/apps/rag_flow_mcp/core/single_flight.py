@@ -0,0 +1,146 @@
+import copy
+import json
+import asyncio
+import hashlib
+import logging
+import threading
+from typing import Any, Awaitable, Callable, Dict
+
+from src.apps.rag_flow_mcp.core import deadline
+
+logger = logging.getLogger(__name__)
+
+def flight_key(*parts: Any) -> str:
+    """Stable key for a request: hash of its endpoint / payload parts."""
+    raw = json.dumps(parts, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+class _Call:
+    __slots__ = ("event", "result", "error", "followers")
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.result = None
+        self.error = None
+        self.followers = 0
+
+class SingleFlight:
+    """
+    请求合并 (Single-flight, 线程版)
+
+    同一 key 的请求在上一个请求尚未返回时到达，将等待并共享该请求的结果，
+    而不是再向上游发起一次调用。只合并"正在进行中"的请求，不做缓存，因此没有过期问题。
+    共享方拿到的是结果的深拷贝，互相修改不会影响。
+    共享方最多等待自己剩余的 deadline；上游调用失败而自己仍有预算时，重新发起一次 (或加入新的调用)。
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls: Dict[str, _Call] = {}
+        self._stats = {"leaders": 0, "shared": 0}
+
+    def do(self, key: str, fn: Callable[[], Any]) -> Any:
+        retried = False
+        while True:
+            call, leader = self._join(key)
+            if leader:
+                return self._lead(key, call, fn)
+            if not call.event.wait(deadline.remaining()):
+                raise deadline.DeadlineExceeded("Deadline exceeded while waiting for a shared upstream call")
+            if call.error is None:
+                return copy.deepcopy(call.result)
+            # The leader may have failed on its own (shorter) budget: retry once if ours allows
+            if retried or deadline.expired():
+                raise call.error
+            retried = True
+            logger.info(f"Single-flight: shared call failed ({call.error!r}), retrying")
+
+    def _join(self, key: str):
+        with self._lock:
+            call = self._calls.get(key)
+            if call is not None:
+                call.followers += 1
+                self._stats["shared"] += 1
+                leader = False
+            else:
+                call = self._calls[key] = _Call()
+                self._stats["leaders"] += 1
+                leader = True
+        return call, leader
+
+    def _lead(self, key: str, call: _Call, fn: Callable[[], Any]) -> Any:
+        try:
+            call.result = fn()
+            return_value = call.result
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                self._calls.pop(key, None)
+                followers = call.followers
+            call.event.set()
+
+        if followers:
+            logger.info(f"Single-flight: shared one upstream call with {followers} concurrent caller(s)")
+            # Keep the stored result pristine while followers copy it
+            return copy.deepcopy(return_value)
+        return return_value
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            stats = dict(self._stats)
+            stats["in_flight"] = len(self._calls)
+        return stats
+
+class AsyncSingleFlight:
+    """
+    请求合并 (Single-flight, asyncio 版)
+
+    与 SingleFlight 语义一致：同一 key 的并发协程共享一个上游 Task。
+    某个调用方被取消 (或等待超过自己的 deadline) 时不会取消共享的 Task，其他等待者仍能拿到结果。
+    """
+
+    def __init__(self):
+        self._tasks: Dict[str, "asyncio.Task"] = {}
+        self._stats = {"leaders": 0, "shared": 0}
+
+    async def do(self, key: str, fn: Callable[[], Awaitable[Any]]) -> Any:
+        retried = False
+        while True:
+            task, leader = self._join(key, fn)
+            if leader:
+                return await asyncio.shield(task)
+            try:
+                result = await asyncio.wait_for(asyncio.shield(task), deadline.remaining())
+            except Exception as e:
+                if not task.done():
+                    raise deadline.DeadlineExceeded("Deadline exceeded while waiting for a shared upstream call") from None
+                # The leader may have failed on its own (shorter) budget: retry once if ours allows
+                if retried or deadline.expired():
+                    raise
+                retried = True
+                logger.info(f"Single-flight: shared call failed ({e!r}), retrying")
+                continue
+            # Followers copy; the event loop is single-threaded so the leader cannot mutate mid-copy
+            return copy.deepcopy(result)
+
+    def _join(self, key: str, fn: Callable[[], Awaitable[Any]]):
+        task = self._tasks.get(key)
+        leader = task is None
+        if leader:
+            task = asyncio.ensure_future(fn())
+            self._tasks[key] = task
+            self._stats["leaders"] += 1
+
+            def _done(_, key=key):
+                self._tasks.pop(key, None)
+            task.add_done_callback(_done)
+        else:
+            self._stats["shared"] += 1
+        return task, leader
+
+    def stats(self) -> Dict[str, int]:
+        stats = dict(self._stats)
+        stats["in_flight"] = len(self._tasks)
+        return stats
@@ -0,0 +1,144 @@
+import re
+import bisect
+from typing import Iterator, List, Optional, Tuple
+
+_NEWLINE = re.compile("\n")
+
+class TextBuffer:
+    """
+    分片文本缓冲区 (Piece Table)
+
+    原文与每次插入的文本都只保存一次，文档由指向这些文本片段的 piece 列表组成；
+    按行 / 按字符的替换只切分、替换 piece，不复制整篇文档。定位通过对前缀和二分查找完成，
+    只有 getvalue() / chunks() 时才拼出完整文本 (getvalue 的结果缓存到下一次修改)。
+    Lines end with "\n" (a "\r\n" line is one line); line numbers are 0-based, ranges are [start, end).
+    """
+
+    def __init__(self, text: str = ""):
+        # (text, newline positions or None until first needed)
+        self._buffers: List[List] = []
+        self._pieces: List[Tuple[int, int, int]] = []
+        self._index: Optional[Tuple[List[int], List[int]]] = None
+        self._value: Optional[str] = text
+        if text:
+            self._pieces.append((self._store(text), 0, len(text)))
+
+    def _store(self, text: str) -> int:
+        self._buffers.append([text, None])
+        return len(self._buffers) - 1
+
+    def _newline_positions(self, buffer: int) -> List[int]:
+        entry = self._buffers[buffer]
+        if entry[1] is None:
+            entry[1] = [m.start() for m in _NEWLINE.finditer(entry[0])]
+        return entry[1]
+
+    def _prefix(self) -> Tuple[List[int], List[int]]:
+        """Cumulative (characters, newlines) before each piece, plus the totals; rebuilt after an edit."""
+        if self._index is None:
+            chars, lines = [0], [0]
+            for buffer, start, end in self._pieces:
+                nl = self._newline_positions(buffer)
+                chars.append(chars[-1] + end - start)
+                lines.append(lines[-1] + bisect.bisect_left(nl, end) - bisect.bisect_left(nl, start))
+            self._index = (chars, lines)
+        return self._index
+
+    def __len__(self) -> int:
+        return self._prefix()[0][-1]
+
+    def __str__(self) -> str:
+        return self.getvalue()
+
+    @property
+    def line_count(self) -> int:
+        """Number of lines, as len(text.split("\n")) minus a final empty line."""
+        total = len(self)
+        if total == 0:
+            return 0
+        buffer, _, end = self._pieces[-1]
+        ends_with_newline = self._buffers[buffer][0][end - 1] == "\n"
+        return self._prefix()[1][-1] + (0 if ends_with_newline else 1)
+
+    def offset(self, line: int) -> int:
+        """Character offset where a line starts (len(self) for lines past the end)."""
+        if line <= 0:
+            return 0
+        chars, lines = self._prefix()
+        if line > lines[-1]:
+            return chars[-1]
+        # The line starts right after the line-th newline, which lies in piece i
+        i = bisect.bisect_left(lines, line) - 1
+        buffer, start, _ = self._pieces[i]
+        nl = self._newline_positions(buffer)
+        position = nl[bisect.bisect_left(nl, start) + line - lines[i] - 1]
+        return chars[i] + position - start + 1
+
+    def _split(self, offset: int) -> int:
+        """Index of the piece that starts at offset, splitting the piece that spans it if needed."""
+        chars, _ = self._prefix()
+        if offset >= chars[-1]:
+            return len(self._pieces)
+        i = bisect.bisect_right(chars, offset) - 1
+        if chars[i] == offset:
+            return i
+        buffer, start, end = self._pieces[i]
+        cut = start + offset - chars[i]
+        self._pieces[i:i + 1] = [(buffer, start, cut), (buffer, cut, end)]
+        self._index = None
+        return i + 1
+
+    def replace(self, start: int, end: int, text: str) -> None:
+        """Replace characters [start, end) with text."""
+        total = len(self)
+        start, end = min(max(start, 0), total), min(max(end, 0), total)
+        if end < start:
+            raise ValueError(f"Invalid range {start}-{end}")
+        if start == end and not text:
+            return
+        first = self._split(start)
+        last = self._split(end)
+        self._pieces[first:last] = [(self._store(text), 0, len(text))] if text else []
+        self._index = None
+        self._value = None
+
+    def replace_lines(self, start_line: int, end_line: int, text: str) -> None:
+        """Replace lines [start_line, end_line) with text (which should end with a newline to stay line-aligned)."""
+        self.replace(self.offset(start_line), self.offset(end_line), text)
+
+    def insert_lines(self, line: int, text: str) -> None:
+        """Insert text before line (at the end for line >= line_count)."""
+        self.replace_lines(line, line, text)
+
+    def delete_lines(self, start_line: int, end_line: int) -> None:
+        self.replace_lines(start_line, end_line, "")
+
+    def append(self, text: str) -> None:
+        total = len(self)
+        self.replace(total, total, text)
+
+    def chunks(self, start: int = 0, end: Optional[int] = None) -> Iterator[str]:
+        """The text of [start, end) as a sequence of piece slices, without building one string."""
+        chars, _ = self._prefix()
+        end = chars[-1] if end is None else min(end, chars[-1])
+        i = max(0, bisect.bisect_right(chars, start) - 1)
+        while i < len(self._pieces) and chars[i] < end:
+            buffer, piece_start, piece_end = self._pieces[i]
+            lo = piece_start + max(0, start - chars[i])
+            hi = piece_end - max(0, chars[i + 1] - end)
+            if lo < hi:
+                yield self._buffers[buffer][0][lo:hi]
+            i += 1
+
+    def get_lines(self, start_line: int, end_line: int) -> str:
+        return "".join(self.chunks(self.offset(start_line), self.offset(end_line)))
+
+    def getvalue(self) -> str:
+        """The full text (built once and kept until the next edit)."""
+        if self._value is None:
+            self._value = "".join(self.chunks())
+            # Collapse to a single piece so later reads and edits start from a compact table
+            self._buffers = [[self._value, None]]
+            self._pieces = [(0, 0, len(self._value))] if self._value else []
+            self._index = None
+        return self._value
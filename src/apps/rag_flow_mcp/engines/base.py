@@ -5,6 +5,9 @@ from typing import Dict, Any
 from src.apps.rag_flow_mcp.core.file_service import FileService
 from src.apps.rag_flow_mcp.core.rag_client import RAGClient
 from src.apps.rag_flow_mcp.core.query_rewriter import QueryRewriter
+from src.apps.rag_flow_mcp.core.retrieval_cache import RetrievalCache
+from src.apps.rag_flow_mcp.core.resilience import Resilience
+from src.common.context_packer import ContextPacker
 
 class BaseEngine(ABC):
     """
@@ -16,6 +19,11 @@ class BaseEngine(ABC):
         self.logger = logging.getLogger(f"rag_flow_mcp.engines.{self.__class__.__name__}")
         self.file_service = FileService()
         
+        # Retrieval cache and concurrency limits / circuit breakers are process-wide:
+        # every engine and the tool-level clients see the same cache and RAGFlow health
+        self.retrieval_cache = RetrievalCache.shared(self.config)
+        self.resilience = Resilience.shared(self.config)
+        
         # Initialize RAGClient here to be shared
         self.rag_client = RAGClient(
             self.config.get("RAGFLOW_API_KEY", ""),
@@ -23,9 +31,17 @@ class BaseEngine(ABC):
             self.config.get("RAGFLOW_CHAT_ID", ""),
             timeout=self.config.get("RAGFLOW_TIMEOUT", 120),
             top_k=self.config.get("RAGFLOW_TOP_K", 10),
-            similarity_threshold=self.config.get("RAGFLOW_SIMILARITY_THRESHOLD", 0.2)
+            similarity_threshold=self.config.get("RAGFLOW_SIMILARITY_THRESHOLD", 0.2),
+            cache=self.retrieval_cache,
+            pool_maxsize=self.config.get("RAGFLOW_MAX_PER_HOST", 10),
+            resilience=self.resilience,
+            hedge_mode=self.config.get("RAG_HEDGE_MODE", "off"),
+            hedge_delay=self.config.get("RAG_HEDGE_DELAY", 0.0)
         )
-        self.query_rewriter = QueryRewriter(self.rag_client)
+        # Rule-based fast path + persistent cache in front of LLM rewrites
+        self.query_rewriter = QueryRewriter.from_config(self.rag_client, self.config)
+        # Token budget for document context passed to the LLM
+        self.context_packer = ContextPacker(self.config.get("RAG_CONTEXT_BUDGET", 3000))
         
     @abstractmethod
     def initialize(self) -> bool:
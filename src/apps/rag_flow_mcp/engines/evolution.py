@@ -5,6 +5,9 @@ from typing import Dict, Any, List, Tuple
 from .base import BaseEngine
 from src.apps.rag_flow_mcp.core.rag_client import RAGClient
 from src.apps.rag_flow_mcp.core.markdown_ast import MarkdownASTManager
+from src.apps.rag_flow_mcp.core.question_index import extractor
+from src.apps.rag_flow_mcp.core.text_buffer import TextBuffer
+from src.apps.rag_flow_mcp.core.section_index import SectionIndex
 # from src.apps.rag_flow_mcp.core.shadow_file_manager import ShadowFileManager # Removed
 
 class EvolutionEngine(BaseEngine):
@@ -31,13 +34,8 @@ class EvolutionEngine(BaseEngine):
         """
         Extract all headers from the document to guide LLM.
         """
-        headers = []
-        tokens = self.ast_manager.parse(content)
-        for i, token in enumerate(tokens):
-            if token.type == "heading_open":
-                if i + 1 < len(tokens) and tokens[i+1].type == "inline":
-                    headers.append(tokens[i+1].content)
-        return headers
+        # The parse is cached, so the replace_section that follows reuses it
+        return [h["text"] for h in self.ast_manager.document(content).headings]
 
     def evolve_scheme_document(self, scheme_doc_path: str, clarification_doc_path: str) -> Dict[str, Any]:
         """
@@ -71,17 +69,34 @@ class EvolutionEngine(BaseEngine):
             
             changes_log = []
             current_content = scheme_content
+            document = TextBuffer(scheme_content)
+            # Edits are resolved against one parse; only a conflicting edit forces a re-parse
+            transaction = self.ast_manager.edit(scheme_content)
+            # BM25 over the sections, built once per run: each decision only sees its best matching sections
+            sections = SectionIndex(self.ast_manager.document(scheme_content))
+            top_k = self.config.get("RAG_EVOLUTION_TOP_K", 3)
             
             # 3. 应用进化
             for idx, (question, answer) in enumerate(decisions):
                 self.logger.info(f"正在处理决策 {idx+1}/{len(decisions)}...")
                 
+                query = f"{question}\n{answer}"
+                relevant = sections.context(query, self.context_packer, top_k)
+                if relevant["headers"]:
+                    candidate_headers_str = "\n".join([f"- {h}" for h in relevant["headers"]])
+                    truncated_content = relevant["text"]
+                else:
+                    # No section matches lexically: fall back to the full outline and the packed document
+                    candidate_headers_str = valid_headers_str
+                    truncated_content = self.context_packer.pack_text(current_content, query=query)
+                
                 # Prompt Engineering: Ask LLM for specific section Header and Content
                 prompt = (
                     f"你是一位技术文档撰写专家。"
                     f"请基于以下决策点更新文档。\n\n"
                     f"**决策点**:\n问题: {question}\n回答: {answer}\n\n"
-                    f"**现有章节标题 (Valid Headers)**:\n{valid_headers_str}\n\n"
+                    f"**现有章节标题 (Valid Headers)**:\n{candidate_headers_str}\n\n"
+                    f"**相关章节内容**:\n{truncated_content}\n\n"
                     f"**任务**:\n"
                     f"1. 从上述现有章节标题中选择一个最相关的章节标题（Target Header）。严禁创造不存在的标题。\n"
                     f"2. 重写该章节下的内容以包含决策点。\n"
@@ -95,9 +110,6 @@ class EvolutionEngine(BaseEngine):
                     f"如果无需修改，返回 `{{\"target_header\": null}}`。"
                 )
                 
-                # Truncate content for context
-                truncated_content = current_content[:8000] 
-                
                 # Use QueryRewriter to optimize the prompt (optional, but good practice)
                 # Here we are asking LLM to generate JSON, so maybe rewrite is not needed for the prompt itself,
                 # but we can use it to "Search" for relevant sections if we were doing RAG first.
@@ -129,7 +141,18 @@ class EvolutionEngine(BaseEngine):
                                 continue
                                 
                             # Apply AST Replacement
-                            current_content = self.ast_manager.replace_section(current_content, target_header, new_content)
+                            try:
+                                applied = transaction.replace_section(target_header, new_content)
+                            except ValueError:
+                                # Overlaps an earlier edit (e.g. a parent section): continue on the edited text
+                                transaction = self.ast_manager.edit(current_content)
+                                applied = transaction.replace_section(target_header, new_content)
+                            if not applied:
+                                continue
+                            # A single join, no re-parse; later prompts see the edited document
+                            document = transaction.to_buffer()
+                            current_content = document.getvalue()
+                            sections.update(target_header, new_content)
                             changes_log.append(f"Updated section '{target_header}' for question: {question[:30]}...")
                             
                 except Exception as parse_err:
@@ -140,9 +163,9 @@ class EvolutionEngine(BaseEngine):
             if changes_log:
                 # Add revision log
                 revision_log = "\n\n## 修订记录 (Auto-generated)\n" + "\n".join([f"- {log}" for log in changes_log])
-                current_content += revision_log
+                document.append(revision_log)
                 
-                shadow_path, diff_path = self.file_service.create_shadow_copy(scheme_doc_path, current_content)
+                shadow_path, diff_path = self.file_service.create_shadow_copy(scheme_doc_path, document)
                 
                 return {
                     "status": "success",
@@ -165,22 +188,13 @@ class EvolutionEngine(BaseEngine):
         content = self.file_service.read_text(doc_path)
             
         decisions = []
-        # Match ## [index].[title] blocks, same as InferenceEngine
-        pattern = re.compile(r'(##\s+(\d+)\.(.+?)\n)(.*?)(?=\n##\s+\d+\.|\Z)', re.DOTALL)
-        matches = pattern.findall(content)
-        
-        for header, idx, title, body in matches:
-            # Look for Question Description and Answer
-            # Support both English and Chinese colons
-            q_match = re.search(r'\*\*问题描述\*\*[:：](.*?)\n', body) or re.search(r'\*\*描述\*\*[:：](.*?)\n', body)
-            a_match = re.search(r'\*\*回答\*\*[:：](.*?)\n', body)
+        # Shared single-pass extractor (same parse as InferenceEngine, cached per content)
+        for q in extractor.extract(content):
+            # "问题描述" or "描述" (both colon styles) and the answer text
+            q_text, a_text = q["description"], q["answer"]
             
-            if q_match and a_match:
-                q_text = q_match.group(1).strip()
-                a_text = a_match.group(1).strip()
-                
-                # Filter out empty answers or placeholders
-                if a_text and "待回答" not in a_text:
-                    decisions.append((q_text, a_text))
+            # Filter out empty answers or placeholders
+            if q_text and a_text and "待回答" not in a_text:
+                decisions.append((q_text, a_text))
                     
         return decisions
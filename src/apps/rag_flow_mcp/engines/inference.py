@@ -1,9 +1,14 @@
 import os
-import re
 import time
-from typing import Dict, Any, List, Optional
+from itertools import islice
+from typing import Dict, Any, Iterable, List, Optional
 from .base import BaseEngine
-from src.apps.rag_flow_mcp.core.rag_client import RAGClient
+from src.apps.rag_flow_mcp.core.rag_client import RAGClient, _ERROR_CITATIONS
+from src.apps.rag_flow_mcp.core.resilience import CircuitOpenError
+from src.apps.rag_flow_mcp.core import deadline
+from src.apps.rag_flow_mcp.core.pipeline import Pipeline, StageFailure
+from src.apps.rag_flow_mcp.core.answer_manifest import AnswerManifest, question_hash
+from src.apps.rag_flow_mcp.core.question_index import iter_questions, iter_revisions
 # from src.apps.rag_flow_mcp.core.shadow_file_manager import ShadowFileManager # Removed
 
 class InferenceEngine(BaseEngine):
@@ -35,6 +40,9 @@ class InferenceEngine(BaseEngine):
         """
         填充澄清建议 (Fill Clarification Suggestions)
         
+        文档按行流式读取，问题按批 (改写 -> 检索 -> 校验) 处理，影子副本边读边写：
+        内存占用只与一批问题相关，与文档大小无关。
+        
         Args:
             doc_path: 待澄清问题记录文档路径 (04_评审问题记录.md)
             
@@ -47,78 +55,146 @@ class InferenceEngine(BaseEngine):
             return {"status": "error", "message": f"文件未找到: {doc_path}"}
             
         try:
-            # 1. 读取内容 (Use FileService)
-            content = self.file_service.read_text(doc_path)
-            
-            # 2. 提取元数据
-            metadata = self._extract_metadata(content)
+            # 1. 提取元数据 (只读取文件头部的 front matter)
+            metadata = self._extract_metadata(self.file_service.iter_lines(doc_path))
             context_str = f"产品: {metadata.get('product')}, 模块: {metadata.get('module')}"
             
-            # 3. 解析问题
-            questions = self._parse_questions(content)
-            if not questions:
-                return {"status": "success", "message": "未发现问题。", "processed_count": 0}
+            # 2. 复用上次运行的结果：问题内容哈希与数据集版本都未变化且已通过校验的问题不再请求 RAG
+            manifest, dataset_version = None, None
+            if self.config.get("RAG_ANSWER_MANIFEST_ENABLED", True):
+                manifest = AnswerManifest(self.file_service, AnswerManifest.default_path(doc_path))
+                dataset_version = self.rag_client.dataset_version(self.config.get("RAG_DATASET_IDS", ""))
             
             answers_map = {}
-            processed_count = 0
+            keys = []
+            processed_count = reused_count = 0
+            attempted = finished = 0
             
-            # 4. 处理每个问题
-            for q in questions:
-                # 组合上下文 (Product + Module + Business Context)
-                combined_context = f"{context_str}\n{q['business_context']}"
-                
-                # 构建完整的查询内容 (Full Question Content)
-                # 使用整个问题块作为查询输入，确保上下文完整
-                # 移除可能存在的旧 AI 回答，避免干扰
-                clean_block = re.sub(r'\n\*\*AI 参考建议\*\*：.*?(?=\n\*\*回答\*\*|\Z)', '', q['full_block'], flags=re.DOTALL)
-                
-                # 执行安全检索 (含重试/降级)
-                # 使用 QueryRewriter 优化查询
-                optimized_query = self.query_rewriter.rewrite(clean_block, context=combined_context)
+            # 3. 流式解析问题，每批问题一次批量改写 (一次 LLM 调用)，再进入 检索 -> 校验 两阶段流水线
+            batch_size = self.config.get("RAG_REWRITE_BATCH_SIZE", 50)
+            questions = iter_questions(self.file_service.iter_lines(doc_path))
+            for batch in iter(lambda: list(islice(questions, batch_size)), []):
+                prepared = [self._prepare_question(q, context_str) for q in batch]
+                batch_keys = [question_hash(combined_context, clean_block) for _, combined_context, clean_block in prepared]
+                keys.extend(batch_keys)
                 
-                result = self._safe_rag_search(
-                    global_ctx="", 
-                    local_ctx=combined_context,
-                    question=optimized_query,  # Use optimized query
-                    dataset_ids=self.config.get("RAG_DATASET_IDS", "")
-                )
-                
-                # 真实性校验 (Still verify against the specific description if available, or the full block)
-                # Using description for verification is usually better as it's the core question, 
-                # but if description is empty, use title or block.
-                verify_text = q["description"] if q["description"] else q["title"]
-                is_valid, reason = self._verify_truthfulness(verify_text, result)
+                pending = []
+                for item, key in zip(prepared, batch_keys):
+                    entry = manifest.lookup(key, dataset_version) if manifest else None
+                    if entry is None:
+                        pending.append((item, key))
+                    else:
+                        answers_map[str(item[0]["id"])] = entry["answer"]
+                        processed_count += 1
+                reused_count += len(batch) - len(pending)
                 
-                if is_valid:
-                    answers_map[str(q["id"])] = result
-                    processed_count += 1
-                else:
-                    self.logger.info(f"跳过问题 {q['id']}，原因: {reason}")
-                    # 即使置信度低，也尝试填充，但标注为低置信度
-                    # answers_map[str(q["id"])] = result # 暂时保持跳过，后续可优化为降级显示
+                # 时间预算已用完后，剩余批次只复用已有结果，待处理问题留待下次
+                exhausted = finished < attempted or deadline.expired()
+                attempted += len(pending)
+                if pending and not exhausted:
+                    answered, done = self._answer_batch(pending, manifest, dataset_version, answers_map)
+                    processed_count += answered
+                    finished += done
+            
+            if not keys:
+                return {"status": "success", "message": "未发现问题。", "processed_count": 0}
+            if reused_count:
+                self.logger.info(f"复用未变化问题的结果: {reused_count}/{len(keys)}")
+            if finished < attempted:
+                # 时间预算已用完：保留已完成的回答，剩余问题留待下次处理
+                self.logger.warning(f"时间预算已用完，跳过剩余问题 (已处理 {finished}/{attempted} 个)")
+            if manifest:
+                manifest.retain(keys)
+                manifest.save()
 
             
-            # 5. 回写文档 (使用影子副本)
+            # 4. 回写文档 (使用影子副本，逐个问题块写出)
             if answers_map:
-                new_content = self._inject_ai_answers(content, answers_map)
-                
-                # Use ShadowFileManager instead of direct write
-                shadow_path, diff_path = self.shadow_manager.generate_shadow_copy(doc_path, new_content)
+                segments = iter_revisions(self.file_service.iter_lines(doc_path), answers_map, self._render_ai_block)
+                shadow_path, diff_path = self.file_service.create_shadow_copy_segments(doc_path, segments)
                 
                 return {
                     "status": "success", 
                     "processed_count": processed_count,
+                    "reused_count": reused_count,
                     "shadow_path": shadow_path,
                     "diff_path": diff_path,
                     "message": "已生成影子副本，请 Review。"
                 }
             
-            return {"status": "success", "message": "无有效建议生成。", "processed_count": 0}
+            return {"status": "success", "message": "无有效建议生成。", "processed_count": 0, "reused_count": reused_count}
 
         except Exception as e:
             self.logger.error(f"处理澄清建议失败: {e}")
             return {"status": "error", "message": str(e)}
 
+    def _answer_batch(self, pending: List[tuple], manifest: Optional[AnswerManifest], dataset_version: Optional[str],
+                      answers_map: Dict[str, Dict]) -> tuple:
+        """改写 -> 检索 -> 校验 一批待处理问题 ((prepared, key) 列表)，返回 (通过校验数, 完成数)"""
+        optimized_queries = self.query_rewriter.rewrite_many(
+            [clean_block for (_, _, clean_block), _ in pending],
+            [combined_context for (_, combined_context, _), _ in pending],
+            batch_size=self.config.get("RAG_REWRITE_BATCH_SIZE", 50)
+        )
+        items = [(q, combined_context, optimized_query)
+                 for ((q, combined_context, _), _), optimized_query in zip(pending, optimized_queries)]
+        
+        pipeline = Pipeline([
+            ("search", self._search_stage, self.config.get("RAG_SEARCH_CONCURRENCY", 4)),
+            ("verify", self._verify_stage, 1)
+        ], queue_size=self.config.get("RAG_PIPELINE_QUEUE_SIZE", 8))
+        
+        answered = finished = 0
+        for index, output in pipeline.process(items):
+            finished += 1
+            if isinstance(output, StageFailure):
+                self.logger.error(f"问题处理失败 ({output.stage}): {output.error}")
+                continue
+            q, result, is_valid, reason = output
+            # Degraded answers (RAG unavailable) are not remembered, so the next run retries them
+            if manifest and not result.get("degraded") and result.get("citation") not in _ERROR_CITATIONS:
+                manifest.record(pending[index][1], str(q["id"]), dataset_version, result, is_valid, reason)
+            
+            if is_valid:
+                answers_map[str(q["id"])] = result
+                answered += 1
+            else:
+                self.logger.info(f"跳过问题 {q['id']}，原因: {reason}")
+                # 即使置信度低，也尝试填充，但标注为低置信度
+                # answers_map[str(q["id"])] = result # 暂时保持跳过，后续可优化为降级显示
+        return answered, finished
+
+    # --- Pipeline Stages ---
+
+    def _prepare_question(self, q: Dict[str, Any], context_str: str) -> tuple:
+        # 组合上下文 (Product + Module + Business Context)
+        combined_context = f"{context_str}\n{q['business_context']}"
+        
+        # 构建完整的查询内容 (Full Question Content)，不含已存在的 AI 回答，避免干扰
+        clean_block = q["clean_block"]
+        
+        return q, combined_context, clean_block
+
+    def _search_stage(self, item: tuple) -> tuple:
+        q, combined_context, optimized_query = item
+        # 执行安全检索 (含重试/降级)
+        result = self._safe_rag_search(
+            global_ctx="", 
+            local_ctx=combined_context,
+            question=optimized_query,  # Use optimized query
+            dataset_ids=self.config.get("RAG_DATASET_IDS", "")
+        )
+        return q, result
+
+    def _verify_stage(self, item: tuple) -> tuple:
+        q, result = item
+        # 真实性校验 (Still verify against the specific description if available, or the full block)
+        # Using description for verification is usually better as it's the core question, 
+        # but if description is empty, use title or block.
+        verify_text = q["description"] if q["description"] else q["title"]
+        is_valid, reason = self._verify_truthfulness(verify_text, result)
+        return q, result, is_valid, reason
+
     def _safe_rag_search(self, global_ctx: str, local_ctx: str, question: str, dataset_ids: str, retries: int = 3) -> Dict[str, Any]:
         """执行带有自动重试和降级策略的 RAG 检索"""
         for i in range(retries):
@@ -131,7 +207,15 @@ class InferenceEngine(BaseEngine):
                 )
                 return result
             except Exception as e:
+                # RAGFlow is overloaded/down: retrying with sleeps only adds load, degrade right away
+                if isinstance(e, CircuitOpenError) or self.rag_client.resilience.is_open("chat"):
+                    self.logger.warning(f"RAG 服务熔断中，跳过重试: {e}")
+                    break
                 wait_time = 2 ** i
+                # No retry if the back-off alone would outlive the tool call's deadline
+                if i == retries - 1 or not deadline.has_time_for(wait_time):
+                    self.logger.warning(f"RAG 检索失败 (第 {i+1} 次)，不再重试: {e}")
+                    break
                 self.logger.warning(f"RAG 检索失败 (第 {i+1} 次)，{wait_time}秒后重试: {e}")
                 time.sleep(wait_time)
         
@@ -162,80 +246,30 @@ class InferenceEngine(BaseEngine):
 
     # _read_file is removed as we use FileService
 
-    def _extract_metadata(self, content: str) -> Dict[str, str]:
+    def _extract_metadata(self, lines: Iterable[str]) -> Dict[str, str]:
+        # Only the front matter is read: "---" on the first line up to the closing "---"
         metadata = {"product": "General", "module": "General"}
-        match = re.search(r'^---\s*\n(.*?)\n---\s*\n', content, re.DOTALL)
-        if match:
-            yaml_block = match.group(1)
-            for line in yaml_block.split('\n'):
-                if ':' in line:
-                    key, val = line.split(':', 1)
-                    metadata[key.strip().lower()] = val.strip()
+        lines = iter(lines)
+        if next(lines, "").strip() != "---":
+            return metadata
+        front = {}
+        for line in lines:
+            if line.strip() == "---":
+                metadata.update(front)
+                break
+            if ':' in line:
+                key, val = line.split(':', 1)
+                front[key.strip().lower()] = val.strip()
         return metadata
 
-    def _parse_questions(self, content: str) -> List[Dict]:
-        questions = []
-        # Regex to match ## [index].[title] blocks
-        pattern = re.compile(r'(##\s+(\d+)\.(.+?)\n)(.*?)(?=\n##\s+\d+\.|\Z)', re.DOTALL)
-        matches = pattern.findall(content)
-        
-        for header, idx, title, body in matches:
-            q_data = {
-                "id": idx,
-                "title": title.strip(),
-                "full_block": header + body
-            }
-            desc_match = re.search(r'\*\*问题描述\*\*：(.*?)\n\*\*', body, re.DOTALL)
-            ctx_match = re.search(r'\*\*业务上下文\*\*：(.*?)\n\*\*', body, re.DOTALL)
-            
-            q_data["description"] = desc_match.group(1).strip() if desc_match else ""
-            q_data["business_context"] = ctx_match.group(1).strip() if ctx_match else ""
-            questions.append(q_data)
-        return questions
-
-    def _inject_ai_answers(self, content: str, answers_map: Dict[str, Dict]) -> str:
-        pattern = re.compile(r'(##\s+(\d+)\.(.+?)\n)(.*?)(?=\n##\s+\d+\.|\Z)', re.DOTALL)
-        
-        def replacement_func(match):
-            header = match.group(1)
-            idx = match.group(2)
-            body = match.group(4)
-            
-            if idx in answers_map:
-                ans_data = answers_map[idx]
-                score_val = ans_data.get('score', 0.0)
-                
-                # Construct AI block
-                ai_block = (
-                    f"\n**AI 参考建议**：\n"
-                    f"> 🤖 **AI 解答** (置信度: {score_val:.2f})\n"
-                    f">\n"
-                    f"> {ans_data['answer']}\n"
-                    f">\n"
-                    f"> 📚 **来源**:\n"
-                    f"> - `{ans_data.get('citation', 'Unknown')}`\n"
-                )
-                
-                # Check if AI block already exists and replace it
-                # Match from **AI 参考建议** start until **回答** or end of block
-                existing_ai_pattern = re.compile(r'\n\*\*AI 参考建议\*\*：.*?(?=\n\*\*回答\*\*|\Z)', re.DOTALL)
-                
-                if existing_ai_pattern.search(body):
-                    # Replace existing AI block
-                    new_body = existing_ai_pattern.sub(ai_block, body)
-                else:
-                    # Insert before **回答** if it exists, otherwise append
-                    if "**回答**" in body:
-                        parts = body.split("**回答**")
-                        # parts[0] is content before answer, parts[1:] is answer content
-                        # We inject AI block between them
-                        new_body = parts[0] + ai_block + "\n**回答**" + "**回答**".join(parts[1:])
-                    else:
-                        new_body = body + ai_block
-                
-                return header + new_body
-            else:
-                return match.group(0) # No change
-                
-        new_content = pattern.sub(replacement_func, content)
-        return new_content
+    def _render_ai_block(self, ans_data: Dict[str, Any]) -> str:
+        score_val = ans_data.get('score', 0.0)
+        return (
+            f"\n**AI 参考建议**：\n"
+            f"> 🤖 **AI 解答** (置信度: {score_val:.2f})\n"
+            f">\n"
+            f"> {ans_data['answer']}\n"
+            f">\n"
+            f"> 📚 **来源**:\n"
+            f"> - `{ans_data.get('citation', 'Unknown')}`\n"
+        )
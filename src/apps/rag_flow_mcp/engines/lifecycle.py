@@ -4,6 +4,8 @@ import json
 import datetime
 from typing import Dict, Any, List
 from .base import BaseEngine
+from src.apps.rag_flow_mcp.core.bulk_uploader import BulkUploader
+from src.apps.rag_flow_mcp.core.question_index import extractor
 
 class LifecycleEngine(BaseEngine):
     """
@@ -12,6 +14,7 @@ class LifecycleEngine(BaseEngine):
     职责:
     1. 收割新知识候选 (Harvest Candidates)。
     2. 晋升知识到 L1/L2 库 (Promote Knowledge)。
+    3. 本地文件夹与知识库增量同步 (Folder Sync)。
     """
     
     def initialize(self) -> bool:
@@ -54,6 +57,22 @@ class LifecycleEngine(BaseEngine):
         self.logger.info(f"正在检索知识切片 (Dataset: {dataset_id}, Query: {optimized_query})")
         return self.rag_client.retrieve_chunks(dataset_id, optimized_query, page, page_size, similarity_threshold)
 
+    def sync_folder(self, folder: str, dataset_id: str, delete_missing: bool = True, parse: bool = True) -> Dict[str, Any]:
+        """
+        增量同步文件夹 (Sync Folder)
+        
+        Uploads only new / changed files (content hash in the folder's manifest), deletes
+        documents whose source file is gone and parses the uploads. Re-run to resume.
+        """
+        self.logger.info(f"正在同步文件夹 {folder} -> 知识库 {dataset_id}")
+        uploader = BulkUploader(
+            self.rag_client, dataset_id,
+            concurrency=self.config.get("RAG_UPLOAD_CONCURRENCY", 4),
+            parse_batch_size=self.config.get("RAG_PARSE_BATCH_SIZE", 32),
+            poll_interval=self.config.get("RAG_PARSE_POLL_INTERVAL", 5.0)
+        )
+        return uploader.sync(folder, parse=parse, delete_missing=delete_missing)
+
     def harvest_knowledge_candidates(self, doc_path: str) -> List[Dict[str, Any]]:
         """
         收割知识候选 (Harvest Knowledge Candidates)
@@ -66,25 +85,18 @@ class LifecycleEngine(BaseEngine):
             self.logger.error(f"文件未找到: {doc_path}")
             return []
             
-        with open(doc_path, 'r', encoding='utf-8') as f:
-            content = f.read()
+        # Shared extractor: re-parsed only when the file's mtime / size changed
+        content, questions = extractor.load(doc_path)
             
         # Extract Metadata first
         metadata = self._extract_metadata(content)
         
         candidates = []
-        # Regex to match blocks
-        pattern = re.compile(r'(##\s+(\d+)\.(.+?)\n)(.*?)(?=\n##\s+\d+\.|\Z)', re.DOTALL)
-        matches = pattern.findall(content)
-        
-        for _, idx, title, body in matches:
-            # Extract Question Description
-            q_match = re.search(r'\*\*问题描述\*\*：(.*?)\n\*\*', body, re.DOTALL)
-            question = q_match.group(1).strip() if q_match else ""
-            
-            # Extract Answer (Human or Final Decision)
-            a_match = re.search(r'\*\*回答\*\*：(.*?)(?=\n\*\*|\Z)', body, re.DOTALL)
-            answer = a_match.group(1).strip() if a_match else ""
+        for q in questions:
+            idx = q["id"]
+            question = q["description"]
+            # Answer (Human or Final Decision)
+            answer = q["answer"]
             
             if question and answer and len(answer) > 5:
                 candidate = {
@@ -2,7 +2,9 @@ import shutil
 import os
 import time
 from pathlib import Path
+from typing import Iterable, Iterator
 from src.common.logger import get_app_logger
+from src.common.atomic_io import write_lines_atomic
 
 logger = get_app_logger("rag_base")
 
@@ -38,3 +40,14 @@ class ShadowFileManager:
     def write_file(file_path: str, content: str):
         with open(file_path, 'w', encoding='utf-8') as f:
             f.write(content)
+
+    @staticmethod
+    def iter_lines(file_path: str) -> Iterator[str]:
+        """Yield the file's lines (line endings kept) without loading the whole file."""
+        with open(file_path, 'r', encoding='utf-8', newline='\n') as f:
+            yield from f
+
+    @staticmethod
+    def write_lines(file_path: str, chunks: Iterable[str]):
+        """Stream chunks into file_path atomically (chunks may lazily read file_path itself)."""
+        write_lines_atomic(file_path, chunks)
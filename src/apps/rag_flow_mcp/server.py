@@ -1,6 +1,8 @@
 import os
 import sys
 import json
+import asyncio
+import inspect
 import functools
 import traceback
 
@@ -14,7 +16,7 @@ else:
     if project_root not in sys.path:
         sys.path.insert(0, project_root)
 
-from mcp.server.fastmcp import FastMCP
+from mcp.server.fastmcp import FastMCP, Context
 from src.common import get_app_logger
 from dotenv import load_dotenv
 
@@ -35,6 +37,7 @@ from engines import (
 
 # Import Implementation Tools
 from src.apps.rag_flow_mcp.tools import base_tools
+from src.apps.rag_flow_mcp.core import deadline
 
 # Initialize Configuration and Logger
 config = load_config()
@@ -50,32 +53,55 @@ mcp = FastMCP("rag_flow_mcp")
 
 # Logging Decorator
 def log_tool_call(func):
+    tool_name = func.__name__
+
+    def log_call(args, kwargs):
+        logger.info(f"🔧 Calling Tool [{tool_name}]")
+        if args:
+            logger.info(f"  Args: {args}")
+        if kwargs:
+            # default=str: async tools may receive a non-serializable MCP Context
+            logger.info(f"  Kwargs: {json.dumps(kwargs, ensure_ascii=False, default=str)}")
+
+    def log_success(result):
+        res_str = str(result)
+        if len(res_str) > 500:
+            res_str = res_str[:500] + "... (truncated)"
+        logger.info(f"✅ Tool [{tool_name}] Success: {res_str}")
+
+    def log_failure(e):
+        logger.error(f"❌ Tool [{tool_name}] Failed: {e}")
+        logger.error(traceback.format_exc())
+        return json.dumps({
+            "status": "error", 
+            "message": f"Tool execution failed: {str(e)}",
+            "details": traceback.format_exc()
+        }, ensure_ascii=False)
+
+    if inspect.iscoroutinefunction(func):
+        @functools.wraps(func)
+        async def async_wrapper(*args, **kwargs):
+            try:
+                log_call(args, kwargs)
+                with deadline.deadline(config.get("RAG_TOOL_DEADLINE")):
+                    result = await func(*args, **kwargs)
+                log_success(result)
+                return result
+            except Exception as e:
+                return log_failure(e)
+        return async_wrapper
+
     @functools.wraps(func)
     def wrapper(*args, **kwargs):
-        tool_name = func.__name__
         try:
-            logger.info(f"🔧 Calling Tool [{tool_name}]")
-            if args:
-                logger.info(f"  Args: {args}")
-            if kwargs:
-                logger.info(f"  Kwargs: {json.dumps(kwargs, ensure_ascii=False)}")
-            
-            result = func(*args, **kwargs)
-            
-            res_str = str(result)
-            if len(res_str) > 500:
-                res_str = res_str[:500] + "... (truncated)"
-            logger.info(f"✅ Tool [{tool_name}] Success: {res_str}")
-            
+            log_call(args, kwargs)
+            # Every RAGFlow request made by this tool call shares one time budget
+            with deadline.deadline(config.get("RAG_TOOL_DEADLINE")):
+                result = func(*args, **kwargs)
+            log_success(result)
             return result
         except Exception as e:
-            logger.error(f"❌ Tool [{tool_name}] Failed: {e}")
-            logger.error(traceback.format_exc())
-            return json.dumps({
-                "status": "error", 
-                "message": f"Tool execution failed: {str(e)}",
-                "details": traceback.format_exc()
-            }, ensure_ascii=False)
+            return log_failure(e)
     return wrapper
 
 # Initialize Engines
@@ -91,7 +117,8 @@ governance_engine.initialize()
 
 try:
     from src.apps.rag_flow_mcp.legacy_core.scenario_processor import ScenarioProcessor as LegacyScenarioProcessor
-    legacy_processor = LegacyScenarioProcessor(inference_engine.rag_client) if hasattr(inference_engine, 'rag_client') else None
+    from src.apps.rag_flow_mcp.core.chunk_ranker import ChunkRanker
+    legacy_processor = LegacyScenarioProcessor(inference_engine.rag_client, ChunkRanker.from_config(config), inference_engine.context_packer) if hasattr(inference_engine, 'rag_client') else None
 except ImportError:
     legacy_processor = None
 
@@ -238,25 +265,34 @@ def document_manage(
     enabled: bool = None,
     keywords: str = "",
     page: int = 1,
-    page_size: int = 30
+    page_size: int = 30,
+    parse: bool = True
 ) -> str:
     """
     Manage Documents in a Knowledge Base.
     
     Args:
-        action: One of ['upload', 'delete', 'update', 'list', 'get_content'].
+        action: One of ['upload', 'bulk_upload', 'sync', 'delete', 'update', 'list', 'get_content'].
         dataset_id: Target Dataset ID (required for all).
         document_id: Document ID (required for delete/update/get_content).
-        file_path: Local file path (required for upload).
+        file_path: Local file path (required for upload); directory or glob pattern for bulk_upload;
+            directory for sync (uploads new/changed files, deletes documents whose file was removed).
         name: New name (optional for update).
         enabled: Enable/Disable (optional for update).
         keywords: Search keywords (optional for list).
         page: Page number (for list).
         page_size: Page size (for list).
+        parse: Parse uploaded documents in batches and wait for them (for bulk_upload/sync). Re-run to resume.
     """
     if action == 'upload':
         if not file_path: return json.dumps({"error": "file_path is required for upload"}, ensure_ascii=False)
         return base_tools.upload_document(dataset_id, file_path)
+    elif action == 'bulk_upload':
+        if not file_path: return json.dumps({"error": "file_path (directory or glob) is required for bulk_upload"}, ensure_ascii=False)
+        return base_tools.bulk_upload(dataset_id, file_path, parse)
+    elif action == 'sync':
+        if not file_path: return json.dumps({"error": "file_path (directory) is required for sync"}, ensure_ascii=False)
+        return base_tools.sync_folder(dataset_id, file_path, parse)
     elif action == 'delete':
         if not document_id: return json.dumps({"error": "document_id is required for delete"}, ensure_ascii=False)
         return base_tools.delete_document(dataset_id, document_id)
@@ -271,6 +307,35 @@ def document_manage(
     else:
         return json.dumps({"error": f"Unknown action: {action}"}, ensure_ascii=False)
 
+@mcp.tool(name="mcp_rag_base_list_all")
+@log_tool_call
+async def list_all(
+    kind: str,
+    dataset_id: str = "",
+    document_id: str = "",
+    cursor: str = "",
+    limit: int = 500,
+    fields: list[str] = None,
+    ctx: Context = None
+) -> str:
+    """
+    List ALL datasets / documents / chunks in one streamed pass (pages are prefetched).
+    Returns {"items", "count", "next_cursor"}; call again with next_cursor to continue (null = done).
+    
+    Args:
+        kind: One of ['datasets', 'documents', 'chunks'].
+        dataset_id: Dataset ID (required for documents/chunks).
+        document_id: Document ID (required for chunks).
+        cursor: next_cursor from the previous call (empty = start).
+        limit: Max items returned by this call (default 500).
+        fields: Keep only these fields per item, e.g. ['id', 'name'] (drops heavy fields).
+    """
+    async def progress(count: int):
+        if ctx is not None:
+            await ctx.report_progress(progress=count, total=limit, message=f"{count} {kind} listed")
+
+    return await base_tools.list_all(kind, dataset_id, document_id, cursor, limit, fields, on_progress=progress)
+
 @mcp.tool(name="mcp_rag_base_file_manage")
 @log_tool_call
 def file_manage(
@@ -295,37 +360,91 @@ def file_manage(
 
 @mcp.tool(name="mcp_rag_base_retrieve_chunks")
 @log_tool_call
-def retrieve_chunks(dataset_id: str, query: str, page: int = 1, page_size: int = 30, similarity_threshold: float = 0.2) -> str:
+async def retrieve_chunks(
+    dataset_id: str,
+    query: str = "",
+    page: int = 1,
+    page_size: int = 30,
+    similarity_threshold: float = 0.2,
+    queries: list[str] = None,
+    concurrency: int = 4,
+    ctx: Context = None
+) -> str:
     """
     [知识检索] 直接检索知识库切片 (不经过 LLM 生成)。
     适用于只查找相关内容而不进行问答的场景。
+    传入 queries 时进入批量模式：一次调用并发检索多个问题，每个问题完成后立即以 MCP progress 通知推送其结果，
+    最终返回按完成顺序排列的全部结果。
     
     Args:
         dataset_id: 知识库 ID
-        query: 检索关键词或问题
+        query: 检索关键词或问题 (单条模式)
         page: 页码 (默认 1)
         page_size: 每页数量 (默认 30)
         similarity_threshold: 相似度阈值 (0.0~1.0, 默认 0.2)
+        queries: 批量模式的问题列表 (可选)
+        concurrency: 批量模式的最大并发数 (默认 4)
+    """
+    if queries:
+        completed = 0
+
+        async def forward(result: dict):
+            nonlocal completed
+            completed += 1
+            if ctx is not None:
+                await ctx.report_progress(progress=completed, total=len(queries), message=json.dumps(result, ensure_ascii=False))
+
+        return await base_tools.retrieve_chunks_many(dataset_id, queries, concurrency, page, page_size, similarity_threshold, on_result=forward)
+    if not query:
+        return json.dumps({"error": "query or queries is required"}, ensure_ascii=False)
+    # The single query uses the blocking client: keep it off the event loop
+    return await asyncio.to_thread(base_tools.retrieve_chunks, dataset_id, query, page, page_size, similarity_threshold)
+
+@mcp.tool(name="mcp_rag_base_ask")
+@log_tool_call
+async def ask(query: str, dataset_ids: str = "", ctx: Context = None) -> str:
     """
-    return base_tools.retrieve_chunks(dataset_id, query, page, page_size, similarity_threshold)
+    [知识问答] 基于知识库回答问题 (流式生成)。
+    生成过程中的增量文本会以 MCP progress 通知实时推送，最终返回完整答案与引用。
+    
+    Args:
+        query: 问题
+        dataset_ids: 知识库 ID，多个用逗号分隔 (可选，默认使用 Chat 助手绑定的知识库)
+    """
+    progress = 0
+
+    async def forward(delta: str):
+        nonlocal progress
+        progress += 1
+        if ctx is not None:
+            await ctx.report_progress(progress=progress, message=delta)
+
+    return await base_tools.ask(query, dataset_ids, on_delta=forward)
 
 @mcp.tool(name="mcp_rag_base_rewrite_query")
 @log_tool_call
-def rewrite_query(query: str, context: str = "") -> str:
+def rewrite_query(query: str = "", context: str = "", queries: list[str] = None) -> str:
     """
     [Query Rewrite] Optimize user query for better retrieval.
     
     Args:
         query: The original user query.
         context: Optional context to help with rewriting.
+        queries: Batch mode - rewrite several queries in one LLM call; returns a JSON list in the same order.
     """
+    if queries:
+        return base_tools.rewrite_queries(queries, context)
     return base_tools.rewrite_query(query, context)
 
 @mcp.tool(name="mcp_rag_base_inspect_config")
 @log_tool_call
 def inspect_config() -> str:
     """[System] Inspect current configuration (sensitive data masked)."""
-    return base_tools.inspect_config()
+    # agentic_search and clarification rewrites run on the engine's client / rewriter, so their counters live there
+    return base_tools.inspect_config({
+        "AGENTIC_SEARCH_HEDGE_STATS": inference_engine.rag_client.hedge_stats.snapshot(),
+        "QUERY_REWRITE_STATS": inference_engine.query_rewriter.stats()
+    })
 
 # --- Other Tools ---
 
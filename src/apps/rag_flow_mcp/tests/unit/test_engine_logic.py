@@ -12,18 +12,15 @@ class TestInferenceEngine:
              patch('src.apps.rag_flow_mcp.core.evaluator.QualityEvaluator'), \
              patch('src.apps.rag_flow_mcp.core.file_service.FileService'):
              
-            # We need to manually handle shadow manager if it's imported or used
-            # But InferenceEngine seems to have issues with shadow_manager
-            
             engine = InferenceEngine(config={})
             # Manually mock components
             engine.rag_client = MagicMock()
             engine.evaluator = MagicMock()
             engine.threshold = 0.6 # Manually set threshold
-            engine.shadow_manager = MagicMock() # Mocking the missing attribute
             engine.file_service = MagicMock()
             engine.logger = MagicMock()
             engine.query_rewriter = MagicMock()
+            engine.query_rewriter.rewrite_many.side_effect = lambda queries, contexts=None, batch_size=50: list(queries)
             return engine
 
     def test_fill_suggestions_no_file(self, engine):
@@ -33,15 +30,18 @@ class TestInferenceEngine:
         assert "文件未找到" in result["message"]
 
     def test_fill_suggestions_no_questions(self, engine, tmp_path):
-        engine.file_service.exists.return_value = True
-        engine.file_service.read_text.return_value = "# Title\nNo questions here."
+        from src.apps.rag_flow_mcp.core.file_service import FileService
+        engine.file_service = FileService()
+        doc = tmp_path / "doc.md"
+        doc.write_text("# Title\nNo questions here.", encoding="utf-8")
         
-        result = engine.fill_clarification_suggestions("doc.md")
+        result = engine.fill_clarification_suggestions(str(doc))
         assert result["status"] == "success"
         assert result["processed_count"] == 0
 
-    def test_fill_suggestions_success(self, engine):
-        engine.file_service.exists.return_value = True
+    def test_fill_suggestions_success(self, engine, tmp_path):
+        from src.apps.rag_flow_mcp.core.file_service import FileService
+        engine.file_service = FileService()
         content = """---
 product: P
 module: M
@@ -53,21 +53,93 @@ module: M
 **问题描述**：What is X?
 **回答**：
 """
-        engine.file_service.read_text.return_value = content
+        doc = tmp_path / "questions.md"
+        doc.write_text(content, encoding="utf-8")
         
         # Mock RAG response
         engine.rag_client.agentic_search.return_value = {"answer": "It is X.", "score": 0.9}
         # Mock Evaluator
         engine.evaluator.evaluate.return_value = {"is_valid": True, "reason": "Pass"}
         
-        # Mock Shadow Manager
-        engine.shadow_manager.generate_shadow_copy.return_value = ("shadow.md", "diff.html")
-
-        result = engine.fill_clarification_suggestions("questions.md")
+        result = engine.fill_clarification_suggestions(str(doc))
         
         assert result["status"] == "success", f"Failed with message: {result.get('message')}"
         assert result["processed_count"] == 1
         assert "shadow_path" in result
+        # The front matter is read for the query context; the original document is left untouched
+        assert engine.rag_client.agentic_search.call_args.kwargs["local_ctx"].startswith("产品: P, 模块: M")
+        assert doc.read_text(encoding="utf-8") == content
+        with open(result["shadow_path"], encoding="utf-8") as f:
+            assert "It is X." in f.read()
+        with open(result["diff_path"], encoding="utf-8") as f:
+            assert "+> It is X." in f.read()
+
+    def test_fill_suggestions_pipeline_keeps_order(self, engine, tmp_path):
+        from src.apps.rag_flow_mcp.core.file_service import FileService
+        engine.file_service = FileService()
+        doc = tmp_path / "questions.md"
+        blocks = [f"## {i}. Q{i}\n**问题描述**：Question {i}?\n**回答**：\n" for i in range(1, 6)]
+        doc.write_text("# 待确认问题\n\n" + "\n".join(blocks), encoding="utf-8")
+        engine.rag_client.agentic_search.side_effect = lambda **kw: {"answer": f"A for {kw['question'].split('.')[0]}", "score": 0.9}
+        engine.evaluator.evaluate.return_value = {"is_valid": True, "reason": "Pass"}
+
+        result = engine.fill_clarification_suggestions(str(doc))
+
+        assert result["processed_count"] == 5
+        # All five questions are rewritten in a single batched call
+        engine.query_rewriter.rewrite_many.assert_called_once()
+        engine.query_rewriter.rewrite.assert_not_called()
+        with open(result["shadow_path"], encoding="utf-8") as f:
+            new_content = f.read()
+        for i in range(1, 6):
+            assert f"A for ## {i}" in new_content
+
+    def test_fill_suggestions_processes_questions_in_batches(self, engine, tmp_path):
+        from src.apps.rag_flow_mcp.core.file_service import FileService
+        engine.file_service = FileService()
+        engine.config = {"RAG_REWRITE_BATCH_SIZE": 2, "RAG_ANSWER_MANIFEST_ENABLED": False}
+        doc = tmp_path / "questions.md"
+        blocks = [f"## {i}. Q{i}\n**问题描述**：Question {i}?\n**回答**：\n" for i in range(1, 6)]
+        doc.write_text("# 待确认问题\n\n" + "\n".join(blocks), encoding="utf-8")
+        engine.rag_client.agentic_search.side_effect = lambda **kw: {"answer": f"A for {kw['question'].split('.')[0]}", "score": 0.9}
+        engine.evaluator.evaluate.return_value = {"is_valid": True, "reason": "Pass"}
+
+        result = engine.fill_clarification_suggestions(str(doc))
+
+        # The document is streamed: questions are rewritten two at a time, never all at once
+        assert result["processed_count"] == 5
+        assert [len(c.args[0]) for c in engine.query_rewriter.rewrite_many.call_args_list] == [2, 2, 1]
+        with open(result["shadow_path"], encoding="utf-8") as f:
+            new_content = f.read()
+        assert [new_content.index(f"A for ## {i}") for i in range(1, 6)] == sorted(new_content.index(f"A for ## {i}") for i in range(1, 6))
+
+    def test_fill_suggestions_reuses_unchanged_questions(self, engine, tmp_path):
+        from src.apps.rag_flow_mcp.core.file_service import FileService
+        engine.file_service = FileService()
+        doc = tmp_path / "questions.md"
+        blocks = [f"## {i}. Q{i}\n**问题描述**：Question {i}?\n**回答**：\n" for i in range(1, 4)]
+        doc.write_text("# 待确认问题\n\n" + "\n".join(blocks), encoding="utf-8")
+        engine.rag_client.dataset_version.return_value = "v1"
+        engine.rag_client.agentic_search.side_effect = lambda **kw: {"answer": "A", "citation": "doc.md", "score": 0.9}
+        engine.evaluator.evaluate.return_value = {"is_valid": True, "reason": "Pass"}
+        first = engine.fill_clarification_suggestions(str(doc))
+        assert first["processed_count"] == 3 and first["reused_count"] == 0
+        assert (tmp_path / ".questions.md.answers.json").exists()
+
+        # Edit one question: only that one goes upstream, the others are re-injected from the manifest
+        blocks[1] = blocks[1].replace("Question 2?", "Question 2, edited?")
+        doc.write_text("# 待确认问题\n\n" + "\n".join(blocks), encoding="utf-8")
+        second = engine.fill_clarification_suggestions(str(doc))
+        assert second["processed_count"] == 3 and second["reused_count"] == 2
+        assert engine.rag_client.agentic_search.call_count == 4
+        with open(second["shadow_path"], encoding="utf-8") as f:
+            assert f.read().count("AI 参考建议") == 3
+
+        # A dataset change invalidates every remembered answer
+        engine.rag_client.dataset_version.return_value = "v2"
+        third = engine.fill_clarification_suggestions(str(doc))
+        assert third["reused_count"] == 0
+        assert engine.rag_client.agentic_search.call_count == 7
 
 class TestEvolutionEngine:
     @pytest.fixture
@@ -125,3 +197,47 @@ class TestEvolutionEngine:
         # The previous test used tmp_path.
         
         pass
+
+    def test_evolve_sends_only_matching_sections(self, engine, tmp_path):
+        from src.apps.rag_flow_mcp.core.markdown_ast import MarkdownASTManager
+        from src.common.context_packer import ContextPacker
+        engine.ast_manager = MarkdownASTManager()
+        engine.context_packer = ContextPacker(1000)
+        engine.config["RAG_EVOLUTION_TOP_K"] = 1
+        scheme = tmp_path / "scheme.md"
+        scheme.write_text("# 方案\n## 登录\n支持 SSO。\n## 导出\n导出 CSV。\n## 部署\n容器化部署。\n", encoding="utf-8")
+        clarification = tmp_path / "review.md"
+        clarification.write_text("", encoding="utf-8")
+        engine.file_service.read_text.return_value = "## 1. 导出\n**问题描述**：导出支持 Excel 吗？\n**回答**：支持导出 Excel\n"
+        engine.file_service.create_shadow_copy.return_value = ("shadow.md", "diff.md")
+        engine.rag_client.agentic_search.return_value = {
+            "answer": '```json\n{"target_header": "导出", "new_content": "导出 CSV 与 Excel。"}\n```'
+        }
+
+        result = engine.evolve_scheme_document(str(scheme), str(clarification))
+
+        # The matching section's text goes out inside the prompt itself
+        question = engine.rag_client.agentic_search.call_args.kwargs["question"]
+        assert "**相关章节内容**:\n## 导出\n导出 CSV。\n\n" in question
+        assert "- 导出" in question and "- 部署" not in question and "容器化部署" not in question
+        assert result["changes"] == ["Updated section '导出' for question: 导出支持 Excel 吗？..."]
+        written = str(engine.file_service.create_shadow_copy.call_args.args[1])
+        assert "## 导出\n导出 CSV 与 Excel。\n## 部署" in written
+
+    def test_evolve_without_matching_section_sends_packed_document(self, engine, tmp_path):
+        from src.apps.rag_flow_mcp.core.markdown_ast import MarkdownASTManager
+        from src.common.context_packer import ContextPacker
+        engine.ast_manager = MarkdownASTManager()
+        engine.context_packer = ContextPacker(1000)
+        scheme = tmp_path / "scheme.md"
+        scheme.write_text("# 方案\n## 登录\n支持 SSO。\n", encoding="utf-8")
+        clarification = tmp_path / "review.md"
+        clarification.write_text("", encoding="utf-8")
+        engine.file_service.read_text.return_value = "## 1. Quota\n**问题描述**：Rate limits?\n**回答**：100 rps\n"
+        engine.rag_client.agentic_search.return_value = {"answer": '```json\n{"target_header": null}\n```'}
+
+        engine.evolve_scheme_document(str(scheme), str(clarification))
+
+        question = engine.rag_client.agentic_search.call_args.kwargs["question"]
+        assert "**相关章节内容**:\n# 方案\n## 登录\n支持 SSO。\n" in question
+        assert "- 方案" in question and "- 登录" in question
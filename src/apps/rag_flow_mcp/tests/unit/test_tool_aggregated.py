@@ -1,7 +1,8 @@
 import json
+import asyncio
 import pytest
 from unittest.mock import patch, MagicMock
-from src.apps.rag_flow_mcp.server import dataset_manage, document_manage, file_manage
+from src.apps.rag_flow_mcp.server import dataset_manage, document_manage, file_manage, retrieve_chunks, ask, list_all, rewrite_query
 
 # ==========================
 # Dataset Manage Tests
@@ -115,3 +116,104 @@ def test_file_manage_list(mock_list):
     result = file_manage(action='list', path='/dir', pattern='*.txt')
     mock_list.assert_called_with('/dir', '*.txt')
     assert result == '[]'
+
+# ==========================
+# Retrieve Chunks Tests
+# ==========================
+
+@patch('src.apps.rag_flow_mcp.tools.base_tools.retrieve_chunks')
+def test_retrieve_chunks_single(mock_retrieve):
+    mock_retrieve.return_value = 'chunks'
+    result = asyncio.run(retrieve_chunks(dataset_id='ds1', query='q'))
+    mock_retrieve.assert_called_with('ds1', 'q', 1, 30, 0.2)
+    assert result == 'chunks'
+
+def test_retrieve_chunks_batch_streams_results_as_progress():
+    async def fake_many(dataset_id, queries, concurrency, page, page_size, similarity_threshold):
+        assert (dataset_id, queries, concurrency) == ('ds1', ['q1', 'q2'], 8)
+        yield {"index": 1, "query": "q2", "result": {"chunks": []}}
+        yield {"index": 0, "query": "q1", "result": {"chunks": []}}
+
+    ctx = MagicMock()
+    ctx.report_progress = MagicMock(side_effect=lambda **kwargs: asyncio.sleep(0))
+    with patch('src.apps.rag_flow_mcp.tools.base_tools.async_rag_client') as mock_client:
+        mock_client.retrieve_chunks_many = fake_many
+        result = asyncio.run(retrieve_chunks(dataset_id='ds1', queries=['q1', 'q2'], concurrency=8, ctx=ctx))
+
+    # Each query is pushed as soon as it completes, then the whole batch is returned
+    assert [r["index"] for r in json.loads(result)] == [1, 0]
+    calls = ctx.report_progress.call_args_list
+    assert [(c.kwargs["progress"], c.kwargs["total"]) for c in calls] == [(1, 2), (2, 2)]
+    assert [json.loads(c.kwargs["message"])["query"] for c in calls] == ["q2", "q1"]
+
+def test_retrieve_chunks_missing_query():
+    result = asyncio.run(retrieve_chunks(dataset_id='ds1'))
+    assert "query or queries is required" in result
+
+# ==========================
+# Ask (Streaming) Tests
+# ==========================
+
+def test_ask_forwards_deltas_as_progress():
+    async def fake_stream(query, dataset_ids):
+        yield {"type": "delta", "content": "It "}
+        yield {"type": "delta", "content": "is X."}
+        yield {"type": "result", "answer": "It is X.", "citation": "spec.md", "score": 0.8, "reference": []}
+
+    ctx = MagicMock()
+    ctx.report_progress = MagicMock(side_effect=lambda **kwargs: asyncio.sleep(0))
+    with patch('src.apps.rag_flow_mcp.tools.base_tools.async_rag_client') as mock_client:
+        mock_client.retrieve_and_answer_stream = fake_stream
+        result = asyncio.run(ask(query='What is X?', ctx=ctx))
+
+    assert json.loads(result)["answer"] == "It is X."
+    messages = [c.kwargs["message"] for c in ctx.report_progress.call_args_list]
+    assert messages == ["It ", "is X."]
+
+# ==========================
+# List All (Cursor) Tests
+# ==========================
+
+def test_list_all_cursor_resumes_after_last_item():
+    docs = [{"id": f"d{i}"} for i in range(5)]
+
+    def fake_iter_documents(dataset_id, page_size, fields=None, start_page=1):
+        async def gen():
+            for doc in docs[(start_page - 1) * page_size:]:
+                yield doc
+        return gen()
+
+    with patch('src.apps.rag_flow_mcp.tools.base_tools.async_rag_client') as mock_client:
+        mock_client.iter_documents = fake_iter_documents
+        first = json.loads(asyncio.run(list_all(kind='documents', dataset_id='ds1', limit=3)))
+        second = json.loads(asyncio.run(list_all(kind='documents', dataset_id='ds1', cursor=first["next_cursor"], limit=3)))
+
+    assert [d["id"] for d in first["items"]] == ["d0", "d1", "d2"]
+    assert [d["id"] for d in second["items"]] == ["d3", "d4"]
+    assert second["next_cursor"] is None
+
+def test_list_all_requires_dataset_id():
+    result = asyncio.run(list_all(kind='documents'))
+    assert "dataset_id is required" in result
+
+@patch('src.apps.rag_flow_mcp.tools.base_tools.bulk_upload')
+def test_document_manage_bulk_upload(mock_bulk):
+    mock_bulk.return_value = '{"complete": true}'
+    result = document_manage(action='bulk_upload', dataset_id='ds1', file_path='/data/docs')
+    mock_bulk.assert_called_with('ds1', '/data/docs', True)
+    assert result == '{"complete": true}'
+
+@patch('src.apps.rag_flow_mcp.tools.base_tools.sync_folder')
+def test_document_manage_sync(mock_sync):
+    mock_sync.return_value = '{"complete": true}'
+    document_manage(action='sync', dataset_id='ds1', file_path='/data/docs', parse=False)
+    mock_sync.assert_called_with('ds1', '/data/docs', False)
+
+@patch('src.apps.rag_flow_mcp.tools.base_tools.rewrite_queries')
+@patch('src.apps.rag_flow_mcp.tools.base_tools.rewrite_query')
+def test_rewrite_query_batch_mode(mock_single, mock_batch):
+    mock_batch.return_value = '["a", "b"]'
+    result = rewrite_query(queries=['qa', 'qb'], context='ctx')
+    mock_batch.assert_called_with(['qa', 'qb'], 'ctx')
+    mock_single.assert_not_called()
+    assert json.loads(result) == ["a", "b"]
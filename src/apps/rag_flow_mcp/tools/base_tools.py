@@ -1,22 +1,42 @@
-from typing import Any, Dict, List
+from typing import Any, Awaitable, Callable, Dict, List, Optional
 import logging
 from src.apps.rag_flow_mcp.core.rag_client import RAGClient
+from src.apps.rag_flow_mcp.core.async_rag_client import AsyncRAGClient
 from src.apps.rag_flow_mcp.core.file_service import FileService
 from src.apps.rag_flow_mcp.core.query_rewriter import QueryRewriter
+from src.apps.rag_flow_mcp.core.retrieval_cache import RetrievalCache
+from src.apps.rag_flow_mcp.core.resilience import Resilience
+from src.apps.rag_flow_mcp.core.pagination import PageError
+from src.apps.rag_flow_mcp.core.bulk_uploader import BulkUploader
 from src.apps.rag_flow_mcp.config import load_config
 
 logger = logging.getLogger(__name__)
 
-# Initialize Clients
+# Initialize Clients (the cache and RAGFlow health state are shared with the engines)
 config = load_config()
 rag_client = RAGClient(
     api_key=config["RAGFLOW_API_KEY"],
     base_url=config["RAGFLOW_HOST"],
     chat_id=config["RAGFLOW_CHAT_ID"],
-    timeout=config["RAGFLOW_TIMEOUT"]
+    timeout=config["RAGFLOW_TIMEOUT"],
+    cache=RetrievalCache.shared(config),
+    pool_maxsize=config["RAGFLOW_MAX_PER_HOST"],
+    resilience=Resilience.shared(config)
+)
+async_rag_client = AsyncRAGClient(
+    api_key=config["RAGFLOW_API_KEY"],
+    base_url=config["RAGFLOW_HOST"],
+    chat_id=config["RAGFLOW_CHAT_ID"],
+    timeout=config["RAGFLOW_TIMEOUT"],
+    max_connections=config["RAGFLOW_MAX_CONNECTIONS"],
+    max_keepalive_connections=config["RAGFLOW_MAX_KEEPALIVE"],
+    keepalive_expiry=config["RAGFLOW_KEEPALIVE_EXPIRY"],
+    max_per_host=config["RAGFLOW_MAX_PER_HOST"],
+    cache=RetrievalCache.shared(config),
+    resilience=Resilience.shared(config)
 )
 file_service = FileService()
-query_rewriter = QueryRewriter(rag_client)
+query_rewriter = QueryRewriter.from_config(rag_client, config)
 
 # --- File System Operations ---
 
@@ -106,6 +126,36 @@ def upload_document(dataset_id: str, file_path: str) -> str:
         logger.error(f"Error uploading document: {e}")
         return f"Error: {str(e)}"
 
+def _bulk_uploader(dataset_id: str) -> BulkUploader:
+    return BulkUploader(
+        rag_client, dataset_id,
+        concurrency=config["RAG_UPLOAD_CONCURRENCY"],
+        parse_batch_size=config["RAG_PARSE_BATCH_SIZE"],
+        poll_interval=config["RAG_PARSE_POLL_INTERVAL"]
+    )
+
+def bulk_upload(dataset_id: str, source: str, parse: bool = True) -> str:
+    """
+    Upload every file of a directory (recursive) or glob pattern with parallel streams,
+    then parse them in batches. Re-running resumes from the manifest written next to the files.
+    """
+    try:
+        return json.dumps(_bulk_uploader(dataset_id).run(source, parse=parse), ensure_ascii=False, indent=2)
+    except Exception as e:
+        logger.error(f"Error in bulk upload: {e}")
+        return f"Error: {str(e)}"
+
+def sync_folder(dataset_id: str, folder: str, parse: bool = True) -> str:
+    """
+    Incrementally sync a local folder to a Knowledge Base: upload new / changed files only,
+    delete documents whose source file was removed. Unchanged files are skipped via the hash manifest.
+    """
+    try:
+        return json.dumps(_bulk_uploader(dataset_id).sync(folder, parse=parse), ensure_ascii=False, indent=2)
+    except Exception as e:
+        logger.error(f"Error syncing folder: {e}")
+        return f"Error: {str(e)}"
+
 def delete_document(dataset_id: str, document_id: str) -> str:
     """
     Delete a document from a Knowledge Base.
@@ -163,6 +213,108 @@ def retrieve_chunks(dataset_id: str, query: str, page: int = 1, page_size: int =
         return f"Error: {str(e)}"
 
 import json
+import base64
+
+async def retrieve_chunks_many(dataset_id: str, queries: List[str], concurrency: int = 4, page: int = 1, page_size: int = 30, similarity_threshold: float = 0.2,
+                               on_result: Optional[Callable[[Dict[str, Any]], Awaitable[None]]] = None) -> str:
+    """
+    [Knowledge Retrieval] Retrieve chunks for many queries in one call.
+    on_result(result) is awaited as soon as each query completes, so callers can forward it before the batch ends.
+    Returns a JSON list of {"index", "query", "result"} in completion order.
+    """
+    try:
+        results = []
+        async for result in async_rag_client.retrieve_chunks_many(dataset_id, queries, concurrency, page, page_size, similarity_threshold):
+            results.append(result)
+            if on_result is not None:
+                await on_result(result)
+        return json.dumps(results, ensure_ascii=False)
+    except Exception as e:
+        logger.error(f"Error retrieving chunks in batch: {e}")
+        return f"Error: {str(e)}"
+
+async def ask(query: str, dataset_ids: str = "", on_delta: Optional[Callable[[str], Awaitable[None]]] = None) -> str:
+    """
+    [Knowledge QA] Answer a question via a streaming chat completion.
+    on_delta(delta) is awaited for every token chunk, so callers can forward partial text.
+    Returns the final {"answer", "citation", "score", "reference"} as JSON.
+    """
+    try:
+        result: Dict[str, Any] = {}
+        async for event in async_rag_client.retrieve_and_answer_stream(query, dataset_ids):
+            if event["type"] == "delta":
+                if on_delta is not None:
+                    await on_delta(event["content"])
+            else:
+                result = {k: v for k, v in event.items() if k != "type"}
+        return json.dumps(result, ensure_ascii=False)
+    except Exception as e:
+        logger.error(f"Error answering question: {e}")
+        return f"Error: {str(e)}"
+
+def _encode_cursor(state: Dict[str, Any]) -> str:
+    return base64.urlsafe_b64encode(json.dumps(state).encode("utf-8")).decode("ascii")
+
+def _decode_cursor(cursor: str) -> Dict[str, Any]:
+    return json.loads(base64.urlsafe_b64decode(cursor.encode("ascii")).decode("utf-8"))
+
+async def list_all(kind: str, dataset_id: str = "", document_id: str = "", cursor: str = "", limit: int = 500,
+                   fields: Optional[List[str]] = None, page_size: int = 100,
+                   on_progress: Optional[Callable[[int], Awaitable[None]]] = None) -> str:
+    """
+    [Knowledge Base] List all datasets / documents / chunks in one pass (pages are prefetched).
+    Returns {"items", "count", "next_cursor"}; call again with next_cursor to continue (null = done).
+    """
+    try:
+        state = _decode_cursor(cursor) if cursor else {"kind": kind, "page": 1, "offset": 0, "page_size": page_size}
+    except Exception:
+        return json.dumps({"error": "invalid cursor"}, ensure_ascii=False)
+    if state.get("kind") != kind:
+        return json.dumps({"error": f"cursor belongs to '{state.get('kind')}', not '{kind}'"}, ensure_ascii=False)
+
+    ps, start_page = state["page_size"], state["page"]
+    if kind == "datasets":
+        items_iter = async_rag_client.iter_datasets(ps, fields, start_page)
+    elif kind == "documents":
+        if not dataset_id:
+            return json.dumps({"error": "dataset_id is required for documents"}, ensure_ascii=False)
+        items_iter = async_rag_client.iter_documents(dataset_id, ps, fields=fields, start_page=start_page)
+    elif kind == "chunks":
+        if not dataset_id or not document_id:
+            return json.dumps({"error": "dataset_id and document_id are required for chunks"}, ensure_ascii=False)
+        items_iter = async_rag_client.iter_chunks(dataset_id, document_id, ps, fields, start_page)
+    else:
+        return json.dumps({"error": f"Unknown kind: {kind}"}, ensure_ascii=False)
+
+    items: List[Dict[str, Any]] = []
+    skip = state["offset"]
+    exhausted = True
+    error = None
+    try:
+        async for item in items_iter:
+            if skip:
+                skip -= 1
+                continue
+            if len(items) >= limit:
+                exhausted = False
+                break
+            items.append(item)
+            if on_progress is not None and len(items) % ps == 0:
+                await on_progress(len(items))
+    except PageError as e:
+        logger.error(f"Error listing {kind}: {e}")
+        error, exhausted = str(e), False
+    finally:
+        await items_iter.aclose()
+
+    result: Dict[str, Any] = {"items": items, "count": len(items), "next_cursor": None}
+    if not exhausted:
+        # Resume exactly after the last returned item
+        position = (start_page - 1) * ps + state["offset"] + len(items)
+        result["next_cursor"] = _encode_cursor({"kind": kind, "page": position // ps + 1, "offset": position % ps, "page_size": ps})
+    if error:
+        result["error"] = error
+    return json.dumps(result, ensure_ascii=False)
 
 def rewrite_query(query: str, context: str = "") -> str:
     """
@@ -178,15 +330,37 @@ def rewrite_query(query: str, context: str = "") -> str:
         logger.error(f"Error rewriting query: {e}")
         return f"Error: {str(e)}"
 
-def inspect_config() -> str:
+def rewrite_queries(queries: List[str], context: str = "") -> str:
+    """
+    [Query Rewrite] Optimize a batch of queries with a single LLM call.
+    Args:
+        queries: The original user queries.
+        context: Optional context shared by all queries.
+    Returns a JSON list of rewritten queries in input order.
+    """
+    try:
+        result = query_rewriter.rewrite_many(queries, context, batch_size=config.get("RAG_REWRITE_BATCH_SIZE", 50))
+        return json.dumps(result, ensure_ascii=False)
+    except Exception as e:
+        logger.error(f"Error rewriting queries: {e}")
+        return f"Error: {str(e)}"
+
+def inspect_config(extra_stats: Optional[Dict[str, Any]] = None) -> str:
     """
     [System] Inspect current configuration (sensitive data masked).
+    extra_stats: runtime counters owned by the caller (e.g. engine clients) to include.
     """
     try:
         safe_config = config.copy()
         if "RAGFLOW_API_KEY" in safe_config:
             key = safe_config["RAGFLOW_API_KEY"]
             safe_config["RAGFLOW_API_KEY"] = f"{key[:4]}***{key[-4:]}" if len(key) > 8 else "***"
+        if rag_client.cache is not None:
+            safe_config["RETRIEVAL_CACHE_STATS"] = rag_client.cache.stats()
+        safe_config["RESILIENCE_STATS"] = rag_client.resilience.stats()
+        if rag_client.single_flight is not None:
+            safe_config["SINGLE_FLIGHT_STATS"] = rag_client.single_flight.stats()
+        safe_config.update(extra_stats or {})
         return json.dumps(safe_config, ensure_ascii=False, indent=2)
     except Exception as e:
         logger.error(f"Error inspecting config: {e}")
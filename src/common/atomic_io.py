@@ -0,0 +1,23 @@
+import os
+import tempfile
+from typing import Iterable
+
+def write_lines_atomic(file_path: str, chunks: Iterable[str]) -> None:
+    """
+    Stream chunks into a temp file next to file_path, then atomically replace it.
+    chunks may lazily read file_path itself (e.g. an iter_lines pipeline); on failure
+    the original file is left untouched. The target's permissions are kept (0644 for new files).
+    """
+    directory = os.path.dirname(os.path.abspath(file_path))
+    fd, tmp_path = tempfile.mkstemp(prefix=f".{os.path.basename(file_path)}.", suffix=".tmp", dir=directory)
+    try:
+        with os.fdopen(fd, 'w', encoding='utf-8', newline='') as f:
+            for chunk in chunks:
+                f.write(chunk)
+        # mkstemp creates 0600 files
+        os.chmod(tmp_path, os.stat(file_path).st_mode & 0o7777 if os.path.exists(file_path) else 0o644)
+        os.replace(tmp_path, file_path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
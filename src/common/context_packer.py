@@ -0,0 +1,228 @@
+import re
+import math
+import logging
+import threading
+from collections import Counter
+from typing import Callable, List, Optional, Sequence
+
+logger = logging.getLogger(__name__)
+
+_CJK = re.compile(r"[㐀-鿿豈-﫿]")
+_WORD = re.compile(r"[a-z0-9_]+")
+_HEADING = re.compile(r"^#{1,6}\s")
+_SENTENCE_END = re.compile(r"(?<=[。！？!?；;\n])")
+_GAP_MARKER = "..."
+
+_encoding = None
+_encoding_lock = threading.Lock()
+_encoding_loaded = False
+
+def _tiktoken_encoding():
+    """cl100k_base if tiktoken is installed and its vocabulary can be loaded, else None (loaded once)."""
+    global _encoding, _encoding_loaded
+    if _encoding_loaded:
+        return _encoding
+    with _encoding_lock:
+        if not _encoding_loaded:
+            try:
+                import tiktoken
+                _encoding = tiktoken.get_encoding("cl100k_base")
+            except Exception as e:
+                logger.info(f"tiktoken unavailable ({type(e).__name__}), using estimated token counts")
+                _encoding = None
+            _encoding_loaded = True
+    return _encoding
+
+def estimate_tokens(text: str) -> int:
+    """Rough token count without a tokenizer: ~1 token per CJK character, ~4 characters per token otherwise."""
+    cjk = len(_CJK.findall(text))
+    return cjk + math.ceil((len(text) - cjk) / 4)
+
+def count_tokens(text: str) -> int:
+    if not text:
+        return 0
+    encoding = _tiktoken_encoding()
+    if encoding is None:
+        return estimate_tokens(text)
+    return len(encoding.encode(text, disallowed_special=()))
+
+def tokenize(text: str) -> List[str]:
+    """Lexical terms for BM25: lowercase latin words plus CJK character bigrams."""
+    text = text.lower()
+    terms = _WORD.findall(text)
+    for run in re.findall(r"[㐀-鿿豈-﫿]+", text):
+        terms.extend([run] if len(run) == 1 else [run[i:i + 2] for i in range(len(run) - 1)])
+    return terms
+
+class BM25Index:
+    """
+    Okapi BM25 over a fixed set of documents: term statistics are computed once,
+    so many queries (or per-document updates) do not re-tokenize the collection.
+    """
+
+    def __init__(self, documents: Sequence[str], k1: float = 1.5, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        self._terms: List[Counter] = []
+        self._lengths: List[int] = []
+        self._df: Counter = Counter()
+        for document in documents:
+            self._add(document)
+
+    def _add(self, document: str) -> None:
+        terms = Counter(tokenize(document))
+        self._terms.append(terms)
+        self._lengths.append(sum(terms.values()))
+        self._df.update(terms.keys())
+
+    def __len__(self) -> int:
+        return len(self._terms)
+
+    def update(self, index: int, document: str) -> None:
+        """Replace the text of one document."""
+        self._df.subtract(self._terms[index].keys())
+        terms = Counter(tokenize(document))
+        self._terms[index] = terms
+        self._lengths[index] = sum(terms.values())
+        self._df.update(terms.keys())
+
+    def scores(self, query: str) -> List[float]:
+        """Score of each document for `query` (all zeros for an empty query)."""
+        query_terms = set(tokenize(query))
+        n = len(self._terms)
+        if not query_terms or not n:
+            return [0.0] * n
+        avg_len = (sum(self._lengths) / n) or 1.0
+        idf = {term: math.log(1 + (n - self._df[term] + 0.5) / (self._df[term] + 0.5)) for term in query_terms}
+        k1, b = self.k1, self.b
+        scores = []
+        for terms, length in zip(self._terms, self._lengths):
+            score = 0.0
+            for term in query_terms:
+                tf = terms.get(term, 0)
+                if tf:
+                    score += idf[term] * tf * (k1 + 1) / (tf + k1 * (1 - b + b * length / avg_len))
+            scores.append(score)
+        return scores
+
+def bm25_scores(query: str, documents: Sequence[str], k1: float = 1.5, b: float = 0.75) -> List[float]:
+    """Okapi BM25 score of each document for `query` (all zeros for an empty query)."""
+    if not tokenize(query) or not documents:
+        return [0.0] * len(documents)
+    return BM25Index(documents, k1, b).scores(query)
+
+class ContextPacker:
+    """
+    上下文打包器 (Context Packer)
+
+    按 token 计数（安装了 tiktoken 时使用 cl100k_base，否则估算），
+    把候选片段按相关度 (BM25 或调用方给出的分数) 排序，在 token 预算内选出最好的片段，
+    再按原文顺序拼接。用于替代各处按字符数截断 prompt 的做法，保证不超出预算。
+    """
+
+    def __init__(self, budget: int = 3000, counter: Optional[Callable[[str], int]] = None):
+        self.budget = budget
+        self.count = counter or count_tokens
+
+    def truncate(self, text: str, budget: Optional[int] = None) -> str:
+        """Longest prefix of `text` that fits in `budget` tokens (cut at a line / sentence end when possible)."""
+        budget = self.budget if budget is None else budget
+        if self.count(text) <= budget:
+            return text
+        # Binary search on characters; token counts are monotonic in the prefix length
+        lo, hi = 0, len(text)
+        while lo < hi:
+            mid = (lo + hi + 1) // 2
+            if self.count(text[:mid]) <= budget:
+                lo = mid
+            else:
+                hi = mid - 1
+        prefix = text[:lo]
+        cut = max(prefix.rfind("\n"), max((prefix.rfind(p) for p in "。！？.!?"), default=-1))
+        return prefix[:cut + 1] if cut > lo // 2 else prefix
+
+    def split(self, text: str, max_tokens: Optional[int] = None) -> List[str]:
+        """
+        Split a document into spans: paragraphs (a markdown heading starts a new span),
+        long paragraphs further split at sentence ends so that each span fits max_tokens.
+        """
+        max_tokens = max_tokens or max(50, self.budget // 4)
+        spans: List[str] = []
+        current: List[str] = []
+        for line in text.split("\n"):
+            if (not line.strip() or _HEADING.match(line)) and current:
+                spans.append("\n".join(current))
+                current = []
+            if line.strip():
+                current.append(line)
+        if current:
+            spans.append("\n".join(current))
+
+        result: List[str] = []
+        for span in spans:
+            if self.count(span) <= max_tokens:
+                result.append(span)
+                continue
+            piece = ""
+            for sentence in _SENTENCE_END.split(span):
+                if piece and self.count(piece + sentence) > max_tokens:
+                    result.append(piece)
+                    piece = ""
+                piece += sentence
+            if piece:
+                result.append(piece)
+        return [self.truncate(s, max_tokens) for s in result]
+
+    def select(self, snippets: Sequence[str], query: str = "", budget: Optional[int] = None,
+               scores: Optional[Sequence[float]] = None, separator: str = "\n\n") -> List[int]:
+        """
+        Indices of the snippets to keep, in their original order. Candidates are visited best first
+        (scores, else BM25 against query, else original order) and kept while they fit the budget.
+        """
+        budget = self.budget if budget is None else budget
+        if scores is None:
+            scores = bm25_scores(query, snippets) if query else [0.0] * len(snippets)
+        order = sorted(range(len(snippets)), key=lambda i: (-scores[i], i))
+        sep_tokens = self.count(separator)
+        used, chosen = 0, []
+        for i in order:
+            cost = self.count(snippets[i]) + (sep_tokens if chosen else 0)
+            if used + cost <= budget:
+                chosen.append(i)
+                used += cost
+        return sorted(chosen)
+
+    def pack(self, snippets: Sequence[str], query: str = "", budget: Optional[int] = None,
+             scores: Optional[Sequence[float]] = None, separator: str = "\n\n") -> str:
+        """Join the selected snippets (original order) so the result fits in budget tokens."""
+        chosen = self.select(snippets, query, budget, scores, separator)
+        return separator.join(snippets[i] for i in chosen)
+
+    def pack_text(self, text: str, query: str = "", budget: Optional[int] = None) -> str:
+        """
+        Fit one document into the budget. Without a query the leading spans are kept (a token-aware
+        prefix); with a query the most relevant spans are kept and gaps are marked with "...".
+        """
+        budget = self.budget if budget is None else budget
+        if self.count(text) <= budget:
+            return text
+        spans = self.split(text, max(50, budget // 4))
+        if not query:
+            scores = [float(-i) for i in range(len(spans))]
+        else:
+            scores = bm25_scores(query, spans)
+            # Ties (and query-less spans) fall back to document order, lead spans first
+            scores = [s - i * 1e-6 for i, s in enumerate(scores)]
+        # Charge every span for a possible gap marker, plus a leading and a trailing one
+        gap = f"\n\n{_GAP_MARKER}\n\n"
+        chosen = self.select(spans, budget=budget - 2 * self.count(gap), scores=scores, separator=gap)
+        parts: List[str] = []
+        previous = -1
+        for i in chosen:
+            if i != previous + 1:
+                parts.append(_GAP_MARKER)
+            parts.append(spans[i])
+            previous = i
+        if previous != len(spans) - 1:
+            parts.append(_GAP_MARKER)
+        return "\n\n".join(parts)
@@ -130,10 +130,8 @@ def get_pyinstaller_cmd(app_name: str, root_dir: Path, app_dir: Path, dist_dir:
         cmd.extend([
             "--hidden-import", "src.apps.rag_flow_mcp.core.evaluator",
             "--hidden-import", "markdown_it",
-            "--hidden-import", "pandas",
             "--hidden-import", "requests",
-            "--collect-all", "markdown_it",
-            "--collect-all", "pandas"
+            "--collect-all", "markdown_it"
         ])
 
     cmd.append(str(server_script))
@@ -0,0 +1,12 @@
+import pytest
+from src.apps.rag_flow_mcp.core.resilience import Resilience
+from src.apps.rag_flow_mcp.core.retrieval_cache import RetrievalCache
+
+@pytest.fixture(autouse=True)
+def isolated_shared_state():
+    # Clients share limiter / breaker / cache state per process; keep tests independent
+    Resilience.reset_shared()
+    RetrievalCache.reset_shared()
+    yield
+    Resilience.reset_shared()
+    RetrievalCache.reset_shared()
@@ -0,0 +1,47 @@
+import json
+from src.apps.rag_flow_mcp.core.answer_manifest import AnswerManifest, question_hash
+from src.apps.rag_flow_mcp.core.file_service import FileService
+
+BLOCK = "## 3. 登录方式\n**问题描述**：是否支持 SSO？\n**回答**：\n"
+
+def test_question_hash_ignores_numbering_but_not_content():
+    assert question_hash("ctx", BLOCK) == question_hash("ctx", BLOCK.replace("## 3.", "## 7."))
+    assert question_hash("ctx", BLOCK) != question_hash("other ctx", BLOCK)
+    assert question_hash("ctx", BLOCK) != question_hash("ctx", BLOCK.replace("SSO", "LDAP"))
+
+def test_default_path_is_hidden_sidecar(tmp_path):
+    doc = tmp_path / "04_审核问题记录.md"
+    assert AnswerManifest.default_path(str(doc)) == str(tmp_path / ".04_审核问题记录.md.answers.json")
+
+def test_roundtrip_and_dataset_version(tmp_path):
+    path = str(tmp_path / ".doc.md.answers.json")
+    manifest = AnswerManifest(FileService(), path)
+    key = question_hash("ctx", BLOCK)
+    manifest.record(key, "3", "ds1=v1", {"answer": "支持", "score": 0.9}, True, "Pass")
+    manifest.save()
+
+    reloaded = AnswerManifest(FileService(), path)
+    assert reloaded.lookup(key, "ds1=v1")["answer"]["answer"] == "支持"
+    assert reloaded.lookup(key, "ds1=v2") is None
+    # Unknown version (probe failed): nothing is reused
+    assert reloaded.lookup(key, None) is None
+
+def test_failed_answers_are_not_reused(tmp_path):
+    manifest = AnswerManifest(FileService(), str(tmp_path / "m.json"))
+    manifest.record("a", "1", "v", {"answer": "不确定", "score": 0.1}, False, "低置信度")
+    assert manifest.lookup("a", "v") is None
+    assert manifest.entries["a"]["reason"] == "低置信度"
+
+def test_retain_drops_removed_questions(tmp_path):
+    manifest = AnswerManifest(FileService(), str(tmp_path / "m.json"))
+    manifest.record("a", "1", "v", {}, True, "Pass")
+    manifest.record("b", "2", "v", {}, False, "低置信度")
+    manifest.retain(["b"])
+    assert list(manifest.entries) == ["b"]
+
+def test_unreadable_manifest_is_ignored(tmp_path):
+    path = tmp_path / "m.json"
+    path.write_text("{not json", encoding="utf-8")
+    assert AnswerManifest(FileService(), str(path)).entries == {}
+    path.write_text(json.dumps(["unexpected"]), encoding="utf-8")
+    assert AnswerManifest(FileService(), str(path)).entries == {}
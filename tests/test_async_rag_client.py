@@ -0,0 +1,179 @@
+import asyncio
+import json
+import time
+import httpx
+import pytest
+from src.apps.rag_flow_mcp.core.async_rag_client import AsyncRAGClient
+from src.apps.rag_flow_mcp.core.retrieval_cache import RetrievalCache
+from src.apps.rag_flow_mcp.core import deadline
+
+class TestAsyncRAGClient:
+
+    def _client(self, handler, **kwargs):
+        client = AsyncRAGClient("test_key", "http://mock-ragflow/", chat_id="chat1", **kwargs)
+        client._client = httpx.AsyncClient(transport=httpx.MockTransport(handler), limits=client.limits)
+        return client
+
+    def test_retrieve_and_answer_parses_references(self):
+        def handler(request):
+            body = json.loads(request.content)
+            assert request.url.path == "/api/v1/chats_openai/chat1/chat/completions"
+            assert body["quote"] is True
+            assert body["dataset_ids"] == ["ds1", "ds2"]
+            return httpx.Response(200, json={
+                "choices": [{"message": {"content": "It is X."}}],
+                "reference": [{"doc_name": "spec.md"}]
+            })
+
+        client = self._client(handler)
+        result = asyncio.run(client.retrieve_and_answer("What is X?", "ds1,ds2"))
+
+        assert result == {"answer": "It is X.", "citation": "spec.md", "score": 0.8}
+
+    def test_retrieve_chunks_normalizes_nested_chunks(self):
+        def handler(request):
+            return httpx.Response(200, json={"code": 0, "data": {"chunks": [{"content": "c1"}]}})
+
+        client = self._client(handler)
+        result = asyncio.run(client.retrieve_chunks("ds1", "query"))
+
+        assert result["data"] == [{"content": "c1"}]
+
+    def test_cached_answer_is_versioned_by_chat_datasets(self):
+        calls = {"chat": 0}
+        def handler(request):
+            if request.url.path == "/api/v1/chats":
+                assert request.url.params["id"] == "chat1"
+                return httpx.Response(200, json={"code": 0, "data": [{"id": "chat1", "datasets": [{"id": "ds1"}]}]})
+            if request.url.path == "/api/v1/datasets/ds1/documents":
+                return httpx.Response(200, json={"code": 0, "data": {"docs": [{"id": "d1"}], "total": 1}})
+            calls["chat"] += 1
+            return httpx.Response(200, json={"choices": [{"message": {"content": "A"}}]})
+
+        client = self._client(handler, cache=RetrievalCache())
+        async def run():
+            await client.retrieve_and_answer("What is X?")
+            await client.retrieve_and_answer("What is X?")
+        asyncio.run(run())
+
+        assert calls["chat"] == 1
+        assert client.cache.cached_version("ds1") == "1:d1::"
+
+    def test_call_llm_http_error_returns_empty(self):
+        client = self._client(lambda request: httpx.Response(500, text="boom"))
+        assert asyncio.run(client.call_llm("sys", "user")) == ""
+
+    def test_per_host_limit_bounds_concurrency(self):
+        in_flight = 0
+        peak = 0
+
+        async def handler(request):
+            nonlocal in_flight, peak
+            in_flight += 1
+            peak = max(peak, in_flight)
+            await asyncio.sleep(0.01)
+            in_flight -= 1
+            return httpx.Response(200, json={"choices": [{"message": {"content": "ok"}}]})
+
+        client = self._client(handler, max_per_host=2)
+
+        async def run():
+            return await asyncio.gather(*[client.call_llm("", f"q{i}") for i in range(6)])
+
+        assert asyncio.run(run()) == ["ok"] * 6
+        assert peak == 2
+
+    def test_mock_key_short_circuits(self):
+        client = AsyncRAGClient("mock_key", "http://unused")
+        result = asyncio.run(client.retrieve_and_answer("Q"))
+        assert result["score"] == 0.88
+
+    def test_retrieve_chunks_many_completion_order(self):
+        async def handler(request):
+            query = json.loads(request.content)["question"]
+            await asyncio.sleep(0.05 if query == "slow" else 0)
+            return httpx.Response(200, json={"code": 0, "data": [query]})
+
+        client = self._client(handler)
+
+        async def run():
+            return [r async for r in client.retrieve_chunks_many("ds1", ["slow", "fast"], concurrency=2)]
+
+        results = asyncio.run(run())
+        assert [r["index"] for r in results] == [1, 0]
+        assert results[1]["result"]["data"] == ["slow"]
+
+    def test_stream_chat_completion_yields_deltas(self):
+        def handler(request):
+            assert json.loads(request.content)["stream"] is True
+            lines = [
+                {"choices": [{"delta": {"content": "It "}}]},
+                {"choices": [{"delta": {"content": "is X."}}], "reference": [{"doc_name": "spec.md"}]},
+            ]
+            body = "".join(f"data: {json.dumps(e)}\n\n" for e in lines) + "data: [DONE]\n\n"
+            return httpx.Response(200, text=body, headers={"content-type": "text/event-stream"})
+
+        client = self._client(handler)
+
+        async def run():
+            return [e async for e in client.retrieve_and_answer_stream("What is X?")]
+
+        events = asyncio.run(run())
+        assert [e["content"] for e in events[:-1]] == ["It ", "is X."]
+        assert events[-1]["answer"] == "It is X."
+        assert events[-1]["citation"] == "spec.md"
+
+    def test_hedged_agentic_search_cancels_loser(self):
+        async def handler(request):
+            content = json.loads(request.content)["messages"][0]["content"]
+            if "System Instruction" in content:
+                return httpx.Response(200, json={"choices": [{"message": {"content": "strict"}}], "reference": [{"doc_name": "a.md"}]})
+            await asyncio.sleep(1)
+            return httpx.Response(200, json={"choices": [{"message": {"content": "broad"}}]})
+
+        client = self._client(handler, hedge_mode="parallel")
+        result = asyncio.run(client.agentic_search("", "", "What is X?"))
+
+        assert result["answer"] == "strict"
+        assert client.hedge_stats.snapshot()["wasted"] == 1
+
+    def test_hedged_waits_are_bounded_by_deadline(self):
+        async def handler(request):
+            await asyncio.sleep(0.5)
+            return httpx.Response(200, json={"choices": [{"message": {"content": "late"}}]})
+
+        async def run():
+            with deadline.deadline(0.1):
+                return await client.agentic_search("", "", "What is X?")
+
+        client = self._client(handler, hedge_mode="delayed", hedge_delay=0.02)
+        started = time.monotonic()
+        result = asyncio.run(run())
+
+        assert time.monotonic() - started < 0.4
+        assert result["citation"] == "System Error"
+
+    def test_upload_document_streams_through_documents_guard(self, tmp_path):
+        f = tmp_path / "报告.md"
+        f.write_bytes(b"x" * 200000)
+        sent = {}
+
+        async def handler(request):
+            sent["length"] = request.headers["Content-Length"]
+            sent["chunked"] = "Transfer-Encoding" in request.headers
+            sent["body"] = b"".join([chunk async for chunk in request.stream])
+            sent["boundary"] = request.headers["Content-Type"].split("boundary=")[1]
+            return httpx.Response(200, json={"code": 0, "data": [{"id": "doc1"}]})
+
+        client = self._client(handler)
+        guarded = []
+        guard_async = client.resilience.guard_async
+        client.resilience.guard_async = lambda endpoint: guarded.append(endpoint) or guard_async(endpoint)
+        result = asyncio.run(client.upload_document("ds1", str(f)))
+
+        assert result["data"][0]["id"] == "doc1"
+        assert guarded == ["documents"]
+        assert int(sent["length"]) == len(sent["body"]) and not sent["chunked"]
+        assert sent["body"].startswith(f"--{sent['boundary']}\r\n".encode())
+        assert 'filename="报告.md"'.encode("utf-8") in sent["body"]
+        assert sent["body"].endswith(f"\r\n--{sent['boundary']}--\r\n".encode())
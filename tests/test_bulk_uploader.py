@@ -0,0 +1,181 @@
+import os
+import json
+import pytest
+from unittest.mock import MagicMock
+from src.apps.rag_flow_mcp.core.bulk_uploader import BulkUploader, UploadManifest, collect_files
+from src.apps.rag_flow_mcp.core.rag_client import RAGClient, _MultipartFile
+
+@pytest.fixture
+def docs_dir(tmp_path):
+    (tmp_path / "sub").mkdir()
+    for name in ["a.md", "b.md", "sub/c.md"]:
+        (tmp_path / name).write_text(f"content of {name}", encoding="utf-8")
+    (tmp_path / ".hidden").write_text("skip me")
+    return tmp_path
+
+def make_client(run="DONE", fail_paths=()):
+    client = MagicMock()
+    uploaded = {}
+
+    def upload(dataset_id, path):
+        if any(path.endswith(p) for p in fail_paths):
+            return {"error": "API Error: 500"}
+        doc_id = f"doc{len(uploaded)}"
+        uploaded[doc_id] = path
+        return {"code": 0, "data": [{"id": doc_id, "name": path}]}
+
+    client.upload_document.side_effect = upload
+    client.parse_documents.return_value = {"status": "success", "data": {}}
+    client.delete_documents.return_value = {"status": "success", "data": {}}
+    client.iter_documents.side_effect = lambda *a, **k: iter([{"id": d, "run": run} for d in uploaded])
+    return client
+
+class TestBulkUploader:
+
+    def test_collect_files_skips_hidden(self, docs_dir):
+        root, paths = collect_files(str(docs_dir))
+        assert [p[len(root) + 1:].replace("\\", "/") for p in paths] == ["a.md", "b.md", "sub/c.md"]
+        _, md_paths = collect_files(str(docs_dir / "*.md"))
+        assert len(md_paths) == 2
+
+    def test_uploads_parses_in_batches_and_waits(self, docs_dir):
+        client = make_client()
+        summary = BulkUploader(client, "ds1", concurrency=2, parse_batch_size=2, poll_interval=0).run(str(docs_dir))
+
+        assert summary["uploaded"] == 3
+        assert summary["parsed"] == 3
+        assert summary["complete"] is True
+        assert sorted(len(c.args[1]) for c in client.parse_documents.call_args_list) == [1, 2]
+
+        manifest = json.loads((docs_dir / ".ragflow_upload_ds1.json").read_text(encoding="utf-8"))
+        assert {e["status"] for e in manifest["files"].values()} == {"done"}
+
+    def test_resume_skips_uploaded_files(self, docs_dir):
+        BulkUploader(make_client(), "ds1", poll_interval=0).run(str(docs_dir))
+        (docs_dir / "b.md").write_text("changed content", encoding="utf-8")
+
+        client = make_client()
+        summary = BulkUploader(client, "ds1", poll_interval=0).run(str(docs_dir))
+
+        assert summary["skipped"] == 2
+        assert summary["uploaded"] == 1
+        assert client.upload_document.call_args.args[1].endswith("b.md")
+
+    def test_failures_are_reported_and_retried(self, docs_dir):
+        summary = BulkUploader(make_client(fail_paths=("a.md",)), "ds1", poll_interval=0).run(str(docs_dir))
+        assert summary["complete"] is False
+        assert summary["upload_failed"][0]["path"] == "a.md"
+
+        client = make_client(run="FAIL")
+        summary = BulkUploader(client, "ds1", poll_interval=0).run(str(docs_dir))
+        assert client.upload_document.call_count == 1
+        assert [f["path"] for f in summary["parse_failed"]] == ["a.md"]
+
+    def test_upload_only(self, docs_dir):
+        client = make_client()
+        summary = BulkUploader(client, "ds1").run(str(docs_dir), parse=False)
+        assert summary["uploaded"] == 3
+        client.parse_documents.assert_not_called()
+
+    def test_manifest_for_other_dataset_is_ignored(self, docs_dir):
+        path = str(docs_dir / "m.json")
+        (docs_dir / "m.json").write_text(json.dumps({"dataset_id": "other", "files": {"a.md": {}}}))
+        assert UploadManifest(path, "ds1").files == {}
+
+class FakeDataset:
+    """In-memory RAGFlow dataset shared across sync runs."""
+
+    def __init__(self):
+        self.docs = {}
+        self.uploads = []
+        self.client = MagicMock()
+        self.client.upload_document.side_effect = self.upload
+        self.client.parse_documents.return_value = {"status": "success", "data": {}}
+        self.client.delete_documents.side_effect = self.delete
+        self.client.iter_documents.side_effect = lambda *a, **k: iter([{"id": d, "run": "DONE"} for d in list(self.docs)])
+
+    def upload(self, dataset_id, path):
+        doc_id = f"doc{len(self.uploads)}"
+        self.uploads.append(path)
+        self.docs[doc_id] = path
+        return {"code": 0, "data": [{"id": doc_id}]}
+
+    def delete(self, dataset_id, ids):
+        for doc_id in ids:
+            self.docs.pop(doc_id, None)
+        return {"status": "success", "data": {}}
+
+class TestFolderSync:
+
+    def sync(self, remote, folder):
+        return BulkUploader(remote.client, "ds1", poll_interval=0).sync(str(folder))
+
+    def test_unchanged_folder_uploads_nothing(self, docs_dir):
+        remote = FakeDataset()
+        assert self.sync(remote, docs_dir)["uploaded"] == 3
+        summary = self.sync(remote, docs_dir)
+        assert summary["uploaded"] == 0 and summary["skipped"] == 3
+        assert len(remote.uploads) == 3
+
+    def test_touched_but_identical_file_is_skipped(self, docs_dir):
+        remote = FakeDataset()
+        self.sync(remote, docs_dir)
+        os.utime(docs_dir / "a.md", (1, 1))
+        assert self.sync(remote, docs_dir)["uploaded"] == 0
+
+    def test_changed_added_and_removed_files(self, docs_dir):
+        remote = FakeDataset()
+        self.sync(remote, docs_dir)
+        (docs_dir / "a.md").write_text("new content for a, longer", encoding="utf-8")
+        (docs_dir / "d.md").write_text("brand new", encoding="utf-8")
+        (docs_dir / "sub" / "c.md").unlink()
+
+        summary = self.sync(remote, docs_dir)
+
+        assert summary["uploaded"] == 2
+        assert summary["replaced"] == 1
+        assert summary["deleted"] == 1
+        assert sorted(p.rsplit("/", 1)[-1] for p in remote.docs.values()) == ["a.md", "b.md", "d.md"]
+        assert len(remote.docs) == 3
+
+    def test_document_deleted_remotely_is_uploaded_again(self, docs_dir):
+        remote = FakeDataset()
+        self.sync(remote, docs_dir)
+        remote.docs.pop("doc0")
+        summary = self.sync(remote, docs_dir)
+        assert summary["uploaded"] == 1
+        assert len(remote.docs) == 3
+
+    def test_sync_requires_directory(self, docs_dir):
+        with pytest.raises(NotADirectoryError):
+            BulkUploader(MagicMock(), "ds1").sync(str(docs_dir / "*.md"))
+
+class TestStreamedUpload:
+
+    def test_upload_streams_multipart_body(self, tmp_path):
+        f = tmp_path / "报告.md"
+        f.write_bytes(b"x" * 50000)
+        client = RAGClient("test_key", "http://mock-ragflow")
+        sent = {}
+
+        def fake_post(url, headers=None, data=None, timeout=None):
+            sent["content_type"] = headers["Content-Type"]
+            sent["length"] = len(data)
+            sent["body"] = b"".join(iter(lambda: data.read(8192), b""))
+            return MagicMock(status_code=200, json=lambda: {"code": 0, "data": [{"id": "doc1"}]})
+
+        client.session.post = fake_post
+        assert client.upload_document("ds1", str(f))["data"][0]["id"] == "doc1"
+
+        assert isinstance(sent["length"], int) and sent["length"] == len(sent["body"])
+        boundary = sent["content_type"].split("boundary=")[1]
+        assert sent["body"].startswith(f"--{boundary}\r\n".encode())
+        assert 'filename="报告.md"'.encode("utf-8") in sent["body"]
+        assert sent["body"].endswith(f"\r\n--{boundary}--\r\n".encode())
+
+    def test_multipart_file_is_closed(self, tmp_path):
+        f = tmp_path / "a.txt"
+        f.write_text("abc")
+        with _MultipartFile(str(f)) as body:
+            pass
+        assert body._file.closed
@@ -0,0 +1,66 @@
+import numpy as np
+from unittest.mock import MagicMock
+from src.apps.rag_flow_mcp.core.chunk_ranker import ChunkRanker, shingle_hashes
+from src.apps.rag_flow_mcp.legacy_core.scenario_processor import ScenarioProcessor
+
+BASE = "RAGFlow 的检索接口返回切片内容、相似度以及文档信息，调用方可以据此组装上下文。"
+
+def chunk(text, similarity):
+    return {"content_with_weight": text, "similarity": similarity}
+
+class TestChunkRanker:
+
+    def test_shingles_are_distinct(self):
+        assert len(shingle_hashes("abcabc", 3)) == 3
+        assert shingle_hashes("", 3).size == 0
+
+    def test_near_duplicates_detected(self):
+        ranker = ChunkRanker()
+        dup = ranker.near_duplicates([BASE, BASE + " ", "完全不同的另一段关于权限配置的说明文字。"])
+        assert dup[0, 1] and not dup[0, 2]
+
+    def test_dedup_keeps_most_relevant_copy(self):
+        ranker = ChunkRanker(top_n=10)
+        chunks = [chunk(BASE, 0.6), chunk(BASE + "  ", 0.9), chunk("数据集的分块策略可以按章节或按固定长度设置。", 0.5)]
+        ranked = ranker.rank(chunks)
+        assert len(ranked) == 2
+        assert ranked[0]["similarity"] == 0.9
+
+    def test_mmr_prefers_diverse_chunk(self):
+        ranker = ChunkRanker(top_n=2, mmr_lambda=0.5, dedup_threshold=1.01)
+        a = "用户权限通过角色进行管理，管理员可以为角色分配菜单权限。"
+        chunks = [
+            chunk(a, 0.9),
+            chunk(a.replace("菜单", "按钮"), 0.85),
+            chunk("报表导出支持 Excel 和 PDF 两种格式。", 0.6),
+        ]
+        ranked = ranker.rank(chunks)
+        assert [c["similarity"] for c in ranked] == [0.9, 0.6]
+
+    def test_pure_relevance_order_with_lambda_one(self):
+        ranker = ChunkRanker(top_n=3, mmr_lambda=1.0)
+        chunks = [chunk(f"第{i}段：" + "x" * i, s) for i, s in enumerate([0.2, 0.9, 0.5])]
+        assert [c["similarity"] for c in ranker.rank(chunks)] == [0.9, 0.5, 0.2]
+
+    def test_lexical_vectors_normalised(self):
+        vectors = ChunkRanker().lexical_vectors([BASE, ""])
+        assert np.isclose(np.linalg.norm(vectors[0]), 1.0)
+        assert not vectors[1].any()
+
+    def test_from_config_disabled(self):
+        assert ChunkRanker.from_config({"RAG_MMR_ENABLED": False}) is None
+        assert ChunkRanker.from_config({"RAG_MMR_TOP_N": 3}).top_n == 3
+
+class TestScenarioProcessorRanking:
+
+    def test_synthesis_prompt_uses_ranked_chunks(self):
+        client = MagicMock()
+        client.call_llm.return_value = "答案"
+        client.retrieve_chunks.return_value = {"status": "success", "data": [chunk(BASE, 0.9), chunk(BASE, 0.8)]}
+        processor = ScenarioProcessor(client, ChunkRanker())
+
+        result = processor.retrieve_rag_suggestion("问题", dataset_id="ds1")
+
+        user_prompt = client.call_llm.call_args_list[-1].args[1]
+        assert user_prompt.count("Fragment") == 1
+        assert result["confidence"] == 0.9
@@ -0,0 +1,114 @@
+import pandas as pd
+from unittest.mock import MagicMock, patch
+from src.common.context_packer import ContextPacker, bm25_scores, estimate_tokens, tokenize
+from src.apps.rag_flow_mcp.core.doc_processor import DocumentProcessor
+from src.apps.rag_flow_mcp.legacy_core.scenario_processor import ScenarioProcessor
+
+DOC = """# 方案
+
+## 登录
+用户通过账号密码登录，连续失败五次后锁定账户。
+
+## 超时
+会话超时时间为 30 分钟，超时后需要重新登录。
+
+## 导出
+报表支持导出为 Excel 和 PDF 格式。
+"""
+
+def packer(budget):
+    # Deterministic counts, independent of whether tiktoken can load its vocabulary
+    return ContextPacker(budget=budget, counter=estimate_tokens)
+
+class TestContextPacker:
+
+    def test_tokenize_mixes_words_and_cjk_bigrams(self):
+        assert tokenize("Excel 导出报表") == ["excel", "导出", "出报", "报表"]
+
+    def test_bm25_ranks_matching_span_first(self):
+        scores = bm25_scores("会话超时", ["用户登录锁定", "会话超时时间为 30 分钟", "导出 Excel"])
+        assert scores.index(max(scores)) == 1
+        assert bm25_scores("", ["a", "b"]) == [0.0, 0.0]
+
+    def test_short_text_is_untouched(self):
+        assert packer(1000).pack_text(DOC) == DOC
+
+    def test_pack_text_keeps_relevant_section_within_budget(self):
+        p = packer(40)
+        packed = p.pack_text(DOC, query="会话超时多久")
+        assert "30 分钟" in packed
+        assert "Excel" not in packed
+        assert "..." in packed
+        assert p.count(packed) <= 40
+
+    def test_pack_text_without_query_keeps_lead(self):
+        p = packer(30)
+        packed = p.pack_text(DOC)
+        assert packed.startswith("# 方案")
+        assert p.count(packed) <= 30
+
+    def test_truncate_fits_budget(self):
+        p = packer(10)
+        text = "第一句话很短。第二句话稍微长一点点。第三句话。"
+        cut = p.truncate(text)
+        assert p.count(cut) <= 10 and text.startswith(cut)
+
+    def test_select_respects_scores_and_budget(self):
+        p = packer(10)
+        kept = p.select(["a" * 20, "b" * 20, "c" * 20], scores=[0.1, 0.9, 0.5], separator="")
+        assert kept == [1, 2]
+
+class TestContextPackerCallers:
+
+    def test_global_context_summary_fits_budget(self, tmp_path):
+        align = tmp_path / "01_Align"
+        align.mkdir()
+        (align / "ALIGNMENT.md").write_text(DOC * 20, encoding="utf-8")
+        processor = DocumentProcessor(packer(60))
+        context = processor.extract_global_context(str(tmp_path), budget=60)
+        assert context.startswith("--- From ALIGNMENT.md ---")
+        assert estimate_tokens(context) <= 60
+
+    def test_global_context_with_many_docs_stays_within_budget(self, tmp_path):
+        align = tmp_path / "01_Align"
+        align.mkdir()
+        for i in range(30):
+            (align / f"{i:02d}_ALIGNMENT.md").write_text(DOC * 5, encoding="utf-8")
+        processor = DocumentProcessor(packer(300))
+        context = processor.extract_global_context(str(tmp_path), budget=300)
+        assert context.startswith("--- From 00_ALIGNMENT.md ---")
+        assert "--- From 29_ALIGNMENT.md ---" not in context
+        assert estimate_tokens(context) <= 300
+        assert all(summary.strip() for summary in context.split("---")[2::2])
+
+    def test_synthesis_prompt_fits_budget(self):
+        client = MagicMock()
+        client.call_llm.return_value = "答案"
+        chunks = [{"content_with_weight": f"第{i}段" + "内容" * 30, "similarity": 0.9 - i * 0.1} for i in range(5)]
+        client.retrieve_chunks.return_value = {"status": "success", "data": chunks}
+        processor = ScenarioProcessor(client, context_packer=packer(150))
+
+        processor.retrieve_rag_suggestion("问题", dataset_id="ds1")
+
+        user_prompt = client.call_llm.call_args_list[-1].args[1]
+        assert user_prompt.count("Fragment") == 2
+        assert "Fragment 1: 第0段" in user_prompt
+
+    def test_eval_answer_context_splits_large_paragraphs(self, tmp_path, monkeypatch):
+        from src.apps.rag_eval_flow import logic
+        monkeypatch.setattr(logic, "_context_packer", packer(logic.GENERATION_CONTEXT_TOKENS))
+        # Six paragraphs, each larger than the whole answer budget
+        topics = ["登录锁定", "会话超时", "报表导出", "权限审批", "日志审计", "数据备份"]
+        kb = tmp_path / "kb.md"
+        kb.write_text("\n\n".join(f"{t}规则说明。" * 700 for t in topics), encoding="utf-8")
+        assert all(estimate_tokens(p) > logic.ANSWER_CONTEXT_TOKENS for p in kb.read_text(encoding="utf-8").split("\n\n"))
+        dataset = tmp_path / "qa.csv"
+        pd.DataFrame({"question": ["会话超时是多久？"]}).to_csv(dataset, index=False)
+
+        with patch.object(logic, "_call_llm", return_value="30 分钟") as llm:
+            logic.run_rag_simulation(str(dataset), str(kb), str(tmp_path / "out.csv"))
+
+        prompt = llm.call_args.args[0]
+        question_context = prompt.split("参考资料:")[1].split("问题:")[0].strip()
+        assert "会话超时规则说明" in question_context
+        assert estimate_tokens(question_context) <= logic.ANSWER_CONTEXT_TOKENS
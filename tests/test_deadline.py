@@ -0,0 +1,71 @@
+import time
+import pytest
+from concurrent.futures import ThreadPoolExecutor
+from unittest.mock import MagicMock
+from src.apps.rag_flow_mcp.core import deadline
+from src.apps.rag_flow_mcp.core.rag_client import RAGClient
+from src.apps.rag_flow_mcp.core.resilience import Resilience
+
+def _response(status_code, payload):
+    resp = MagicMock()
+    resp.status_code = status_code
+    resp.json.return_value = payload
+    resp.text = str(payload)
+    return resp
+
+class TestDeadline:
+
+    def test_unbounded_by_default(self):
+        assert deadline.remaining() is None
+        assert deadline.timeout_for(120) == 120
+        assert not deadline.expired()
+
+    def test_timeout_is_clamped_to_remaining_budget(self):
+        with deadline.deadline(5):
+            assert deadline.timeout_for(120) <= 5
+            assert deadline.timeout_for(1) == 1
+        assert deadline.remaining() is None
+
+    def test_nested_deadline_cannot_extend_outer(self):
+        with deadline.deadline(1):
+            with deadline.deadline(100):
+                assert deadline.remaining() <= 1
+
+    def test_expired_budget_raises(self):
+        with deadline.deadline(0.01):
+            time.sleep(0.02)
+            assert deadline.expired()
+            with pytest.raises(deadline.DeadlineExceeded):
+                deadline.timeout_for(120)
+
+    def test_wrap_carries_deadline_into_threads(self):
+        with deadline.deadline(5):
+            with ThreadPoolExecutor(max_workers=2) as executor:
+                plain = executor.submit(deadline.remaining).result()
+                wrapped = [f.result() for f in [executor.submit(deadline.wrap(deadline.remaining)) for _ in range(2)]]
+        assert plain is None
+        assert all(w is not None and w <= 5 for w in wrapped)
+
+class TestRAGClientDeadline:
+
+    @pytest.fixture
+    def client(self):
+        client = RAGClient("test_key", "http://mock-ragflow", chat_id="chat1", timeout=120,
+                           resilience=Resilience(failure_threshold=1))
+        client.session = MagicMock()
+        client.session.post.return_value = _response(200, {"choices": [{"message": {"content": "low"}}]})
+        return client
+
+    def test_request_gets_remaining_time(self, client):
+        with deadline.deadline(3):
+            client.retrieve_and_answer("Q")
+        assert client.session.post.call_args.kwargs["timeout"] <= 3
+
+    def test_spent_budget_skips_request_and_fallback(self, client):
+        with deadline.deadline(0.01):
+            time.sleep(0.02)
+            result = client.agentic_search("", "", "What is X?")
+        assert result["citation"] == "System Error"
+        assert client.session.post.call_count == 0
+        # Running out of budget is not counted against RAGFlow's health
+        assert client.resilience.breaker("chat").state == "closed"
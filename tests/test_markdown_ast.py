@@ -1,4 +1,5 @@
 import pytest
+from unittest.mock import patch
 from src.apps.rag_flow_mcp.core.markdown_ast import MarkdownASTManager
 
 class TestMarkdownASTManager:
@@ -97,3 +98,100 @@ New Content
 """
         result = self.manager.replace_section(content, "Deep Header", new_content)
         assert result == expected
+
+class TestParsedDocument:
+    def setup_method(self):
+        self.manager = MarkdownASTManager()
+        self.content = """# Root
+## Section 10
+| A | B |
+|---|---|
+| 1 | 2 |
+## Section 1
+Body
+### Auth & SSO
+Nested
+# Appendix
+"""
+
+    def test_heading_tree_and_offsets(self):
+        doc = self.manager.document(self.content)
+        root, s10, s1, auth, appendix = doc.headings
+        assert (root["start"], root["end"]) == (0, 9)
+        assert (s1["start"], s1["end"], s1["header_end"]) == (5, 9, 6)
+        assert root["children"] == [s10["index"], s1["index"]]
+        assert auth["parent"] == s1["index"] and appendix["parent"] is None
+        assert doc.offset(1) == len("# Root\n")
+        assert doc.tables_in(s10["start"], s10["end"]) == [(2, 5)]
+        assert doc.tables_in(s1["start"], s1["end"]) == []
+
+    def test_lookup_prefers_exact_then_slug_then_substring(self):
+        doc = self.manager.document(self.content)
+        # Substring matching alone would hit "Section 10" first
+        assert doc.section_range("Section 1") == (5, 9)
+        assert doc.find_heading("auth--sso")["text"] == "Auth & SSO"
+        assert doc.find_heading("Append")["text"] == "Appendix"
+        assert doc.find_heading("Missing") is None
+
+    def test_parse_is_cached_by_content(self):
+        with patch.object(self.manager.md, "parse", wraps=self.manager.md.parse) as parse:
+            self.manager.document(self.content)
+            self.manager.replace_section(self.content, "Section 1", "New")
+            self.manager.update_table_cell(self.content, "Section 10", 0, 0, "X")
+            assert parse.call_count == 1
+            self.manager.document(self.content + "more\n")
+            assert parse.call_count == 2
+
+class TestDocumentEdit:
+    def setup_method(self):
+        self.manager = MarkdownASTManager()
+        self.content = """# Root
+## A
+Old A
+## B
+| K | V |
+|---|---|
+| x | 1 |
+| y | 2 |
+## C
+Old C
+"""
+
+    def test_batch_matches_sequential_edits(self):
+        with patch.object(self.manager.md, "parse", wraps=self.manager.md.parse) as parse:
+            transaction = self.manager.edit(self.content)
+            assert transaction.replace_section("C", "New C")
+            assert transaction.update_table_cell("B", 1, 1, "20")
+            assert transaction.insert_after_section("A", "Note A")
+            assert transaction.replace_section("A", "New A")
+            result = transaction.apply()
+            assert parse.call_count == 1
+
+        sequential = self.manager.replace_section(self.content, "C", "New C")
+        sequential = self.manager.update_table_cell(sequential, "B", 1, 1, "20")
+        sequential = self.manager.insert_after_section(sequential, "A", "Note A")
+        sequential = self.manager.replace_section(sequential, "A", "New A")
+        assert result == sequential
+
+    def test_repeated_targets_merge(self):
+        transaction = self.manager.edit(self.content)
+        transaction.replace_section("A", "First")
+        transaction.replace_section("A", "Second")
+        transaction.update_table_cell("B", 0, 1, "10")
+        transaction.update_table_cell("B", 1, 1, "20")
+        assert len(transaction) == 2
+        result = transaction.apply()
+        assert "Second" in result and "First" not in result
+        assert "10" in result and "20" in result
+
+    def test_replace_supersedes_edits_inside_and_rejects_later_ones(self):
+        transaction = self.manager.edit(self.content)
+        transaction.update_table_cell("B", 0, 1, "10")
+        transaction.insert_after_section("A", "Note A")
+        transaction.replace_section("Root", "Everything")
+        assert len(transaction) == 1
+        assert transaction.apply() == "# Root\nEverything\n"
+        with pytest.raises(ValueError):
+            transaction.update_table_cell("B", 0, 1, "10")
+        # Missing targets are reported, not raised
+        assert transaction.replace_section("Ghost", "Boo") is False
@@ -45,3 +45,22 @@ No table here.
 """
         new_content = self.manager.update_table_cell(content, "Section A", 0, 0, "X")
         assert new_content == content
+
+    def test_bulk_table_edits_rewrite_only_that_table(self):
+        content = """# Section A
+| Key | Value |
+|-----|-------|
+| a   | 1     |
+| b   | 2     |
+
+| Other | Table |
+|-------|-------|
+| x     | y     |
+"""
+        transaction = self.manager.edit(content)
+        table = transaction.table("Section A")
+        table.set_cells({(0, "Value"): "10", (1, "Value"): "20"})
+        table.add_row(["c", "3"])
+        result = transaction.apply()
+        assert result == content.replace("| 1     |", "| 10    |").replace("| 2     |\n", "| 20    |\n| c   | 3     |\n")
+        assert transaction.table("Section A", table_index=5) is None
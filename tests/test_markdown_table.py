@@ -0,0 +1,66 @@
+import pytest
+from src.apps.rag_flow_mcp.core.markdown_table import MarkdownTable, display_width
+
+ALIGNED = """| Name  | Score | Note   |
+|:------|------:|:------:|
+| alice |     9 |   ok   |
+| bob   |    12 |  复核  |
+"""
+
+LOOSE = """| A | B |
+| --- | --- |
+| 1 | 2 |
+| 3 | 4 |
+"""
+
+class TestMarkdownTable:
+    def test_parse_cells_and_alignment(self):
+        table = MarkdownTable.parse(ALIGNED)
+        assert table.header == ["Name", "Score", "Note"]
+        assert table.aligns == ["left", "right", "center"]
+        assert table.rows == [["alice", "9", "ok"], ["bob", "12", "复核"]]
+        assert table.get(1, "Score") == "12"
+        assert table.render() == ALIGNED
+
+    def test_set_keeps_widths_and_alignment(self):
+        table = MarkdownTable.parse(ALIGNED)
+        table.set_cells({(0, 1): "10", (1, "Note"): "好"})
+        assert table.render() == ALIGNED.replace("|     9 |", "|    10 |").replace("|  复核  |", "|   好   |")
+
+    def test_wider_value_widens_aligned_column(self):
+        table = MarkdownTable.parse(ALIGNED)
+        table.set(0, 0, "alexandra")
+        lines = table.render().splitlines()
+        assert lines[0] == "| Name      | Score | Note   |"
+        assert lines[1] == "|:----------|------:|:------:|"
+        assert lines[2] == "| alexandra |     9 |   ok   |"
+        assert len({display_width(l) for l in lines}) == 1
+
+    def test_loose_table_only_rewrites_changed_rows(self):
+        table = MarkdownTable.parse(LOOSE)
+        table.set(1, 1, "x|y")
+        assert table.render() == LOOSE.replace("| 3 | 4 |", "| 3 | x\\|y |")
+        assert table.get(1, 1) == "x\\|y"
+
+    def test_rows_add_delete_sort(self):
+        table = MarkdownTable.parse(ALIGNED)
+        table.add_row({"Name": "carol", "Score": "3"}, index=0)
+        assert table.delete_row(2) == ["bob", "12", "复核"]
+        table.sort("Score", key=int, reverse=True)
+        assert [r[0] for r in table.rows] == ["alice", "carol"]
+        assert table.render().splitlines()[2:] == ["| alice |     9 |   ok   |", "| carol |     3 |        |"]
+
+    def test_bounds_and_invalid_tables(self):
+        table = MarkdownTable.parse(LOOSE)
+        with pytest.raises(IndexError):
+            table.set(5, 0, "x")
+        with pytest.raises(KeyError):
+            table.get(0, "Missing")
+        with pytest.raises(ValueError):
+            MarkdownTable.parse("| A |\n| B |\n")
+
+    def test_unchanged_table_is_not_modified(self):
+        table = MarkdownTable.parse(LOOSE.replace("\n", "\r\n"))
+        table.set(0, 0, "1")
+        assert not table.changed
+        assert table.render() == LOOSE.replace("\n", "\r\n")
@@ -0,0 +1,77 @@
+import asyncio
+import threading
+import httpx
+import pytest
+from unittest.mock import MagicMock
+from src.apps.rag_flow_mcp.core.rag_client import RAGClient
+from src.apps.rag_flow_mcp.core.async_rag_client import AsyncRAGClient
+from src.apps.rag_flow_mcp.core.pagination import PageError, iter_pages, page_items
+
+DOCS = [{"id": f"d{i}", "name": f"doc{i}.md", "content": "x" * 100} for i in range(5)]
+
+def _docs_page(page, page_size):
+    start = (page - 1) * page_size
+    return {"code": 0, "data": {"docs": DOCS[start:start + page_size], "total": len(DOCS)}}
+
+class TestIterPages:
+
+    def test_walks_all_pages_with_projection(self):
+        items = list(iter_pages(_docs_page, "docs", page_size=2, fields=["id"]))
+        assert items == [{"id": f"d{i}"} for i in range(5)]
+
+    def test_prefetches_next_page_while_consuming(self):
+        requested = []
+        second_page_requested = threading.Event()
+
+        def fetch(page, page_size):
+            requested.append(page)
+            if page == 2:
+                second_page_requested.set()
+            return _docs_page(page, page_size)
+
+        it = iter_pages(fetch, "docs", page_size=2)
+        next(it)
+        # Page 2 is requested before the consumer gets past page 1
+        assert second_page_requested.wait(1)
+
+    def test_stops_early_without_fetching_everything(self):
+        fetch = MagicMock(side_effect=_docs_page)
+        it = iter_pages(fetch, "docs", page_size=2, prefetch=False)
+        next(it)
+        it.close()
+        assert fetch.call_count == 1
+
+    def test_error_page_raises(self):
+        with pytest.raises(PageError):
+            list(iter_pages(lambda p, ps: {"error": "API Error: 500"}, "docs"))
+
+    def test_page_items_shapes(self):
+        assert page_items({"data": [{"id": 1}]}, "datasets") == ([{"id": 1}], None)
+        assert page_items({"status": "success", "data": {"chunks": [{"id": 1}], "total": 9}}, "chunks") == ([{"id": 1}], 9)
+
+class TestClientIterators:
+
+    def test_iter_documents(self):
+        client = RAGClient("test_key", "http://mock-ragflow")
+        client.list_documents = MagicMock(side_effect=lambda ds, p, ps, kw="": _docs_page(p, ps))
+        names = [d["name"] for d in client.iter_documents("ds1", page_size=2, fields=["name"])]
+        assert names == [f"doc{i}.md" for i in range(5)]
+        assert client.list_documents.call_count == 3
+
+    def test_async_iter_chunks_sends_page_params(self):
+        seen = []
+
+        def handler(request):
+            page = int(request.url.params["page"])
+            seen.append(page)
+            chunks = [{"id": f"c{page}-{i}", "vector": [0.1] * 8} for i in range(2 if page == 1 else 1)]
+            return httpx.Response(200, json={"code": 0, "data": {"chunks": chunks, "total": 3}})
+
+        client = AsyncRAGClient("test_key", "http://mock-ragflow")
+        client._client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+
+        async def run():
+            return [c async for c in client.iter_chunks("ds1", "doc1", page_size=2, fields=["id"])]
+
+        assert asyncio.run(run()) == [{"id": "c1-0"}, {"id": "c1-1"}, {"id": "c2-0"}]
+        assert seen == [1, 2]
@@ -0,0 +1,76 @@
+import time
+import threading
+import pytest
+from src.apps.rag_flow_mcp.core import deadline
+from src.apps.rag_flow_mcp.core.pipeline import Pipeline, StageFailure
+
+class TestPipeline:
+
+    def test_results_in_input_order(self):
+        # Later items finish first; output order must still follow the input
+        pipeline = Pipeline([("slow_first", lambda x: time.sleep(0.02 * (5 - x)) or x * 10, 5)])
+        assert pipeline.run(range(5)) == [0, 10, 20, 30, 40]
+
+    def test_stages_overlap(self):
+        events = []
+        lock = threading.Lock()
+
+        def stage(name):
+            def fn(x):
+                with lock:
+                    events.append((name, x, "start"))
+                time.sleep(0.05)
+                with lock:
+                    events.append((name, x, "end"))
+                return x
+            return fn
+
+        Pipeline([("a", stage("a"), 1), ("b", stage("b"), 1)]).run(range(2))
+        # a(1) starts before b(0) ends
+        assert events.index(("a", 1, "start")) < events.index(("b", 0, "end"))
+
+    def test_per_stage_concurrency_limit(self):
+        state = {"active": 0, "peak": 0}
+        lock = threading.Lock()
+
+        def fn(x):
+            with lock:
+                state["active"] += 1
+                state["peak"] = max(state["peak"], state["active"])
+            time.sleep(0.02)
+            with lock:
+                state["active"] -= 1
+            return x
+
+        Pipeline([("limited", fn, 2)], queue_size=1).run(range(8))
+        assert state["peak"] == 2
+
+    def test_failure_is_isolated(self):
+        def boom(x):
+            if x == 1:
+                raise ValueError("bad item")
+            return x
+
+        results = Pipeline([("check", boom, 2), ("double", lambda x: x * 2, 1)]).run(range(3))
+        assert results[0] == 0 and results[2] == 4
+        assert isinstance(results[1], StageFailure) and results[1].stage == "check"
+
+    def test_stops_feeding_after_deadline(self):
+        with deadline.deadline(0.05):
+            results = Pipeline([("slow", lambda x: time.sleep(0.03) or x, 1)], queue_size=1).run(range(20))
+        assert 0 < len(results) < 20
+        assert results == list(range(len(results)))
+
+    def test_stages_see_caller_deadline(self):
+        with deadline.deadline(30):
+            results = Pipeline([("budget", lambda _: deadline.remaining(), 2)]).run(range(2))
+        assert all(r is not None and r <= 30 for r in results)
+
+    def test_early_close(self):
+        gen = Pipeline([("id", lambda x: x, 2)], queue_size=1).process(range(1000))
+        assert next(gen) == (0, 0)
+        gen.close()
+
+    def test_requires_stage(self):
+        with pytest.raises(ValueError):
+            Pipeline([])
@@ -1,6 +1,7 @@
+import json
 import pytest
 from unittest.mock import MagicMock, patch
-from src.apps.rag_flow_mcp.core.query_rewriter import QueryRewriter
+from src.apps.rag_flow_mcp.core.query_rewriter import QueryRewriter, RewriteCache, clean_query
 from src.apps.rag_flow_mcp.core.rag_client import RAGClient
 
 class TestQueryRewriter:
@@ -42,3 +43,134 @@ class TestQueryRewriter:
         
         # Should return original query on error
         assert result == "original query"
+
+    def test_rewrite_many_single_call(self, mock_rag_client):
+        """N queries are rewritten with one LLM call."""
+        queries = [f"question {i}" for i in range(40)]
+        mock_rag_client.call_llm.return_value = json.dumps(
+            [{"id": i, "rewritten": f"q{i}"} for i in range(40)]
+        )
+        rewriter = QueryRewriter(mock_rag_client)
+
+        result = rewriter.rewrite_many(queries, "context")
+
+        assert result == [f"q{i}" for i in range(40)]
+        mock_rag_client.call_llm.assert_called_once()
+        user_prompt = mock_rag_client.call_llm.call_args.args[1]
+        assert "question 39" in user_prompt
+
+    def test_rewrite_many_fenced_partial_response(self, mock_rag_client):
+        """Code fences are tolerated; items missing from the array fall back to rewrite()."""
+        batch = '```json\n[{"id": 0, "rewritten": "first"}, {"id": 2, "rewritten": ""}]\n```'
+        mock_rag_client.call_llm.side_effect = [batch, "second", "third"]
+        rewriter = QueryRewriter(mock_rag_client)
+
+        result = rewriter.rewrite_many(["a", "b", "c"], ["ctx a", "ctx b", "ctx c"])
+
+        assert result == ["first", "second", "third"]
+        assert mock_rag_client.call_llm.call_count == 3
+        # Fallback calls carry the per-item context
+        assert "ctx b" in mock_rag_client.call_llm.call_args_list[1].args[1]
+
+    def test_rewrite_many_invalid_json(self, mock_rag_client):
+        """An unparseable response falls back to one rewrite() per query."""
+        mock_rag_client.call_llm.side_effect = ["not json", "x", "y"]
+        rewriter = QueryRewriter(mock_rag_client)
+
+        assert rewriter.rewrite_many(["a", "b"]) == ["x", "y"]
+
+    def test_rewrite_many_exception_and_no_chat_id(self, mock_rag_client):
+        """LLM failure or missing chat_id returns the original queries."""
+        mock_rag_client.call_llm.side_effect = Exception("API Error")
+        rewriter = QueryRewriter(mock_rag_client)
+        assert rewriter.rewrite_many(["a", "b"]) == ["a", "b"]
+        assert mock_rag_client.call_llm.call_count == 1
+
+        mock_rag_client.chat_id = ""
+        assert rewriter.rewrite_many(["a", "b"]) == ["a", "b"]
+        assert mock_rag_client.call_llm.call_count == 1
+
+    def test_rewrite_many_batches(self, mock_rag_client):
+        """batch_size splits the queries over several calls, ids restart per batch."""
+        mock_rag_client.call_llm.side_effect = [
+            json.dumps([{"id": 0, "rewritten": "A"}, {"id": 1, "rewritten": "B"}]),
+            json.dumps([{"id": 0, "rewritten": "C"}]),
+        ]
+        rewriter = QueryRewriter(mock_rag_client)
+
+        assert rewriter.rewrite_many(["a", "b", "c"], batch_size=2) == ["A", "B", "C"]
+        assert mock_rag_client.call_llm.call_count == 2
+
+class TestTieredRewriter:
+
+    @pytest.fixture
+    def mock_rag_client(self):
+        client = MagicMock(spec=RAGClient)
+        client.chat_id = "test_chat_id"
+        client.call_llm.return_value = "llm rewrite"
+        return client
+
+    def test_clean_query(self):
+        assert clean_query("## 3. 问题：  SSO   登录配置 ") == "SSO 登录配置"
+        assert clean_query("- Question: reset password") == "reset password"
+        assert clean_query("2024 roadmap") == "2024 roadmap"
+
+    def test_fast_path_skips_llm(self, mock_rag_client):
+        rewriter = QueryRewriter(mock_rag_client, fast_path_chars=32)
+
+        assert rewriter.rewrite("1. 问题：SSO 登录配置") == "SSO 登录配置"
+        assert rewriter.rewrite_many(["- 导出报表", "权限模型"]) == ["导出报表", "权限模型"]
+        mock_rag_client.call_llm.assert_not_called()
+        assert rewriter.stats()["fast_path"] == 3
+
+    def test_long_or_context_dependent_queries_use_llm(self, mock_rag_client):
+        rewriter = QueryRewriter(mock_rag_client, fast_path_chars=32)
+
+        assert rewriter.rewrite("这个功能怎么开启", context="产品: CRM") == "llm rewrite"
+        assert rewriter.rewrite("第一行\n第二行") == "llm rewrite"
+        assert rewriter.rewrite("x" * 40) == "llm rewrite"
+        assert mock_rag_client.call_llm.call_count == 3
+        # Without context there is nothing to resolve the reference against
+        assert rewriter.rewrite("这个功能怎么开启") == "这个功能怎么开启"
+
+    def test_cache_memoizes_llm_rewrites(self, mock_rag_client):
+        rewriter = QueryRewriter(mock_rag_client, cache=RewriteCache())
+        long_query = "请问一下我们系统里面的单点登录到底应该如何配置才能生效呢"
+
+        assert rewriter.rewrite(long_query, "ctx") == "llm rewrite"
+        assert rewriter.rewrite("  " + long_query, "ctx") == "llm rewrite"
+        assert mock_rag_client.call_llm.call_count == 1
+        # A different context is a different rewrite
+        rewriter.rewrite(long_query, "other ctx")
+        assert mock_rag_client.call_llm.call_count == 2
+        assert rewriter.stats()["cache_hits"] == 1
+
+    def test_batch_only_sends_uncached_queries(self, mock_rag_client):
+        rewriter = QueryRewriter(mock_rag_client, cache=RewriteCache())
+        mock_rag_client.call_llm.return_value = json.dumps([{"id": 0, "rewritten": "A"}, {"id": 1, "rewritten": "B"}])
+        assert rewriter.rewrite_many(["a", "b"]) == ["A", "B"]
+
+        mock_rag_client.call_llm.return_value = json.dumps([{"id": 0, "rewritten": "C"}])
+        assert rewriter.rewrite_many(["b", "c", "a"]) == ["B", "C", "A"]
+        assert mock_rag_client.call_llm.call_count == 2
+        assert '"query": "c"' in mock_rag_client.call_llm.call_args.args[1]
+        assert '"query": "a"' not in mock_rag_client.call_llm.call_args.args[1]
+
+    def test_disk_cache_survives_restart(self, mock_rag_client, tmp_path):
+        QueryRewriter(mock_rag_client, cache=RewriteCache(cache_dir=str(tmp_path))).rewrite("long query", "ctx")
+
+        fresh = QueryRewriter(mock_rag_client, cache=RewriteCache(cache_dir=str(tmp_path)))
+        assert fresh.rewrite("long query", "ctx") == "llm rewrite"
+        assert mock_rag_client.call_llm.call_count == 1
+
+    def test_prompt_change_invalidates_entries(self, mock_rag_client):
+        cache = RewriteCache()
+        cache.set("q", "", "old")
+        with patch("src.apps.rag_flow_mcp.core.query_rewriter._PROMPT_VERSION", "changed"):
+            assert cache.get("q") is None
+        assert cache.get("q") == "old"
+
+    def test_from_config(self, mock_rag_client):
+        rewriter = QueryRewriter.from_config(mock_rag_client, {"RAG_REWRITE_CACHE_ENABLED": False})
+        assert rewriter.cache is None
+        assert rewriter.fast_path_chars == 32
@@ -0,0 +1,164 @@
+import pytest
+import os
+from unittest.mock import patch
+from src.apps.rag_flow_mcp.core import question_index
+from src.apps.rag_flow_mcp.core.question_index import (
+    index_questions, field_text, splice, inject_answers, extract_questions, iter_injected, iter_questions,
+    QuestionExtractor, AI_FIELD, ANSWER_FIELD
+)
+from src.apps.rag_flow_mcp.core.doc_processor import DocumentProcessor
+from src.apps.rag_flow_mcp.core.file_service import FileService
+
+DOC = """# 待确认问题
+
+## 1. 登录
+**问题描述**：支持 SSO 吗？
+**业务上下文**：企业客户
+**回答**：
+
+## 2. 导出
+**问题描述**：导出格式？
+多行描述
+**回答**：待回答
+"""
+
+def render(ans):
+    return f"\n**AI 参考建议**：\n> {ans['answer']}\n"
+
+def test_index_records_block_and_field_offsets():
+    blocks = index_questions(DOC)
+    assert [(b["id"], b["title"]) for b in blocks] == [("1", "登录"), ("2", "导出")]
+    first, second = blocks
+    assert DOC[first["start"]:first["end"]] == "## 1. 登录\n**问题描述**：支持 SSO 吗？\n**业务上下文**：企业客户\n**回答**：\n"
+    assert DOC[second["start"]:].startswith("## 2. 导出")
+    assert field_text(DOC, first, "业务上下文") == "企业客户"
+    assert field_text(DOC, second, "问题描述") == "导出格式？\n多行描述"
+    assert field_text(DOC, second, ANSWER_FIELD) == "待回答"
+    assert field_text(DOC, second, AI_FIELD) == ""
+    assert DOC[first["fields"][ANSWER_FIELD][0]:].startswith("**回答**")
+
+def test_splice_applies_edits_in_one_rebuild():
+    assert splice("abcdef", [(4, 5, "E"), (0, 0, ">"), (1, 3, "")]) == ">adEf"
+    with pytest.raises(ValueError):
+        splice("abcdef", [(0, 3, "x"), (2, 4, "y")])
+
+def test_inject_inserts_then_replaces_in_place():
+    once = inject_answers(DOC, {"1": {"answer": "支持"}, "2": {"answer": "CSV"}}, render)
+    assert once.count("**AI 参考建议**") == 2
+    assert once.index("> 支持") < once.index("**回答**：\n\n## 2.")
+    # Re-running replaces the AI blocks instead of stacking them, and is stable
+    twice = inject_answers(once, {"1": {"answer": "支持 v2\n**注意**：仅企业版"}}, render)
+    assert twice.count("**AI 参考建议**") == 2
+    assert "> 支持\n" not in twice and "仅企业版" in twice
+    assert inject_answers(twice, {"1": {"answer": "支持 v2\n**注意**：仅企业版"}}, render) == twice
+
+def test_inject_patches_every_duplicate_at_its_own_position():
+    doc = "## 1. A\n**回答**：\n\n## 1. A\n**回答**：\n"
+    result = inject_answers(doc, {"1": {"answer": "x"}}, render)
+    assert result == "## 1. A\n\n**AI 参考建议**：\n> x\n\n**回答**：\n\n## 1. A\n\n**AI 参考建议**：\n> x\n\n**回答**：\n"
+
+def test_document_processor_injection():
+    processor = DocumentProcessor()
+    result = processor.inject_ai_answers(DOC, {"2": {"answer": "CSV", "citation": "spec.md", "score": 0.8}})
+    assert "> 🤖 **RAG自动回复** (置信度: 80%)" in result
+    assert result.index("*来源: spec.md*") < result.index("**回答**：待回答")
+    assert processor.inject_ai_answers(result, {"2": {"answer": "CSV", "citation": "spec.md", "score": 0.8}}) == result
+
+def test_extract_questions_records():
+    doc = inject_answers(DOC, {"1": {"answer": "支持"}}, render)
+    first, second = extract_questions(doc)
+    assert first["id"] == "1" and first["line"] == 3
+    assert first["business_context"] == "企业客户"
+    assert first["ai_block"] == "> 支持"
+    assert "AI 参考建议" in first["full_block"] and "AI 参考建议" not in first["clean_block"]
+    # Only the blank line that separated the AI block from **回答** is left behind
+    assert first["clean_block"].replace("\n\n", "\n") == DOC[DOC.index("## 1."):DOC.index("\n## 2.")]
+    assert second["description"] == "导出格式？\n多行描述"
+    assert second["answer"] == "待回答"
+    assert doc[second["start"]:second["end"]] == second["full_block"]
+
+def test_extract_accepts_short_label_and_ascii_colon():
+    (record,) = extract_questions("## 7. 缓存\n**描述**: 缓存多久？\n**回答**: 一小时\n")
+    assert record["description"] == "缓存多久？"
+    assert record["answer"] == "一小时"
+
+def test_extractor_parses_each_content_once():
+    extractor = QuestionExtractor()
+    with patch.object(question_index, "extract_questions", wraps=extract_questions) as parse:
+        first = extractor.extract(DOC)
+        first[0]["title"] = "mutated"
+        second = extractor.extract(DOC)
+        assert parse.call_count == 1
+    assert second[0]["title"] == "登录"
+
+def test_extractor_load_rereads_only_changed_files(tmp_path):
+    path = tmp_path / "questions.md"
+    path.write_text(DOC, encoding="utf-8")
+    extractor = QuestionExtractor()
+    with patch("builtins.open", wraps=open) as opened:
+        content, records = extractor.load(str(path))
+        extractor.load(str(path))
+        assert opened.call_count == 1
+    assert content == DOC and len(records) == 2
+
+    path.write_text(DOC + "\n## 3. 新问题\n**问题描述**：新增\n", encoding="utf-8")
+    stat = os.stat(path)
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000))
+    _, records = extractor.load(str(path))
+    assert [r["id"] for r in records] == ["1", "2", "3"]
+
+@pytest.mark.parametrize("doc", [DOC, DOC.replace("\n", "\r\n"), DOC.rstrip("\n"), "# 无问题\n正文"])
+def test_streaming_matches_in_memory(doc):
+    answers = {"1": {"answer": "支持"}, "2": {"answer": "CSV"}}
+    lines = doc.splitlines(keepends=True)
+    assert "".join(iter_injected(iter(lines), answers, render)) == inject_answers(doc, answers, render)
+    assert list(iter_questions(iter(lines))) == extract_questions(doc)
+
+def test_extractor_stream_reads_file_lazily(tmp_path):
+    path = tmp_path / "questions.md"
+    path.write_text(DOC, encoding="utf-8")
+    records = QuestionExtractor().stream(str(path))
+    assert next(records)["id"] == "1"
+    assert [r["id"] for r in records] == ["2"]
+
+def test_inject_file_streams_to_temp_and_replaces(tmp_path):
+    path = tmp_path / "questions.md"
+    path.write_bytes(DOC.replace("\n", "\r\n").encode("utf-8"))
+    os.chmod(path, 0o640)
+    processor = DocumentProcessor()
+    processor.inject_ai_answers_file(str(path), {"2": {"answer": "CSV", "score": 0.5}})
+
+    expected = processor.inject_ai_answers(DOC.replace("\n", "\r\n"), {"2": {"answer": "CSV", "score": 0.5}})
+    assert path.read_bytes() == expected.encode("utf-8")
+    assert os.stat(path).st_mode & 0o777 == 0o640
+    assert os.listdir(tmp_path) == ["questions.md"]
+
+def test_write_lines_keeps_original_on_failure(tmp_path):
+    path = tmp_path / "doc.md"
+    path.write_text("original\n", encoding="utf-8")
+
+    def chunks():
+        yield "partial\n"
+        raise RuntimeError("boom")
+
+    with pytest.raises(RuntimeError):
+        FileService().write_lines(str(path), chunks())
+    assert path.read_text(encoding="utf-8") == "original\n"
+    assert os.listdir(tmp_path) == ["doc.md"]
+
+def test_iter_lines_missing_file(tmp_path):
+    with pytest.raises(FileNotFoundError):
+        list(FileService().iter_lines(str(tmp_path / "missing.md")))
+
+def test_legacy_scenario_processor_streams_questions_and_suggestions(tmp_path):
+    from unittest.mock import MagicMock
+    from src.apps.rag_flow_mcp.legacy_core.scenario_processor import ScenarioProcessor
+    path = tmp_path / "scenario.md"
+    path.write_bytes("## Q1?\r\ntext\n## Notes\n```\n## not a header?\n```\n## Q2?".encode("utf-8"))
+    processor = ScenarioProcessor(MagicMock())
+
+    assert [(q["line_index"], q["text"]) for q in processor.extract_questions(str(path))] == [(0, "Q1?"), (6, "Q2?")]
+
+    processor.apply_suggestions(str(path), {"0": "> S1", "6": "> S2"})
+    assert path.read_bytes() == "## Q1?\r\n> S1\ntext\n## Notes\n```\n## not a header?\n```\n## Q2?\n> S2".encode("utf-8")
+    assert os.listdir(tmp_path) == ["scenario.md"]
@@ -0,0 +1,181 @@
+import time
+import json
+import threading
+import pytest
+from unittest.mock import MagicMock
+from concurrent.futures import ThreadPoolExecutor
+from src.apps.rag_flow_mcp.core.rag_client import RAGClient, _strict_query
+from src.apps.rag_flow_mcp.core import deadline
+
+class TestRetrieveChunksMany:
+
+    @pytest.fixture
+    def client(self):
+        return RAGClient("test_key", "http://mock-ragflow")
+
+    def test_yields_in_completion_order(self, client):
+        delays = {"slow": 0.05, "fast": 0.0}
+        client.retrieve_chunks = lambda ds, q, *args: time.sleep(delays[q]) or {"code": 0, "data": [q]}
+
+        results = list(client.retrieve_chunks_many("ds1", ["slow", "fast"], concurrency=2))
+
+        assert [r["query"] for r in results] == ["fast", "slow"]
+        assert [r["index"] for r in results] == [1, 0]
+        assert results[0]["result"] == {"code": 0, "data": ["fast"]}
+
+    def test_bounded_concurrency(self, client):
+        lock = threading.Lock()
+        state = {"in_flight": 0, "peak": 0}
+
+        def fake_retrieve(ds, q, *args):
+            with lock:
+                state["in_flight"] += 1
+                state["peak"] = max(state["peak"], state["in_flight"])
+            time.sleep(0.01)
+            with lock:
+                state["in_flight"] -= 1
+            return {"code": 0, "data": []}
+
+        client.retrieve_chunks = fake_retrieve
+        results = list(client.retrieve_chunks_many("ds1", [f"q{i}" for i in range(8)], concurrency=3))
+
+        assert len(results) == 8
+        assert state["peak"] <= 3
+
+    def test_exceptions_become_error_results(self, client):
+        client.retrieve_chunks = MagicMock(side_effect=RuntimeError("boom"))
+        results = list(client.retrieve_chunks_many("ds1", ["q"]))
+        assert results == [{"index": 0, "query": "q", "result": {"error": "boom"}}]
+
+def _sse(*events):
+    return [f"data: {json.dumps(e)}" for e in events] + ["", "data: [DONE]"]
+
+class TestStreamChatCompletion:
+
+    @pytest.fixture
+    def client(self):
+        client = RAGClient("test_key", "http://mock-ragflow", chat_id="chat1")
+        client.session = MagicMock()
+        return client
+
+    def _stream_response(self, client, status_code, lines):
+        resp = MagicMock()
+        resp.status_code = status_code
+        resp.text = "boom"
+        resp.iter_lines.return_value = iter(lines)
+        client.session.post.return_value.__enter__.return_value = resp
+
+    def test_yields_deltas_then_result_with_reference(self, client):
+        self._stream_response(client, 200, _sse(
+            {"choices": [{"delta": {"content": "It "}}]},
+            {"choices": [{"delta": {"content": "is X."}}]},
+            {"choices": [{"delta": {"content": "", "reference": {"chunks": [{"document_name": "spec.md"}]}}}]}
+        ))
+
+        events = list(client.retrieve_and_answer_stream("What is X?"))
+
+        assert [e["content"] for e in events if e["type"] == "delta"] == ["It ", "is X."]
+        assert events[-1]["type"] == "result"
+        assert events[-1]["answer"] == "It is X."
+        assert events[-1]["citation"] == "spec.md"
+        assert client.session.post.call_args.kwargs["stream"] is True
+        assert client.session.post.call_args.kwargs["json"]["stream"] is True
+
+    def test_http_error_yields_error_result(self, client):
+        self._stream_response(client, 500, [])
+        events = list(client.retrieve_and_answer_stream("Q"))
+        assert len(events) == 1
+        assert events[0]["citation"] == "API Error"
+
+    def test_call_llm_stream_yields_text(self, client):
+        self._stream_response(client, 200, _sse(
+            {"choices": [{"delta": {"content": "a"}}]},
+            {"choices": [{"delta": {"content": "b"}}]}
+        ))
+        assert list(client.call_llm_stream("sys", "user")) == ["a", "b"]
+
+class TestHedgedAgenticSearch:
+
+    def _client(self, answers, delays=None, **kwargs):
+        client = RAGClient("test_key", "http://mock-ragflow", chat_id="chat1", **kwargs)
+        delays = delays or {}
+        calls = []
+
+        def fake_answer(query, dataset_ids=""):
+            calls.append(query)
+            time.sleep(delays.get(query, 0))
+            return dict(answers[query])
+
+        client.retrieve_and_answer = fake_answer
+        return client, calls
+
+    def test_parallel_mode_keeps_better_broad_answer(self):
+        strict = _strict_query("What is X?")
+        client, calls = self._client({
+            strict: {"answer": "weak", "citation": "a.md", "score": 0.3},
+            "What is X?": {"answer": "strong", "citation": "b.md", "score": 0.8},
+        }, hedge_mode="parallel")
+
+        result = client.agentic_search("", "", "What is X?")
+
+        assert result["answer"] == "strong"
+        assert sorted(calls) == sorted([strict, "What is X?"])
+        assert client.hedge_stats.snapshot()["won"] == 1
+
+    def test_confident_strict_answer_ignores_broad(self):
+        strict = _strict_query("What is X?")
+        client, _ = self._client({
+            strict: {"answer": "good", "citation": "a.md", "score": 0.8},
+            "What is X?": {"answer": "other", "citation": "b.md", "score": 0.9},
+        }, hedge_mode="parallel")
+
+        assert client.agentic_search("", "", "What is X?")["answer"] == "good"
+        assert client.hedge_stats.snapshot()["wasted"] == 1
+
+    def test_delayed_mode_hedges_only_slow_strict_queries(self):
+        strict = _strict_query("What is X?")
+        answers = {
+            strict: {"answer": "weak", "citation": "a.md", "score": 0.3},
+            "What is X?": {"answer": "strong", "citation": "b.md", "score": 0.8},
+        }
+        # Fast strict query: no hedge, sequential fallback still applies
+        client, calls = self._client(answers, hedge_mode="delayed", hedge_delay=0.2)
+        assert client.agentic_search("", "", "What is X?")["answer"] == "strong"
+        assert calls == [strict, "What is X?"]
+        assert client.hedge_stats.snapshot()["not_hedged"] == 1
+
+        # Slow strict query: broad query is sent before the strict one returns
+        client, calls = self._client(answers, delays={strict: 0.1}, hedge_mode="delayed", hedge_delay=0.02)
+        assert client.agentic_search("", "", "What is X?")["answer"] == "strong"
+        assert client.hedge_stats.snapshot()["hedged"] == 1
+
+    def test_waits_are_bounded_by_deadline(self):
+        strict = _strict_query("What is X?")
+        answers = {
+            strict: {"answer": "late", "citation": "a.md", "score": 0.3},
+            "What is X?": {"answer": "late too", "citation": "b.md", "score": 0.8},
+        }
+        client, _ = self._client(answers, delays={strict: 0.5, "What is X?": 0.5}, hedge_mode="delayed", hedge_delay=0.02)
+        started = time.monotonic()
+        with deadline.deadline(0.1):
+            result = client.agentic_search("", "", "What is X?")
+        assert time.monotonic() - started < 0.4
+        assert result["citation"] == "System Error"
+
+    def test_queued_hedge_is_cancelled_at_deadline(self):
+        strict = _strict_query("What is X?")
+        client, calls = self._client({strict: {"answer": "A", "citation": "a.md", "score": 0.9}}, hedge_mode="parallel")
+        # Every hedge worker is busy, so the strict query never leaves the queue
+        client._hedge_executor = ThreadPoolExecutor(max_workers=1)
+        blocker = threading.Event()
+        client._hedge_executor.submit(blocker.wait, 2)
+        with deadline.deadline(0.05):
+            result = client.agentic_search("", "", "What is X?")
+        blocker.set()
+        client._hedge_executor.shutdown(wait=True)
+        assert result["citation"] == "System Error"
+        assert calls == []
+
+    def test_invalid_mode_rejected(self):
+        with pytest.raises(ValueError):
+            RAGClient("test_key", "http://mock-ragflow", hedge_mode="sometimes")
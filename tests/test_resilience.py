@@ -0,0 +1,166 @@
+import time
+import asyncio
+import threading
+import pytest
+from unittest.mock import MagicMock
+from src.apps.rag_flow_mcp.core.rag_client import RAGClient
+from src.apps.rag_flow_mcp.core.retrieval_cache import RetrievalCache
+from src.apps.rag_flow_mcp.core.resilience import AIMDLimiter, CircuitBreaker, Resilience, CircuitOpenError
+from src.apps.rag_flow_mcp.core import deadline
+
+def _response(status_code, payload):
+    resp = MagicMock()
+    resp.status_code = status_code
+    resp.json.return_value = payload
+    resp.text = str(payload)
+    return resp
+
+class TestAIMDLimiter:
+
+    def test_multiplicative_decrease_on_overload(self):
+        limiter = AIMDLimiter(initial=8, min_limit=1)
+        assert limiter.acquire()
+        limiter.release(latency=0.1, overloaded=True)
+        assert limiter.limit == 4
+
+    def test_slow_responses_count_as_overload(self):
+        limiter = AIMDLimiter(initial=8, latency_target=1.0)
+        limiter.acquire()
+        limiter.release(latency=5.0, overloaded=False)
+        assert limiter.limit == 4
+
+    def test_additive_increase_and_bounds(self):
+        limiter = AIMDLimiter(initial=2, max_limit=3)
+        for _ in range(20):
+            limiter.acquire()
+            limiter.release(latency=0.1, overloaded=False)
+        assert limiter.limit == 3
+
+        for _ in range(10):
+            limiter.acquire()
+            limiter.release(latency=0.1, overloaded=True)
+        assert limiter.limit == 1
+
+    def test_acquire_blocks_at_limit(self):
+        limiter = AIMDLimiter(initial=1)
+        assert limiter.acquire()
+        assert not limiter.try_acquire()
+        assert not limiter.acquire(timeout=0.01)
+
+    def test_async_waiter_is_woken_by_release_from_another_thread(self):
+        limiter = AIMDLimiter(initial=1, max_limit=1)
+        assert limiter.acquire()
+
+        async def wait():
+            threading.Timer(0.05, limiter.release, args=(0.1, False)).start()
+            started = time.monotonic()
+            acquired = await limiter.acquire_async(timeout=2)
+            return acquired, time.monotonic() - started
+
+        acquired, waited = asyncio.run(wait())
+        assert acquired and waited < 1
+        assert limiter.in_flight == 1
+        assert not asyncio.run(limiter.acquire_async(timeout=0.01))
+        assert limiter._async_waiters == []
+
+class TestCircuitBreaker:
+
+    def test_opens_after_threshold_and_half_opens(self):
+        breaker = CircuitBreaker(failure_threshold=2, reset_timeout=0.05)
+        breaker.record_failure()
+        assert breaker.allow()
+        breaker.record_failure()
+        assert breaker.state == "open"
+        assert not breaker.allow()
+
+        time.sleep(0.06)
+        # One probe is let through in half-open
+        assert breaker.allow()
+        assert not breaker.allow()
+        breaker.record_success()
+        assert breaker.state == "closed"
+
+    def test_failed_probe_reopens(self):
+        breaker = CircuitBreaker(failure_threshold=1, reset_timeout=0.01)
+        breaker.record_failure()
+        time.sleep(0.02)
+        assert breaker.allow()
+        breaker.record_failure()
+        assert breaker.state == "open"
+
+class TestResilienceGuard:
+
+    def test_guard_gives_up_when_deadline_expires_in_queue(self):
+        resilience = Resilience(initial_limit=1)
+        assert resilience.limiter("chat").acquire()
+        with deadline.deadline(0.05):
+            with pytest.raises(deadline.DeadlineExceeded):
+                with resilience.guard("chat"):
+                    pass
+        assert resilience.limiter("chat").in_flight == 1
+        assert resilience.breaker("chat").state == "closed"
+
+    def test_guard_async_gives_up_when_deadline_expires_in_queue(self):
+        resilience = Resilience(initial_limit=1)
+        assert resilience.limiter("chat").acquire()
+
+        async def call():
+            with deadline.deadline(0.05):
+                async with resilience.guard_async("chat"):
+                    pass
+
+        with pytest.raises(deadline.DeadlineExceeded):
+            asyncio.run(call())
+
+    def test_shared_instances_per_host(self):
+        config = {"RAGFLOW_HOST": "http://shared-ragflow/", "RAG_CACHE_ENABLED": True}
+        resilience = Resilience.shared(config)
+        assert Resilience.shared({"RAGFLOW_HOST": "http://shared-ragflow"}) is resilience
+        assert Resilience.shared({"RAGFLOW_HOST": "http://other-ragflow"}) is not resilience
+        assert RAGClient("k", "http://shared-ragflow").resilience is resilience
+        assert RetrievalCache.shared(config) is RetrievalCache.shared(dict(config))
+        assert RetrievalCache.shared({"RAGFLOW_HOST": "http://shared-ragflow", "RAG_CACHE_ENABLED": False}) is None
+
+class TestRAGClientResilience:
+
+    @pytest.fixture
+    def client(self):
+        client = RAGClient("test_key", "http://mock-ragflow", chat_id="chat1",
+                           resilience=Resilience(failure_threshold=2, reset_timeout=60))
+        client.session = MagicMock()
+        return client
+
+    def test_breaker_fails_fast_with_degraded_answer(self, client):
+        client.session.post.return_value = _response(503, {"message": "overloaded"})
+        client.retrieve_and_answer("Q1")
+        client.retrieve_and_answer("Q2")
+        assert client.session.post.call_count == 2
+
+        result = client.retrieve_and_answer("Q3")
+        assert result["citation"] == "Degraded"
+        assert result["degraded"] is True
+        # Rejected without touching RAGFlow
+        assert client.session.post.call_count == 2
+
+    def test_agentic_search_skips_broad_retry_when_degraded(self, client):
+        client.resilience.breaker("chat").record_failure()
+        client.resilience.breaker("chat").record_failure()
+        result = client.agentic_search("", "", "What is X?")
+        assert result["citation"] == "Degraded"
+        assert client.session.post.call_count == 0
+
+    def test_serves_stale_cache_while_open(self, client):
+        client.cache = RetrievalCache()
+        client.session.get.return_value = _response(200, {"code": 0, "data": {"docs": [{"id": "d1"}], "total": 1}})
+        client.session.post.return_value = _response(200, {"code": 0, "data": [{"content": "c1"}]})
+        client.retrieve_chunks("ds1", "What is X?")
+
+        # Dataset changed, then RAGFlow starts failing
+        client.cache.invalidate("ds1")
+        client.session.get.return_value = _response(200, {"code": 0, "data": {"docs": [{"id": "d2"}], "total": 2}})
+        client.resilience.breaker("retrieval").record_failure()
+        client.resilience.breaker("retrieval").record_failure()
+
+        result = client.retrieve_chunks("ds1", "What is X?")
+        assert result["data"] == [{"content": "c1"}]
+        assert result["stale"] is True
@@ -0,0 +1,146 @@
+import time
+import pytest
+from unittest.mock import MagicMock
+from src.apps.rag_flow_mcp.core.rag_client import RAGClient
+from src.apps.rag_flow_mcp.core.retrieval_cache import RetrievalCache, dataset_fingerprint, chat_dataset_ids
+
+def _response(status_code, payload):
+    resp = MagicMock()
+    resp.status_code = status_code
+    resp.json.return_value = payload
+    resp.text = str(payload)
+    return resp
+
+class TestRetrievalCache:
+
+    def test_key_normalizes_query_and_dataset_order(self):
+        k1 = RetrievalCache.make_key("retrieve_chunks", "  What   is X? ", ["b", "a"], {"page": 1})
+        k2 = RetrievalCache.make_key("retrieve_chunks", "what is x?", ["a", "b"], {"page": 1})
+        k3 = RetrievalCache.make_key("retrieve_chunks", "what is x?", ["a", "b"], {"page": 2})
+        assert k1 == k2
+        assert k1 != k3
+
+    def test_version_change_invalidates(self):
+        cache = RetrievalCache()
+        cache.set("k", {"answer": "A"}, "v1")
+        assert cache.get("k", "v1") == {"answer": "A"}
+        assert cache.get("k", "v2") is None
+
+        stats = cache.stats()
+        assert stats["hits"] == 1
+        assert stats["misses"] == 1
+        assert stats["invalidated"] == 1
+
+    def test_ttl_expiry(self):
+        cache = RetrievalCache(ttl=0.01)
+        cache.set("k", {"answer": "A"}, "v1")
+        time.sleep(0.02)
+        assert cache.get("k", "v1") is None
+        assert cache.stats()["expired"] == 1
+
+    def test_lru_size_limit(self):
+        cache = RetrievalCache(max_entries=2)
+        for key in ("a", "b", "c"):
+            cache.set(key, {"k": key}, "v")
+        assert cache.get("a", "v") is None
+        assert cache.get("c", "v") == {"k": "c"}
+
+    def test_disk_tier_survives_new_instance(self, tmp_path):
+        RetrievalCache(cache_dir=str(tmp_path)).set("k", {"answer": "A"}, "v1")
+
+        fresh = RetrievalCache(cache_dir=str(tmp_path))
+        assert fresh.get("k", "v1") == {"answer": "A"}
+        assert fresh.stats()["disk_hits"] == 1
+
+    def test_disk_read_error_is_a_miss(self, tmp_path):
+        import sqlite3
+        cache = RetrievalCache(cache_dir=str(tmp_path))
+        cache.set("k", {"answer": "A"}, "v1")
+        cache.memory.clear()
+        cache.disk._conn = MagicMock()
+        cache.disk._conn.execute.side_effect = sqlite3.OperationalError("database is locked")
+
+        assert cache.get("k", "v1") is None
+        assert cache.stats()["misses"] == 1
+
+    def test_enabled_by_default(self):
+        assert isinstance(RetrievalCache.from_config({}), RetrievalCache)
+        assert RetrievalCache.from_config({"RAG_CACHE_ENABLED": False}) is None
+
+    def test_returned_values_are_copies(self):
+        cache = RetrievalCache()
+        cache.set("k", {"answer": "A"}, "v")
+        cache.get("k", "v")["answer"] = "mutated"
+        assert cache.get("k", "v") == {"answer": "A"}
+
+    def test_dataset_fingerprint(self):
+        resp = {"code": 0, "data": {"docs": [{"id": "d1", "update_time": 123, "chunk_count": 4}], "total": 7}}
+        assert dataset_fingerprint(resp) == "7:d1:123:4"
+        assert dataset_fingerprint({"error": "API Error: 500"}) is None
+
+    def test_chat_dataset_ids(self):
+        assert chat_dataset_ids({"code": 0, "data": [{"id": "c1", "datasets": [{"id": "b"}, {"id": "a"}]}]}) == ["a", "b"]
+        assert chat_dataset_ids({"code": 0, "data": [{"id": "c1", "dataset_ids": ["x"]}]}) == ["x"]
+        assert chat_dataset_ids({"code": 0, "data": []}) is None
+        assert chat_dataset_ids({"error": "API Error: 500"}) is None
+
+class TestRAGClientCaching:
+
+    @pytest.fixture
+    def client(self):
+        client = RAGClient("test_key", "http://mock-ragflow", cache=RetrievalCache())
+        client.session = MagicMock()
+        client.session.get.return_value = _response(200, {"code": 0, "data": {"docs": [{"id": "d1", "update_time": 1}], "total": 1}})
+        client.session.post.return_value = _response(200, {"code": 0, "data": [{"content": "c1"}]})
+        return client
+
+    def test_retrieve_chunks_hits_cache(self, client):
+        first = client.retrieve_chunks("ds1", "What is X?")
+        second = client.retrieve_chunks("ds1", "what is  x?")
+
+        assert first == second
+        assert client.session.post.call_count == 1
+        # Dataset version is probed once and remembered
+        assert client.session.get.call_count == 1
+
+    def test_dataset_change_forces_refetch(self, client):
+        client.retrieve_chunks("ds1", "What is X?")
+        client.session.get.return_value = _response(200, {"code": 0, "data": {"docs": [{"id": "d2", "update_time": 2}], "total": 2}})
+        client.cache.invalidate("ds1")
+
+        client.retrieve_chunks("ds1", "What is X?")
+        assert client.session.post.call_count == 2
+
+    def test_errors_are_not_cached(self, client):
+        client.session.post.return_value = _response(500, {"message": "boom"})
+        client.retrieve_chunks("ds1", "What is X?")
+        client.retrieve_chunks("ds1", "What is X?")
+        assert client.session.post.call_count == 2
+
+    def test_answers_without_dataset_ids_use_chat_datasets(self, client):
+        chat = _response(200, {"code": 0, "data": [{"id": "chat1", "datasets": [{"id": "ds1"}]}]})
+        docs = _response(200, {"code": 0, "data": {"docs": [{"id": "d1", "update_time": 1}], "total": 1}})
+        client.chat_id = "chat1"
+        client.session.get.side_effect = lambda url, **kw: chat if "/chats?" in url else docs
+        client.session.post.return_value = _response(200, {"choices": [{"message": {"content": "A"}}]})
+
+        client.retrieve_and_answer("What is X?")
+        client.retrieve_and_answer("What is X?")
+        assert client.session.post.call_count == 1
+        assert client.dataset_version() == "ds1=1:d1:1:"
+
+        # A new document in the chat's dataset invalidates the cached answer
+        docs.json.return_value = {"code": 0, "data": {"docs": [{"id": "d2", "update_time": 2}], "total": 2}}
+        client.cache.invalidate("ds1")
+        client.retrieve_and_answer("What is X?")
+        assert client.session.post.call_count == 2
+
+    def test_unknown_chat_datasets_bypass_cache(self, client):
+        client.chat_id = "chat1"
+        client.session.get.return_value = _response(500, {"message": "boom"})
+        client.session.post.return_value = _response(200, {"choices": [{"message": {"content": "A"}}]})
+
+        client.retrieve_and_answer("What is X?")
+        client.retrieve_and_answer("What is X?")
+        assert client.session.post.call_count == 2
+        assert client.dataset_version() is None
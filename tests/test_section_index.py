@@ -0,0 +1,53 @@
+from src.common.context_packer import BM25Index, ContextPacker, bm25_scores
+from src.apps.rag_flow_mcp.core.markdown_ast import MarkdownASTManager
+from src.apps.rag_flow_mcp.core.section_index import SectionIndex
+
+SCHEME = """# 方案
+概述。
+
+## 1. 登录
+### 1.1 单点登录
+支持 SAML 与 OIDC 单点登录。
+### 1.2 密码策略
+密码至少 12 位。
+
+## 2. 导出
+导出为 CSV 与 Excel。
+"""
+
+def _index():
+    return SectionIndex(MarkdownASTManager().document(SCHEME))
+
+def test_sections_cover_own_body_with_header_path():
+    index = _index()
+    assert [s["header"] for s in index.sections] == ["方案", "1. 登录", "1.1 单点登录", "1.2 密码策略", "2. 导出"]
+    sso = index.sections[2]
+    assert sso["path"] == ["方案", "1. 登录"]
+    assert sso["text"] == "### 1.1 单点登录\n支持 SAML 与 OIDC 单点登录。\n"
+
+def test_search_finds_deep_sections():
+    hits = _index().search("是否支持 OIDC 登录", top_k=2)
+    assert hits[0]["header"] == "1.1 单点登录"
+    assert _index().search("kubernetes") == []
+
+def test_context_fits_budget_in_document_order():
+    index = _index()
+    context = index.context("导出 CSV 与单点登录", ContextPacker(budget=1000), top_k=2)
+    assert context["headers"] == ["1.1 单点登录", "2. 导出"]
+    assert context["text"].startswith("### 1.1 单点登录")
+    tight = index.context("导出 CSV 与单点登录", ContextPacker(budget=25), top_k=2)
+    assert len(tight["headers"]) == 1
+
+def test_update_rewrites_section_and_drops_subsections():
+    index = _index()
+    assert index.update("1. 登录", "统一使用企业微信扫码登录。\n")
+    assert len(index) == 3
+    assert [h["header"] for h in index.search("单点登录 SAML 企业微信")] == ["1. 登录"]
+    assert not index.update("1.1 单点登录", "x")
+
+def test_bm25_index_matches_function_and_updates():
+    docs = ["alpha beta", "beta gamma gamma", "delta"]
+    index = BM25Index(docs)
+    assert index.scores("gamma beta") == bm25_scores("gamma beta", docs)
+    index.update(2, "gamma")
+    assert index.scores("gamma") == bm25_scores("gamma", ["alpha beta", "beta gamma gamma", "gamma"])
@@ -55,3 +55,23 @@ class TestShadowFileManager:
         assert "```diff" in report
         assert "-Line 2" in report
         assert "+Line 2 Modified" in report
+
+    def test_generate_shadow_copy_segments_streams_revision(self, tmp_path):
+        p = tmp_path / "doc.md"
+        segments = [(f"Line {i}\n", f"Line {i}\n" if i % 10 else f"Line {i} edited\n") for i in range(1, 41)]
+        p.write_text("".join(old for old, _ in segments), encoding="utf-8")
+
+        shadow_path, diff_path = self.manager.generate_shadow_copy_segments(str(p), iter(segments))
+
+        new_content = "".join(new for _, new in segments)
+        with open(shadow_path, 'r', encoding='utf-8') as f:
+            assert f.read() == new_content
+        with open(diff_path, 'r', encoding='utf-8') as f:
+            report = f.read()
+        # One hunk per changed segment, numbered by its line in the whole file
+        assert [line for line in report.splitlines() if line.startswith("@@")] == [f"@@ -{i} +{i} @@" for i in (10, 20, 30, 40)]
+        assert "-Line 20" in report and "+Line 20 edited" in report
+
+    def test_generate_shadow_copy_segments_file_not_found(self):
+        with pytest.raises(FileNotFoundError):
+            self.manager.generate_shadow_copy_segments("non_existent_file.md", [])
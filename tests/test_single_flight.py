@@ -0,0 +1,173 @@
+import time
+import asyncio
+import threading
+import pytest
+from unittest.mock import MagicMock
+from src.apps.rag_flow_mcp.core.rag_client import RAGClient
+from src.apps.rag_flow_mcp.core.single_flight import SingleFlight, AsyncSingleFlight, flight_key
+from src.apps.rag_flow_mcp.core import deadline
+
+def _run_concurrently(n, fn):
+    barrier = threading.Barrier(n)
+    results = [None] * n
+
+    def worker(i):
+        barrier.wait()
+        results[i] = fn()
+
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(n)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    return results
+
+class TestSingleFlight:
+
+    def test_concurrent_calls_share_one_execution(self):
+        flight = SingleFlight()
+        calls = []
+
+        def fetch():
+            calls.append(1)
+            time.sleep(0.05)
+            return {"data": ["c1"]}
+
+        results = _run_concurrently(5, lambda: flight.do("k", fetch))
+
+        assert len(calls) == 1
+        assert all(r == {"data": ["c1"]} for r in results)
+        # Each caller gets its own copy
+        assert len({id(r) for r in results}) == 5
+        assert flight.stats() == {"leaders": 1, "shared": 4, "in_flight": 0}
+
+    def test_sequential_calls_are_not_cached(self):
+        flight = SingleFlight()
+        fetch = MagicMock(return_value="ok")
+        flight.do("k", fetch)
+        flight.do("k", fetch)
+        assert fetch.call_count == 2
+
+    def test_errors_propagate_to_followers(self):
+        flight = SingleFlight()
+
+        def fetch():
+            time.sleep(0.05)
+            raise ValueError("boom")
+
+        def call():
+            try:
+                return flight.do("k", fetch)
+            except ValueError as e:
+                return str(e)
+
+        assert _run_concurrently(3, call) == ["boom"] * 3
+
+    def test_follower_gives_up_at_its_deadline(self):
+        flight = SingleFlight()
+        release = threading.Event()
+        leader = threading.Thread(target=flight.do, args=("k", lambda: release.wait(2)))
+        leader.start()
+        time.sleep(0.02)
+
+        started = time.monotonic()
+        with deadline.deadline(0.05):
+            with pytest.raises(deadline.DeadlineExceeded):
+                flight.do("k", lambda: "unused")
+        assert time.monotonic() - started < 1
+        release.set()
+        leader.join()
+
+    def test_follower_retries_after_leader_error(self):
+        flight = SingleFlight()
+        attempts = []
+
+        def fetch():
+            attempts.append(1)
+            time.sleep(0.05)
+            if len(attempts) == 1:
+                raise deadline.DeadlineExceeded("leader budget spent")
+            return "ok"
+
+        def call():
+            try:
+                return flight.do("k", fetch)
+            except deadline.DeadlineExceeded:
+                return "timeout"
+
+        assert sorted(_run_concurrently(3, call)) == ["ok", "ok", "timeout"]
+        assert len(attempts) == 2
+
+    def test_key_depends_on_payload(self):
+        assert flight_key("retrieve_chunks", "ds1", "q", {"page": 1}) == flight_key("retrieve_chunks", "ds1", "q", {"page": 1})
+        assert flight_key("retrieve_chunks", "ds1", "q", {"page": 1}) != flight_key("retrieve_chunks", "ds1", "q", {"page": 2})
+
+class TestAsyncSingleFlight:
+
+    def test_concurrent_coroutines_share_one_task(self):
+        flight = AsyncSingleFlight()
+        calls = []
+
+        async def fetch():
+            calls.append(1)
+            await asyncio.sleep(0.01)
+            return {"answer": "A"}
+
+        async def run():
+            return await asyncio.gather(*[flight.do("k", fetch) for _ in range(4)])
+
+        results = asyncio.run(run())
+        assert len(calls) == 1
+        assert results == [{"answer": "A"}] * 4
+        assert flight.stats()["shared"] == 3
+
+    def test_follower_deadline_does_not_cancel_shared_task(self):
+        flight = AsyncSingleFlight()
+
+        async def fetch():
+            await asyncio.sleep(0.1)
+            return "A"
+
+        async def follower():
+            await asyncio.sleep(0)
+            with deadline.deadline(0.02):
+                return await flight.do("k", fetch)
+
+        async def run():
+            return await asyncio.gather(flight.do("k", fetch), follower(), return_exceptions=True)
+
+        leader_result, follower_result = asyncio.run(run())
+        assert leader_result == "A"
+        assert isinstance(follower_result, deadline.DeadlineExceeded)
+
+class TestRAGClientCoalescing:
+
+    def test_identical_retrievals_hit_upstream_once(self):
+        client = RAGClient("test_key", "http://mock-ragflow")
+        client.session = MagicMock()
+
+        def slow_post(*args, **kwargs):
+            time.sleep(0.05)
+            resp = MagicMock(status_code=200)
+            resp.json.return_value = {"code": 0, "data": [{"content": "c1"}]}
+            return resp
+
+        client.session.post.side_effect = slow_post
+        results = _run_concurrently(4, lambda: client.retrieve_chunks("ds1", "What is X?"))
+
+        assert client.session.post.call_count == 1
+        assert all(r["data"] == [{"content": "c1"}] for r in results)
+
+    def test_coalescing_can_be_disabled(self):
+        client = RAGClient("test_key", "http://mock-ragflow", chat_id="chat1", coalesce=False)
+        client.session = MagicMock()
+
+        def slow_post(*args, **kwargs):
+            time.sleep(0.02)
+            resp = MagicMock(status_code=200)
+            resp.json.return_value = {"choices": [{"message": {"content": "ok"}}]}
+            return resp
+
+        client.session.post.side_effect = slow_post
+        assert _run_concurrently(3, lambda: client.call_llm("sys", "user")) == ["ok"] * 3
+        assert client.session.post.call_count == 3
@@ -0,0 +1,54 @@
+import random
+import pytest
+from src.apps.rag_flow_mcp.core.text_buffer import TextBuffer
+from src.apps.rag_flow_mcp.core.file_service import FileService
+
+def _line_offsets(text):
+    offsets = [0]
+    for line in text.splitlines(keepends=True):
+        offsets.append(offsets[-1] + len(line))
+    return offsets
+
+class TestTextBuffer:
+    def test_line_addressed_edits(self):
+        buffer = TextBuffer("a\nb\nc\n")
+        buffer.replace_lines(1, 2, "B1\nB2\n")
+        buffer.insert_lines(0, "top\n")
+        buffer.delete_lines(4, 5)
+        buffer.append("end")
+        assert buffer.getvalue() == "top\na\nB1\nB2\nend"
+        assert buffer.line_count == 5
+        assert buffer.get_lines(2, 4) == "B1\nB2\n"
+        assert buffer.offset(99) == len(buffer)
+
+    def test_random_edits_match_string_operations(self):
+        rng = random.Random(7)
+        text = "".join(f"line {i}\n" for i in range(50))
+        buffer = TextBuffer(text)
+        for step in range(300):
+            offsets = _line_offsets(text)
+            start = rng.randrange(len(offsets))
+            end = rng.randrange(start, len(offsets))
+            new = "".join(f"n{step}.{k}\n" for k in range(rng.randrange(3)))
+            text = text[:offsets[start]] + new + text[offsets[end]:]
+            buffer.replace_lines(start, end, new)
+            assert buffer.offset(start) == offsets[start]
+            if step % 50 == 0:
+                assert buffer.getvalue() == text
+        assert "".join(buffer.chunks()) == text
+        assert buffer.line_count == len(text.splitlines())
+
+    def test_chunks_of_a_range(self):
+        buffer = TextBuffer("0123456789")
+        buffer.replace(3, 5, "xy")
+        buffer.replace(8, 8, "!")
+        assert "".join(buffer.chunks(2, 9)) == "2xy567!"
+        with pytest.raises(ValueError):
+            buffer.replace(5, 2, "")
+
+    def test_file_service_writes_buffer_chunks(self, tmp_path):
+        buffer = TextBuffer("# Title\nbody\n")
+        buffer.replace_lines(1, 2, "new body\n")
+        path = tmp_path / "out.md"
+        FileService().write_text(str(path), buffer)
+        assert path.read_text(encoding="utf-8") == "# Title\nnew body\n"